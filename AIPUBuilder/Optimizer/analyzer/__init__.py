@@ -2,4 +2,6 @@
 # Copyright © 2023 Arm Technology (China) Co. Ltd.
 
 from . cosine import *
+from . layer_similarity import *
 from . running_time import *
+from . profiler import *
@@ -2,14 +2,20 @@
 # Copyright © 2023 Arm Technology (China) Co. Ltd.
 
 
-def check_nodes_similarity(float_graph, quant_graph, inputs, keep_tensors=False):
+def check_nodes_similarity(float_graph, quant_graph, inputs, keep_tensors=False, float_cache=None, similarity=None):
     '''
     use one input to test the network
     check each node's similarity between float graph and quant graph
+    similarity (a LayerSimilarity) accumulates the comparison of this batch with the previous ones, without it the
+    cosine of each quant tensor on this batch is appended to its similarity list
+    float_cache (a FloatResultCache) provides the float node outputs of batch float_graph.current_batch_idx
+    instead of forwarding the float graph, or stores them when it does not hold this batch yet
     '''
-    from AIPUBuilder.Optimizer.logger import OPT_INFO, OPT_DEBUG, OPT_ERROR
-    from AIPUBuilder.Optimizer.utils.quant_tool_utils import cosine_distance
-    from AIPUBuilder.Optimizer.framework.pycore.pytensor import PyTensor
+    from AIPUBuilder.Optimizer.logger import OPT_ERROR
+    from AIPUBuilder.Optimizer.framework.pycore.pytensor import PyTensor, opt_use_cuda
+    from AIPUBuilder.Optimizer.analyzer.layer_similarity import LayerSimilarity
+
+    stats = LayerSimilarity() if similarity is None else similarity
 
     float_graph.feed_inputs_data(inputs)
     quant_graph.feed_inputs_data(inputs)
@@ -20,8 +26,18 @@ def check_nodes_similarity(float_graph, quant_graph, inputs, keep_tensors=False)
     else:
         float_graph.reset_edge_tensors_ref_count()
         quant_graph.reset_edge_tensors_ref_count()
+    batch_idx = float_graph.current_batch_idx
+    cached = None
+    if float_cache is not None and batch_idx in float_cache:
+        cached = float_cache.get(batch_idx)
     for n, qn in zip(float_graph.nodes, quant_graph.nodes):
-        n.forward()
+        if cached is None:
+            n.forward()
+            if float_cache is not None:
+                float_cache.put(batch_idx, {t.name: t.betensor for t in n.outputs})
+        else:
+            for t in n.outputs:
+                t.betensor = cached[t.name].cuda() if opt_use_cuda() else cached[t.name]
         qn.forward()
         if n.type != qn.type or n.name != qn.name:
             OPT_ERROR(
@@ -30,28 +46,9 @@ def check_nodes_similarity(float_graph, quant_graph, inputs, keep_tensors=False)
             if float_t.name != t.name:
                 OPT_ERROR(
                     f"check_nodes_similarity: failed to match tensor in '{n.type} {n.name}': '{float_t.name}' vs '{t.name}'. ")
-            float_output = float_t.betensor
-            quant_output = t.betensor + (0 if t.debug_flag else t.zerop)
-            sim = cosine_distance(float_output, quant_output)
-            if sim < 0.9:
-                OPT_DEBUG(t.name, ' accuracy too low : %f' % sim)
-                # ref = float_t.betensor+float_t.zerop
-                # tar = t.betensor+t.zerop
-                # import matplotlib.pyplot as plt
-                # plt.subplot(131)
-                # plt.title('out,%s'%t.name)
-                # plt.plot(tar.reshape(-1).cpu()[:10000]/t.scale)
-                # plt.subplot(132)
-                # plt.title('ref')
-                # plt.plot(ref.reshape(-1).cpu()[:10000])
-                # plt.subplot(133)
-                # plt.title('diff')
-                # plt.plot(tar.reshape(-1).cpu()[:10000]/t.scale-ref.reshape(-1).cpu()[:10000])
-                # plt.show()
-            if t.similarity is None:
-                t.similarity = [sim]
-            else:
-                t.similarity.append(sim)
+        stats.update(n, qn)
+    if similarity is None:
+        stats.set_tensor_similarity()
     if keep_tensors:
         pass
     else:
@@ -0,0 +1,132 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import csv
+import json
+
+__all__ = ['LayerSimilarity']
+
+# float64 accumulators kept for each compared tensor, on the device of the tensors
+_BATCHES, _COS_SUM, _DOT, _FF, _QQ, _ERR2, _NUMEL, _MAX_ABS = range(8)
+
+_REPORT_COLUMNS = ('layer_id', 'layer_type', 'layer_name', 'tensor_name', 'batches', 'cosine', 'global_cosine', 'mse',
+                   'max_abs_error', 'sqnr_db', 'input_cosine', 'cosine_drop', 'degradation_rank')
+
+
+def _dequantized(t):
+    # the float values of a quant graph tensor, dequantized the way graph_inference does with the graph outputs.
+    # per-channel tensors are dequantized with the scale and zerop of each channel along key_axis, where the former
+    # cosine of t.betensor + t.zerop against the float tensor ignored the channel scales, so their cosines change
+    import torch
+    from AIPUBuilder.Optimizer.utils.quant_tool_utils import linear_dequantize
+    x = t.betensor.double()
+    if t.debug_flag or (t.pnode is not None and t.pnode.get_param('unquantifiable', optional=True, default_value=False)):
+        return x
+
+    def along_key_axis(p):
+        if isinstance(p, torch.Tensor) and p.numel() > 1 and t.key_axis is not None and x.dim() > 0:
+            shape = [1] * x.dim()
+            shape[t.key_axis] = -1
+            return p.to(x.device).reshape(shape)
+        return p
+    return linear_dequantize(x, along_key_axis(t.scale), along_key_axis(t.zerop))
+
+
+class LayerSimilarity(object):
+    """
+    streaming per-layer comparison between a float graph and its quant graph: each update compares the outputs of a
+    pair of nodes that just forwarded the same batch, and only accumulates float64 sums on the device, so nothing is
+    synchronized until the report. per output tensor it reports the mean cosine of the batches, the cosine, mse,
+    max abs error and sqnr over all the batches, and the cosine drop against the worst input of the layer, which
+    ranks the layers by how much degradation they add themselves instead of inheriting it from their producers.
+    the quant tensors are compared once dequantized (see _dequantized): per-tensor quantized ones get the same cosine
+    as before, per-channel quantized ones are no longer compared without their channel scales.
+    """
+
+    def __init__(self):
+        self.stats = {}
+
+    def update(self, n, qn):
+        """compare the outputs of float node n and quant node qn."""
+        import torch
+        for float_t, t in zip(n.outputs, qn.outputs):
+            x = float_t.betensor.double().reshape(-1)
+            y = _dequantized(t).reshape(-1)
+            if x.numel() != y.numel():
+                continue
+            diff = y - x
+            dot, ff, qq = (x * y).sum(), (x * x).sum(), (y * y).sum()
+            norm = (ff * qq).sqrt()
+            # the same as cosine_distance: two all-zeros tensors are identical, one all-zeros tensor is orthogonal
+            cos = torch.where(norm > 0, dot / torch.where(norm > 0, norm, torch.ones_like(norm)), (ff == qq).double())
+            max_abs = diff.abs().max() if diff.numel() else diff.new_zeros([])
+            acc = torch.stack([torch.ones_like(dot), cos.clamp(-1., 1.), dot, ff, qq, (diff * diff).sum(),
+                               torch.full_like(dot, x.numel()), max_abs])
+            entry = self.stats.get(t.name)
+            if entry is None:
+                self.stats[t.name] = {'node': qn, 'tensor': t, 'acc': acc}
+            else:
+                entry['acc'][:_MAX_ABS] += acc[:_MAX_ABS]
+                entry['acc'][_MAX_ABS] = torch.maximum(entry['acc'][_MAX_ABS], acc[_MAX_ABS])
+
+    def report(self):
+        """one row per compared tensor in graph order, see _REPORT_COLUMNS."""
+        import math
+        rows = []
+        cosines = {}
+        for name, entry in self.stats.items():
+            acc = entry['acc'].tolist()
+            n = entry['node']
+            dot, ff, qq, err2 = acc[_DOT], acc[_FF], acc[_QQ], acc[_ERR2]
+            norm = math.sqrt(ff * qq)
+            row = {'layer_id': n.attrs.get('layer_id', '-1'),
+                   'layer_type': str(n.type)[7:],
+                   'layer_name': n.name,
+                   'tensor_name': name,
+                   'batches': int(acc[_BATCHES]),
+                   'cosine': acc[_COS_SUM] / acc[_BATCHES],
+                   'global_cosine': dot / norm if norm > 0 else float(ff == qq),
+                   'mse': err2 / acc[_NUMEL] if acc[_NUMEL] else 0.,
+                   'max_abs_error': acc[_MAX_ABS],
+                   # None means no quantization noise at all
+                   'sqnr_db': 10 * math.log10(max(ff, 1e-300) / err2) if err2 > 0 else None}
+            cosines[name] = row['cosine']
+            rows.append(row)
+        for row in rows:
+            n = self.stats[row['tensor_name']]['node']
+            # graph inputs and constants count as lossless inputs
+            row['input_cosine'] = min([cosines[t.name] for t in n.inputs if t.name in cosines] + [1.])
+            row['cosine_drop'] = row['input_cosine'] - row['cosine']
+        for rank, row in enumerate(sorted(rows, key=lambda r: -r['cosine_drop'])):
+            row['degradation_rank'] = rank + 1
+        return rows
+
+    def ranked(self, rows=None):
+        """the rows sorted by degradation_rank, the layers adding the most degradation first."""
+        return sorted(self.report() if rows is None else rows, key=lambda r: r['degradation_rank'])
+
+    def set_tensor_similarity(self, rows=None):
+        """append the mean cosine of each compared quant tensor to its similarity list, as show_similarity expects."""
+        from AIPUBuilder.Optimizer.logger import OPT_DEBUG
+        for row in (self.report() if rows is None else rows):
+            t = self.stats[row['tensor_name']]['tensor']
+            if row['cosine'] < 0.9:
+                OPT_DEBUG(t.name, ' accuracy too low : %f' % row['cosine'])
+            if t.similarity is None:
+                t.similarity = [row['cosine']]
+            else:
+                t.similarity.append(row['cosine'])
+
+    def export(self, output_dir, prefix, rows=None):
+        rows = self.report() if rows is None else rows
+        os.makedirs(output_dir, exist_ok=True)
+        json_path = os.path.join(output_dir, f"{prefix}_layer_similarity.json")
+        csv_path = os.path.join(output_dir, f"{prefix}_layer_similarity.csv")
+        with open(json_path, 'w') as fw:
+            json.dump({'layers': rows, 'ranked': [r['tensor_name'] for r in self.ranked(rows)]}, fw, indent=1)
+        with open(csv_path, 'w', newline='') as fw:
+            writer = csv.DictWriter(fw, fieldnames=_REPORT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+        return json_path, csv_path
@@ -0,0 +1,240 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import time
+import json
+import threading
+from array import array
+from contextlib import ContextDecorator
+
+__all__ = ['OpProfiler', 'opt_profiler', 'profile_op', 'profile_phase']
+
+_ACTIVE_PROFILER = None
+
+
+def opt_profiler():
+    """the profiler currently recording, None if profiling is off"""
+    return _ACTIVE_PROFILER
+
+
+def _storages(tensors):
+    # data_ptr: nbytes of the storages behind the betensor of tensors, views share one storage
+    stores = {}
+    for t in tensors:
+        bt = getattr(t, 'betensor', None)
+        if bt is None or not hasattr(bt, 'untyped_storage'):
+            continue
+        st = bt.untyped_storage()
+        if st.data_ptr() != 0:
+            stores[st.data_ptr()] = st.nbytes()
+    return stores
+
+
+def _shapes(tensors):
+    return tuple(tuple(t.betensor.shape) if getattr(t, 'betensor', None) is not None else None for t in tensors)
+
+
+class _OpRecord(object):
+    __slots__ = ('name', 'type', 'layer_id', 'graph', 'phase', 'kind', 'durations', 'allocated', 'peak', 'shapes')
+
+    def __init__(self, node, phase, kind):
+        self.name = node.name
+        self.type = str(node.type)[7:]
+        self.layer_id = str(node.attrs.get('layer_id', '-1'))
+        self.graph = 'quant' if node.quantized else 'float'
+        self.phase = phase
+        self.kind = kind
+        self.durations = array('d')
+        self.allocated = 0
+        self.peak = 0
+        self.shapes = []
+
+
+def _summary(durations):
+    import numpy as np
+    d = np.frombuffer(durations, dtype=np.float64) if isinstance(durations, array) else np.asarray(durations)
+    if d.size == 0:
+        return {'calls': 0, 'total': 0., 'min': 0., 'max': 0., 'p50': 0., 'p99': 0.}
+    p50, p99 = np.percentile(d, [50, 99])
+    return {'calls': int(d.size), 'total': float(d.sum()), 'min': float(d.min()), 'max': float(d.max()),
+            'p50': float(p50), 'p99': float(p99)}
+
+
+class OpProfiler(object):
+    """
+    records the wall time (seconds), memory (bytes) and tensor shapes of each PyNode.forward and PyNode.quantize
+    call, grouped by the workflow phase (statistic, calibration, quantize, metric...) they run in.
+    on cuda, the device is synchronized around each op and allocated/peak bytes come from the cuda allocator,
+    otherwise they are the bytes of the new output storages and of all the input and output storages of the op.
+    """
+
+    def __init__(self, synchronize=True, max_trace_events=1000000, max_shapes=8):
+        self.synchronize = synchronize
+        self.max_trace_events = max_trace_events
+        self.max_shapes = max_shapes
+        self.records = {}
+        self.events = []
+        self.dropped_events = 0
+        self.phases = []
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._previous = None
+
+    def start(self):
+        global _ACTIVE_PROFILER
+        self._previous = _ACTIVE_PROFILER
+        _ACTIVE_PROFILER = self
+        return self
+
+    def stop(self):
+        global _ACTIVE_PROFILER
+        _ACTIVE_PROFILER = self._previous
+        self._previous = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    @property
+    def phase(self):
+        return self.phases[-1] if len(self.phases) else 'other'
+
+    def run(self, node, kind, func, *args, **kwargs):
+        import torch
+        cuda = self.synchronize and torch.cuda.is_available() and torch.cuda.is_initialized()
+        tensors = list(node.inputs) + list(node.outputs)
+        if cuda:
+            torch.cuda.synchronize()
+            base = torch.cuda.memory_allocated()
+            torch.cuda.reset_peak_memory_stats()
+        else:
+            before = _storages(tensors)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if cuda:
+                torch.cuda.synchronize()
+            end = time.perf_counter()
+            if cuda:
+                allocated = torch.cuda.memory_allocated() - base
+                peak = torch.cuda.max_memory_allocated() - base
+            else:
+                after = _storages(tensors)
+                allocated = sum(v for k, v in after.items() if k not in before)
+                peak = sum(after.values())
+            self._record(node, kind, start, end, allocated, peak)
+
+    def _record(self, node, kind, start, end, allocated, peak):
+        phase = self.phase
+        key = self._key(phase, kind, node)
+        with self._lock:
+            rec = self.records.get(key)
+            if rec is None:
+                rec = _OpRecord(node, phase, kind)
+                self.records[key] = rec
+            rec.durations.append(end - start)
+            rec.allocated += max(0, allocated)
+            rec.peak = max(rec.peak, peak)
+            if len(rec.shapes) < self.max_shapes:
+                shapes = [_shapes(node.inputs), _shapes(node.outputs)]
+                if shapes not in rec.shapes:
+                    rec.shapes.append(shapes)
+            if len(self.events) < self.max_trace_events:
+                self.events.append((rec, start, end, threading.get_ident()))
+            else:
+                self.dropped_events += 1
+
+    @staticmethod
+    def _key(phase, kind, node):
+        # float graph and quant graph own nodes of the same name
+        return (phase, kind, id(node.graph), node.name)
+
+    def node_summary(self, node, phase, kind='forward'):
+        rec = self.records.get(self._key(phase, kind, node))
+        return _summary(rec.durations if rec is not None else [])
+
+    def node_report(self):
+        report = []
+        for rec in self.records.values():
+            item = {'phase': rec.phase, 'kind': rec.kind, 'graph': rec.graph, 'name': rec.name, 'type': rec.type,
+                    'layer_id': rec.layer_id}
+            item.update(_summary(rec.durations))
+            item.update({'allocated_bytes': rec.allocated, 'peak_bytes': rec.peak,
+                         'shapes': [{'inputs': s[0], 'outputs': s[1]} for s in rec.shapes]})
+            report.append(item)
+        return report
+
+    def op_type_report(self):
+        groups = {}
+        for rec in self.records.values():
+            groups.setdefault((rec.phase, rec.kind, rec.graph, rec.type), []).append(rec)
+        report = []
+        for (phase, kind, graph, optype), recs in groups.items():
+            durations = array('d')
+            for rec in recs:
+                durations.extend(rec.durations)
+            item = {'phase': phase, 'kind': kind, 'graph': graph, 'type': optype, 'nodes': len(recs)}
+            item.update(_summary(durations))
+            item.update({'allocated_bytes': sum(r.allocated for r in recs), 'peak_bytes': max(r.peak for r in recs)})
+            report.append(item)
+        return sorted(report, key=lambda x: -x['total'])
+
+    def report(self):
+        return {'nodes': self.node_report(), 'op_types': self.op_type_report(), 'dropped_trace_events': self.dropped_events}
+
+    def export_json(self, path):
+        with open(path, 'w') as fw:
+            json.dump(self.report(), fw, indent=1)
+
+    def export_chrome_trace(self, path):
+        # trace event format, can be opened by chrome://tracing or perfetto
+        pid = os.getpid()
+        events = []
+        for rec, start, end, tid in self.events:
+            events.append({'name': f"{rec.type} {rec.name}", 'cat': f"{rec.phase},{rec.kind},{rec.graph}", 'ph': 'X',
+                           'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6, 'pid': pid, 'tid': tid,
+                           'args': {'layer_id': rec.layer_id}})
+        with open(path, 'w') as fw:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fw)
+
+    def export(self, output_dir, prefix):
+        os.makedirs(output_dir, exist_ok=True)
+        json_path = os.path.join(output_dir, f"{prefix}_op_profile.json")
+        trace_path = os.path.join(output_dir, f"{prefix}_op_trace.json")
+        self.export_json(json_path)
+        self.export_chrome_trace(trace_path)
+        return json_path, trace_path
+
+
+def profile_op(node, kind, func, *args, **kwargs):
+    """call func(*args, **kwargs) on behalf of node, recorded by the active profiler if any"""
+    profiler = _ACTIVE_PROFILER
+    if profiler is None:
+        return func(*args, **kwargs)
+    return profiler.run(node, kind, func, *args, **kwargs)
+
+
+class profile_phase(ContextDecorator):
+    """mark the ops run inside (a with block or a decorated function) as belonging to the workflow phase name"""
+
+    def __init__(self, name):
+        self.name = name
+        self._entered = []
+
+    def __enter__(self):
+        profiler = _ACTIVE_PROFILER
+        if profiler is not None:
+            profiler.phases.append(self.name)
+        self._entered.append(profiler)
+        return self
+
+    def __exit__(self, *exc):
+        profiler = self._entered.pop()
+        if profiler is not None:
+            profiler.phases.pop()
+        return False
@@ -1,7 +1,7 @@
 # SPDX-License-Identifier: Apache-2.0
 # Copyright © 2023 Arm Technology (China) Co. Ltd.
 
-def calculate_op_running_time(f_graph, q_graph):
+def calculate_op_running_time(f_graph, q_graph, profiler, phase):
 
     from AIPUBuilder.Optimizer.logger import OPT_DEBUG
     nname_id = {}
@@ -10,16 +10,16 @@ def calculate_op_running_time(f_graph, q_graph):
     cost_times = {}
     for n in q_graph.nodes:
         key = f"{n.attrs['layer_id']} {str(n.type)[7:]}"
-        q_cost_time = n.attrs['cost_time']
+        q_cost_time = profiler.node_summary(n, phase)['total']
         f_cost_time = 0
         if n.name in nname_id.keys():
             fnodes = f_graph.nodes[nname_id[n.name]]
-            f_cost_time = fnodes.attrs['cost_time']
+            f_cost_time = profiler.node_summary(fnodes, phase)['total']
         ct = [f_cost_time, q_cost_time]
         cost_times.update({key: ct})
 
-    fall_times = sum([v[0] for v in cost_times.values()])
-    qall_times = sum([v[1] for v in cost_times.values()])
+    fall_times = max(sum([v[0] for v in cost_times.values()]), 1e-12)
+    qall_times = max(sum([v[1] for v in cost_times.values()]), 1e-12)
     type_max_len = max([len(k) for k in cost_times.keys()]) if len(cost_times.keys()) > 0 else 0
     for k, v in cost_times.items():
         v.append(v[0] / fall_times * 100)
@@ -28,9 +28,3 @@ def calculate_op_running_time(f_graph, q_graph):
         ostr = (f"layer_type={k:{type_max_len}} fp32_forward_time={v[0]:<8.6f}s, quant_forward_time={v[1]:<8.6f}s, "
                 f"this_fp32/all_fp32={v[2]:<3.6f}%%, this_quant/all_quant={v[3]:<3.6f}%%")
         OPT_DEBUG(ostr)
-
-    # disable to calculate op running time
-    for n in f_graph.nodes:
-        n.attrs['calculate_running_time'] = False
-    for n in q_graph.nodes:
-        n.attrs['calculate_running_time'] = False
@@ -78,6 +78,48 @@ class BinField(BaseField):
         return "Binary file path of Compass IR."
 
 
+@field_register('ir_cache_dir', 'default')
+class IRCacheDirField(BaseField):
+    # parsed IR topology cache, repeated runs on the same IR text skip the text parsing.
+    @staticmethod
+    def default():
+        return ''
+
+    @staticmethod
+    def check(cd):
+        return True if not isinstance(cd, str) or (os.path.exists(cd) and not os.path.isdir(cd)) else False
+
+    @staticmethod
+    def error(cd):
+        return f"Require the 'ir_cache_dir' field to be a directory path, now 'ir_cache_dir={cd}' is not a directory."
+
+    @staticmethod
+    def message():
+        return ("A directory caching the parsed topology (layers, tensors and params) of the Compass IR text, keyed by "
+                "the content of the IR text file. Default to '' which means disabled.")
+
+
+@field_register('lazy_load_constants', 'default')
+class LazyLoadConstantsField(BaseField):
+    @staticmethod
+    def default():
+        return 'False'
+
+    @staticmethod
+    def check(ll):
+        return True if not isinstance(ll, bool) else False
+
+    @staticmethod
+    def error(ll):
+        return f"Require the 'lazy_load_constants' field must be in bool type, now is {type(ll)} type, default value=False."
+
+    @staticmethod
+    def message():
+        return ("Whether to load the constants (weights, biases, etc.) from the memory-mapped IR bin file on their first "
+                "use instead of reading all of them when parsing the IR. Constants already in their computing type "
+                "(e.g. float32) share the file pages without copying, so the bin file must not be modified while running.")
+
+
 @field_register('model_name', 'default')
 class ModelNameField(BaseField):
     @staticmethod
@@ -410,6 +452,53 @@ class DataloaderWorkersField(BaseField):
         return f"Thread workers for DataLoader."
 
 
+@field_register('statistic_workers', 'default')
+class StatisticWorkersField(BaseField):
+    # number of reduction workers for the pipelined statistic mode
+    @staticmethod
+    def default():
+        return '0'
+
+    @staticmethod
+    def check(sw):
+        return True if not (isinstance(sw, int) and sw >= 0) else False
+
+    @staticmethod
+    def error(sw):
+        msg = sw if isinstance(sw, int) else type(sw)
+        return f"Required the nonnegative integer(>= 0) 'statistic_workers' field, now is {msg}. default value=0."
+
+    @staticmethod
+    def message():
+        return ("Thread workers for the pipelined statistic mode: calibration batches are prefetched in background, "
+                "and the statistic reductions of each forwarded tensor are dispatched to these workers. "
+                "0 means the serial statistic (default), results are identical in both modes.")
+
+
+@field_register('metric_workers', 'default')
+class MetricWorkersField(BaseField):
+    # number of forked processes for the data parallel metric inference
+    @staticmethod
+    def default():
+        return '0'
+
+    @staticmethod
+    def check(mw):
+        return True if not (isinstance(mw, int) and mw >= 0) else False
+
+    @staticmethod
+    def error(mw):
+        msg = mw if isinstance(mw, int) else type(mw)
+        return f"Required the nonnegative integer(>= 0) 'metric_workers' field, now is {msg}. default value=0."
+
+    @staticmethod
+    def message():
+        return ("Processes for the data parallel metric inference on cpu: the validation batches are sharded to "
+                "these forked processes, each one forwards its batches on a copy-on-write copy of the graph and the "
+                "predictions are fed to the metrics in the original batch order. "
+                "0 means the serial inference (default), metric results are identical in both modes.")
+
+
 @field_register('calibration_batch_size', 'default')
 class CalibrationBatchSizeField(BaseField):
     # the batch size used for computing quantization parameters over calibration dataset
@@ -529,7 +618,101 @@ class StatisticFileField(BaseField):
 
     @staticmethod
     def message():
-        return f"A file stores calibration statistic information of each tensor in each node."
+        return f"A file stores calibration statistic information of each tensor in each node, the '.stat' file saved with 'save_statistic_info' or a former pickled '.npy' one."
+
+
+@field_register('statistic_cache_dir', 'default')
+class StatisticCacheDirField(BaseField):
+    # content-addressed statistic cache, tensors whose upstream is unchanged reuse their statistic info across runs.
+    @staticmethod
+    def default():
+        return ''
+
+    @staticmethod
+    def check(sd):
+        return True if not isinstance(sd, str) or (os.path.exists(sd) and not os.path.isdir(sd)) else False
+
+    @staticmethod
+    def error(sd):
+        return f"Require the 'statistic_cache_dir' field to be a directory path, now 'statistic_cache_dir={sd}' is not a directory."
+
+    @staticmethod
+    def message():
+        return ("A directory caching the statistic information of each tensor, keyed by its producer subgraph, "
+                "the calibration dataset and the statistic settings. Tensors found in cache skip the statistic and "
+                "only the affected part of the graph will be forwarded. Ignored when 'statistic_file' is set, "
+                "default to '' which means disabled.")
+
+
+@field_register('float_result_cache_dir', 'default')
+class FloatResultCacheDirField(BaseField):
+    # float graph results of each validation/similarity batch, reused by later float forwards on the same batches
+    @staticmethod
+    def default():
+        return ''
+
+    @staticmethod
+    def check(fd):
+        return True if not isinstance(fd, str) or (os.path.exists(fd) and not os.path.isdir(fd)) else False
+
+    @staticmethod
+    def error(fd):
+        return f"Require the 'float_result_cache_dir' field to be a directory path, now 'float_result_cache_dir={fd}' is not a directory."
+
+    @staticmethod
+    def message():
+        return ("A directory caching the float graph outputs of each validation batch and the float node outputs of "
+                "each batch used by the per-layer similarity check, keyed by the float graph, the dataset and its "
+                "batching. The float metric, the similarity check and the searches (mixed_precision_auto_search, "
+                "calibration_strategy_sweep) read the cached batches instead of forwarding the float graph again. "
+                "Default to '' which means disabled.")
+
+
+@field_register('checkpoint_dir', 'default')
+class CheckpointDirField(BaseField):
+    # snapshots of the graph after each optimization stage, an interrupted run resumes from the last one
+    @staticmethod
+    def default():
+        return ''
+
+    @staticmethod
+    def check(cd):
+        return True if not isinstance(cd, str) or (os.path.exists(cd) and not os.path.isdir(cd)) else False
+
+    @staticmethod
+    def error(cd):
+        return f"Require the 'checkpoint_dir' field to be a directory path, now 'checkpoint_dir={cd}' is not a directory."
+
+    @staticmethod
+    def message():
+        return ("A directory storing a snapshot of the graph (statistic info, scales/zerops, quantized constants and "
+                "attrs) after each optimization stage (graph_optimize_stage1, statistic, graph_optimize_stage2, "
+                "quantize, collect_information_for_debug, graph_optimize_stage3), keyed by the IR, the config and "
+                "the datasets. A run with the same IR, config and datasets resumes from the last completed stage, "
+                "e.g. after a crash in the metric. Default to '' which means disabled.")
+
+
+@field_register('profile_dir', 'default')
+class ProfileDirField(BaseField):
+    # per-op profiling of forward and quantize over the whole workflow
+    @staticmethod
+    def default():
+        return ''
+
+    @staticmethod
+    def check(pd):
+        return True if not isinstance(pd, str) or (os.path.exists(pd) and not os.path.isdir(pd)) else False
+
+    @staticmethod
+    def error(pd):
+        return f"Require the 'profile_dir' field to be a directory path, now 'profile_dir={pd}' is not a directory."
+
+    @staticmethod
+    def message():
+        return ("A directory to save the per-op profile: call count, wall time (total/min/max/p50/p99), allocated "
+                "and peak memory and tensor shapes of each node and each op type, separately for the statistic, "
+                "calibration, quantize and metric phases, as '<model_name>_op_profile.json', and the Chrome trace "
+                "events as '<model_name>_op_trace.json'. Default to '' which means disabled.")
 
 
 class CalibrationStrategyField(BaseField):
@@ -755,6 +938,106 @@ class GlobalCalibrationParamField(BaseField):
         return GlobalCalibrationParamField.message() + f" now is {gc}"
 
 
+@field_register('global_calibration_memory_budget', 'default')
+class GlobalCalibrationMemoryBudgetField(BaseField):
+    # host memory (MB) for the featuremaps kept by layer-wise global calibration methods
+    @staticmethod
+    def default():
+        return '0'
+
+    @staticmethod
+    def check(mb):
+        return True if not (isinstance(mb, (int, float)) and not isinstance(mb, bool) and mb >= 0) else False
+
+    @staticmethod
+    def error(mb):
+        msg = mb if isinstance(mb, (int, float)) else type(mb)
+        return f"Required the nonnegative number(>= 0) 'global_calibration_memory_budget' field, now is {msg}. default value=0."
+
+    @staticmethod
+    def message():
+        return ("Host memory budget in MB for the featuremaps which 'easy_quant', 'adaround' and 'adaquant_zy' keep "
+                "between layers. Each featuremap is dropped after its last consumer is optimized, and when the kept "
+                "ones exceed the budget the least recently used are spilled into files under "
+                "'global_calibration_spill_dir' and read back (prefetched for the next layer) when needed. "
+                "0 means no limit (default).")
+
+
+@field_register('global_calibration_spill_dir', 'default')
+class GlobalCalibrationSpillDirField(BaseField):
+    # where global calibration methods spill featuremaps over 'global_calibration_memory_budget'
+    @staticmethod
+    def default():
+        return ''
+
+    @staticmethod
+    def check(sd):
+        return True if not isinstance(sd, str) or (os.path.exists(sd) and not os.path.isdir(sd)) else False
+
+    @staticmethod
+    def error(sd):
+        return f"Require the 'global_calibration_spill_dir' field to be a directory path, now 'global_calibration_spill_dir={sd}' is not a directory."
+
+    @staticmethod
+    def message():
+        return ("A directory for the featuremaps spilled by global calibration methods over "
+                "'global_calibration_memory_budget', the files are removed when the method finishes. "
+                "Default to '' which means the system temporary directory.")
+
+
+@field_register('global_calibration_schedule', 'default')
+class GlobalCalibrationScheduleField(BaseField):
+    # how 'adaround' and 'adaquant_zy' walk through the layers
+    @staticmethod
+    def _options():
+        return ['sequential', 'wavefront', 'float_input']
+
+    @staticmethod
+    def default():
+        return 'sequential'
+
+    @staticmethod
+    def check(sc):
+        return True if str(sc).lower().strip() not in GlobalCalibrationScheduleField._options() else False
+
+    @staticmethod
+    def error(sc):
+        return f"Required the 'global_calibration_schedule' field in {GlobalCalibrationScheduleField._options()}, now is {sc}. default value=sequential."
+
+    @staticmethod
+    def message():
+        return ("The order in which 'adaround' and 'adaquant_zy' optimize the layers. "
+                "'sequential' optimizes one layer after another (default). "
+                "'wavefront' optimizes the layers of the same topological generation together, "
+                "they are independent of each other. "
+                "'float_input' reconstructs every layer from float featuremaps (instead of the outputs of the already "
+                "optimized layers for 'adaround') and optimizes 'global_calibration_workers' layers together. "
+                "The layers optimized together run in 'global_calibration_workers' forked processes on cpu.")
+
+
+@field_register('global_calibration_workers', 'default')
+class GlobalCalibrationWorkersField(BaseField):
+    # number of forked processes optimizing layers in parallel
+    @staticmethod
+    def default():
+        return '0'
+
+    @staticmethod
+    def check(gw):
+        return True if not (isinstance(gw, int) and gw >= 0) else False
+
+    @staticmethod
+    def error(gw):
+        msg = gw if isinstance(gw, int) else type(gw)
+        return f"Required the nonnegative integer(>= 0) 'global_calibration_workers' field, now is {msg}. default value=0."
+
+    @staticmethod
+    def message():
+        return ("Processes for the layers which 'global_calibration_schedule' optimizes together, each one works on "
+                "a copy-on-write copy of the graphs and its results are applied in the original layer order. "
+                "0 or 1 means optimizing them serially (default), also used on cuda.")
+
+
 @field_register('calibration_data', 'default')
 class CalibrationDataField(BaseField):
     # the npy data file for the calibration dataset
@@ -1393,6 +1676,95 @@ class MixedPrecisionAutoSearchField(BaseField):
                 f"default value='0,0.,L'.")
 
 
+@field_register('calibration_strategy_sweep', 'default')
+class CalibrationStrategySweepField(BaseField):
+    # candidate calibration strategy combinations evaluated from one statistic pass, like 'mean/extrema;2kld/extrema'
+    @staticmethod
+    def default():
+        return ''
+
+    @staticmethod
+    def parse(css):
+        # returns [(activation_strategy, weight_strategy or None), ...]
+        candidates = []
+        for c in str(css).split(';'):
+            if c.strip():
+                strategies = [x.strip() for x in c.split('/')]
+                candidates.append((strategies[0], strategies[1] if len(strategies) > 1 else None))
+        return candidates
+
+    @staticmethod
+    def check(css):
+        if not isinstance(css, str):
+            return True
+        for c in css.split(';'):
+            if not c.strip():
+                continue
+            strategies = [x.strip() for x in c.split('/')]
+            if len(strategies) > 2:
+                return True
+            if any(CalibrationStrategyField.check(x) for x in strategies):
+                return True
+        return False
+
+    @staticmethod
+    def error(css):
+        return ("Require the 'calibration_strategy_sweep' field to be ';' separated candidates of "
+                "'activation_strategy/weight_strategy' (weight_strategy can be omitted to use "
+                "'calibration_strategy_for_weight'), like 'mean;2kld/extrema;3std/extrema', each strategy must be "
+                f"supported by 'calibration_strategy_for_activation' or 'calibration_strategy_for_weight', now is: {css}")
+
+    @staticmethod
+    def message():
+        return ("Calibration strategy combinations to sweep, like 'mean;2kld/extrema;3std/extrema'. The statistic is "
+                "done once with all the statistic info, then each 'activation_strategy/weight_strategy' candidate is "
+                "calibrated, quantized and evaluated by the metric on the validation dataset, a ranked table of the "
+                "candidates is reported and the best one (closest to the float metric) is applied to the layers which "
+                "follow the global calibration strategies, the layers with their own strategy in 'opt_config' keep it. "
+                "default value='' which means disabled.")
+
+
+@field_register('calibration_strategy_sweep_batches', 'default')
+class CalibrationStrategySweepBatchesField(BaseField):
+    @staticmethod
+    def default():
+        return '0'
+
+    @staticmethod
+    def check(csb):
+        return True if not (isinstance(csb, int) and csb >= 0) else False
+
+    @staticmethod
+    def error(csb):
+        msg = csb if isinstance(csb, int) else type(csb)
+        return f"Required the nonnegative integer(>= 0) 'calibration_strategy_sweep_batches' field, now is {msg}. default value=0."
+
+    @staticmethod
+    def message():
+        return "Batches of validation dataset used to evaluate each 'calibration_strategy_sweep' candidate, 0 means all."
+
+
+@field_register('calibration_strategy_sweep_workers', 'default')
+class CalibrationStrategySweepWorkersField(BaseField):
+    @staticmethod
+    def default():
+        return '1'
+
+    @staticmethod
+    def check(csw):
+        return True if not (isinstance(csw, int) and csw >= 1) else False
+
+    @staticmethod
+    def error(csw):
+        msg = csw if isinstance(csw, int) else type(csw)
+        return f"Required the positive integer(>= 1) 'calibration_strategy_sweep_workers' field, now is {msg}. default value=1."
+
+    @staticmethod
+    def message():
+        return ("Worker processes evaluating 'calibration_strategy_sweep' candidates in parallel "
+                "(only on CPU, candidates are evaluated one by one when using CUDA).")
+
+
 @field_register('featuremap_tiling_param', 'hidden')
 class FeaturemapTilingParamField(BaseField):
     # check featuremap split parameter by end user
@@ -1769,7 +2141,8 @@ class SaveStatisticInfoField(BaseField):
 
     @staticmethod
     def message():
-        return f"Whether to save and dump the statisticed information file, if set false, will further just statistic information which is necessary for corresponding calibration strategy for time saving."
+        return (f"Whether to save and dump the statisticed information file, if set false, will further just statistic information which is necessary for corresponding calibration strategy for time saving. "
+                f"The file is saved as '<output_dir>/<model_name>_statistic_info.stat' in a columnar format (it was a pickled '<model_name>_statistic_info.npy' before), and can be given to 'statistic_file'.")
 
 
 @field_register('trim_infinity_before_statistic', 'default')
@@ -1862,6 +2235,27 @@ class SimilarityDataNumField(BaseField):
         return f"The batches amount for checking similarity."
 
 
+@field_register('layer_similarity_report', 'default')
+class LayerSimilarityReportField(BaseField):
+    @staticmethod
+    def default():
+        return 'False'
+
+    @staticmethod
+    def check(lsr):
+        return True if not isinstance(lsr, bool) else False
+
+    @staticmethod
+    def error(lsr):
+        return f"Require the 'layer_similarity_report' field must be in bool type, now is {type(lsr)} type, default value=False."
+
+    @staticmethod
+    def message():
+        return ("Whether to save the per-layer similarity between the float graph and the quantized graph into "
+                "<output_dir>/<model_name>_layer_similarity.json and .csv, and log the layers adding the most "
+                "degradation. Disabled by default.")
+
+
 @field_register('run_mode', 'hidden')
 class RunModeField(BaseField):
     @staticmethod
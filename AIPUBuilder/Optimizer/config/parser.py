@@ -120,6 +120,10 @@ class CfgParser(object):
             OPT_ERROR("please set 'metric' field in cfg file if want to enable mixed_precision_auto_search.")
             ret = ret and False
 
+        if argv['calibration_strategy_sweep'] != '' and argv['metric'] == '':
+            OPT_ERROR("please set 'metric' field in cfg file if want to enable calibration_strategy_sweep.")
+            ret = ret and False
+
         if argv['metric'] != '':
             if argv['dataset'] == '':
                 OPT_ERROR("please set 'dataset' field in cfg file if want to metric the model.")
@@ -1,6 +1,6 @@
 # SPDX-License-Identifier: Apache-2.0
 # Copyright © 2023 Arm Technology (China) Co. Ltd.
 
-from AIPUBuilder.Optimizer.features.autosearch import NaiveAutoSearchMixedPrecision
-from AIPUBuilder.Optimizer.features.calibration import apply_calibration_strategy, apply_global_calibration
+from AIPUBuilder.Optimizer.features.autosearch import NaiveAutoSearchMixedPrecision, CalibrationStrategySweep
+from AIPUBuilder.Optimizer.features.calibration import apply_calibration_strategy, apply_calibration_strategies, apply_global_calibration
 from AIPUBuilder.Optimizer.features.imagetiling import *
@@ -2,3 +2,4 @@
 # Copyright © 2023 Arm Technology (China) Co. Ltd.
 
 from . mixed_precision_naive_search import NaiveAutoSearchMixedPrecision
+from . calibration_strategy_sweep import CalibrationStrategySweep
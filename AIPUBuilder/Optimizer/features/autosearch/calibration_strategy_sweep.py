@@ -0,0 +1,126 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+from AIPUBuilder.Optimizer.framework import graph_inference
+from AIPUBuilder.Optimizer.logger import OPT_INFO, OPT_WARN
+from AIPUBuilder.Optimizer.utils import forked_processes_available, run_in_forked_processes
+import copy
+import time
+
+
+class CalibrationStrategySweep(object):
+    """
+    evaluate several activation/weight calibration strategy combinations on the same statistic info:
+    each candidate is calibrated, quantized (QuantizeGraph.quantize) and scored on the validation dataset
+    (graph_inference), then the candidates are ranked by how close their metric is to the float one.
+    """
+
+    def __init__(self, optimizer):
+        from AIPUBuilder.Optimizer.config import CalibrationStrategySweepField
+        self.optimizer = optimizer
+        self.hparams = optimizer.hparams
+        self.candidates = []
+        wdefault = self.hparams.calibration_strategy_for_weight
+        for astrategy, wstrategy in CalibrationStrategySweepField.parse(self.hparams.calibration_strategy_sweep):
+            self.candidates.append((astrategy, wstrategy if wstrategy else wdefault))
+        self.batches = self.hparams.calibration_strategy_sweep_batches
+        self.workers = min(self.hparams.calibration_strategy_sweep_workers, len(self.candidates))
+        self.fscore = 0.0
+
+    def apply(self, g, astrategy, wstrategy):
+        """
+        set the strategies of the layers which follow the global ones, the layers with their own strategy (from the
+        per-layer opt_config or 'in_ir') keep it.
+        """
+        def follows_global(n, key, global_strategy):
+            strategy = n.attrs.get(key, global_strategy)
+            return strategy == global_strategy and strategy.lower().strip() != 'in_ir'
+
+        for n in g.nodes:
+            if follows_global(n, 'q_strategy_activation', self.hparams.calibration_strategy_for_activation):
+                n.attrs['q_strategy_activation'] = astrategy
+            if follows_global(n, 'q_strategy_weight', self.hparams.calibration_strategy_for_weight):
+                n.attrs['q_strategy_weight'] = wstrategy
+
+    def evaluate(self, idx):
+        astrategy, wstrategy = self.candidates[idx]
+        start = time.time()
+        # work on copies so that the statistic info and the float graph are left untouched
+        om = copy.copy(self.optimizer)
+        om.hparams = copy.deepcopy(self.hparams)
+        om.hparams.mixed_precision_auto_search_batches = 0
+        om.g = self.optimizer.g.clone()
+        om.dataloader4debug = None
+        self.apply(om.g, astrategy, wstrategy)
+        om.calibrate()
+        om.quantize()
+        qmetrics = copy.deepcopy(om.q_metrics)
+        for qm in qmetrics:
+            qm.reset()
+        graph_inference(om.g.quantgraph,
+                        om.g.qforward,
+                        copy.deepcopy(om.validation_dataloader),
+                        qmetrics,
+                        with_float=False,
+                        max_batches=self.batches,
+                        disable_tqdm=True)
+        qscore = float(qmetrics[0].compute())
+        return qscore, time.time() - start
+
+    def _evaluate_in_processes(self, workers):
+        def evaluate(indices):
+            for idx in indices:
+                try:
+                    yield idx, self.evaluate(idx)
+                except Exception as e:
+                    raise RuntimeError(f"calibration_strategy_sweep failed on candidate {self.candidates[idx]}") from e
+        results = [None] * len(self.candidates)
+        shards = [list(range(k, len(self.candidates), workers)) for k in range(workers)]
+        for idx, result in run_in_forked_processes(evaluate, shards, 'calibration_strategy_sweep'):
+            results[idx] = result
+        return results
+
+    def float_score(self):
+        fmetrics = copy.deepcopy(self.optimizer.f_metrics)
+        for fm in fmetrics:
+            fm.reset()
+        graph_inference(self.optimizer.g,
+                        self.optimizer.g.forward,
+                        copy.deepcopy(self.optimizer.validation_dataloader),
+                        fmetrics,
+                        with_float=True,
+                        max_batches=self.batches,
+                        disable_tqdm=True,
+                        float_cache=self.optimizer.float_result_cache(self.optimizer.g,
+                                                                      self.optimizer.validation_dataloader))
+        return float(fmetrics[0].compute())
+
+    def sweep(self):
+        if self.optimizer.validation_dataloader is None or len(self.optimizer.q_metrics) < 1:
+            OPT_WARN("calibration_strategy_sweep needs the validation dataset and metric, the sweep is skipped.")
+            return None
+        self.fscore = self.float_score()
+        workers = self.workers
+        if workers > 1 and not forked_processes_available('parallel calibration_strategy_sweep'):
+            workers = 1
+        OPT_INFO(f"calibration_strategy_sweep: evaluating {len(self.candidates)} candidates with {workers} workers")
+        if workers > 1:
+            results = self._evaluate_in_processes(workers)
+        else:
+            results = [self.evaluate(i) for i in range(len(self.candidates))]
+
+        ranked = sorted(range(len(self.candidates)), key=lambda i: (abs(self.fscore - results[i][0]), i))
+        smsg = (f"calibration_strategy_sweep (on {self.batches if self.batches > 0 else 'all'} batches of validation "
+                f"dataset), float metric score [{self.fscore}]:\n")
+        smsg += f"{'rank':>4}  {'activation strategy':<24}  {'weight strategy':<24}  {'metric':>12}  {'drop':>12}  {'time(s)':>8}\n"
+        for rank, i in enumerate(ranked):
+            astrategy, wstrategy = self.candidates[i]
+            qscore, cost = results[i]
+            smsg += (f"{rank + 1:>4}  {astrategy:<24}  {wstrategy:<24}  {qscore:>12.6f}  {self.fscore - qscore:>12.6f}  "
+                     f"{cost:>8.2f}\n")
+        astrategy, wstrategy = self.candidates[ranked[0]]
+        smsg += (f"layers following the global strategies will be calibrated with activation strategy '{astrategy}' "
+                 f"and weight strategy '{wstrategy}'.")
+        OPT_INFO(smsg)
+        self.apply(self.optimizer.g, astrategy, wstrategy)
+        return [(self.candidates[i], results[i]) for i in ranked]
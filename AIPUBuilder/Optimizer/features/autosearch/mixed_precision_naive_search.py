@@ -9,13 +9,15 @@ import copy
 
 class NaiveAutoSearchMixedPrecision(object):
 
-    def __init__(self, g, val_dataloader, fmetrics, qmetrics, hparams):
+    def __init__(self, g, val_dataloader, fmetrics, qmetrics, hparams, float_cache=None):
 
         self.g = g
         self.validation_dataloader = val_dataloader
         self.fmetrics = fmetrics
         self.qmetrics = qmetrics
         self.hparams = hparams
+        # FloatResultCache of g on val_dataloader, if any
+        self.float_cache = float_cache
 
         self.search_times = 0
         self.abatches = 0
@@ -126,7 +128,8 @@ class NaiveAutoSearchMixedPrecision(object):
                         fmetrics,
                         with_float=True,
                         max_batches=self.abatches,
-                        disable_tqdm=True)
+                        disable_tqdm=True,
+                        float_cache=self.float_cache)
         self.fscore = fmetrics[0].compute()
         for fm in fmetrics:
             fm.reset()
@@ -1,4 +1,4 @@
 # SPDX-License-Identifier: Apache-2.0
 # Copyright © 2023 Arm Technology (China) Co. Ltd.
 
-from . calibration import apply_calibration_strategy, apply_global_calibration
+from . calibration import apply_calibration_strategy, apply_calibration_strategies, apply_global_calibration
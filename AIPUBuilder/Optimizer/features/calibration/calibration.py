@@ -5,6 +5,7 @@ from AIPUBuilder.Optimizer.logger import *
 from . local_calibration import *
 from . global_calibration import *
 import torch
+import sys
 import re
 
 
@@ -36,6 +37,34 @@ def apply_calibration_strategy(t, strategy, quantize_method):
             if None != t.running_min_key_axis:
                 t.min_key_axis = t.running_min_key_axis
                 t.max_key_axis = t.running_max_key_axis
+    _include_zero(t)
+
+
+def apply_calibration_strategies(items, desc='calibration'):
+    """
+    apply_calibration_strategy on a list of (tensor, strategy, quantize_method), the kld ones are solved together
+    (see nkld_calibration_batch) instead of one tensor (and one channel) at a time.
+    """
+    kld_items = []
+    other_items = []
+    for t, strategy, quantize_method in items:
+        if strategy and re.match(r'^\d*kld$', strategy.lower().strip()):
+            kld_items.append((t, strategy.lower().strip()))
+        else:
+            other_items.append((t, strategy, quantize_method))
+    with tqdm(total=len(items), desc=desc, file=sys.stdout) as pbar:
+        if len(kld_items) > 0:
+            nkld_calibration_batch([t for t, _ in kld_items], [s for _, s in kld_items])
+            for t, _ in kld_items:
+                _include_zero(t)
+            pbar.update(len(kld_items))
+        for t, strategy, quantize_method in other_items:
+            apply_calibration_strategy(t, strategy, quantize_method)
+            pbar.update(1)
+        pbar.refresh()
+
+
+def _include_zero(t):
     t.min = min(t.min, 0.0)
     t.max = max(t.max, 0.0)
     if None != t.min_key_axis:
@@ -43,7 +72,11 @@ def apply_calibration_strategy(t, strategy, quantize_method):
         t.max_key_axis = torch.max(t.max_key_axis, torch.zeros_like(t.max_key_axis))
 
 
-def apply_global_calibration(g, cdataloader, strategy):
+def apply_global_calibration(g, cdataloader, strategy, memory_budget=0, spill_dir='', schedule='sequential', workers=0):
+    # memory_budget (MB) and spill_dir bound the featuremaps kept by the layer-wise methods, see ActivationStore
+    # schedule and workers decide which layers adaround and adaquant_zy optimize together, see layer_waves
+    schedule = schedule.lower().strip()
+    budget = int(memory_budget * 1024 ** 2)
     cstrategy = strategy.lower().strip()
     from AIPUBuilder.Optimizer.config import GlobalCalibrationParamField
     valid, methods = GlobalCalibrationParamField._parse(cstrategy)
@@ -54,11 +87,11 @@ def apply_global_calibration(g, cdataloader, strategy):
             mparams = method[1]
             mscopes = method[2]
             if 'easy_quant' == mname:
-                easy_quant_global_calibration(g, cdataloader, mparams, mscopes)
+                easy_quant_global_calibration(g, cdataloader, mparams, mscopes, budget, spill_dir)
             elif 'adaround' == mname:
-                adaround_global_calibration(g, cdataloader, mparams, mscopes)
+                adaround_global_calibration(g, cdataloader, mparams, mscopes, budget, spill_dir, schedule, workers)
             elif 'adaquant_zy' == mname:
-                adaquant_zy_global_calibration(g, cdataloader, mparams, mscopes)
+                adaquant_zy_global_calibration(g, cdataloader, mparams, mscopes, budget, spill_dir, schedule, workers)
             elif 'svd_quant' == mname:
                 svd_based_quant_global_calibration(g, cdataloader, mparams, mscopes)
             elif 'mvn_correction' == mname:
@@ -0,0 +1,177 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+__all__ = ['ActivationStore']
+
+
+class ActivationStore(object):
+    """
+    reference-counted store of the activations which a layer-wise global calibration keeps between layers.
+    uses tells how many times each tensor will be released: a tensor is dropped at its last release and the ones
+    never released are not stored at all. the stored tensors live on cpu, and when they exceed budget bytes
+    (0 means no limit) the least recently used ones are spilled into files under spill_dir (a temporary directory by
+    default) and mapped back when requested. prefetch loads spilled tensors in a background thread, so the inputs of
+    the next layer can be read while the current one is being optimized.
+    """
+
+    def __init__(self, uses, budget=0, spill_dir=''):
+        self.uses = dict(uses)
+        self.budget = budget
+        self.spill_root = spill_dir
+        self.spill_dir = None
+        # name -> cpu tensor, the least recently used first
+        self.resident = OrderedDict()
+        self.resident_bytes = 0
+        # name -> (file name, dtype, shape)
+        self.spilled = {}
+        self.prefetching = {}
+        self._files = 0
+        self._lock = threading.RLock()
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __contains__(self, name):
+        return name in self.resident or name in self.spilled
+
+    def put(self, name, tensor):
+        if self.uses.get(name, 0) < 1:
+            return
+        t = tensor.detach().cpu()
+        with self._lock:
+            self._drop(name)
+            self._hold(name, t)
+            self._fit(keep=name)
+
+    def get(self, name, device=None):
+        with self._lock:
+            future = self.prefetching.pop(name, None)
+        if future is not None:
+            future.result()
+        with self._lock:
+            if name in self.resident:
+                self.resident.move_to_end(name)
+                t = self.resident[name]
+            else:
+                t = self._read(*self.spilled[name])
+                self._hold(name, t)
+                self._fit(keep=name)
+        return t if device is None else t.to(device)
+
+    def prefetch(self, names):
+        from concurrent.futures import ThreadPoolExecutor
+        with self._lock:
+            for name in names:
+                if name in self.spilled and name not in self.resident and name not in self.prefetching:
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(max_workers=1)
+                    self.prefetching[name] = self._executor.submit(self._prefetch, name)
+
+    def settle(self):
+        """wait for the pending prefetches, so no background load is in flight, e.g. before forking."""
+        with self._lock:
+            futures = list(self.prefetching.values())
+        for future in futures:
+            future.result()
+
+    def release(self, names):
+        with self._lock:
+            for name in names:
+                if name not in self.uses:
+                    continue
+                self.uses[name] -= 1
+                if self.uses[name] < 1:
+                    self.uses.pop(name)
+                    self._drop(name)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.resident.clear()
+        self.spilled.clear()
+        self.prefetching.clear()
+        self.resident_bytes = 0
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+
+    def _hold(self, name, t):
+        self.resident[name] = t
+        self.resident_bytes += t.numel() * t.element_size()
+
+    def _drop(self, name):
+        t = self.resident.pop(name, None)
+        if t is not None:
+            self.resident_bytes -= t.numel() * t.element_size()
+        spilled = self.spilled.pop(name, None)
+        if spilled is not None:
+            os.remove(spilled[0])
+
+    def _fit(self, keep):
+        while self.budget > 0 and self.resident_bytes > self.budget:
+            victim = next((k for k in self.resident if k != keep), None)
+            if victim is None:
+                break
+            self._spill(victim)
+
+    def _spill(self, name):
+        t = self.resident.pop(name)
+        self.resident_bytes -= t.numel() * t.element_size()
+        if name in self.spilled:
+            # the file written by an earlier spill still holds the same values
+            return
+        import torch
+        if self.spill_dir is None:
+            if self.spill_root:
+                os.makedirs(self.spill_root, exist_ok=True)
+            self.spill_dir = tempfile.mkdtemp(prefix='opt_activations_', dir=self.spill_root or None)
+        fname = os.path.join(self.spill_dir, f'{self._files}.bin')
+        self._files += 1
+        t.contiguous().reshape(-1).view(torch.uint8).numpy().tofile(fname)
+        self.spilled[name] = (fname, t.dtype, list(t.shape))
+
+    @staticmethod
+    def _read(fname, dtype, shape):
+        import torch
+        import numpy as np
+        if os.path.getsize(fname) == 0:
+            return torch.zeros(shape, dtype=dtype)
+        mapped = np.memmap(fname, dtype=np.uint8, mode='c')
+        return torch.from_numpy(np.asarray(mapped)).view(dtype).reshape(shape).clone()
+
+    def _prefetch(self, name):
+        try:
+            self._load(name)
+        finally:
+            # done (or skipped), so a later prefetch of the same tensor is scheduled again
+            with self._lock:
+                self.prefetching.pop(name, None)
+
+    def _load(self, name):
+        with self._lock:
+            if name not in self.spilled:
+                return
+            spilled = self.spilled[name]
+        try:
+            t = self._read(*spilled)
+        except OSError:
+            # released while being prefetched
+            return
+        with self._lock:
+            nbytes = t.numel() * t.element_size()
+            # a prefetch never spills other tensors, it is skipped when the budget is already used up
+            if self.spilled.get(name) is spilled and name not in self.resident and (
+                    self.budget <= 0 or self.resident_bytes + nbytes <= self.budget):
+                self._hold(name, t)
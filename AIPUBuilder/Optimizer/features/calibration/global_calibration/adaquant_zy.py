@@ -3,11 +3,14 @@
 
 from AIPUBuilder.Optimizer.utils import *
 from AIPUBuilder.Optimizer.logger import OPT_INFO, OPT_DEBUG, OPT_WARN
+from . activation_store import ActivationStore
+from . layer_schedule import layer_waves, run_layer_jobs
 import torch
 import sys
 
 
-def adaquant_zy_global_calibration(g, cdataloader, mparams, mscopes):
+def adaquant_zy_global_calibration(g, cdataloader, mparams, mscopes, budget=0, spill_dir='', schedule='sequential',
+                                   workers=0):
     vec = mparams
     batches = int(vec[0] if len(vec) > 0 else 1)
     epochs = int(vec[1] if len(vec) > 1 else 1)
@@ -19,10 +22,12 @@ def adaquant_zy_global_calibration(g, cdataloader, mparams, mscopes):
     msg = (f"adaquant_zy with batches={batches}, epochs={epochs}, batch_size={batch_size}, "
            f"lr_weight={lr_w}, lr_bias={lr_b}, lr_qp_wht={lr_qpw}, lr_qp_act={lr_qpa}")
     OPT_INFO(msg)
-    _adaquant_zy(g, cdataloader, batches, epochs, batch_size, lr_w, lr_b, lr_qpw, lr_qpa, mscopes)
+    _adaquant_zy(g, cdataloader, batches, epochs, batch_size, lr_w, lr_b, lr_qpw, lr_qpa, mscopes, budget, spill_dir,
+                 schedule, workers)
 
 
-def _adaquant_zy(g, cdataloader, batches, epochs, batch_size, lr_w, lr_b, lr_qpw, lr_qpa, mscopes):
+def _adaquant_zy(g, cdataloader, batches, epochs, batch_size, lr_w, lr_b, lr_qpw, lr_qpa, mscopes, budget=0,
+                 spill_dir='', schedule='sequential', workers=0):
     def is_in_scopes(layer_n):
         if len(mscopes) < 1:
             return True
@@ -211,155 +216,166 @@ def _adaquant_zy(g, cdataloader, batches, epochs, batch_size, lr_w, lr_b, lr_qpw
         it.betensor = cached_float_tensors[it.name].to(it.betensor.device)
     for it in qg.input_tensors:
         it.betensor = cached_float_tensors[it.name].to(it.betensor.device)
-    cached_float_tensors = {}
-    with tqdm(total=iterations*epochs*len(g.nodes), desc='adaquant_zy', file=sys.stdout, leave=True) as pbar:
-        for k, n in enumerate(g.nodes):
-            qn = qg.nodes[k]
-            # move inputs to device
-            for it in n.inputs:
-                cached_float_tensors[it.name] = cached_float_tensors[it.name].to(it.betensor.device)
-            # forward featuremaps on float graph
-            for it in n.inputs:
-                it.betensor = cached_float_tensors[it.name]
-            n.current_batch_size = sample_num
-            n.current_batch_idx = 0
-            n.forward()
-            for ot in n.outputs:
-                if len(ot.betensor.shape) < 1 or ot.betensor.shape[0] != sample_num:
-                    # no batch dim
-                    abnormal_tensors[ot.name] = True
-                    OPT_WARN(f"{n.name} type={n.type} layer_id={n.attrs['layer_id']} batch dim is abnormal: expect batch_dim=0 and batches={sample_num}, but got shape={ot.betensor.shape}."
-                             f"you may try to set batch_size = calibration_batch_size x batches or batch_size=calibration_batch_size=batches=1", log_once=True)
-                if ot.name not in cached_float_tensors.keys():
-                    cached_float_tensors[ot.name] = ot.betensor
-            # apply adaround on current layer
-            unquantifiable = n.get_param('unquantifiable', optional=True, default_value=False)
-            if n.type != OpType.Input and not unquantifiable and is_in_scopes(n):
-                only_optim_inp = True
-                if 'weights' in n.constants and n.type not in [OpType.GRUv3, OpType.GRUv1]:
-                    only_optim_inp = False
-                qmodule = QNodeModule(n, qn, lr_w, lr_b, lr_qpw, lr_qpa, only_optim_inp)
-                cur_iter = 0
-                scheduler_qpa = torch.optim.lr_scheduler.CosineAnnealingLR(
-                    qmodule.optim_qpa, epochs*iterations) if qmodule.optim_qpa else None
-                for _ in range(epochs):
-                    cur_rand_indices = torch.randperm(sample_num)
-                    cur_batch_idx = 0
-                    for i in range(iterations):
-                        cur_float_inp = []
-                        cur_float_out = []
-                        indices = cur_rand_indices[i*batch_size: (i+1)*batch_size]
-                        for it in n.inputs:
-                            t = cached_float_tensors[it.name] if it.name in abnormal_tensors.keys(
-                            ) else cached_float_tensors[it.name][indices]
-                            cur_float_inp.append(t)
-                        for ot in n.outputs:
-                            t = cached_float_tensors[ot.name] if ot.name in abnormal_tensors.keys(
-                            ) else cached_float_tensors[ot.name][indices]
-                            cur_float_out.append(t)
-                        qmodule.n.current_batch_idx = cur_batch_idx
-                        qmodule.n.current_batch_size = batch_size
-                        qmodule.forward(cur_float_inp)
 
-                        def get_act_func_ret(n, idx, x):
-                            for chl in n.children:
-                                if n.outputs[idx] in chl.inputs and OpType.Activation == chl.type:
-                                    chl.inputs[0].betensor = x
-                                    chl.current_batch_idx = cur_batch_idx
-                                    chl.current_batch_size = batch_size
-                                    chl.forward()
-                                    y = chl.outputs[0].betensor
-                                    return y
-                            return x
-                        cur_qmodule_out = []
-                        for idx, ot in enumerate(qmodule.n.outputs):
-                            yp = get_act_func_ret(n, idx, ot.betensor)
-                            cur_qmodule_out.append(yp)
-                            yg = get_act_func_ret(n, idx, cur_float_out[idx])
-                            cur_float_out[idx] = yg
-                        if len(cur_qmodule_out) < 2:
-                            pt = cur_qmodule_out[0]
-                        else:
-                            pt = torch.cat([t.flatten() for t in cur_qmodule_out])
-                        if len(cur_float_out) < 2:
-                            gt = cur_float_out[0]
-                        else:
-                            gt = torch.cat([t.flatten() for t in cur_float_out])
-                        loss = torch.nn.functional.mse_loss(pt.double(), gt.double())
-                        qmodule.zero_grad()
-                        try:
-                            loss.backward()
-                        except:
-                            OPT_DEBUG("Adaquant optimization of layer_id=%s, %s, %s\n does not support backward." % (
-                                str(n.attrs['layer_id']), str(n.type), n.name))
-                        qmodule.step()
-                        if 0 == cur_iter % 100:
-                            OPT_DEBUG("Adaquant optimization of layer_id=%s, %s, %s\n iterations=%d, loss=%.5f " % (
-                                str(n.attrs['layer_id']), str(n.type), n.name, cur_iter, float(loss)))
-                        cur_iter += 1
-                        cur_batch_idx += 1
-                        pbar.update(1)
-                        if scheduler_qpa:
-                            scheduler_qpa.step()
-                            # print(qmodule.optim_qpa.param_groups[0]["lr"])
-                for ii, ti in enumerate(n.inputs):
-                    ti.min, ti.max = qmodule.get_optimized_inp_range(ii)
-                if not only_optim_inp:
+    def is_optimizable(n):
+        unquantifiable = n.get_param('unquantifiable', optional=True, default_value=False)
+        return n.type != OpType.Input and not unquantifiable and is_in_scopes(n)
+
+    # the float featuremaps of the layers being optimized in the current wave: k -> (inputs and outputs)
+    layer_data = {}
+
+    def optimize_layer(k):
+        n, qn = g.nodes[k], qg.nodes[k]
+        cached_float_tensors = layer_data[k]
+        only_optim_inp = True
+        if 'weights' in n.constants and n.type not in [OpType.GRUv3, OpType.GRUv1]:
+            only_optim_inp = False
+        qmodule = QNodeModule(n, qn, lr_w, lr_b, lr_qpw, lr_qpa, only_optim_inp)
+        cur_iter = 0
+        scheduler_qpa = torch.optim.lr_scheduler.CosineAnnealingLR(
+            qmodule.optim_qpa, epochs*iterations) if qmodule.optim_qpa else None
+        for _ in range(epochs):
+            cur_rand_indices = torch.randperm(sample_num)
+            cur_batch_idx = 0
+            for i in range(iterations):
+                cur_float_inp = []
+                cur_float_out = []
+                indices = cur_rand_indices[i*batch_size: (i+1)*batch_size]
+                for it in n.inputs:
+                    t = cached_float_tensors[it.name] if it.name in abnormal_tensors.keys(
+                    ) else cached_float_tensors[it.name][indices]
+                    cur_float_inp.append(t)
+                for ot in n.outputs:
+                    t = cached_float_tensors[ot.name] if ot.name in abnormal_tensors.keys(
+                    ) else cached_float_tensors[ot.name][indices]
+                    cur_float_out.append(t)
+                qmodule.n.current_batch_idx = cur_batch_idx
+                qmodule.n.current_batch_size = batch_size
+                qmodule.forward(cur_float_inp)
+
+                def get_act_func_ret(n, idx, x):
+                    for chl in n.children:
+                        if n.outputs[idx] in chl.inputs and OpType.Activation == chl.type:
+                            chl.inputs[0].betensor = x
+                            chl.current_batch_idx = cur_batch_idx
+                            chl.current_batch_size = batch_size
+                            chl.forward()
+                            y = chl.outputs[0].betensor
+                            return y
+                    return x
+                cur_qmodule_out = []
+                for idx, ot in enumerate(qmodule.n.outputs):
+                    yp = get_act_func_ret(n, idx, ot.betensor)
+                    cur_qmodule_out.append(yp)
+                    yg = get_act_func_ret(n, idx, cur_float_out[idx])
+                    cur_float_out[idx] = yg
+                if len(cur_qmodule_out) < 2:
+                    pt = cur_qmodule_out[0]
+                else:
+                    pt = torch.cat([t.flatten() for t in cur_qmodule_out])
+                if len(cur_float_out) < 2:
+                    gt = cur_float_out[0]
+                else:
+                    gt = torch.cat([t.flatten() for t in cur_float_out])
+                loss = torch.nn.functional.mse_loss(pt.double(), gt.double())
+                qmodule.zero_grad()
+                try:
+                    loss.backward()
+                except:
+                    OPT_DEBUG("Adaquant optimization of layer_id=%s, %s, %s\n does not support backward." % (
+                        str(n.attrs['layer_id']), str(n.type), n.name))
+                qmodule.step()
+                if 0 == cur_iter % 100:
+                    OPT_DEBUG("Adaquant optimization of layer_id=%s, %s, %s\n iterations=%d, loss=%.5f " % (
+                        str(n.attrs['layer_id']), str(n.type), n.name, cur_iter, float(loss)))
+                cur_iter += 1
+                cur_batch_idx += 1
+                if scheduler_qpa:
+                    scheduler_qpa.step()
+                    # print(qmodule.optim_qpa.param_groups[0]["lr"])
+        # the optimized ranges and constants, they are applied to the float graph in g.nodes order by the caller
+        result = {'inputs': [qmodule.get_optimized_inp_range(ii) for ii in range(len(n.inputs))]}
+        if not only_optim_inp:
+            result['weights_range'] = qmodule.get_optimized_weights_range()
+            result['weights'] = qmodule.get_optimized_weights().clone().detach()
+            if 'biases' in n.constants:
+                result['biases'] = qmodule.get_optimized_biases().clone().detach()
+        return result
+
+    def reset_layer_tensors(n):
+        for t in n.inputs:
+            ss = None
+            try:
+                ss = list(t.ir_shape)
+            except:
+                ss = list(t.shape)
+            t.betensor = torch.zeros(ss, device=t.betensor.device)
+        for t in n.outputs:
+            ss = None
+            try:
+                ss = list(t.ir_shape)
+            except:
+                ss = list(t.shape)
+            t.betensor = torch.zeros(ss, device=t.betensor.device)
+        for t in n.placeholders:
+            ss = None
+            try:
+                ss = list(t.ir_shape)
+            except:
+                ss = list(t.shape)
+            t.betensor = torch.zeros(ss, device=t.betensor.device)
+
+    # every layer is optimized from float featuremaps only, so the layers of a wave never depend on each other
+    waves = layer_waves(g, schedule, workers, is_optimizable)
+    cached_tensors = ActivationStore(ref_count_float_tensors, budget, spill_dir)
+    with cached_tensors, tqdm(total=iterations*epochs*len(g.nodes), desc='adaquant_zy', file=sys.stdout, leave=True) as pbar:
+        for w, wave in enumerate(waves):
+            if w + 1 < len(waves):
+                cached_tensors.prefetch([it.name for k in waves[w + 1] for it in g.nodes[k].inputs])
+            layer_data.clear()
+            for k in wave:
+                n = g.nodes[k]
+                # forward featuremaps on float graph
+                cached_float_tensors = {}
+                for it in n.inputs:
+                    cached_float_tensors[it.name] = cached_tensors.get(it.name, it.betensor.device)
+                    it.betensor = cached_float_tensors[it.name]
+                n.current_batch_size = sample_num
+                n.current_batch_idx = 0
+                n.forward()
+                for ot in n.outputs:
+                    if len(ot.betensor.shape) < 1 or ot.betensor.shape[0] != sample_num:
+                        # no batch dim
+                        abnormal_tensors[ot.name] = True
+                        OPT_WARN(f"{n.name} type={n.type} layer_id={n.attrs['layer_id']} batch dim is abnormal: expect batch_dim=0 and batches={sample_num}, but got shape={ot.betensor.shape}."
+                                 f"you may try to set batch_size = calibration_batch_size x batches or batch_size=calibration_batch_size=batches=1", log_once=True)
+                    cached_float_tensors[ot.name] = ot.betensor
+                    cached_tensors.put(ot.name, ot.betensor)
+                if is_optimizable(n):
+                    layer_data[k] = cached_float_tensors
+            # apply adaquant on the layers of this wave
+            jobs = [k for k in wave if k in layer_data]
+            if len(jobs) > 1 and workers > 1:
+                cached_tensors.settle()
+            for k, result in zip(jobs, run_layer_jobs(optimize_layer, jobs, workers)):
+                n, qn = g.nodes[k], qg.nodes[k]
+                for ti, (tmin, tmax) in zip(n.inputs, result['inputs']):
+                    ti.min, ti.max = tmin, tmax
+                if 'weights' in result:
                     tw = n.constants['weights']
-                    wmin, wmax = qmodule.get_optimized_weights_range()
+                    wmin, wmax = result['weights_range']
                     if isinstance(wmin, torch.Tensor):
                         tw.min_key_axis, tw.max_key_axis = wmin, wmax
                     else:
                         tw.min, tw.max = wmin, wmax
                     # record adaround weights to source node
-                    n.attrs['adaquant_weights'] = {
-                        qn.attrs['q_bits_weight']: qmodule.get_optimized_weights().clone().detach()}
-                    if 'biases' in n.constants:
-                        n.attrs['adaquant_biases'] = {
-                            qn.attrs['q_bits_bias']: qmodule.get_optimized_biases().clone().detach()}
-            else:
+                    n.attrs['adaquant_weights'] = {qn.attrs['q_bits_weight']: result['weights']}
+                    if 'biases' in result:
+                        n.attrs['adaquant_biases'] = {qn.attrs['q_bits_bias']: result['biases']}
+            layer_data.clear()
+            for k in wave:
+                n = g.nodes[k]
+                # reduce tensor's reference count, the featuremaps without consumers left are dropped from the cache
+                cached_tensors.release([it.name for it in n.inputs])
+                reset_layer_tensors(n)
                 pbar.update(iterations*epochs)
-
-            # reduce tensor's reference count
-            for it in n.inputs:
-                ref_count_float_tensors[it.name] -= 1
-            # clear useless tensors out of cache for memory saving
-            useless_tnames = []
-            for rkey, rval in ref_count_float_tensors.items():
-                if rval < 1:
-                    useless_tnames.append(rkey)
-            for rkey in useless_tnames:
-                if rkey in cached_float_tensors.keys():
-                    rval = cached_float_tensors.pop(rkey)
-                    del rval
-            # move tensors back to cpu
-            for t in n.inputs:
-                if t.name in cached_float_tensors.keys():
-                    cached_float_tensors[t.name] = cached_float_tensors[t.name].cpu()
-            for t in n.outputs:
-                if t.name in cached_float_tensors.keys():
-                    cached_float_tensors[t.name] = cached_float_tensors[t.name].cpu()
-
-            def reset_layer_tensors(n):
-                for t in n.inputs:
-                    ss = None
-                    try:
-                        ss = list(t.ir_shape)
-                    except:
-                        ss = list(t.shape)
-                    t.betensor = torch.zeros(ss, device=t.betensor.device)
-                for t in n.outputs:
-                    ss = None
-                    try:
-                        ss = list(t.ir_shape)
-                    except:
-                        ss = list(t.shape)
-                    t.betensor = torch.zeros(ss, device=t.betensor.device)
-                for t in n.placeholders:
-                    ss = None
-                    try:
-                        ss = list(t.ir_shape)
-                    except:
-                        ss = list(t.shape)
-                    t.betensor = torch.zeros(ss, device=t.betensor.device)
-            reset_layer_tensors(n)
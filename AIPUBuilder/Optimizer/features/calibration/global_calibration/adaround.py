@@ -3,11 +3,14 @@
 
 from AIPUBuilder.Optimizer.utils import *
 from AIPUBuilder.Optimizer.logger import OPT_INFO, OPT_DEBUG, OPT_WARN
+from . activation_store import ActivationStore
+from . layer_schedule import layer_waves, run_layer_jobs
 import torch
 import sys
 
 
-def adaround_global_calibration(g, cdataloader, mparams, mscopes):
+def adaround_global_calibration(g, cdataloader, mparams, mscopes, budget=0, spill_dir='', schedule='sequential',
+                                workers=0):
     vec = mparams
     batches = int(vec[0] if len(vec) > 0 else 1)
     epochs = int(vec[1] if len(vec) > 1 else 1)
@@ -21,10 +24,12 @@ def adaround_global_calibration(g, cdataloader, mparams, mscopes):
     msg = (f"adaround with batches={batches}, epochs={epochs}, batch_size={batch_size}, lr={lrate}, "
            f"reg_param={reg_param}, beta_start={beta_start}, beta_end={beta_end}, warm_start={warm_start}")
     OPT_INFO(msg)
-    _adaround(g, cdataloader, batches, epochs, batch_size, lrate, reg_param, beta_start, beta_end, warm_start, mscopes)
+    _adaround(g, cdataloader, batches, epochs, batch_size, lrate, reg_param, beta_start, beta_end, warm_start, mscopes,
+              budget, spill_dir, schedule, workers)
 
 
-def _adaround(g, cdataloader, batches, epochs, batch_size, lrate, reg_param, beta_start, beta_end, warm_start, mscopes):
+def _adaround(g, cdataloader, batches, epochs, batch_size, lrate, reg_param, beta_start, beta_end, warm_start, mscopes,
+              budget=0, spill_dir='', schedule='sequential', workers=0):
     def is_in_scopes(layer_n):
         if len(mscopes) < 1:
             return True
@@ -137,14 +142,14 @@ def _adaround(g, cdataloader, batches, epochs, batch_size, lrate, reg_param, bet
                 t = torch.cat((t, t), dim=0)
             cached_float_tensors[key] = t[:batch_size]
         sample_num = cached_float_tensors[key].shape[0]
-    # count each tensor's reference count
-    ref_count_float_tensors = {}
+    # float_input schedule reconstructs each layer from its float inputs, the quant graph is not forwarded at all
+    kinds = ('float', ) if schedule == 'float_input' else ('float', 'quant')
+    # count each tensor's reference count, float and quant featuremaps are released together
+    ref_count_tensors = {}
     for n in g.nodes:
         for inp in n.inputs:
-            if inp.name not in ref_count_float_tensors.keys():
-                ref_count_float_tensors[inp.name] = 1
-            else:
-                ref_count_float_tensors[inp.name] += 1
+            for kind in kinds:
+                ref_count_tensors[(kind, inp.name)] = ref_count_tensors.get((kind, inp.name), 0) + 1
     # optimize each node
     iterations = sample_num // batch_size
     abnormal_tensors = {}
@@ -152,160 +157,168 @@ def _adaround(g, cdataloader, batches, epochs, batch_size, lrate, reg_param, bet
         it.betensor = cached_float_tensors[it.name].to(it.betensor.device)
     for it in qg.input_tensors:
         it.betensor = cached_float_tensors[it.name].to(it.betensor.device)
-    cached_float_tensors = {}
-    cached_quant_tensors = {}
-    with tqdm(total=iterations*epochs*len(g.nodes), desc='adaround', file=sys.stdout, leave=True) as pbar:
-        for k, n in enumerate(g.nodes):
-            qn = qg.nodes[k]
-            # move inputs to device
-            for it in n.inputs:
-                cached_float_tensors[it.name] = cached_float_tensors[it.name].to(it.betensor.device)
-                cached_quant_tensors[it.name] = cached_quant_tensors[it.name].to(it.betensor.device)
-            # forward featuremaps on float graph
-            for it in n.inputs:
-                it.betensor = cached_float_tensors[it.name]
-            n.current_batch_size = sample_num
-            n.current_batch_idx = 0
-            n.forward()
-            for ot in n.outputs:
-                if len(ot.betensor.shape) < 1 or ot.betensor.shape[0] != sample_num:
-                    # no batch dim
-                    abnormal_tensors[ot.name] = True
-                    OPT_WARN(f"{n.name} type={n.type} layer_id={n.attrs['layer_id']} batch dim is abnormal: expect batch_dim=0 and batches={sample_num}, but got shape={ot.betensor.shape}."
-                             f"you may try to set batches == batch_size or batches=batch_size=1", log_once=True)
-                if ot.name not in cached_float_tensors.keys():
-                    cached_float_tensors[ot.name] = ot.betensor
-            # apply adaround on current layer
-            unquantifiable = n.get_param('unquantifiable', optional=True, default_value=False)
-            if 'weights' in n.constants and not unquantifiable and n.type not in [OpType.GRUv3, OpType.GRUv1] and is_in_scopes(n):
-                qmodule = QNodeModule(n, qn)
-                optim = torch.optim.Adam([qmodule.alpha], lr=lrate)
-                cur_iter = 0
-                for _ in range(epochs):
-                    cur_rand_indices = torch.randperm(sample_num)
-                    cur_batch_idx = 0
-                    for i in range(iterations):
-                        optim.zero_grad()
-                        cur_float_inp = []
-                        cur_float_out = []
-                        indices = cur_rand_indices[i*batch_size: (i+1)*batch_size]
-                        for it in n.inputs:
-                            t = cached_float_tensors[it.name] if it.name in abnormal_tensors.keys(
-                            ) else cached_float_tensors[it.name][indices]
-                            cur_float_inp.append(t)
-                        for ot in n.outputs:
-                            t = cached_float_tensors[ot.name] if ot.name in abnormal_tensors.keys(
-                            ) else cached_float_tensors[ot.name][indices]
-                            cur_float_out.append(t)
-                        cur_qmodule_inp = []
-                        for it in qn.inputs:
-                            t = cached_quant_tensors[it.name] if it.name in abnormal_tensors.keys(
-                            ) else cached_quant_tensors[it.name][indices]
-                            t = linear_dequantize(t, it.scale, it.zerop)
-                            cur_qmodule_inp.append(t)
-                        qmodule.n.current_batch_idx = cur_batch_idx
-                        qmodule.n.current_batch_size = batch_size
-                        qmodule.forward(cur_qmodule_inp)
 
-                        def get_act_func_ret(n, idx, x):
-                            for chl in n.children:
-                                if n.outputs[idx] in chl.inputs and OpType.Activation == chl.type:
-                                    chl.inputs[0].betensor = x
-                                    chl.current_batch_idx = cur_batch_idx
-                                    chl.current_batch_size = batch_size
-                                    chl.forward()
-                                    y = chl.outputs[0].betensor
-                                    return y
-                            return x
-                        cur_qmodule_out = []
-                        for idx, ot in enumerate(qmodule.n.outputs):
-                            yp = get_act_func_ret(n, idx, ot.betensor)
-                            cur_qmodule_out.append(yp)
-                            yg = get_act_func_ret(n, idx, cur_float_out[idx])
-                            cur_float_out[idx] = yg
-                        if len(cur_qmodule_out) < 2:
-                            pt = cur_qmodule_out[0]
-                        else:
-                            pt = torch.cat([t.flatten() for t in cur_qmodule_out])
-                        if len(cur_float_out) < 2:
-                            gt = cur_float_out[0]
+    def is_optimizable(n):
+        unquantifiable = n.get_param('unquantifiable', optional=True, default_value=False)
+        return 'weights' in n.constants and not unquantifiable and n.type not in [OpType.GRUv3, OpType.GRUv1] and is_in_scopes(n)
+
+    # the featuremaps of the layers being optimized in the current wave: k -> (float inputs, float outputs, qmodule inputs)
+    layer_data = {}
+
+    def optimize_layer(k):
+        n, qn = g.nodes[k], qg.nodes[k]
+        cached_float_tensors, cached_float_outputs, cur_qmodule_tensors = layer_data[k]
+        qmodule = QNodeModule(n, qn)
+        optim = torch.optim.Adam([qmodule.alpha], lr=lrate)
+        cur_iter = 0
+        for _ in range(epochs):
+            cur_rand_indices = torch.randperm(sample_num)
+            cur_batch_idx = 0
+            for i in range(iterations):
+                optim.zero_grad()
+                cur_float_inp = []
+                cur_float_out = []
+                indices = cur_rand_indices[i*batch_size: (i+1)*batch_size]
+                for it in n.inputs:
+                    t = cached_float_tensors[it.name] if it.name in abnormal_tensors.keys(
+                    ) else cached_float_tensors[it.name][indices]
+                    cur_float_inp.append(t)
+                for ot in n.outputs:
+                    t = cached_float_outputs[ot.name] if ot.name in abnormal_tensors.keys(
+                    ) else cached_float_outputs[ot.name][indices]
+                    cur_float_out.append(t)
+                cur_qmodule_inp = []
+                for it in qn.inputs:
+                    t = cur_qmodule_tensors[it.name] if it.name in abnormal_tensors.keys(
+                    ) else cur_qmodule_tensors[it.name][indices]
+                    cur_qmodule_inp.append(t)
+                qmodule.n.current_batch_idx = cur_batch_idx
+                qmodule.n.current_batch_size = batch_size
+                qmodule.forward(cur_qmodule_inp)
+
+                def get_act_func_ret(n, idx, x):
+                    for chl in n.children:
+                        if n.outputs[idx] in chl.inputs and OpType.Activation == chl.type:
+                            chl.inputs[0].betensor = x
+                            chl.current_batch_idx = cur_batch_idx
+                            chl.current_batch_size = batch_size
+                            chl.forward()
+                            y = chl.outputs[0].betensor
+                            return y
+                    return x
+                cur_qmodule_out = []
+                for idx, ot in enumerate(qmodule.n.outputs):
+                    yp = get_act_func_ret(n, idx, ot.betensor)
+                    cur_qmodule_out.append(yp)
+                    yg = get_act_func_ret(n, idx, cur_float_out[idx])
+                    cur_float_out[idx] = yg
+                if len(cur_qmodule_out) < 2:
+                    pt = cur_qmodule_out[0]
+                else:
+                    pt = torch.cat([t.flatten() for t in cur_qmodule_out])
+                if len(cur_float_out) < 2:
+                    gt = cur_float_out[0]
+                else:
+                    gt = torch.cat([t.flatten() for t in cur_float_out])
+                recon_loss = qmodule.reconstruction_loss(gt, pt)
+                round_loss = qmodule.regularization_term(
+                    reg_param, beta_start, beta_end, warm_start, iterations*epochs, cur_iter)
+                total_loss = recon_loss + round_loss
+                total_loss.backward()
+                optim.step()
+                if 0 == cur_iter % 100:
+                    OPT_DEBUG("Adaround optimization of layer_id=%s, %s, %s\n iterations=%d, loss=%.5f, recon_loss=%.5f, round_loss=%.5f" % (
+                        str(n.attrs['layer_id']), str(n.type), n.name, cur_iter, float(total_loss), float(recon_loss), float(round_loss)))
+                cur_iter += 1
+                cur_batch_idx += 1
+        wq = qmodule.get_optimized_weights().detach()
+        return wq, linear_dequantize(wq, qmodule.wscale, qmodule.wzerop)
+
+    def reset_layer_tensors(n):
+        for t in n.inputs:
+            ss = None
+            try:
+                ss = list(t.ir_shape)
+            except:
+                ss = list(t.shape)
+            t.betensor = torch.zeros(ss, device=t.betensor.device)
+        for t in n.outputs:
+            ss = None
+            try:
+                ss = list(t.ir_shape)
+            except:
+                ss = list(t.shape)
+            t.betensor = torch.zeros(ss, device=t.betensor.device)
+        for t in n.placeholders:
+            ss = None
+            try:
+                ss = list(t.ir_shape)
+            except:
+                ss = list(t.shape)
+            t.betensor = torch.zeros(ss, device=t.betensor.device)
+
+    waves = layer_waves(g, schedule, workers, is_optimizable)
+    cached_tensors = ActivationStore(ref_count_tensors, budget, spill_dir)
+    with cached_tensors, tqdm(total=iterations*epochs*len(g.nodes), desc='adaround', file=sys.stdout, leave=True) as pbar:
+        for w, wave in enumerate(waves):
+            if w + 1 < len(waves):
+                cached_tensors.prefetch([(kind, it.name) for k in waves[w + 1]
+                                         for it in g.nodes[k].inputs for kind in kinds])
+            layer_data.clear()
+            for k in wave:
+                n = g.nodes[k]
+                # forward featuremaps on float graph
+                cached_float_tensors = {}
+                for it in n.inputs:
+                    cached_float_tensors[it.name] = cached_tensors.get(('float', it.name), it.betensor.device)
+                    it.betensor = cached_float_tensors[it.name]
+                n.current_batch_size = sample_num
+                n.current_batch_idx = 0
+                n.forward()
+                cached_float_outputs = {}
+                for ot in n.outputs:
+                    if len(ot.betensor.shape) < 1 or ot.betensor.shape[0] != sample_num:
+                        # no batch dim
+                        abnormal_tensors[ot.name] = True
+                        OPT_WARN(f"{n.name} type={n.type} layer_id={n.attrs['layer_id']} batch dim is abnormal: expect batch_dim=0 and batches={sample_num}, but got shape={ot.betensor.shape}."
+                                 f"you may try to set batches == batch_size or batches=batch_size=1", log_once=True)
+                    cached_float_outputs[ot.name] = ot.betensor
+                    cached_tensors.put(('float', ot.name), ot.betensor)
+                if is_optimizable(n):
+                    # the quantized path of the layer starts from the dequantized quant featuremaps,
+                    # or from the float ones in the float_input schedule
+                    qmodule_tensors = {}
+                    for it in qg.nodes[k].inputs:
+                        if schedule == 'float_input':
+                            qmodule_tensors[it.name] = cached_float_tensors[it.name]
                         else:
-                            gt = torch.cat([t.flatten() for t in cur_float_out])
-                        recon_loss = qmodule.reconstruction_loss(gt, pt)
-                        round_loss = qmodule.regularization_term(
-                            reg_param, beta_start, beta_end, warm_start, iterations*epochs, cur_iter)
-                        total_loss = recon_loss + round_loss
-                        total_loss.backward()
-                        optim.step()
-                        if 0 == cur_iter % 100:
-                            OPT_DEBUG("Adaround optimization of layer_id=%s, %s, %s\n iterations=%d, loss=%.5f, recon_loss=%.5f, round_loss=%.5f" % (
-                                str(n.attrs['layer_id']), str(n.type), n.name, cur_iter, float(total_loss), float(recon_loss), float(round_loss)))
-                        cur_iter += 1
-                        cur_batch_idx += 1
-                        pbar.update(1)
+                            t = cached_tensors.get(('quant', it.name), it.betensor.device)
+                            qmodule_tensors[it.name] = linear_dequantize(t, it.scale, it.zerop)
+                    layer_data[k] = (cached_float_tensors, cached_float_outputs, qmodule_tensors)
+            # apply adaround on the layers of this wave
+            jobs = [k for k in wave if k in layer_data]
+            if len(jobs) > 1 and workers > 1:
+                cached_tensors.settle()
+            for k, (wq, wf) in zip(jobs, run_layer_jobs(optimize_layer, jobs, workers)):
+                n, qn = g.nodes[k], qg.nodes[k]
                 qnw = qn.constants['weights']
-                qnw.betensor = qmodule.get_optimized_weights()
+                qnw.betensor = wq.to(qnw.betensor.device)
                 # record adaround weights to source node
-                n.attrs['adaround_weights'] = {qn.attrs['q_bits_weight']: linear_dequantize(qnw.betensor, qmodule.wscale, qmodule.wzerop)}
-            else:
+                n.attrs['adaround_weights'] = {qn.attrs['q_bits_weight']: wf.to(qnw.betensor.device)}
+            layer_data.clear()
+            for k in wave:
+                n, qn = g.nodes[k], qg.nodes[k]
+                if schedule != 'float_input':
+                    # forward featuremaps on quant graph
+                    for it in qn.inputs:
+                        it.betensor = cached_tensors.get(('quant', it.name), it.betensor.device)
+                    qn.current_batch_size = sample_num
+                    qn.current_batch_idx = 0
+                    qn.forward()
+                    for ot in qn.outputs:
+                        cached_tensors.put(('quant', ot.name), ot.betensor)
+                # reduce tensor's reference count, the featuremaps without consumers left are dropped from the cache
+                cached_tensors.release([(kind, it.name) for it in n.inputs for kind in kinds])
+                reset_layer_tensors(n)
+                reset_layer_tensors(qn)
                 pbar.update(iterations*epochs)
-            # forward featuremaps on quant graph
-            for it in qn.inputs:
-                it.betensor = cached_quant_tensors[it.name]
-            qn.current_batch_size = sample_num
-            qn.current_batch_idx = 0
-            qn.forward()
-            for ot in qn.outputs:
-                if ot.name not in cached_quant_tensors.keys():
-                    cached_quant_tensors[ot.name] = ot.betensor
-            # reduce tensor's reference count
-            for it in n.inputs:
-                ref_count_float_tensors[it.name] -= 1
-            # clear useless tensors out of cache for memory saving
-            useless_tnames = []
-            for rkey, rval in ref_count_float_tensors.items():
-                if rval < 1:
-                    useless_tnames.append(rkey)
-            for rkey in useless_tnames:
-                if rkey in cached_float_tensors.keys():
-                    rval = cached_float_tensors.pop(rkey)
-                    del rval
-                if rkey in cached_quant_tensors.keys():
-                    rval = cached_quant_tensors.pop(rkey)
-                    del rval
-            # move tensors back to cpu
-            for t in n.inputs:
-                if t.name in cached_float_tensors.keys():
-                    cached_float_tensors[t.name] = cached_float_tensors[t.name].cpu()
-                if t.name in cached_quant_tensors.keys():
-                    cached_quant_tensors[t.name] = cached_quant_tensors[t.name].cpu()
-            for t in n.outputs:
-                if t.name in cached_float_tensors.keys():
-                    cached_float_tensors[t.name] = cached_float_tensors[t.name].cpu()
-                if t.name in cached_quant_tensors.keys():
-                    cached_quant_tensors[t.name] = cached_quant_tensors[t.name].cpu()
-
-            def reset_layer_tensors(n):
-                for t in n.inputs:
-                    ss = None
-                    try:
-                        ss = list(t.ir_shape)
-                    except:
-                        ss = list(t.shape)
-                    t.betensor = torch.zeros(ss, device=t.betensor.device)
-                for t in n.outputs:
-                    ss = None
-                    try:
-                        ss = list(t.ir_shape)
-                    except:
-                        ss = list(t.shape)
-                    t.betensor = torch.zeros(ss, device=t.betensor.device)
-                for t in n.placeholders:
-                    ss = None
-                    try:
-                        ss = list(t.ir_shape)
-                    except:
-                        ss = list(t.shape)
-                    t.betensor = torch.zeros(ss, device=t.betensor.device)
-            reset_layer_tensors(n)
-            reset_layer_tensors(qn)
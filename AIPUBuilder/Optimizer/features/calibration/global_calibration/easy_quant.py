@@ -2,11 +2,12 @@
 # Copyright © 2023 Arm Technology (China) Co. Ltd.
 
 from AIPUBuilder.Optimizer.utils import *
+from . activation_store import ActivationStore
 import torch
 import sys
 
 
-def easy_quant_global_calibration(g, cdataloader, mparams, mscopes):
+def easy_quant_global_calibration(g, cdataloader, mparams, mscopes, budget=0, spill_dir=''):
     vec = mparams
     batches = int(vec[0] if len(vec) > 0 else 1)
     epochs = int(vec[1] if len(vec) > 1 else 1)
@@ -17,12 +18,29 @@ def easy_quant_global_calibration(g, cdataloader, mparams, mscopes):
     msg = (f"easy_quant with batches={batches}, epochs={epochs}, alpha={alpha}, "
            f"beta={beta}, nsteps={nsteps}, ngroups={ngroups}")
     OPT_INFO(msg)
-    _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, mscopes)
+    _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, mscopes, budget, spill_dir)
 
 
-def _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, mscopes):
+def _best_candidate(n, candidates, baseline):
+    """
+    index of the candidate (the list of output tensors of a candidate node) most similar to the outputs of n, scored
+    all at once, the first best one wins as in a one by one search. None means no candidate beats baseline.
+    """
+    if len(candidates) < 1:
+        return None
+    scores = layer_similarities(n, candidates)
+    best = int(torch.argmax(scores).item())
+    # the batched cosine may differ in the last bits from layer_similarity, which gives baseline, so the winner is
+    # scored again the same way: a candidate only as good as the baseline must not replace it
+    score = cosine_distance(torch.cat([t.betensor.reshape(-1).float() for t in n.outputs]),
+                            torch.cat([t.reshape(-1).float() for t in candidates[best]]))
+    return best if score > baseline else None
+
+
+def _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, mscopes, budget=0, spill_dir=''):
     import copy
     from AIPUBuilder.Optimizer.logger import tqdm
+    from AIPUBuilder.Optimizer.framework.pycore.pytensor import PyTensor
 
     def is_in_scopes(layer_n):
         if len(mscopes) < 1:
@@ -39,6 +57,18 @@ def _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, m
     # prevent deleting intermediate tensors
     g.ref_count_tensors = {}
     vdataloader = copy.deepcopy(cdataloader)
+    consumers = {}
+    for n in g.nodes:
+        for inp in n.inputs:
+            consumers[inp.name] = consumers.get(inp.name, 0) + 1
+    # the second pass reads the float featuremaps of the first one: each of them is used by its producer
+    # and by its consumers
+    float_uses = {t.name: 1 + consumers.get(t.name, 0) for n in g.nodes for t in n.outputs}
+    tz = PyTensor('null').betensor
+
+    def free(tensors):
+        for t in tensors:
+            t.betensor = tz
     with tqdm(total=batches*epochs*len(g.nodes)*2, desc='easy_quant', file=sys.stdout, leave=True) as pbar:
         for i, sample in enumerate(vdataloader):
             if i >= max(1, batches):  # to save forward times, move batches loop outside instead of calculating mean cos similarity of batches
@@ -62,6 +92,8 @@ def _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, m
                         n.quantize()
                         n.quantized = True
                 qg.quantized = True
+                float_tensors = ActivationStore(float_uses, budget, spill_dir)
+                pending = dict(consumers)
                 # fix Sa, optimize Sw
                 for k, n in enumerate(g.nodes):
                     unquantifiable = n.get_param('unquantifiable', optional=True, default_value=False)
@@ -85,9 +117,10 @@ def _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, m
                                 cstart = 0
                                 for chunk in wscale_chunks:
                                     wcs = chunk.float().mean()
-                                    max_score = initial_similarity
-                                    for s in torch.linspace(alpha * wcs, beta * wcs, nsteps):
-                                        wmin, wmax = scale2minmax(s.item(), is_signed(w.dtype), qrange)
+                                    candidates = torch.linspace(alpha * wcs, beta * wcs, nsteps).tolist()
+                                    outputs = []
+                                    for s in candidates:
+                                        wmin, wmax = scale2minmax(s, is_signed(w.dtype), qrange)
                                         dn = n.clone(n.name+"_clone_")
                                         dw = dn.constants["weights"]
                                         dw.min_key_axis[cstart:cstart+chunk.numel()] = wmin
@@ -96,11 +129,12 @@ def _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, m
                                         for it, t in enumerate(qn.inputs):
                                             dn.inputs[it].betensor = t.betensor
                                         dn.forward()
-                                        score = layer_similarity(n, dn)
-                                        if score > max_score:
-                                            max_score = score
-                                            wmins[cstart:cstart+chunk.numel()] = wmin
-                                            wmaxs[cstart:cstart+chunk.numel()] = wmax
+                                        outputs.append([t.betensor for t in dn.outputs])
+                                    best = _best_candidate(n, outputs, initial_similarity)
+                                    if best is not None:
+                                        wmin, wmax = scale2minmax(candidates[best], is_signed(w.dtype), qrange)
+                                        wmins[cstart:cstart+chunk.numel()] = wmin
+                                        wmaxs[cstart:cstart+chunk.numel()] = wmax
                                     cstart += chunk.numel()
                                 dn = n.clone(n.name+"_clone_")
                                 dw = dn.constants["weights"]
@@ -116,9 +150,10 @@ def _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, m
                                     w.min_key_axis = wmins
                                     w.max_key_axis = wmaxs
                             else:
-                                max_score = initial_similarity
-                                for s in torch.linspace(alpha * w.scale, beta * w.scale, nsteps):
-                                    wmin, wmax = scale2minmax(s.item(), is_signed(w.dtype), qrange)
+                                candidates = torch.linspace(alpha * w.scale, beta * w.scale, nsteps).tolist()
+                                outputs = []
+                                for s in candidates:
+                                    wmin, wmax = scale2minmax(s, is_signed(w.dtype), qrange)
                                     dn = n.clone(n.name+"_clone_")
                                     dw = dn.constants["weights"]
                                     dw.min = wmin
@@ -127,12 +162,18 @@ def _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, m
                                     for it, t in enumerate(qn.inputs):
                                         dn.inputs[it].betensor = t.betensor
                                     dn.forward()
-                                    score = layer_similarity(n, dn)
-                                    if score > max_score:
-                                        dn_m = dn
-                                        max_score = score
-                                        w.min = wmin
-                                        w.max = wmax
+                                    outputs.append([t.betensor for t in dn.outputs])
+                                best = _best_candidate(n, outputs, initial_similarity)
+                                if best is not None:
+                                    # only the quantized constants and params of the best candidate are needed,
+                                    # so it is quantized again instead of keeping every candidate node alive
+                                    wmin, wmax = scale2minmax(candidates[best], is_signed(w.dtype), qrange)
+                                    dn_m = n.clone(n.name+"_clone_")
+                                    dn_m.constants["weights"].min = wmin
+                                    dn_m.constants["weights"].max = wmax
+                                    dn_m.quantize()
+                                    w.min = wmin
+                                    w.max = wmax
                             if dn_m:
                                 for key in qn.constants.keys():
                                     qn.constants[key] = dn_m.constants[key]
@@ -140,11 +181,28 @@ def _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, m
                                     qn.params[key] = dn_m.params[key]
                                 qn.forward()
                     pbar.update(1)
+                    # keep the float featuremaps for the second pass, and free the featuremaps of both graphs
+                    # once no later node consumes them
+                    for ot in n.outputs:
+                        float_tensors.put(ot.name, ot.betensor)
+                    for idx, ot in enumerate(n.outputs):
+                        if consumers.get(ot.name, 0) < 1:
+                            free([ot, qn.outputs[idx]])
+                    for idx, it in enumerate(n.inputs):
+                        pending[it.name] -= 1
+                        if pending[it.name] < 1:
+                            free([it, qn.inputs[idx]])
                 # fix Sw, optimize Sa
                 tmap = {}
                 for k, n in enumerate(g.nodes):
                     unquantifiable = n.get_param('unquantifiable', optional=True, default_value=False)
                     qn = qg.nodes[k]
+                    node_tensors = list(n.inputs) + list(n.outputs)
+                    if k + 1 < len(g.nodes):
+                        next_n = g.nodes[k + 1]
+                        float_tensors.prefetch([t.name for t in list(next_n.inputs) + list(next_n.outputs)])
+                    for t in node_tensors:
+                        t.betensor = float_tensors.get(t.name, tz.device)
                     for it, t in enumerate(n.inputs):
                         qn.inputs[it].betensor = linear_quantize_clip(t.betensor, t.scale, t.zerop, t.qmin, t.qmax)
                     qn.forward()
@@ -156,27 +214,29 @@ def _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, m
                             qrange = 2 ** inp.qbits - 1
                             if not QuantMode.is_full_range(q_mode_activation):
                                 qrange -= 1
-                            max_score = initial_similarity
-                            for s in torch.linspace(alpha * inp.scale, beta * inp.scale, nsteps):
-                                imin, imax = scale2minmax(s.item(), is_signed(inp.dtype), qrange)
+                            candidates = torch.linspace(alpha * inp.scale, beta * inp.scale, nsteps).tolist()
+                            # quantize the searched input with every candidate scale in one broadcast op,
+                            # the other inputs keep their current quantization
+                            x = inp.betensor
+                            cscales = torch.tensor(candidates, device=x.device).reshape([-1] + [1] * x.dim())
+                            cinps = linear_quantize_clip(x.unsqueeze(0), cscales, 0, inp.qmin, inp.qmax)
+                            outputs = []
+                            for j, s in enumerate(candidates):
+                                imin, imax = scale2minmax(s, is_signed(inp.dtype), qrange)
                                 dn = n.clone(n.name+"_clone_")
                                 dn.inputs[idx].min = imin
                                 dn.inputs[idx].max = imax
-                                dn.inputs[idx].scale = s.item()
+                                dn.inputs[idx].scale = s
                                 dn.inputs[idx].zerop = 0
                                 dn.quantize()
-                                for it, t in enumerate(n.inputs):
-                                    if it == idx:
-                                        dn.inputs[it].betensor = linear_quantize_clip(
-                                            t.betensor, s.item(), 0, t.qmin, t.qmax)
-                                    else:
-                                        dn.inputs[it].betensor = linear_quantize_clip(
-                                            t.betensor, t.scale, t.zerop, t.qmin, t.qmax)
+                                for it, t in enumerate(qn.inputs):
+                                    dn.inputs[it].betensor = cinps[j] if it == idx else t.betensor
                                 dn.forward()
-                                score = layer_similarity(n, dn)
-                                if score > max_score:
-                                    max_score = score
-                                    inp_scales[idx] = (s.item(), 0, imin, imax)
+                                outputs.append([t.betensor for t in dn.outputs])
+                            best = _best_candidate(n, outputs, initial_similarity)
+                            if best is not None:
+                                imin, imax = scale2minmax(candidates[best], is_signed(inp.dtype), qrange)
+                                inp_scales[idx] = (candidates[best], 0, imin, imax)
                     if len(inp_scales) > 1:
                         dn = n.clone(n.name+"_clone_")
                         for idx, inp in enumerate(dn.inputs):
@@ -193,6 +253,9 @@ def _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, m
                             tmap[inp.name] = []
                         tmap[inp.name].append(inp_scales[idx])
                     pbar.update(1)
+                    float_tensors.release([t.name for t in node_tensors])
+                    free(node_tensors + list(qn.inputs) + list(qn.outputs))
+                float_tensors.close()
                 for k, n in enumerate(g.nodes):
                     for inp in n.inputs:
                         if inp.name in tmap.keys():
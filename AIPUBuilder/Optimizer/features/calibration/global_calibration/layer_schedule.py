@@ -0,0 +1,61 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+__all__ = ['layer_waves', 'run_layer_jobs']
+
+
+def layer_waves(g, schedule, workers=0, optimizable=lambda n: True):
+    """
+    split the nodes of g into waves of node indices, the layers of a wave are optimized together:
+    'sequential' optimizes one layer after another, in g.nodes order;
+    'wavefront' groups the layers of the same topological generation (attrs['tgid']), which never consume each
+    other's outputs, so they can be optimized in parallel from the featuremaps of the previous waves;
+    'float_input' groups consecutive layers, up to workers optimizable ones per wave, which is only valid when each
+    layer is reconstructed from float featuremaps instead of the outputs of the already optimized layers.
+    the nodes of each wave keep their g.nodes order.
+    """
+    indices = list(range(len(g.nodes)))
+    if schedule == 'wavefront':
+        g.update_topological_generations()
+        generations = {}
+        for k in indices:
+            generations.setdefault(g.nodes[k].attrs['tgid'], []).append(k)
+        return [generations[gid] for gid in sorted(generations.keys())]
+    if schedule == 'float_input':
+        waves = []
+        wave = []
+        count = 0
+        for k in indices:
+            wave.append(k)
+            if optimizable(g.nodes[k]):
+                count += 1
+                if count >= max(1, workers):
+                    waves.append(wave)
+                    wave = []
+                    count = 0
+        if len(wave) > 0:
+            waves.append(wave)
+        return waves
+    return [[k] for k in indices]
+
+
+def run_layer_jobs(func, jobs, workers=0):
+    """
+    return [func(job) for job in jobs], computed by up to workers forked processes which share the state func
+    closes over copy-on-write. the jobs are run serially with workers <= 1, on cuda, or when fork is unavailable.
+    """
+    from AIPUBuilder.Optimizer.utils import forked_processes_available, run_in_forked_processes
+    workers = min(workers, len(jobs))
+    if workers > 1 and not forked_processes_available('parallel layer optimization'):
+        workers = 0
+    if workers <= 1:
+        return [func(job) for job in jobs]
+
+    def optimize(indices):
+        for i in indices:
+            yield i, func(jobs[i])
+    results = [None] * len(jobs)
+    for i, result in run_in_forked_processes(optimize, [list(range(k, len(jobs), workers)) for k in range(workers)],
+                                             'layer optimization'):
+        results[i] = result
+    return results
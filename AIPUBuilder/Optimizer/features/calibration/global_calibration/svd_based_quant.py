@@ -28,6 +28,23 @@ def svd_based_quant_global_calibration(g, cdataloader, mparams, mscopes):
     _svd_based_search_scale(g, cdataloader, alpha, beta, nsteps, thresh, mode, oplist)
 
 
+def _closest_singular_values(x, S, scales, zerop, q_min, q_max, chunk_numel=1 << 26):
+    """
+    index of the first of scales (1-d) whose fake quantization of x has the singular values closest to S (those of
+    x). the scales are quantized in one broadcast op and decomposed by one batched svd, chunk_numel bounds the
+    elements of the featuremaps stacked at once.
+    """
+    chunk = max(1, chunk_numel // max(1, x.numel()))
+    dists = []
+    for cs in scales.to(x.device).split(chunk):
+        cs = cs.reshape([-1] + [1] * x.dim())
+        qbetensor = linear_quantize_clip(x.unsqueeze(0), cs, zerop, q_min, q_max)
+        deqbetenor = linear_dequantize(qbetensor, cs, zerop)
+        qS = torch.linalg.svdvals(deqbetenor)
+        dists.append((qS - S.unsqueeze(0)).reshape(cs.shape[0], -1).norm(dim=1))
+    return int(torch.argmin(torch.cat(dists)).item())
+
+
 def _svd_based_search_scale(g, cdataloader, alpha, beta, nsteps, thresh, mode, oplist):
     import copy
 
@@ -53,10 +70,13 @@ def _svd_based_search_scale(g, cdataloader, alpha, beta, nsteps, thresh, mode, o
             fmin = -fmax
         return fmin, fmax
 
-    def get_denoise_max_min(out):
+    def filter_inf(out):
         have_inf = out.betensor.float() < -32768
         mvalue = have_inf*-127
-        filt_out = out.betensor.float()*(~have_inf)+mvalue
+        return out.betensor.float()*(~have_inf)+mvalue
+
+    def get_denoise_max_min(out):
+        filt_out = filter_inf(out)
         U, S, Vh = torch.linalg.svd(filt_out, full_matrices=False)
         percent = thresh
         S_sorted = S.flatten().sort()[0]
@@ -83,7 +103,8 @@ def _svd_based_search_scale(g, cdataloader, alpha, beta, nsteps, thresh, mode, o
         if out.betensor.min() > 0:
             bmin = torch.tensor(0)
             bmax = bmax-bmin
-        return bmin.item(), bmax.item()
+        # the singular values are returned too, get_best_scale reuses them
+        return bmin.item(), bmax.item(), S
 
     def check_node_if_optimization(k, nodes, oplist):
         layer_n = nodes[k]
@@ -93,14 +114,11 @@ def _svd_based_search_scale(g, cdataloader, alpha, beta, nsteps, thresh, mode, o
         else:
             return layer_n.type.name.lower() in mscopes or int(layer_n.attrs['layer_id']) in mscopes
 
-    def get_best_scale(out, bmin, bmax, quant_mode, op_list):
+    def get_best_scale(out, bmin, bmax, quant_mode, op_list, S=None):
 
         out_signed = is_signed(out.dtype)
         q_min, q_max = get_qmin_qmax(out_signed, out.qbits)
-        have_inf = out.betensor.float() < -32768
-        mvalue = have_inf*-127
-        filt_out = out.betensor.float()*(~have_inf)+mvalue
-        U, S, Vh = torch.linalg.svd(filt_out, full_matrices=False)
+        filt_out = filter_inf(out)
         denoise_out = PyTensor('denoise_out', out.ir_shape, out.dtype)
         denoise_out.min, denoise_out.max = bmin, bmax
 
@@ -110,21 +128,16 @@ def _svd_based_search_scale(g, cdataloader, alpha, beta, nsteps, thresh, mode, o
         # if str(n.type)[7:].lower() in op_list:
         zero = zerop
         if op_list:
-
-            init_s = scale*scale
-            qbetensor = linear_quantize_clip(filt_out, init_s, zerop, q_min, q_max)
-            deqbetenor = linear_dequantize(qbetensor, init_s, zerop)
-            qU, qS, qVh = torch.linalg.svd(deqbetenor, full_matrices=False)
-            min_dist = torch.dist(S, qS)
+            # only the singular values are compared, so the float ones come from the denoise svd when given
+            if S is None:
+                S = torch.linalg.svdvals(filt_out)
+            # the initial scale comes first, so a candidate has to be strictly closer to replace it
+            candidates = torch.linspace(alpha * scale, beta * scale, nsteps)
+            scales = torch.cat([torch.as_tensor(scale*scale).reshape(1).to(candidates), candidates])
             # zero = torch.clamp(zerop.round(), -2 ** (out.qbits - 1) + 1, 2 ** (out.qbits - 1))
-            for s in torch.linspace(alpha * scale, beta * scale, nsteps):
-                qbetensor = linear_quantize_clip(filt_out, s, zerop, q_min, q_max)
-                deqbetenor = linear_dequantize(qbetensor, s, zerop)
-                qU, qS, qVh = torch.linalg.svd(deqbetenor, full_matrices=False)
-                dist = torch.dist(S, qS)
-                if dist < min_dist:
-                    min_dist = dist
-                    best_s = s
+            best = _closest_singular_values(filt_out, S, scales, zerop, q_min, q_max)
+            if best > 0:
+                best_s = candidates[best - 1]
 
         return best_s, zero
 
@@ -186,9 +199,9 @@ def _svd_based_search_scale(g, cdataloader, alpha, beta, nsteps, thresh, mode, o
                     out = n.outputs[0]
 
                     if optimized_flag and mode > 0:
-                        fmin, fmax = get_denoise_max_min(out)
+                        fmin, fmax, S = get_denoise_max_min(out)
                         if mode == 1:
-                            best_s, zerop = get_best_scale(out, fmin, fmax, quant_mode, optimized_flag)
+                            best_s, zerop = get_best_scale(out, fmin, fmax, quant_mode, optimized_flag, S)
                             symmetric = QuantMode.is_symmetric(quant_mode)
 
                             out_signed = is_signed(n.outputs[0].dtype)
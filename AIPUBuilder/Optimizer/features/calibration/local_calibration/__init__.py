@@ -4,7 +4,7 @@
 from . extrema import extrema_calibration
 from . in_ir import in_ir_calibration
 from . mean import mean_calibration
-from . kld import nkld_calibration
+from . kld import nkld_calibration, nkld_calibration_batch
 from . nstd import nstd_calibration
 from . weighted_scale_param import weighted_scale_param_calibration
 from . aciq_laplace import aciq_laplace_calibration
@@ -4,38 +4,68 @@
 import torch
 
 
+def _nkld_topk(cstrategy):
+    return 10 if len(cstrategy) < 4 else max(2, int(cstrategy[:-3]))
+
+
 def nkld_calibration(t, *args):  # eg. 5kld/10kld/20kld
-    cstrategy = args[0]
-    tn = 10 if len(cstrategy) < 4 else max(2, int(cstrategy[:-3]))
-    t.min, t.max = tune_min_max_by_kld_v1(t.running_histc, t.running_min, t.running_max, 2 ** t.qbits, tn)
-    if None != t.running_histc_key_axis:
-        sk_min = []
-        sk_max = []
-        for k, histc in enumerate(t.running_histc_key_axis):
-            smin, smax = tune_min_max_by_kld_v1(histc,
-                                                t.running_min_key_axis[k],
-                                                t.running_max_key_axis[k],
-                                                2 ** t.qbits,
-                                                tn)
-            sk_min.append(smin)
-            sk_max.append(smax)
-        t.min_key_axis = torch.tensor(sk_min,
-                                      dtype=t.running_max_key_axis.dtype,
-                                      device=t.running_max_key_axis.device)
-        t.max_key_axis = torch.tensor(sk_max,
-                                      dtype=t.running_max_key_axis.dtype,
-                                      device=t.running_max_key_axis.device)
-    elif None != t.running_min_key_axis:
-        t.min_key_axis = t.running_min_key_axis
-        t.max_key_axis = t.running_max_key_axis
+    nkld_calibration_batch([t], [args[0]])
+
+
+def nkld_calibration_batch(tensors, cstrategies):
+    """
+    nkld_calibration of several tensors at once: the histograms of all the tensors (including every channel
+    of the per-channel ones) which share the same bins, target bins and topk are solved together.
+    """
+    # group every histogram by (histc bins, target bins, topk), entries are (tensor index, channel or None)
+    groups = {}
+    for i, (t, cstrategy) in enumerate(zip(tensors, cstrategies)):
+        key = (t.running_histc.numel(), 2 ** t.qbits, _nkld_topk(cstrategy))
+        groups.setdefault(key, []).append((i, None))
+        if None != t.running_histc_key_axis:
+            key = (t.running_histc_key_axis.shape[-1], 2 ** t.qbits, _nkld_topk(cstrategy))
+            groups.setdefault(key, []).extend([(i, k) for k in range(t.running_histc_key_axis.shape[0])])
+    results = {}
+    for (_, target_bins, topk), entries in groups.items():
+        histcs = []
+        min_vs = []
+        max_vs = []
+        for i, k in entries:
+            t = tensors[i]
+            if k is None:
+                histcs.append(t.running_histc.reshape(1, -1))
+                min_vs.append(t.running_min)
+                max_vs.append(t.running_max)
+            else:
+                histcs.append(t.running_histc_key_axis[k:k + 1])
+                min_vs.append(t.running_min_key_axis[k])
+                max_vs.append(t.running_max_key_axis[k])
+        # consecutive channels of the same tensor are concatenated as one block
+        histcs = torch.cat([h.to(histcs[0].device) for h in histcs], dim=0)
+        for entry, r in zip(entries, tune_min_max_by_kld_batch(histcs, min_vs, max_vs, target_bins, topk)):
+            results[entry] = r
+
+    for i, t in enumerate(tensors):
+        t.min, t.max = results[(i, None)]
+        if None != t.running_histc_key_axis:
+            channels = t.running_histc_key_axis.shape[0]
+            t.min_key_axis = torch.tensor([results[(i, k)][0] for k in range(channels)],
+                                          dtype=t.running_max_key_axis.dtype,
+                                          device=t.running_max_key_axis.device)
+            t.max_key_axis = torch.tensor([results[(i, k)][1] for k in range(channels)],
+                                          dtype=t.running_max_key_axis.dtype,
+                                          device=t.running_max_key_axis.device)
+        elif None != t.running_min_key_axis:
+            t.min_key_axis = t.running_min_key_axis
+            t.max_key_axis = t.running_max_key_axis
 
 
 def tune_min_max_by_kld_v1(histc, min_v, max_v, target_bins, topk=10):
-    hbins = histc.numel()
-    if hbins <= target_bins or target_bins < 2:
-        return min_v, max_v
-    interval = (max_v - min_v) / hbins
-    midx = torch.argmax(histc).item()  # align on the max element's position
+    return tune_min_max_by_kld_batch(histc.reshape(1, -1), [min_v], [max_v], target_bins, topk)[0]
+
+
+def _kld_window(midx, min_v, max_v, hbins, target_bins):
+    # the initial target_bins window [lidx, ridx] of the histogram
     lidx = 0
     ridx = hbins-1
     if min_v >= 0:
@@ -51,64 +81,11 @@ def tune_min_max_by_kld_v1(histc, min_v, max_v, target_bins, topk=10):
         else:
             ridx = min(midx + (target_bins // 2), hbins-1)
             lidx = ridx - (target_bins - 1)
-    steps = max(lidx+1, hbins-ridx)
-
-    p = torch.nn.functional.pad(histc, (steps-(lidx+1), steps-(hbins-ridx)))
-    bins = p.numel()
-    h_cumsum = p.cumsum(dim=0, dtype=torch.float32)
-    h_cumsum_r = p.flip(0).cumsum(dim=0, dtype=torch.float32).flip(0)
-    p = p.repeat(steps, 1)
-    triu = torch.ones(steps, steps, device=p.device).triu()
-    mask = torch.nn.functional.pad(triu.flip(1), (0, bins-steps)) + torch.nn.functional.pad(triu, (bins-steps, 0))
-    p = torch.where(mask > 0, torch.zeros_like(p), p)
-    # add outliers to border bins
-    triu = torch.diag_embed(torch.ones(steps, device=p.device))
-    border = torch.nn.functional.pad(triu.flip(1), (0, bins-steps))
-    p = torch.where(border > 0, h_cumsum, p)
-    border = torch.nn.functional.pad(triu, (bins-steps, 0))
-    p = torch.where(border > 0, h_cumsum_r, p)
-    # normalize p
-    p = p / h_cumsum[-1]
-
-    # get extended qbins matrix steps * (target_bins*2) X max_qinterval
-    qbins_seq = []
-    max_qinterval = bins // target_bins
-    qindex = torch.zeros_like(p, dtype=torch.long)
-    ts = torch.arange(target_bins, device=p.device).reshape(-1, 1)
-    for idx in range(steps-1, -1, -1):
-        cur_p_len = bins - 2*idx
-        cur_p = p.select(0, steps-1-idx).narrow(0, idx, cur_p_len)
-        qinterval, qtail = divmod(cur_p_len, target_bins)
-        cur_p = torch.nn.functional.pad(cur_p, (0, qinterval * target_bins - qtail))
-        qbins = cur_p.reshape(target_bins * 2, qinterval)
-        qbins = torch.nn.functional.pad(qbins, (0, max_qinterval - qinterval))
-        qbins_seq.append(qbins)
-        cur_index = qindex.narrow(0, steps-1-idx, 1).narrow(1, idx, cur_p_len)
-        cur_ts = torch.nn.functional.pad(ts.repeat(1, qinterval).reshape(1, -1), (0, qtail), value=target_bins-1)
-        cur_index.index_copy_(0, torch.tensor([0], device=p.device), cur_ts)
-    qbins_matrix = torch.cat(qbins_seq, 0)
-    qbins_sum = qbins_matrix.sum(dim=1)
-    qbins_nonz = qbins_matrix.count_nonzero(dim=1)
-    # merge [target_bins, 2*target_bins) values into target_bins, and get steps X target_bins qbins_sum & qbins_nonz
-    qbins_sum = qbins_sum.reshape(steps, target_bins*2)
-    qbins_sum.narrow(1, 0, target_bins).index_add_(1, torch.tensor([target_bins-1], device=p.device),
-                                                   qbins_sum.narrow(1, target_bins, target_bins).sum(dim=1).reshape(-1, 1))
-    qbins_sum = qbins_sum.narrow(1, 0, target_bins)
-    qbins_nonz = qbins_nonz.reshape(steps, target_bins*2)
-    qbins_nonz.narrow(1, 0, target_bins).index_add_(1, torch.tensor([target_bins-1], device=p.device),
-                                                    qbins_nonz.narrow(1, target_bins, target_bins).sum(dim=1).reshape(-1, 1))
-    qbins_nonz = qbins_nonz.narrow(1, 0, target_bins)
-    eps = torch.finfo(torch.float32).eps
-    qvalues = qbins_sum / (qbins_nonz + eps)
-    # get q
-    qtmp = torch.gather(qvalues, 1, qindex)
-    p_eps = p + eps
-    c_q = torch.where(p != 0.0, qtmp, p_eps)
-    c_p = torch.where(p != 0.0, p, p_eps)
-    # get kl divergences
-    kl_divergence = (p * torch.log(c_p / c_q)).sum(dim=1)
-
-    min_idx = torch.argsort(kl_divergence)[:topk].max()  # make it more stable
+    return lidx, ridx
+
+
+def _kld_min_max(min_v, max_v, hbins, lidx, ridx, min_idx):
+    interval = (max_v - min_v) / hbins
     lval = min_v + max(lidx-min_idx, 0) * interval
     rval = max_v - (hbins-1 - min(ridx+min_idx, hbins-1)) * interval
     if isinstance(lval, torch.Tensor):
@@ -116,3 +93,115 @@ def tune_min_max_by_kld_v1(histc, min_v, max_v, target_bins, topk=10):
     if isinstance(rval, torch.Tensor):
         rval = rval.item()
     return min(lval, 0.0), max(rval, 0.0)
+
+
+def tune_min_max_by_kld_batch(histcs, min_vs, max_vs, target_bins, topk=10, max_elements=1 << 24):
+    """
+    tune (min, max) by kld for each row of histcs ([N, hbins]) with its own min_vs[i], max_vs[i].
+    rows are grouped by their search steps, each group is solved as one [rows, steps, bins] problem
+    (split to keep about max_elements per chunk), which gives the same results as solving them one by one.
+    """
+    hbins = histcs.shape[-1]
+    n = histcs.shape[0]
+    if hbins <= target_bins or target_bins < 2:
+        return [(min_vs[i], max_vs[i]) for i in range(n)]
+    midxs = torch.argmax(histcs, dim=-1).tolist()  # align on the max element's position
+    windows = [_kld_window(midxs[i], min_vs[i], max_vs[i], hbins, target_bins) for i in range(n)]
+    groups = {}
+    for i, (lidx, ridx) in enumerate(windows):
+        groups.setdefault(max(lidx+1, hbins-ridx), []).append(i)
+    geometry = _KLDGeometry(max(groups.keys()), target_bins, histcs.device)
+    results = [None] * n
+    for steps, rows in groups.items():
+        bins = 2 * steps + target_bins - 2
+        chunk = max(1, max_elements // (steps * bins))
+        for c in range(0, len(rows), chunk):
+            part = rows[c: c + chunk]
+            min_idxs = _kld_search(histcs[part], [windows[i][0] for i in part], steps, geometry, topk)
+            for i, min_idx in zip(part, min_idxs):
+                results[i] = _kld_min_max(min_vs[i], max_vs[i], hbins, windows[i][0], windows[i][1], min_idx)
+    return results
+
+
+class _KLDGeometry(object):
+    # index tensors of a search with max_steps steps: row r checks the window [idx, bins-1-idx] (idx = steps-1-r),
+    # a search with fewer steps is the same one with rows [:steps] and columns shifted by max_steps - steps
+    def __init__(self, max_steps, target_bins, device):
+        self.max_steps = max_steps
+        self.target_bins = target_bins
+        bins = 2 * max_steps + target_bins - 2
+        idx = max_steps - 1 - torch.arange(max_steps, device=device).reshape(-1, 1)
+        col = torch.arange(bins, device=device).reshape(1, -1)
+        self.inner = (col > idx) & (col < bins - 1 - idx)
+        self.left = col == idx
+        self.right = col == bins - 1 - idx
+        # the window of length L (qinterval, qtail = divmod(L, target_bins)) is viewed as a target_bins*2 X qinterval
+        # matrix padded to max_qinterval columns, the rows beyond target_bins are merged into the last target bin
+        cur_p_len = (bins - 2 * idx).reshape(-1, 1, 1)
+        self.qinterval = cur_p_len // target_bins
+        qrow = torch.arange(target_bins * 2, device=device).reshape(1, -1, 1)
+        qcol = torch.arange(bins // target_bins, device=device).reshape(1, 1, -1)
+        self.qpos = qrow * self.qinterval + qcol
+        self.qvalid = (qcol < self.qinterval) & (self.qpos < cur_p_len)
+        # each position of the window takes the value of its target bin
+        wpos = col - idx
+        self.qindex = torch.where((wpos >= 0) & (wpos < cur_p_len.reshape(-1, 1)),
+                                  torch.clamp(wpos // self.qinterval.reshape(-1, 1), max=target_bins - 1),
+                                  torch.zeros_like(wpos))
+
+    def get(self, steps):
+        target_bins = self.target_bins
+        bins = 2 * steps + target_bins - 2
+        shift = self.max_steps - steps
+        cols = slice(shift, shift + bins)
+        max_qinterval = bins // target_bins
+        idx = steps - 1 - torch.arange(steps, device=self.qpos.device).reshape(-1, 1, 1)
+        qvalid = self.qvalid[:steps, :, :max_qinterval]
+        qpos = torch.where(qvalid, self.qpos[:steps, :, :max_qinterval] + idx,
+                           torch.zeros_like(qvalid, dtype=torch.long))
+        return (self.inner[:steps, cols], self.left[:steps, cols], self.right[:steps, cols],
+                qpos, qvalid, self.qindex[:steps, cols])
+
+
+def _kld_search(histcs, lidxs, steps, geometry, topk):
+    # kl divergences of all the candidate windows of each histogram, returns the chosen step of each one
+    device = histcs.device
+    nrows, hbins = histcs.shape
+    target_bins = geometry.target_bins
+    bins = 2 * steps + target_bins - 2
+    inner, left, right, qpos, qvalid, qindex = geometry.get(steps)
+    # pad each histogram so that its initial window sits in the middle
+    lpad = torch.tensor([steps - (lidx + 1) for lidx in lidxs], device=device).reshape(-1, 1)
+    p = torch.zeros([nrows, bins], dtype=histcs.dtype, device=device)
+    p.scatter_(1, lpad + torch.arange(hbins, device=device), histcs)
+    h_cumsum = p.cumsum(dim=-1, dtype=torch.float32)
+    h_cumsum_r = p.flip(-1).cumsum(dim=-1, dtype=torch.float32).flip(-1)
+    # normalize p, and add outliers to border bins
+    total = h_cumsum[:, -1:]
+    p = torch.where(inner, (p / total).unsqueeze(1), torch.zeros([], dtype=p.dtype, device=device))
+    p = torch.where(left, (h_cumsum / total).unsqueeze(1), p)
+    p = torch.where(right, (h_cumsum_r / total).unsqueeze(1), p)
+
+    qbins_matrix = torch.gather(p, 2, qpos.reshape(1, steps, -1).expand(nrows, -1, -1)).reshape(
+        nrows, *qpos.shape)
+    qbins_matrix = torch.where(qvalid, qbins_matrix, torch.zeros([], dtype=p.dtype, device=device))
+    qbins_sum = qbins_matrix.sum(dim=-1)
+    qbins_nonz = qbins_matrix.count_nonzero(dim=-1)
+    # merge [target_bins, 2*target_bins) values into target_bins
+    tail_sum = qbins_sum.narrow(-1, target_bins, target_bins).sum(dim=-1)
+    tail_nonz = qbins_nonz.narrow(-1, target_bins, target_bins).sum(dim=-1)
+    qbins_sum = qbins_sum.narrow(-1, 0, target_bins).clone()
+    qbins_sum[..., target_bins - 1] += tail_sum
+    qbins_nonz = qbins_nonz.narrow(-1, 0, target_bins).clone()
+    qbins_nonz[..., target_bins - 1] += tail_nonz
+    eps = torch.finfo(torch.float32).eps
+    qvalues = qbins_sum / (qbins_nonz + eps)
+    # get q
+    qtmp = torch.gather(qvalues, 2, qindex.unsqueeze(0).expand(nrows, -1, -1))
+    # get kl divergences, zero p contributes nothing (its c_p / c_q is eps / eps)
+    nonzero = p != 0.0
+    ratio = (p / qtmp).masked_fill_(~nonzero, 1.0)
+    kl_divergence = ratio.log_().mul_(p).sum(dim=-1)
+
+    min_idxs = torch.argsort(kl_divergence, dim=-1)[:, :topk].max(dim=-1).values  # make it more stable
+    return [min_idxs[r] for r in range(nrows)]
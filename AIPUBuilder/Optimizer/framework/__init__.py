@@ -4,5 +4,7 @@
 
 from AIPUBuilder.Optimizer.framework.pycore import *
 from AIPUBuilder.Optimizer.framework.qgraph import *
+from AIPUBuilder.Optimizer.framework.float_cache import *
+from AIPUBuilder.Optimizer.framework.stage_checkpoint import *
 from AIPUBuilder.Optimizer.framework.opt_register import *
 from AIPUBuilder.Optimizer.logger import OPT_DEBUG, OPT_WARN, OPT_INFO, OPT_ERROR, OPT_FATAL
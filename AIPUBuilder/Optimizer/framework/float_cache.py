@@ -0,0 +1,103 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import json
+
+__all__ = ['FloatResultCache']
+
+
+class FloatResultCache(object):
+    """
+    on-disk store of the float graph results (the outputs, or any named tensors) of each batch of a dataset, so that
+    a later float metric, similarity check or search iteration on the same batches reads them back instead of
+    forwarding the float graph again.
+    a store lives in <cache_dir>/<key>/: an append-only blob of 64 bytes aligned tensors (data.bin) and the json
+    index of the stored batches (index.json), the tensors are read back as zero-copy views on the memory-mapped blob.
+    the key must identify the float graph, the dataset and its batching (see QuantizeGraph.float_result_key), and
+    only one process is expected to write a store at a time.
+    """
+    _ALIGN = 64
+
+    def __init__(self, cache_dir, key):
+        from AIPUBuilder.Optimizer.utils.files_utils import make_dir_path
+        self.key = key
+        self.path = make_dir_path(os.path.join(cache_dir, key))
+        self.data_fname = os.path.join(self.path, 'data.bin')
+        self.index_fname = os.path.join(self.path, 'index.json')
+        self.index = {}
+        self.dirty = False
+        self._mapped = None
+        self._load_index()
+
+    def _load_index(self):
+        from AIPUBuilder.Optimizer.logger import OPT_DEBUG
+        if not os.path.isfile(self.index_fname):
+            return
+        try:
+            with open(self.index_fname) as f:
+                index = json.load(f)
+            size = os.path.getsize(self.data_fname)
+        except (OSError, ValueError) as e:
+            OPT_DEBUG(f"ignore broken float result cache {self.path}: {e}")
+            return
+        for batch_idx, tensors in index.items():
+            if all(meta['offset'] + meta['nbytes'] <= size for meta in tensors.values()):
+                self.index[int(batch_idx)] = tensors
+
+    def __contains__(self, batch_idx):
+        return batch_idx in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, batch_idx):
+        """the tensors stored for batch_idx as {name: torch.Tensor}, in the order they were put."""
+        import torch
+        import numpy as np
+        tensors = self.index[batch_idx]
+        end = max([meta['offset'] + meta['nbytes'] for meta in tensors.values()] + [0])
+        if end > 0 and (self._mapped is None or self._mapped.size < end):
+            # map the blob again when it has grown since the last mapping,
+            # copy-on-write keeps the views writable for torch without touching the file
+            self._mapped = np.memmap(self.data_fname, dtype=np.uint8, mode='c')
+        results = {}
+        for name, meta in tensors.items():
+            dtype = getattr(torch, meta['dtype'])
+            if meta['nbytes'] == 0:
+                results[name] = torch.zeros(meta['shape'], dtype=dtype)
+                continue
+            start = meta['offset']
+            raw = torch.from_numpy(np.asarray(self._mapped[start: start + meta['nbytes']]))
+            results[name] = raw.view(dtype).reshape(meta['shape'])
+        return results
+
+    def put(self, batch_idx, tensors):
+        """
+        append tensors ({name: torch.Tensor}) to the results of batch_idx, they are visible to other runs after flush.
+        """
+        import torch
+        entry = self.index.setdefault(batch_idx, {})
+        with open(self.data_fname, 'ab') as fw:
+            offset = fw.tell()
+            for name, t in tensors.items():
+                t = t.detach().cpu().contiguous()
+                raw = t.reshape(-1).view(torch.uint8).numpy()
+                padding = -offset % self._ALIGN
+                fw.write(b'\0' * padding)
+                fw.write(raw)
+                offset += padding
+                entry[name] = {'dtype': str(t.dtype)[6:], 'shape': list(t.shape), 'offset': offset,
+                               'nbytes': raw.nbytes}
+                offset += raw.nbytes
+        self.dirty = True
+
+    def flush(self):
+        """write the index of the stored batches, the blob is always written before the index refers to it."""
+        if not self.dirty:
+            return
+        tmp_fname = f'{self.index_fname}.{os.getpid()}.tmp'
+        with open(tmp_fname, 'w') as fw:
+            json.dump({str(k): v for k, v in self.index.items()}, fw)
+        os.replace(tmp_fname, self.index_fname)
+        self.dirty = False
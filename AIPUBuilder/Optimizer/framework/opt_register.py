@@ -29,7 +29,47 @@ QUANTIZE_DATASET_DICT = dict()
 QUANTIZE_METRIC_DICT = dict()
 
 
+def _merge_state_value(rule, value, other):
+    import torch
+    import numpy as np
+    if rule == 'sum':
+        if value is None:
+            return other
+        if other is None:
+            return value
+        if isinstance(value, list):
+            return [a + b for a, b in zip(value, other)]
+        return value + other
+    if rule == 'extend':
+        if isinstance(value, dict):
+            for k, v in other.items():
+                value[k] = value[k] + v if k in value else v
+            return value
+        if isinstance(value, np.ndarray):
+            return np.concatenate([value, other], axis=0)
+        if isinstance(value, torch.Tensor):
+            return torch.cat([value, other], dim=0)
+        return value + other
+    if rule == 'update':
+        value.update(other)
+        return value
+    if rule == 'max':
+        return other if value is None else (value if other is None else max(value, other))
+    if rule == 'min':
+        return other if value is None else (value if other is None else min(value, other))
+    if rule == 'first':
+        return other if value is None or (isinstance(value, str) and value == '') else value
+    raise ValueError(f"unknown metric state merge rule '{rule}'")
+
+
 class OptBaseMetric(object):
+    # fields which make up the metric state and how two states are merged, {attribute name: rule}, rules are:
+    # 'sum' (counters, numpy/torch arrays or lists of them summed elementwise), 'extend' (per-sample results in
+    # lists/arrays/dicts of lists, concatenated in order), 'update' (dicts keyed by sample), 'max', 'min',
+    # 'first' (settings learnt from the data) and 'state' (an object with its own state_dict/merge).
+    # metrics which keep their state this way get state_dict/merge for free, others may override them.
+    state_fields = None
+
     def __init__(self, *args):
         pass
 
@@ -45,6 +85,37 @@ class OptBaseMetric(object):
     def report(self):
         raise NotImplementedError()
 
+    def is_mergeable(self):
+        return self.state_fields is not None or type(self).merge is not OptBaseMetric.merge
+
+    def state_dict(self):
+        """
+        :return: a picklable snapshot of the data accumulated by the calls since the last reset.
+        """
+        import copy
+        if self.state_fields is None:
+            raise NotImplementedError(f"{type(self).__name__} does not support state_dict()")
+        state = {}
+        for name, rule in self.state_fields.items():
+            value = getattr(self, name)
+            state[name] = value.state_dict() if rule == 'state' else copy.deepcopy(value)
+        return state
+
+    def merge(self, other_state):
+        """
+        fold the state_dict() of another instance (with the same settings) into this one, as if this instance had
+        also been fed the samples of the other one, after its own. merging into a reset instance restores the state.
+        """
+        import copy
+        if self.state_fields is None:
+            raise NotImplementedError(f"{type(self).__name__} does not support merge()")
+        for name, rule in self.state_fields.items():
+            other = other_state[name]
+            if rule == 'state':
+                getattr(self, name).merge(other)
+            else:
+                setattr(self, name, _merge_state_value(rule, getattr(self, name), copy.deepcopy(other)))
+
 
 def is_plugin_op(filename):
     return True if 'aipubt_' in filename else False
@@ -114,8 +185,9 @@ def find_nested_func(parent, child_name):
     return None
 
 
-def op_register(optypes, version=1., *args):
-    import time
+def op_register(optypes, version=1., *args, mutable_inputs=True):
+    # mutable_inputs=False declares that the forward never modifies its inputs' betensor in place,
+    # so PyNode.forward can pass the inputs to it without defensive copies
     import torch
     global OP_DICT
     from AIPUBuilder.Optimizer.logger import OPT_ERROR
@@ -135,12 +207,7 @@ def op_register(optypes, version=1., *args):
                 # set readonly keys
                 # self.readonly_keys_set()
                 # self.disable_keys_set()
-                if 'calculate_running_time' not in self.attrs or not self.attrs['calculate_running_time']:
-                    ret = func(self)
-                else:
-                    start_t = time.time()
-                    ret = func(self)
-                    self.attrs['cost_time'] = time.time() - start_t
+                ret = func(self)
 
                 # free readonly keys
                 # self.disable_keys_free()
@@ -153,6 +220,7 @@ def op_register(optypes, version=1., *args):
                 OPT_ERROR(f"{self}")
                 raise e
             return ret
+        mfun.mutable_inputs = mutable_inputs
         is_plugin = is_plugin_op(get_file_name())
         _register(optypes, version, mfun, ALL_OPT_OP_DICT, OP_DICT, is_plugin, 'forward register')
         return mfun
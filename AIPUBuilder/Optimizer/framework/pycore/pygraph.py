@@ -11,14 +11,138 @@ __all__ = [
 ]
 
 
+class _TopologyIndex(object):
+    # edges of a graph by tensor name: the producer and the consumers (in no particular order) of each tensor
+    def __init__(self, nodes):
+        self.nodes = set(nodes)
+        self.producers = {}
+        self.consumers = {}
+        self.generations_dirty = False
+        for n in nodes:
+            for t in n.outputs:
+                self.producers[t.name] = n
+        for n in nodes:
+            for t in n.inputs:
+                self.consumers.setdefault(t.name, []).append(n)
+
+
+class _NodeList(list):
+    # nodes of a PyGraph, inserting or removing a single node keeps the graph's topology index up to date,
+    # other in-place changes drop the index and the next edit falls back to init_networkx
+    def __init__(self, graph, nodes=()):
+        super().__init__(nodes)
+        self.graph = graph
+
+    def __reduce__(self):
+        # pickle and copy would otherwise restore the items through extend before the graph is set
+        return self.__class__, (self.graph, list(self))
+
+    def append(self, node):
+        super().append(node)
+        self.graph._link_node(node)
+
+    def insert(self, idx, node):
+        super().insert(idx, node)
+        self.graph._link_node(node)
+
+    def extend(self, nodes):
+        nodes = list(nodes)
+        super().extend(nodes)
+        for n in nodes:
+            self.graph._link_node(n)
+
+    def __iadd__(self, nodes):
+        self.extend(nodes)
+        return self
+
+    def remove(self, node):
+        super().remove(node)
+        self.graph._unlink_node(node)
+
+    def pop(self, idx=-1):
+        node = super().pop(idx)
+        self.graph._unlink_node(node)
+        return node
+
+    def __delitem__(self, idx):
+        nodes = self[idx] if isinstance(idx, slice) else [self[idx], ]
+        super().__delitem__(idx)
+        for n in nodes:
+            self.graph._unlink_node(n)
+
+    def __setitem__(self, idx, value):
+        if isinstance(idx, slice):
+            old_nodes = self[idx]
+            value = list(value)
+        else:
+            old_nodes = [self[idx], ]
+        super().__setitem__(idx, value)
+        for n in old_nodes:
+            self.graph._unlink_node(n)
+        for n in (value if isinstance(idx, slice) else [value, ]):
+            self.graph._link_node(n)
+
+    def __imul__(self, k):
+        self.graph._drop_topology_index()
+        return super().__imul__(k)
+
+    def clear(self):
+        self.graph._drop_topology_index()
+        super().clear()
+
+    def sort(self, *args, **kwargs):
+        self.graph._drop_topology_index()
+        super().sort(*args, **kwargs)
+
+    def reverse(self):
+        self.graph._drop_topology_index()
+        super().reverse()
+
+
+class _ActivationMemory(object):
+    # live bytes of the activations during a forward pass, tensors sharing one storage (views) are counted once
+    def __init__(self):
+        self.storages = {}  # storage's data_ptr: [nbytes, number of live tensors on it]
+        self.tensors = {}  # PyTensor: the data_ptr it is counted on
+        self.live = 0
+        self.peak = 0
+
+    def acquire(self, tensors):
+        for t in tensors:
+            st = t.betensor.untyped_storage()
+            ptr = st.data_ptr()
+            # graph inputs are acquired again as the outputs of their Input nodes
+            if ptr == 0 or self.tensors.get(t, None) == ptr:
+                continue
+            self.release(t)
+            self.tensors[t] = ptr
+            if ptr in self.storages:
+                self.storages[ptr][1] += 1
+            else:
+                self.storages[ptr] = [st.nbytes(), 1]
+                self.live += st.nbytes()
+        self.peak = max(self.peak, self.live)
+
+    def release(self, t):
+        ptr = self.tensors.pop(t, None)
+        if ptr in self.storages:
+            self.storages[ptr][1] -= 1
+            if self.storages[ptr][1] < 1:
+                self.live -= self.storages.pop(ptr)[0]
+
+
 class PyGraph:
     def __init__(self, name="unamed"):
         self.name = str(name)
         self.net_ = None  # take advantage of networkx's basic graph algorithms
+        self._topology = None
         self.nodes = []
         self.input_tensors = ()
         self.output_tensors = ()
         self.ref_count_tensors = {}
+        # peak bytes of the activations alive at the same time over the forward passes of this graph
+        self.peak_activation_memory = 0
+        self._activation_memory = None
 
     def clone(self):
         import copy
@@ -76,6 +200,15 @@ class PyGraph:
 
         return g
 
+    @property
+    def nodes(self):
+        return self._nodes
+
+    @nodes.setter
+    def nodes(self, nodes):
+        self._nodes = _NodeList(self, nodes)
+        self._drop_topology_index()
+
     def tensors(self, tname=None):
         from AIPUBuilder.Optimizer.logger import OPT_DEBUG, OPT_WARN
         tlist = []
@@ -223,8 +356,125 @@ class PyGraph:
                     ot.pnode = n
 
         self.net_ = net
+        self._topology = _TopologyIndex(self.nodes)
         return self.net_
 
+    def _drop_topology_index(self):
+        self._topology = None
+        self.net_ = None
+
+    def update_node_edges(self, node, inputs=(), outputs=(), removed=False):
+        """
+        incremental counterpart of init_networkx after some input or output tensors of the node are linked
+        (or unlinked if removed=True): only the parents and children of the nodes around those tensors are
+        updated, and each node's attrs['tgid'] is left to update_topological_generations.
+        """
+        topo = self._topology
+        if topo is None:
+            self.init_networkx()
+        elif node in topo.nodes:
+            self._update_edges(node, inputs, outputs, removed, True)
+
+    def update_topological_generations(self):
+        """
+        refresh attrs['tgid'] of each node if the topology has been changed by local edits since it was computed.
+        """
+        topo = self._topology
+        if topo is None:
+            self.init_networkx()
+            return
+        if not topo.generations_dirty:
+            return
+        indegree = {}
+        generation = []
+        for n in self.nodes:
+            d = len(set(n.parents))
+            if d > 0:
+                indegree[n] = d
+            else:
+                generation.append(n)
+        gid = 0
+        while generation:
+            next_generation = []
+            for n in generation:
+                n.attrs['tgid'] = gid
+                for c in dict.fromkeys(n.children):
+                    indegree[c] -= 1
+                    if indegree[c] == 0:
+                        next_generation.append(c)
+                        del indegree[c]
+            generation = next_generation
+            gid += 1
+        if indegree:
+            import networkx as nx
+            raise nx.NetworkXUnfeasible("Graph contains a cycle or graph changed during iteration")
+        topo.generations_dirty = False
+
+    def _link_node(self, node):
+        topo = self._topology
+        if topo is not None and node not in topo.nodes:
+            topo.nodes.add(node)
+            node.graph = self
+            self._update_edges(node, node.inputs, node.outputs, False, True)
+
+    def _unlink_node(self, node):
+        topo = self._topology
+        if topo is not None and node in topo.nodes:
+            self._update_edges(node, node.inputs, node.outputs, True, False)
+            topo.nodes.discard(node)
+
+    def _update_edges(self, node, inputs, outputs, removed, relink_node):
+        topo = self._topology
+        affected = set()
+        for t in inputs:
+            p = topo.producers.get(t.name, None)
+            if p is not None:
+                affected.add(p)
+            consumers = topo.consumers.setdefault(t.name, [])
+            if not removed:
+                consumers.append(node)
+            elif node in consumers:
+                consumers.remove(node)
+        for t in outputs:
+            p = topo.producers.get(t.name, None)
+            if not removed:
+                if p is not None:
+                    affected.add(p)
+                topo.producers[t.name] = node
+                t.pnode = node
+            elif p is node:
+                del topo.producers[t.name]
+            affected.update(topo.consumers.get(t.name, ()))
+        if relink_node:
+            affected.add(node)
+        else:
+            affected.discard(node)
+        for n in affected:
+            self._relink(n)
+        topo.generations_dirty = True
+        self.net_ = None
+
+    def _relink(self, n):
+        # the same parents and children as init_networkx gives: successors are ordered by their first edge
+        # (the producer's output index, then the node position), children follow the order of n's outputs
+        producers = self._topology.producers
+        consumers = self._topology.consumers
+        n.parents = tuple(producers[t.name] for t in n.inputs if t.name in producers)
+        first_edge = {}
+        for k, t in enumerate(n.outputs):
+            if producers.get(t.name, None) is n:
+                for d in consumers.get(t.name, ()):
+                    first_edge.setdefault(d, k)
+        successors = list(first_edge)
+        if len(successors) > 1:
+            successors.sort(key=lambda d: (first_edge[d], self.nodes.index(d)))
+        children = []
+        for t in n.outputs:
+            tconsumers = consumers.get(t.name, ())
+            if tconsumers:
+                children.extend(d for d in successors if d in tconsumers)
+        n.children = tuple(children)
+
     def reset_edge_tensors_ref_count(self):
         ref_count_tensors = {}
         for n in self.nodes:
@@ -235,19 +485,49 @@ class PyGraph:
                     ref_count_tensors[it.name][0] += 1
         self.ref_count_tensors = ref_count_tensors
 
+    def release_node_tensors(self, node):
+        """
+        called after node's forward: each input of node is freed once node is its last consumer
+        (reference counts of reset_edge_tensors_ref_count), an empty ref_count_tensors keeps all of them.
+        """
+        from AIPUBuilder.Optimizer.framework.pycore.pytensor import PyTensor
+        memory = self._activation_memory
+        if memory is not None:
+            memory.acquire(node.outputs)
+        tz = None
+        for it in node.inputs:
+            rval = self.ref_count_tensors.get(it.name, None)
+            if rval is None:
+                continue
+            rval[0] -= 1
+            rt = rval[1]
+            if 0 == rval[0] and rt not in self.output_tensors:
+                if memory is not None:
+                    memory.release(rt)
+                if tz is None:
+                    tz = PyTensor('null').betensor
+                del rt.betensor
+                rt.betensor = tz
+
     def add_node(self, node):
         if node not in self.nodes:
             self.nodes.append(node)
-            self.init_networkx()
+            self.update_topological_generations()
             idx = -1
             for i, n in enumerate(self.nodes):
                 if n.attrs['tgid'] > node.attrs['tgid']:
                     idx = i
                     break
-            self.nodes = self.nodes[:idx] + [node, ] + self.nodes[idx:-1]
+            if idx >= 0:
+                # move it without touching the index, only the order of its parents' children may change
+                list.pop(self.nodes)
+                list.insert(self.nodes, idx, node)
+                for p in set(node.parents):
+                    self._relink(p)
 
     def remove_node(self, node):
         if node in self.nodes:
+            self.nodes.remove(node)
             node.graph = None
             node.parents = ()
             node.children = ()
@@ -259,18 +539,17 @@ class PyGraph:
             for i, t in enumerate(node.outputs):
                 outputs.append(t.clone())
             node.outputs = tuple(outputs)
-            idx = self.nodes.index(node)
-            self.nodes = self.nodes[:idx] + self.nodes[idx+1:]
-            self.init_networkx()
+            if self._topology is None:
+                self.init_networkx()
 
     def replace_node_safely(self, old, new):
         if old in self.nodes:
             idx = self.nodes.index(old)
-            self.nodes[idx] = new
             new.inputs = old.inputs
             new.outputs = old.outputs
             new.parents = old.parents
             new.children = old.children
+            self.nodes[idx] = new
             new.graph = self
             if 'tgid' in old.attrs:
                 new.attrs['tgid'] = old.attrs['tgid']
@@ -301,14 +580,23 @@ class PyGraph:
             inp.betensor = PyTensor('tmp', d).betensor
 
         import sys
-        from AIPUBuilder.Optimizer.logger import tqdm
-        with tqdm(total=len(self.nodes), desc='forward_to', file=sys.stdout, leave=True, disable=disable_pbar) as pbar:
-            for n in self.nodes:
-                n.forward()
-                if dest_node is not None and n == dest_node:
-                    break
-                pbar.update(1)
-            pbar.refresh()
+        from AIPUBuilder.Optimizer.logger import tqdm, OPT_DEBUG
+        self._activation_memory = _ActivationMemory()
+        self._activation_memory.acquire(self.input_tensors)
+        try:
+            with tqdm(total=len(self.nodes), desc='forward_to', file=sys.stdout, leave=True, disable=disable_pbar) as pbar:
+                for n in self.nodes:
+                    n.forward()
+                    if dest_node is not None and n == dest_node:
+                        break
+                    pbar.update(1)
+                pbar.refresh()
+            peak = self._activation_memory.peak
+        finally:
+            self._activation_memory = None
+        if peak > self.peak_activation_memory:
+            self.peak_activation_memory = peak
+            OPT_DEBUG('peak activation memory of graph %s: %.3f MB' % (self.name, peak / 1024 ** 2))
 
         ret = []
         if dest_node is None:
@@ -419,9 +707,9 @@ class PyGraph:
         serialize_graph_to_ir(self, ir_txt, ir_bin)
 
     @classmethod
-    def parse(cls, ir_txt, ir_bin):
+    def parse(cls, ir_txt, ir_bin, cache_dir='', lazy_constants=False):
         from AIPUBuilder.Optimizer.framework.pycore.pyir import parse_graph_from_ir
-        g = parse_graph_from_ir(ir_txt, ir_bin)
+        g = parse_graph_from_ir(ir_txt, ir_bin, cache_dir, lazy_constants)
         return g
 
 
@@ -5,6 +5,10 @@
 # -*- coding: UTF-8 -*-
 # cython: language_level=3
 
+import functools
+import re
+import sys
+
 
 def cast_to_NodeParamValue(v):
     from AIPUBuilder.Optimizer.logger import OPT_WARN
@@ -38,38 +42,75 @@ def cast_to_NodeParamValue(v):
     return v
 
 
-def cast_from_NodeParamValue_string(v):
-    from AIPUBuilder.Optimizer.utils.dtype_utils import str2dtype, dtype2str
-    from AIPUBuilder.Optimizer.framework.pycore.pytype import Dtype
-    import re
-
-    def is_valid_list_string(sv):
-        if (len(sv) > 1) and (sv[0] == '[') and (sv[-1] == ']'):
-            stk = []
-            for i in range(len(sv)):
-                c = sv[i]
-                if '[' == c:
-                    stk.append(c)
-                elif ']' == c:
-                    if len(stk) < 1:
-                        return False
-                    else:
-                        stk.pop()
-            if len(stk) < 1:
-                return True
-            else:
-                return False
-        else:
-            return False
+def _is_valid_list_string(sv):
+    if (len(sv) > 1) and (sv[0] == '[') and (sv[-1] == ']'):
+        stk = 0
+        for c in sv:
+            if '[' == c:
+                stk += 1
+            elif ']' == c:
+                if stk < 1:
+                    return False
+                else:
+                    stk -= 1
+        return stk < 1
+    else:
+        return False
+
+
+_PARAM_VALUE_PATTERNS = None
+
+
+def _param_value_patterns():
+    # compiled once instead of on every (recursive) cast_from_NodeParamValue_string call
+    global _PARAM_VALUE_PATTERNS
+    if _PARAM_VALUE_PATTERNS is None:
+        from AIPUBuilder.Optimizer.utils.dtype_utils import dtype2str
+        from AIPUBuilder.Optimizer.framework.pycore.pytype import Dtype
+        import re
+        dt_s = ''
+        for dt in Dtype:
+            str_dt = dtype2str(dt)
+            dt_s += '|'.join([str_dt, f"dtype.{str_dt}|"])
+        _PARAM_VALUE_PATTERNS = (re.compile('^('+dt_s[:-1]+')$'),
+                                 re.compile(r'^(\-|\+)?\d+$'),
+                                 re.compile(r'^(((\-|\+)?\d+((\.\d+)|\.)?(e(\-|\+)?\d+)?)|((\-|\+)?inf))$'))
+    return _PARAM_VALUE_PATTERNS
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _cast_scalar_from_NodeParamValue_string(sv):
+    # results are immutable, so repeated values (dtypes, names, small numbers) share one object
+    from AIPUBuilder.Optimizer.utils.dtype_utils import str2dtype
+    dtype_pattern, int_pattern, float_pattern = _param_value_patterns()
+    lsv = sv.lower()
+    if dtype_pattern.match(lsv):
+        return str2dtype(sv)
+    elif int_pattern.match(lsv):
+        return int(sv)
+    elif float_pattern.match(lsv):
+        return float(sv)
+    elif 'true' == lsv:
+        return True
+    elif 'false' == lsv:
+        return False
+    else:
+        # str
+        return sys.intern(str(sv))
+
 
-    dt_s = ''
-    for dt in Dtype:
-        str_dt = dtype2str(dt)
-        dt_s += '|'.join([str_dt, f"dtype.{str_dt}|"])
+def cast_from_NodeParamValue_string(v):
     sv = v.strip()
-    if is_valid_list_string(sv):
+    if _is_valid_list_string(sv):
         # list
         lt = []
+        if '[' not in sv[1:-1]:
+            # flat list, the common case of shapes, names and scales
+            for sub_str in sv[1:-1].split(','):
+                sub_str = sub_str.strip(' \'')
+                if len(sub_str) > 0:
+                    lt.append(cast_from_NodeParamValue_string(sub_str))
+            return lt
         ts = sv[1:-1] + ','
         cntl = 0
         cntr = 0
@@ -87,19 +128,8 @@ def cast_from_NodeParamValue_string(v):
                         lt.append(cast_from_NodeParamValue_string(sub_str))
                     pos = i+1
         return lt
-    elif re.match('^('+dt_s[:-1]+')$', sv.lower()):
-        return str2dtype(sv)
-    elif re.match(r'^(\-|\+)?\d+$', sv.lower()):
-        return int(sv)
-    elif re.match(r'^(((\-|\+)?\d+((\.\d+)|\.)?(e(\-|\+)?\d+)?)|((\-|\+)?inf))$', sv.lower()):
-        return float(sv)
-    elif re.match(r'^true$', sv.lower()):
-        return True
-    elif re.match(r'^false$', sv.lower()):
-        return False
     else:
-        # str
-        return str(sv)
+        return _cast_scalar_from_NodeParamValue_string(sv)
 
 
 def cast_to_NodeParamValue_string(v):
@@ -294,172 +324,287 @@ def convert_opt_graph_to_aipu_graph(g):
     return cg
 
 
-def parse_graph_from_ir(ir_txt, ir_bin):
+# bump when the cached topology layout changes
+_IR_TOPOLOGY_CACHE_VERSION = 1
+_IR_TOPOLOGY_CACHE_KEYS = {}
+_LAYER_NON_PARAM_KEYS = ('layer_id', 'layer_name', 'layer_type', 'layer_bottom', 'layer_bottom_shape',
+                         'layer_bottom_type', 'layer_top', 'layer_top_shape', 'layer_top_type', 'layer_top_scale',
+                         'layer_top_zp')
+_CONSTANT_OFFSET_PATTERN = re.compile(r'.+_offset')
+
+
+def _iter_ir_sections(ftxt):
+    # stream the blank line separated sections of `key=value` lines, keys are interned as they repeat in every layer
+    sdict = {}
+    for line in ftxt:
+        line = line.strip()
+        if len(line) > 0:
+            k, v = line.split('=')
+            sdict[sys.intern(k.strip())] = v.strip()
+        elif len(sdict) > 0:
+            yield sdict
+            sdict = {}
+    if len(sdict) > 0:
+        yield sdict
+
+
+def _parse_ir_abstract(sec):
+    inp_tensor_names = cast_from_NodeParamValue_string(sec['input_tensors']) if 'input_tensors' in sec.keys() else []
+    out_tensor_names = cast_from_NodeParamValue_string(sec['output_tensors']) if 'output_tensors' in sec.keys() else []
+    compat_quantized_model = None
+    if 'compat_quantized_model' in sec:
+        compat_quantized_model = True if sec['compat_quantized_model'].lower() == 'true' else False
+    return {'model_name': sec['model_name'],
+            'compat_quantized_model': compat_quantized_model,
+            'input_tensors': [str(s) for s in inp_tensor_names],
+            'output_tensors': [str(s) for s in out_tensor_names]}
+
+
+def _parse_ir_layer(sec):
+    # the plain python values of a layer section: (name, type, id, bottoms, tops, constants, params)
+    from AIPUBuilder.Optimizer.utils.dtype_utils import str2dtype
+    bottom_names = [str(s) for s in cast_from_NodeParamValue_string(sec['layer_bottom'])]
+    top_names = [str(s) for s in cast_from_NodeParamValue_string(sec['layer_top'])]
+    top_shape = cast_from_NodeParamValue_string(sec['layer_top_shape'])
+    top_dtype = cast_from_NodeParamValue_string(sec['layer_top_type'])
+    top_scale = cast_from_NodeParamValue_string(sec['layer_top_scale']) if 'layer_top_scale' in sec.keys() else []
+    top_zerop = cast_from_NodeParamValue_string(sec['layer_top_zp']) if 'layer_top_zp' in sec.keys() else []
+    tops = []
+    for j in range(len(top_names)):
+        tops.append((top_names[j], top_shape[j], top_dtype[j],
+                     top_scale[j] if len(top_scale) > j else None,
+                     top_zerop[j] if len(top_zerop) > j else None))
+    non_param_keys = set(_LAYER_NON_PARAM_KEYS)
+    constants = []
+    for key in sec.keys():
+        if _CONSTANT_OFFSET_PATTERN.match(key):
+            ckey = key[:-7]
+            ckey_type = ckey + '_type'
+            ckey_size = ckey + '_size'
+            ckey_shape = ckey + '_shape'
+            ckey_scale = ckey + '_scale'
+            ckey_zerop = ckey + '_zp'
+            if ckey_type in sec.keys() and ckey_size in sec.keys() and ckey_shape in sec.keys():
+                scale = None
+                zerop = None
+                if ckey_scale in sec.keys() and ckey_zerop in sec.keys():
+                    scale = cast_from_NodeParamValue_string(sec[ckey_scale])
+                    zerop = cast_from_NodeParamValue_string(sec[ckey_zerop])
+                constants.append((ckey, int(sec[key]), int(sec[ckey_size]),
+                                  cast_from_NodeParamValue_string(sec[ckey_shape]),
+                                  cast_from_NodeParamValue_string(sec[ckey_type]), str2dtype(sec[ckey_type]),
+                                  scale, zerop))
+                non_param_keys.update((key, ckey_type, ckey_size, ckey_shape))
+    params = [(key, cast_from_NodeParamValue_string(sec[key])) for key in sec.keys() if key not in non_param_keys]
+    return (sec['layer_name'], sec['layer_type'], sec['layer_id'], bottom_names, tops, constants, params)
+
+
+def _ir_topology_cache_file(ir_txt, cache_dir):
+    # keyed by the content of the IR text, hashed once per (path, size, mtime) in a process
+    import hashlib
+    import os
+    st = os.stat(ir_txt)
+    stamp = (os.path.realpath(ir_txt), st.st_size, st.st_mtime_ns)
+    if stamp not in _IR_TOPOLOGY_CACHE_KEYS:
+        h = hashlib.sha256(f'ir_topology_v{_IR_TOPOLOGY_CACHE_VERSION}'.encode())
+        with open(ir_txt, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 24), b''):
+                h.update(chunk)
+        _IR_TOPOLOGY_CACHE_KEYS[stamp] = h.hexdigest()
+    key = _IR_TOPOLOGY_CACHE_KEYS[stamp]
+    return os.path.join(cache_dir, key[:2], key + '.irtopo.pkl')
+
+
+def _load_ir_topology(cache_file):
+    import os
+    import pickle
+    from AIPUBuilder.Optimizer.logger import OPT_DEBUG
+    if not os.path.isfile(cache_file):
+        return None
+    try:
+        with open(cache_file, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        OPT_DEBUG(f"ignore broken IR topology cache file {cache_file}: {e}")
+        return None
+
+
+def _save_ir_topology(cache_file, topology):
+    import os
+    import pickle
+    from AIPUBuilder.Optimizer.utils.files_utils import make_dir_path
+    make_dir_path(os.path.dirname(cache_file))
+    # write to a temporary file first so that concurrent runs never read a partial entry
+    tmp_fname = f'{cache_file}.{os.getpid()}.tmp'
+    with open(tmp_fname, 'wb') as f:
+        pickle.dump(topology, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_fname, cache_file)
+
+
+class _BinConstantLoader(object):
+    # a constant of the IR bin file, its betensor shares the mmap'd file when no type conversion is needed
+    def __init__(self, ir_bin, offset, size, dtype, shape, bstr=None, copy=False):
+        import mmap
+        if bstr is None:
+            with open(ir_bin, "rb") as f:
+                bstr = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        self.ir_bin = ir_bin
+        self.bstr = bstr
+        self.offset = offset
+        self.size = size
+        self.dtype = dtype
+        self.shape = shape
+        self.copy = copy
+
+    def __call__(self):
+        import numpy as np
+        from AIPUBuilder.Optimizer.framework.pycore.pytensor import _betensor_from_numpy
+        arr = np.frombuffer(self.bstr, dtype=self.dtype, count=self.size // np.dtype(self.dtype).itemsize,
+                            offset=self.offset)
+        return _betensor_from_numpy(arr, copy=self.copy).reshape(self.shape)
+
+    def source(self):
+        """where the constant is read from, a changed IR bin file gives another source"""
+        import os
+        st = os.stat(self.ir_bin)
+        return [os.path.abspath(self.ir_bin), st.st_size, st.st_mtime_ns, self.offset, self.size, str(self.dtype),
+                list(self.shape)]
+
+    def __deepcopy__(self, memo):
+        # the copy must not share its betensor with the original one
+        return self.__class__(self.ir_bin, self.offset, self.size, self.dtype, self.shape, self.bstr, True)
+
+    def __reduce__(self):
+        # the mapping itself can not be pickled, reopen the file instead
+        return (self.__class__, (self.ir_bin, self.offset, self.size, self.dtype, self.shape))
+
+
+def parse_graph_from_ir(ir_txt, ir_bin, cache_dir='', lazy_constants=False):
     from AIPUBuilder.Optimizer.framework.qgraph import QuantizeGraph
     from AIPUBuilder.Optimizer.framework.pycore.pynode import PyNode
     from AIPUBuilder.Optimizer.framework.pycore.pytensor import PyTensor, TensorShape
     from AIPUBuilder.Optimizer.framework.pycore.pytype import register_optype, OpType
     from AIPUBuilder.Optimizer.logger import OPT_INFO, OPT_WARN, OPT_DEBUG, tqdm
-    from AIPUBuilder.Optimizer.utils.dtype_utils import str2dtype, dtype2nptype
+    from AIPUBuilder.Optimizer.utils.dtype_utils import dtype2nptype
+    import itertools
     import mmap
     import os
-    import sys
-    import re
-    import numpy as np
     import torch
     g = QuantizeGraph()
     OPT_INFO('Suggest using "aipuchecker" to validate the IR firstly if you are not sure about its validity.')
-    gstr = ''
-    with open(ir_txt, 'r') as ftxt:
-        gstr += ftxt.read()
     # get sections of key value pairs
     msg = 'Invalid IR, please use "aipuchecker" to diagnose it for more specific information.'
+    ftxt = None
     try:
-        sections = []
-        sdict = {}
-        gstr += '\n\n'
-        for line in gstr.splitlines():
-            if len(line.strip()) > 0:
-                k, v = line.strip().split('=')
-                sdict[k.strip()] = v.strip()
-            else:
-                if len(sdict.keys()) > 0:
-                    sections.append(sdict)
-                sdict = {}
-        if len(sections) > 1:
-            abstract = sections[0]
+        cache_file = _ir_topology_cache_file(ir_txt, cache_dir) if cache_dir else ''
+        topology = _load_ir_topology(cache_file) if cache_file else None
+        if topology is not None:
+            OPT_INFO(f"IR topology loaded from cache: {cache_file}")
+            abstract, layers = topology
+            layers_iter = iter(layers)
+        else:
+            # parse the text section by section while building the graph
+            ftxt = open(ir_txt, 'r')
+            sections = _iter_ir_sections(ftxt)
+            abstract = next(sections, None)
+            first_layer = next(sections, None)
+            abstract = _parse_ir_abstract(abstract) if first_layer is not None else None
+            layers = []
+
+            def parse_layers():
+                for sec in itertools.chain([first_layer], sections):
+                    layer = _parse_ir_layer(sec)
+                    layers.append(layer)
+                    yield layer
+            layers_iter = parse_layers()
+        if abstract is not None:
             g.name = abstract['model_name']
-            if 'compat_quantized_model' in abstract:
-                g.compat_quantized_model = True if abstract['compat_quantized_model'].lower() == 'true' else False
-            inp_tensor_names = cast_from_NodeParamValue_string(
-                abstract['input_tensors']) if 'input_tensors' in abstract.keys() else []
-            inp_tensor_names = [str(s) for s in inp_tensor_names]
-            out_tensor_names = cast_from_NodeParamValue_string(
-                abstract['output_tensors']) if 'output_tensors' in abstract.keys() else []
-            out_tensor_names = [str(s) for s in out_tensor_names]
+            if abstract['compat_quantized_model'] is not None:
+                g.compat_quantized_model = abstract['compat_quantized_model']
+            inp_tensor_names = abstract['input_tensors']
+            out_tensor_names = abstract['output_tensors']
             emap = {}
-            for i in range(1, len(sections)):
-                sec = sections[i]
-                top_names = cast_from_NodeParamValue_string(sec['layer_top'])
-                top_names = [str(s) for s in top_names]
-                top_shape = cast_from_NodeParamValue_string(sec['layer_top_shape'])
-                top_dtype = cast_from_NodeParamValue_string(sec['layer_top_type'])
-                top_scale = cast_from_NodeParamValue_string(
-                    sec['layer_top_scale']) if 'layer_top_scale' in sec.keys() else []
-                top_zerop = cast_from_NodeParamValue_string(
-                    sec['layer_top_zp']) if 'layer_top_zp' in sec.keys() else []
-                for j in range(len(top_names)):
-                    t = PyTensor(top_names[j])
-                    t.ir_shape = TensorShape(top_shape[j])
-                    t.ir_dtype = top_dtype[j]
-                    t.dtype = t.ir_dtype
-                    if len(top_scale) > j:
-                        t.scale = torch.tensor(top_scale[j], device=t.betensor.device) if isinstance(
-                            top_scale[j], list) else top_scale[j]
-                    if len(top_zerop) > j:
-                        t.zerop = torch.tensor(top_zerop[j], device=t.betensor.device) if isinstance(
-                            top_zerop[j], list) else top_zerop[j]
-                    emap[t.name] = t
-            OPT_INFO("IR loaded.")
+            defined = set()
+
+            def get_tensor(tname):
+                # tensors are created at their first reference, either as a bottom or a top
+                if tname not in emap:
+                    emap[tname] = PyTensor(tname)
+                return emap[tname]
+
+            def to_tensor(v, t):
+                return torch.tensor(v, device=t.betensor.device) if isinstance(v, list) else v
+
             tensor_list = []
             need_reordering = False
             old_offset = -1
-            pbar = tqdm(range(1, len(sections)), desc="Building graph", file=sys.stdout)
-            for i in pbar:
-                sec = sections[i]
-                n = PyNode(sec['layer_name'], register_optype(sec['layer_type']))
-                n.attrs['layer_id'] = sec['layer_id']
-                bottom_names = cast_from_NodeParamValue_string(sec['layer_bottom'])
-                bottom_names = [str(s) for s in bottom_names]
-                for j in range(len(bottom_names)):
-                    t = emap[bottom_names[j]]
-                    n.add_input(t)
-                top_names = cast_from_NodeParamValue_string(sec['layer_top'])
-                top_names = [str(s) for s in top_names]
-                for j in range(len(top_names)):
-                    t = emap[top_names[j]]
+            pbar = tqdm(layers_iter, total=len(layers) if topology is not None else None,
+                        desc="Building graph", file=sys.stdout)
+            for name, ltype, layer_id, bottom_names, tops, constants, params in pbar:
+                n = PyNode(name, register_optype(ltype))
+                n.attrs['layer_id'] = layer_id
+                for tname in bottom_names:
+                    n.add_input(get_tensor(tname))
+                for tname, shape, dtype, scale, zerop in tops:
+                    t = get_tensor(tname)
+                    t.ir_shape = TensorShape(shape)
+                    t.ir_dtype = dtype
+                    t.dtype = t.ir_dtype
+                    if scale is not None:
+                        t.scale = to_tensor(scale, t)
+                    if zerop is not None:
+                        t.zerop = to_tensor(zerop, t)
+                    defined.add(tname)
                     n.add_output(t)
-                non_param_keys = ['layer_id', 'layer_name', 'layer_type', 'layer_bottom', 'layer_bottom_shape',
-                                  'layer_bottom_type', 'layer_top', 'layer_top_shape', 'layer_top_type', 'layer_top_scale', 'layer_top_zp']
-                for key in sec.keys():
-                    if re.match(r'.+_offset', key):
-                        ckey = key[:-7]
-                        ckey_offset = key
-                        ckey_type = ckey + '_type'
-                        ckey_size = ckey + '_size'
-                        ckey_shape = ckey + '_shape'
-                        ckey_scale = ckey + '_scale'
-                        ckey_zerop = ckey + '_zp'
-                        if ckey_type in sec.keys() and ckey_size in sec.keys() and ckey_shape in sec.keys():
-                            bytes_offset = int(sec[ckey_offset])
-                            if not need_reordering and bytes_offset < old_offset:
-                                need_reordering = True
-                            old_offset = bytes_offset
-                            bytes_size = int(sec[ckey_size])
-                            t = PyTensor(f'{n.name}{ckey}')
-                            t.ir_shape = TensorShape(cast_from_NodeParamValue_string(sec[ckey_shape]))
-                            t.ir_dtype = cast_from_NodeParamValue_string(sec[ckey_type])
-                            t.dtype = t.ir_dtype
-                            tensor_list.append([bytes_offset, bytes_size, t, dtype2nptype(str2dtype(sec[ckey_type]))])
-                            if set((ckey_scale, ckey_zerop)).issubset(set(sec.keys())):
-                                t.scale = cast_from_NodeParamValue_string(sec[ckey_scale])
-                                t.zerop = cast_from_NodeParamValue_string(sec[ckey_zerop])
-                                t.scale = torch.tensor(t.scale, device=t.betensor.device) if isinstance(
-                                    t.scale, list) else t.scale
-                                t.zerop = torch.tensor(t.zerop, device=t.betensor.device) if isinstance(
-                                    t.zerop, list) else t.zerop
-                            n.constants[ckey] = t
-                            non_param_keys.extend([ckey_offset, ckey_type, ckey_size, ckey_shape])
-                for key in sec.keys():
-                    if key not in non_param_keys:
-                        n.params[key] = cast_from_NodeParamValue_string(sec[key])
+                for ckey, bytes_offset, bytes_size, shape, dtype, np_dtype, scale, zerop in constants:
+                    if not need_reordering and bytes_offset < old_offset:
+                        need_reordering = True
+                    old_offset = bytes_offset
+                    t = PyTensor(f'{n.name}{ckey}')
+                    t.ir_shape = TensorShape(shape)
+                    t.ir_dtype = dtype
+                    t.dtype = t.ir_dtype
+                    tensor_list.append([bytes_offset, bytes_size, t, dtype2nptype(np_dtype)])
+                    if scale is not None:
+                        t.scale = to_tensor(scale, t)
+                        t.zerop = to_tensor(zerop, t)
+                    n.constants[ckey] = t
+                for key, value in params:
+                    n.params[key] = value
                 g.nodes.append(n)
             pbar.refresh()
+            for tname in emap.keys():
+                if tname not in defined:
+                    raise KeyError(tname)
+            if ftxt is not None and cache_file:
+                _save_ir_topology(cache_file, (abstract, layers))
+            OPT_INFO("IR loaded.")
             OPT_INFO("Begin to load weights.")
-            f = open(ir_bin, "rb")
             fsize = os.path.getsize(ir_bin)
             if fsize == 0 or len(tensor_list) == 0:
                 bstr = b''
             else:
-                bstr = mmap.mmap(f.fileno(), fsize, access=mmap.ACCESS_READ)
-                page_size = mmap.PAGESIZE
-                page_count = fsize // page_size
-                cores = torch.multiprocessing.cpu_count()  # Use multicores to preload
-                pages_per_core = page_count // cores
-                jobs = [[core * pages_per_core, (core+1) * pages_per_core] for core in range(cores)]
-
-                def load_page(ranges):
-                    for i in range(ranges[0], ranges[1]):
-                        _ = bstr[i * 4096]
-                ps = []
-                for core in range(cores):
-                    p = torch.multiprocessing.Process(target=load_page, args=(jobs[core],))
-                    p.start()
-                    ps.append(p)
-                for p in ps:
-                    p.join()
-            OPT_INFO("Weights loaded.")
-            global_offset = 0
-            forward_threshold = 2**29  # 512MB
+                with open(ir_bin, "rb") as f:
+                    # private mapping: lazily loaded constants can be modified in place without touching the file
+                    bstr = mmap.mmap(f.fileno(), fsize, access=mmap.ACCESS_COPY)
+                if not lazy_constants and hasattr(bstr, 'madvise'):
+                    bstr.madvise(mmap.MADV_SEQUENTIAL)
             if need_reordering:
                 tensor_list = sorted(tensor_list, key=lambda x: x[0])
-            pbar = tqdm(tensor_list, desc="Deserializing bin", file=sys.stdout)
-            for bytes_offset, bytes_size, t, dtype in pbar:
-                bytes_offset -= global_offset
-                arr = np.frombuffer(bstr[bytes_offset: bytes_offset + bytes_size], dtype=dtype)
-                if bytes_offset + bytes_size > forward_threshold:
-                    OPT_DEBUG(
-                        "Due to reading large bin file, OPT will split the large file to accelerate loading process.", log_once=True)
-                    global_offset += bytes_offset + bytes_size
-                    global_offset -= global_offset % mmap.ALLOCATIONGRANULARITY
-                    f.close()
-                    f = open(ir_bin, "rb")
-                    bstr = mmap.mmap(f.fileno(), fsize - global_offset,
-                                     access=mmap.ACCESS_READ, offset=int(global_offset))
-                tmp = PyTensor("bintmp", arr)
-                t.betensor = tmp.betensor.reshape(t.ir_shape)
-            pbar.refresh()
-            f.close()
+            if lazy_constants:
+                for bytes_offset, bytes_size, t, dtype in tensor_list:
+                    t.set_betensor_loader(_BinConstantLoader(ir_bin, bytes_offset, bytes_size, dtype, t.ir_shape, bstr))
+                OPT_INFO("Weights will be loaded on first use.")
+            else:
+                pbar = tqdm(tensor_list, desc="Deserializing bin", file=sys.stdout)
+                for bytes_offset, bytes_size, t, dtype in pbar:
+                    # loaded right away, through the loader so that the constant keeps its source
+                    t.set_betensor_loader(_BinConstantLoader(ir_bin, bytes_offset, bytes_size, dtype, t.ir_shape, bstr,
+                                                             True))
+                    _ = t.betensor
+                pbar.refresh()
+                OPT_INFO("Weights loaded.")
+            del bstr
 
             inp_tensors = []
             for tname in inp_tensor_names:
@@ -516,6 +661,9 @@ def parse_graph_from_ir(ir_txt, ir_bin):
         OPT_WARN(f'Failed to parse IR with the exception msg: {e}')
         OPT_WARN(msg)
         raise e
+    finally:
+        if ftxt is not None:
+            ftxt.close()
 
     return g
 
@@ -79,7 +79,7 @@ class PyNode:
         self.inputs = self.inputs[:k] + (t, ) + self.inputs[k:]
         if self.graph:
             # update edges' relationship in corresponding graph
-            self.graph.init_networkx()
+            self.graph.update_node_edges(self, inputs=(t, ))
 
     def add_output(self, t, idx=-1):
         k = idx if idx >= 0 else len(self.outputs) + 1 + idx
@@ -87,7 +87,7 @@ class PyNode:
         self.outputs = self.outputs[:k] + (t, ) + self.outputs[k:]
         if self.graph:
             # update edges' relationship in corresponding graph
-            self.graph.init_networkx()
+            self.graph.update_node_edges(self, outputs=(t, ))
 
     def remove_input(self, t):
         flag = False
@@ -97,10 +97,11 @@ class PyNode:
                 flag = True
                 idx = i
         if flag:
+            removed = self.inputs[idx]
             self.inputs = self.inputs[: idx] + self.inputs[idx+1:]
             if self.graph:
                 # update edges' relationship in corresponding graph
-                self.graph.init_networkx()
+                self.graph.update_node_edges(self, inputs=(removed, ), removed=True)
         return idx
 
     def remove_output(self, t):
@@ -112,10 +113,11 @@ class PyNode:
                 idx = i
                 out.pnode = None
         if flag:
+            removed = self.outputs[idx]
             self.outputs = self.outputs[: idx] + self.outputs[idx+1:]
             if self.graph:
                 # update edges' relationship in corresponding graph
-                self.graph.init_networkx()
+                self.graph.update_node_edges(self, outputs=(removed, ), removed=True)
         return idx
 
     def replace_input_temporarily(self, idx, t):
@@ -147,7 +149,7 @@ class PyNode:
         if key in self.params:
             return self.params[key]
         elif optional:
-            OPT_DEBUG('Optional param "%s" not exist in layer_id=%s, %s, %s, use default value "%s".' % (
+            OPT_DEBUG(lambda: 'Optional param "%s" not exist in layer_id=%s, %s, %s, use default value "%s".' % (
                 key, self.attrs.get('layer_id', "-1"), str(self.type), self.name, str(default_value)), log_once=True)
             return default_value
         else:
@@ -160,7 +162,7 @@ class PyNode:
         if key in self.attrs:
             return self.attrs[key]
         elif optional:
-            OPT_DEBUG('Optional attrs "%s" not exist in layer_id=%s, %s, %s, use default value "%s".' % (
+            OPT_DEBUG(lambda: 'Optional attrs "%s" not exist in layer_id=%s, %s, %s, use default value "%s".' % (
                 key, self.attrs.get('layer_id', "-1"), str(self.type), self.name, str(default_value)), log_once=True)
             return default_value
         else:
@@ -178,10 +180,12 @@ class PyNode:
             return None
 
     def forward(self, *args):
+        import torch
         from AIPUBuilder.Optimizer.framework import OP_DICT
         from AIPUBuilder.Optimizer.framework.pycore.pytensor import PyTensor
         from AIPUBuilder.Optimizer.utils.quant_tool_utils import linear_dequantize, linear_quantize_clip
         from AIPUBuilder.Optimizer.logger import OPT_WARN, OPT_ERROR, OPT_FATAL, OPT_DEBUG
+        from AIPUBuilder.Optimizer.analyzer.profiler import profile_op
         ret = None
 
         def _node_params_replace(dst_dict, src_dict, replace_keys=None):
@@ -234,10 +238,17 @@ class PyNode:
                         inp.betensor = linear_quantize_clip(
                             inp.betensor, inp.scale, inp.zerop, inp.qmin, inp.qmax)
                         inp.debug_flag = 0
-        # call OP's forward(), backup its inputs first in case that inp.betensor be modified in forward function
+        # call OP's forward(), backup its inputs first in case that inp.betensor be modified in forward function,
+        # ops which may modify them in place work on copies, so the backups never need to be copied
+        op_forward = OP_DICT[self.type]
         maintained_inp_betensors = []
         for ii, iinp in enumerate(self.inputs):
-            maintained_inp_betensors.append(iinp.betensor.clone())
+            maintained_inp_betensors.append(iinp.betensor)
+        if getattr(op_forward, 'mutable_inputs', True):
+            for iinp in self.inputs:
+                iinp.betensor = iinp.betensor.clone()
+            # the explicit args become the inputs' betensor, so the caller's tensors need the same protection
+            args = tuple(a.clone() if isinstance(a, torch.Tensor) else a for a in args)
         maintained_constants_betensor = {}
         if "weights" in self.constants.keys() and self.get_param("weight_compressed", optional=True, default_value=False):
             wt = self.constants["weights"]
@@ -253,7 +264,7 @@ class PyNode:
             # dequantize quantized weights
             maintained_constants_betensor['weights'] = wt.betensor
             wt.betensor = wt.betensor.float() * wscale * (0.5 ** wshift)
-        ret = OP_DICT[self.type](self, *args)
+        ret = profile_op(self, 'forward', op_forward, self, *args)
         for ii, iinp in enumerate(self.inputs):
             iinp.betensor = maintained_inp_betensors[ii]
         for kk, vv in maintained_constants_betensor.items():
@@ -279,7 +290,7 @@ class PyNode:
             if t.ir_shape:
                 sshape = t.ir_shape
             else:
-                OPT_WARN('IR Shape Info of Tensor: %s in layer_id=%s %s is lost' % (
+                OPT_WARN(lambda: 'IR Shape Info of Tensor: %s in layer_id=%s %s is lost' % (
                     t.name, str(self.attrs.get('layer_id', -1)), str(self.type)), log_once=True)
             flag = False
             if len(list(sshape)) != len(list(dshape)):
@@ -292,22 +303,11 @@ class PyNode:
                         flag = True
                         break
             if flag:
-                OPT_WARN('Get inconformity tensor shape %s with the original IR %s, layer_id=%s, tensor_name=%s' % (
+                OPT_WARN(lambda: 'Get inconformity tensor shape %s with the original IR %s, layer_id=%s, tensor_name=%s' % (
                     str(dshape), str(sshape), self.attrs.get('layer_id', "-1"), self.name), op_name=str(self.type), log_once=True)
         if self.graph:
-            tz = PyTensor('null').betensor
-            # reduce tensor's reference count
-            for it in self.inputs:
-                if it.name in self.graph.ref_count_tensors.keys():
-                    self.graph.ref_count_tensors[it.name][0] -= 1
             # clear useless tensors out of cache for memory saving
-            count_free = 0
-            for rkey, rval in self.graph.ref_count_tensors.items():
-                rt = rval[1]
-                if 0 == rval[0] and rt not in self.graph.output_tensors:
-                    del rt.betensor
-                    rt.betensor = tz
-                    count_free += 1
+            self.graph.release_node_tensors(self)
 
         return ret
 
@@ -316,6 +316,7 @@ class PyNode:
         from AIPUBuilder.Optimizer.framework import QUANT_OP_DICT, OpType
         from AIPUBuilder.Optimizer.utils.dtype_utils import is_signed, dtype2str
         from AIPUBuilder.Optimizer.logger import OPT_FATAL, OPT_DEBUG, OPT_ERROR, OPT_WARN
+        from AIPUBuilder.Optimizer.analyzer.profiler import profile_op
         import torch
 
         if self.type not in QUANT_OP_DICT:
@@ -387,7 +388,7 @@ class PyNode:
                 qnw.betensor = self.attrs['adaquant_biases'][bkey]
         ####################
         # then do the quantization
-        ret = QUANT_OP_DICT[self.type](self, *args, **kwargs)
+        ret = profile_op(self, 'quantize', QUANT_OP_DICT[self.type], self, *args, **kwargs)
 
         # finnaly check properties that must be decided during quantization
         self.attrs['quantization_info'] = {}
@@ -66,23 +66,57 @@ _tensor_default_property = {
 }
 
 
-def get_tensor_default_property():
-    return list(_tensor_default_property.keys())
+def _std_mean_mad(fbetensor, dims):
+    # std, mean and mean absolute deviation (around the same mean) of fbetensor reduced over dims (None means all)
+    import torch
+    from AIPUBuilder.Optimizer.utils import OPT_INT_MAX, OPT_INT_MIN
+    if dims is None:
+        std, mean = torch.std_mean(fbetensor)
+        mad = torch.mean(torch.abs(fbetensor - mean))
+    else:
+        std, mean = torch.std_mean(fbetensor, dim=dims, keepdim=True)
+        mad = torch.mean(torch.abs(fbetensor - mean), dim=dims)
+        std = std.reshape(mad.shape)
+        mean = mean.reshape(mad.shape)
+    std = torch.nan_to_num(torch.clamp(std, OPT_INT_MIN, OPT_INT_MAX), nan=1.0)
+    mean = torch.nan_to_num(torch.clamp(mean, OPT_INT_MIN, OPT_INT_MAX), nan=0.0)
+    mad = torch.nan_to_num(torch.clamp(mad, OPT_INT_MIN, OPT_INT_MAX), nan=0.0)
+    return std, mean, mad
 
 
-class PyTensor:
+def _histc_key_axis(fbetensor2d, kmin, kmax, bins):
+    """
+    batched torch.histc over each row of fbetensor2d (row i is binned within [kmin[i], kmax[i]]),
+    computed by one bincount over a flattened [channels, bins] index. the binning follows torch.histc:
+    an empty range is widened by 1 on both sides, values out of range (and nan) are ignored, a value is
+    mapped to bin int((x - min) * bins / (max - min)) in fp32 and the max value falls into the last bin.
+    the result may still differ from torch.histc by a few counts on the bin edges on other backends.
+    """
     import torch
-    import numpy as np
-    from typing import Union
-    from AIPUBuilder.Optimizer.framework.pycore.pytype import Dtype
-    __slots__ = tuple(_tensor_default_property.keys()) + ('name', 'betensor')
+    x = fbetensor2d.float()
+    channels = x.shape[0]
+    lo = kmin.float().reshape(-1, 1)
+    hi = kmax.float().reshape(-1, 1)
+    empty = lo == hi
+    lo = torch.where(empty, lo - 1, lo)
+    hi = torch.where(empty, hi + 1, hi)
+    valid = (x >= lo) & (x <= hi)
+    pos = ((x - lo) * bins / (hi - lo)).nan_to_num(0.0).clamp(0, bins - 1).long()
+    pos += torch.arange(channels, device=x.device).reshape(-1, 1) * bins
+    histc = torch.bincount(pos[valid], minlength=channels * bins)
+    return histc.reshape(channels, bins).float()
 
-    def __init__(self, name: str, shape_or_arr: Union[TensorShape, np.ndarray, torch.Tensor] = TensorShape(), dtype: Union[Dtype, None] = None):
+
+_DTYPE2TORCH_TYPE = None
+
+
+def _dtype2torch_type():
+    # the torch dtype holding each Dtype's betensor
+    global _DTYPE2TORCH_TYPE
+    if _DTYPE2TORCH_TYPE is None:
         import torch
-        import numpy as np
         from AIPUBuilder.Optimizer.framework.pycore.pytype import Dtype
-        from AIPUBuilder.Optimizer.utils.dtype_utils import torch_type2dtype, str2dtype, torch_type2nptype
-        th_dict = {
+        _DTYPE2TORCH_TYPE = {
             None:                   None,
             Dtype.FP16:             torch.float16,
             Dtype.BFP16:            torch.bfloat16,
@@ -102,6 +136,42 @@ class PyTensor:
             Dtype.ALIGNED_INT12:    torch.int32,  # in case of overflow in quant forward's computation
             Dtype.ALIGNED_UINT12:   torch.int32,  # in case of overflow in quant forward's computation
         }
+    return _DTYPE2TORCH_TYPE
+
+
+def _betensor_from_numpy(arr, copy=True):
+    """
+    the betensor of PyTensor(name, arr), the array is shared instead of copied if copy is False and it is
+    already of the target type.
+    """
+    import torch
+    from AIPUBuilder.Optimizer.utils.dtype_utils import str2dtype, torch_type2nptype
+    nptype = torch_type2nptype(_dtype2torch_type()[str2dtype(arr.dtype.name)])
+    if copy or arr.dtype != nptype or not arr.flags.aligned:
+        arr = arr.astype(nptype)
+    betensor = torch.from_numpy(arr)
+    if opt_use_cuda():
+        betensor = betensor.cuda()
+    return betensor
+
+
+def get_tensor_default_property():
+    return list(_tensor_default_property.keys())
+
+
+class PyTensor:
+    import torch
+    import numpy as np
+    from typing import Union
+    from AIPUBuilder.Optimizer.framework.pycore.pytype import Dtype
+    __slots__ = tuple(_tensor_default_property.keys()) + ('name', '_betensor', '_betensor_loader', '_betensor_source')
+
+    def __init__(self, name: str, shape_or_arr: Union[TensorShape, np.ndarray, torch.Tensor] = TensorShape(), dtype: Union[Dtype, None] = None):
+        import torch
+        import numpy as np
+        from AIPUBuilder.Optimizer.framework.pycore.pytype import Dtype
+        from AIPUBuilder.Optimizer.utils.dtype_utils import torch_type2dtype, str2dtype, torch_type2nptype
+        th_dict = _dtype2torch_type()
         for k, v in _tensor_default_property.items():
             self.__setattr__(k, v)
         self.name = str(name)
@@ -125,6 +195,49 @@ class PyTensor:
             self.betensor = self.betensor.cuda()
         self.ir_shape = TensorShape(self.betensor.shape)
 
+    @property
+    def betensor(self):
+        if self._betensor_loader is not None:
+            # deferred (e.g. constants lazily loaded from the IR bin file), materialized on first access
+            self._betensor = self._betensor_loader()
+            self._betensor_loader = None
+            if self._betensor_source is not None:
+                self._betensor_source = (self._betensor_source[0], self._betensor, self._betensor._version)
+        return self._betensor
+
+    @betensor.setter
+    def betensor(self, value):
+        self._betensor = value
+        self._betensor_loader = None
+        self._betensor_source = None
+
+    @betensor.deleter
+    def betensor(self):
+        del self._betensor
+        self._betensor_loader = None
+        self._betensor_source = None
+
+    def set_betensor_loader(self, loader):
+        """
+        defer betensor to the first access, which sets it to loader(). a loader with a source() (e.g. where it reads
+        in the IR bin file) lets betensor_source() identify betensor without loading it.
+        """
+        self._betensor = None
+        self._betensor_loader = loader
+        self._betensor_source = (loader.source(), None, None) if hasattr(loader, 'source') else None
+
+    def betensor_source(self):
+        """
+        the source() of the loader betensor came from, as long as betensor was neither replaced nor modified in place
+        since, else None.
+        """
+        if self._betensor_source is None:
+            return None
+        source, loaded, version = self._betensor_source
+        if self._betensor_loader is not None or (loaded is self._betensor and loaded._version == version):
+            return source
+        return None
+
     def clone(self, name=None):
         import copy
         import torch
@@ -148,11 +261,14 @@ class PyTensor:
                   statistic_std_mean=True,
                   # How to deal with infinite or equivalent very large/small values
                   trim_infinity=((float('-inf'), float('inf')), ''),
-                  reset=False):
+                  reset=False,
+                  # None means self.betensor, otherwise statistic on the given data (which may outlive self.betensor)
+                  data=None):
         import torch
         from AIPUBuilder.Optimizer.utils import OPT_INT_MAX, OPT_INT_MIN
-        tdevice = self.betensor.device
-        fbetensor = self.betensor.float()
+        data = self.betensor if data is None else data
+        tdevice = data.device
+        fbetensor = data.float()
 
         if trim_infinity[-1] == 'clip':
             fbetensor = torch.clamp(fbetensor.clone().detach(), trim_infinity[0][0], trim_infinity[0][1])
@@ -160,14 +276,12 @@ class PyTensor:
             trim_min, trim_max = min(trim_infinity[0][0], 0.0), max(trim_infinity[0][1], 0.0)
             sfbetensor = torch.where(fbetensor <= trim_min, torch.zeros_like(fbetensor), fbetensor)
             sfbetensor = torch.where(sfbetensor >= trim_max, torch.zeros_like(sfbetensor), sfbetensor)
-            second_min = sfbetensor.min().item()
-            second_max = sfbetensor.max().item()
+            second_min, second_max = torch.stack(torch.aminmax(sfbetensor)).tolist()
             fbetensor = torch.clamp(fbetensor.clone().detach(), second_min, second_max)
         else:
             pass
 
-        bmin = fbetensor.min().item()
-        bmax = fbetensor.max().item()
+        bmin, bmax = torch.stack(torch.aminmax(fbetensor)).tolist()
         bmin = max(bmin, OPT_INT_MIN)
         bmax = min(bmax, OPT_INT_MAX)
         other_dims = [i for i in range(fbetensor.dim())]
@@ -211,43 +325,27 @@ class PyTensor:
             perm = [key_axis] + [axis for axis in range(fbetensor.dim()) if axis != key_axis]
             torch_int_min = torch.tensor(OPT_INT_MIN, device=tdevice)
             torch_int_max = torch.tensor(OPT_INT_MAX, device=tdevice)
-            running_min_key_axis = torch.maximum(fbetensor.permute(perm).reshape([channels, -1]).min(dim=-1).values,
-                                                 torch_int_min)
+            fbetensor_key_axis = fbetensor.permute(perm).reshape([channels, -1])
+            # one min/max reduction over the [channels, -1] view instead of one walk per extrema
+            cmin, cmax = torch.aminmax(fbetensor_key_axis, dim=-1)
+            running_min_key_axis = torch.maximum(cmin, torch_int_min)
             self.extrema_min_key_axis = torch.min(self.extrema_min_key_axis, running_min_key_axis)
             self.running_min_key_axis = momentum * self.running_min_key_axis + (1.0-momentum) * running_min_key_axis
-            running_max_key_axis = torch.minimum(fbetensor.permute(perm).reshape([channels, -1]).max(dim=-1).values,
-                                                 torch_int_max)
+            running_max_key_axis = torch.minimum(cmax, torch_int_max)
             self.extrema_max_key_axis = torch.max(self.extrema_max_key_axis, running_max_key_axis)
             self.running_max_key_axis = momentum * self.running_max_key_axis + (1.0-momentum) * running_max_key_axis
             if statistic_std_mean:
-                running_std_key_axis, running_mean_key_axis = torch.std_mean(fbetensor, dim=other_dims)
-                running_mad_key_axis = torch.mean(
-                    torch.abs(fbetensor - torch.mean(fbetensor, dim=other_dims, keepdim=True)), dim=other_dims)
-                running_std_key_axis = torch.clamp(running_std_key_axis, OPT_INT_MIN, OPT_INT_MAX)
-                running_mean_key_axis = torch.clamp(running_mean_key_axis, OPT_INT_MIN, OPT_INT_MAX)
-                running_mad_key_axis = torch.clamp(running_mad_key_axis, OPT_INT_MIN, OPT_INT_MAX)
-                running_std_key_axis[torch.isnan(running_std_key_axis)] = 1.0
-                running_mean_key_axis[torch.isnan(running_mean_key_axis)] = 0.0
-                running_mad_key_axis[torch.isnan(running_mad_key_axis)] = 0.0
+                running_std_key_axis, running_mean_key_axis, running_mad_key_axis = _std_mean_mad(fbetensor,
+                                                                                                  other_dims)
                 self.running_mean_key_axis = momentum * self.running_mean_key_axis + \
                     (1.0-momentum) * running_mean_key_axis
                 self.running_std_key_axis = momentum * self.running_std_key_axis + (1.0-momentum) * running_std_key_axis
                 self.running_mad_key_axis = momentum * self.running_mad_key_axis + (1.0-momentum) * running_mad_key_axis
             if histc_bins != None:
-                running_histc_key_axis = torch.zeros_like(self.running_histc_key_axis)
-                for i in range(channels):
-                    kmin = max(min(running_min_key_axis[i], OPT_INT_MAX), OPT_INT_MIN)
-                    kmax = min(max(running_max_key_axis[i], OPT_INT_MIN), OPT_INT_MAX)
-                    if kmin != kmin:
-                        # nan
-                        kmin = 0
-                    if kmax != kmax:
-                        # nan
-                        kmax = 0
-                    if kmax <= kmin:
-                        kmax = kmin + abs(kmin / 2.) + 1.
-                    running_histc_key_axis[i] = fbetensor.select(
-                        key_axis, i).float().histc(bins=histc_bins, min=kmin, max=kmax)
+                kmin = torch.nan_to_num(torch.clamp(running_min_key_axis, OPT_INT_MIN, OPT_INT_MAX), nan=0.0)
+                kmax = torch.nan_to_num(torch.clamp(running_max_key_axis, OPT_INT_MIN, OPT_INT_MAX), nan=0.0)
+                kmax = torch.where(kmax <= kmin, kmin + torch.abs(kmin / 2.) + 1., kmax)
+                running_histc_key_axis = _histc_key_axis(fbetensor_key_axis, kmin, kmax, histc_bins)
                 self.running_histc_key_axis = momentum * self.running_histc_key_axis + \
                     (1.0-momentum) * running_histc_key_axis
         self.extrema_min = min(float(self.extrema_min), bmin)
@@ -255,17 +353,11 @@ class PyTensor:
         self.running_min = momentum * self.running_min + (1.0-momentum) * bmin
         self.running_max = momentum * self.running_max + (1.0-momentum) * bmax
         if statistic_std_mean:
-            running_std, running_mean = torch.std_mean(fbetensor)
-            running_mad = torch.mean(torch.abs(fbetensor - running_mean))
-            running_std = torch.clamp(running_std, OPT_INT_MIN, OPT_INT_MAX)
-            running_mean = torch.clamp(running_mean, OPT_INT_MIN, OPT_INT_MAX)
-            running_mad = torch.clamp(running_mad, OPT_INT_MIN, OPT_INT_MAX)
-            running_std[torch.isnan(running_std)] = 1.0
-            running_mean[torch.isnan(running_mean)] = 0.0
-            running_mad[torch.isnan(running_mad)] = 0.0
-            self.running_mean = momentum * self.running_mean + (1.0-momentum) * running_mean.item()
-            self.running_std = momentum * self.running_std + (1.0-momentum) * running_std.item()
-            self.running_mad = momentum * self.running_mad + (1.0-momentum) * running_mad.item()
+            # fetch all scalars with a single host sync
+            running_std, running_mean, running_mad = torch.stack(_std_mean_mad(fbetensor, None)).tolist()
+            self.running_mean = momentum * self.running_mean + (1.0-momentum) * running_mean
+            self.running_std = momentum * self.running_std + (1.0-momentum) * running_std
+            self.running_mad = momentum * self.running_mad + (1.0-momentum) * running_mad
         if histc_bins != None:
             kmin = max(min(bmin, OPT_INT_MAX), OPT_INT_MIN)
             kmax = min(max(bmax, OPT_INT_MIN), OPT_INT_MAX)
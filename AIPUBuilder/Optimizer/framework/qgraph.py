@@ -12,63 +12,277 @@ __all__ = [
 ]
 
 
-def graph_inference(graph, g_forward, dataloader, metrics, with_float=False, max_batches=0, disable_tqdm=False):
-    import sys
+def _float_cache_entry(tensors, prediction):
+    # the position keeps the entries apart when a tensor is listed twice in the graph outputs
+    return {f'{i}:{t.name}': p for i, (t, p) in enumerate(zip(tensors, prediction))}
+
+
+def _inference_batch(graph, g_forward, sample, with_float, float_cache=None):
     import torch
     from AIPUBuilder.Optimizer.framework.pycore.pytensor import opt_use_cuda
     from AIPUBuilder.Optimizer.utils.quant_tool_utils import linear_dequantize
-    from AIPUBuilder.Optimizer.logger import tqdm
-    desc = 'float metric batch' if with_float else 'quant metric batch'
+    inp, target = sample
+    if opt_use_cuda():
+        if isinstance(target, dict):
+            target = {key: target[key].cuda() if isinstance(target[key], torch.Tensor) else target[key]
+                      for key in target}
+        elif isinstance(target, (list, tuple)):
+            target = [t.cuda() if isinstance(t, torch.Tensor) else t for t in target]
+        else:
+            target = target.cuda() if isinstance(target, torch.Tensor) else target
+
+        if isinstance(inp, dict):
+            inp = {key: inp[key].cuda() for key in inp}
+        elif isinstance(inp, (list, tuple)):
+            inp = [ii.cuda() for ii in inp]
+        else:
+            inp = inp.cuda()
+    if float_cache is not None and graph.current_batch_idx in float_cache:
+        prediction = list(float_cache.get(graph.current_batch_idx).values())
+        if opt_use_cuda():
+            prediction = [p.cuda() for p in prediction]
+        return prediction, target
+    out = g_forward(inp)
+    # dequantize quantized forward's output tensors for consistently call metirc functions
+    prediction = []
+    for t in out:
+        if with_float:
+            prediction.append(t.betensor)
+        else:
+            if t.debug_flag or (t.pnode is not None and t.pnode.get_param('unquantifiable', optional=True, default_value=False)):
+                dtb = t.betensor
+            else:
+                dtb = linear_dequantize(t.betensor, t.scale, t.zerop)
+            prediction.append(dtb)
+    if float_cache is not None and with_float:
+        float_cache.put(graph.current_batch_idx, _float_cache_entry(out, prediction))
+    return prediction, target
+
+
+def _set_batch(graph, dataloader, batch_idx):
+    graph.current_batch_idx = batch_idx
     graph.current_batch_size = dataloader.batch_size
-    current_batch_idx = 0
-    with tqdm(dataloader, desc=desc, file=sys.stdout, disable=disable_tqdm) as pbar:
-        for i, sample in enumerate(pbar):
-            graph.current_batch_idx = current_batch_idx
-            current_batch_idx += 1
-            if current_batch_idx * dataloader.batch_size > len(dataloader.dataset):
-                graph.current_batch_size = len(dataloader.dataset) - (current_batch_idx - 1) * dataloader.batch_size
-            inp, target = sample
-            if opt_use_cuda():
-                if isinstance(target, dict):
-                    target = {key: target[key].cuda() if isinstance(target[key], torch.Tensor) else target[key]
-                              for key in target}
-                elif isinstance(target, (list, tuple)):
-                    target = [t.cuda() if isinstance(t, torch.Tensor) else t for t in target]
-                else:
-                    target = target.cuda() if isinstance(target, torch.Tensor) else target
+    if (batch_idx + 1) * dataloader.batch_size > len(dataloader.dataset):
+        graph.current_batch_size = len(dataloader.dataset) - batch_idx * dataloader.batch_size
 
-                if isinstance(inp, dict):
-                    inp = {key: inp[key].cuda() for key in inp}
-                elif isinstance(inp, (list, tuple)):
-                    inp = [ii.cuda() for ii in inp]
-                else:
-                    inp = inp.cuda()
-            out = g_forward(inp)
-            # dequantize quantized forward's output tensors for consistently call metirc functions
-            prediction = []
-            for t in out:
-                if with_float:
-                    prediction.append(t.betensor)
-                else:
-                    if t.debug_flag or (t.pnode is not None and t.pnode.get_param('unquantifiable', optional=True, default_value=False)):
-                        dtb = t.betensor
-                    else:
-                        dtb = linear_dequantize(t.betensor, t.scale, t.zerop)
-                    prediction.append(dtb)
+
+def _graph_inference_in_processes(graph, g_forward, dataloader, metrics, with_float, max_batches, workers, pbar,
+                                  float_cache):
+    from torch.utils.data import DataLoader
+    from AIPUBuilder.Optimizer.utils import run_in_forked_processes
+    batches = list(enumerate(dataloader.batch_sampler))
+    if max_batches > 0:
+        batches = batches[:max_batches]
+    workers = max(1, min(workers, len(batches)))
+
+    def forward(shard):
+        # only the samples of this worker's batches are loaded, with the original batching
+        loader = DataLoader(dataloader.dataset, batch_sampler=[idxs for _, idxs in shard],
+                            collate_fn=dataloader.collate_fn, num_workers=dataloader.num_workers)
+        for (batch_idx, _), sample in zip(shard, loader):
+            _set_batch(graph, dataloader, batch_idx)
+            yield batch_idx, _inference_batch(graph, g_forward, sample, with_float)
+        yield None, graph.peak_activation_memory
+    # metrics are fed in batch order, so they see exactly what the serial inference would feed them
+    pending = {}
+    next_batch = 0
+    for batch_idx, result in run_in_forked_processes(forward, [batches[k::workers] for k in range(workers)],
+                                                     'graph_inference'):
+        if batch_idx is None:
+            graph.peak_activation_memory = max(graph.peak_activation_memory, result)
+            continue
+        pending[batch_idx] = result
+        while next_batch in pending:
+            prediction, target = pending.pop(next_batch)
+            if float_cache is not None and next_batch not in float_cache:
+                float_cache.put(next_batch, _float_cache_entry(graph.output_tensors, prediction))
             for metric in metrics:
                 metric(prediction, target)
-            if max_batches > 0 and current_batch_idx >= max_batches:
-                break
-        pbar.refresh()
+            next_batch += 1
+            pbar.update(1)
+
+
+def graph_inference(graph, g_forward, dataloader, metrics, with_float=False, max_batches=0, disable_tqdm=False,
+                    workers=0, float_cache=None):
+    """
+    forward the batches of dataloader through g_forward (graph.forward or graph.qforward) and feed the predictions
+    to metrics. when workers > 0, the batches are sharded to that many forked processes, each one working on a
+    copy-on-write copy of graph, and their predictions are fed to metrics in the original batch order.
+    float_cache (a FloatResultCache of graph on dataloader, only used with with_float) provides the predictions of
+    the batches it holds and stores the predictions of the others.
+    """
+    import sys
+    import torch
+    from AIPUBuilder.Optimizer.framework.pycore.pytensor import opt_use_cuda
+    from AIPUBuilder.Optimizer.logger import tqdm
+    from AIPUBuilder.Optimizer.utils import forked_processes_available
+    desc = 'float metric batch' if with_float else 'quant metric batch'
+    total = len(dataloader) if max_batches <= 0 else min(max_batches, len(dataloader))
+    if not with_float:
+        float_cache = None
+    elif float_cache is not None and all(k in float_cache for k in range(total)):
+        # reading the cached predictions is cheaper than forking
+        workers = 0
+    if workers > 0 and not forked_processes_available('data parallel graph inference'):
+        workers = 0
+    try:
+        if workers > 0:
+            with tqdm(total=total, desc=desc, file=sys.stdout, disable=disable_tqdm) as pbar:
+                _graph_inference_in_processes(graph, g_forward, dataloader, metrics, with_float, max_batches, workers,
+                                              pbar, float_cache)
+                pbar.refresh()
+            return
+        current_batch_idx = 0
+        with tqdm(dataloader, desc=desc, file=sys.stdout, disable=disable_tqdm) as pbar:
+            for i, sample in enumerate(pbar):
+                _set_batch(graph, dataloader, current_batch_idx)
+                current_batch_idx += 1
+                prediction, target = _inference_batch(graph, g_forward, sample, with_float, float_cache)
+                for metric in metrics:
+                    metric(prediction, target)
+                if max_batches > 0 and current_batch_idx >= max_batches:
+                    break
+            pbar.refresh()
+    finally:
+        if float_cache is not None:
+            float_cache.flush()
     if opt_use_cuda():
         torch.cuda.empty_cache()
 
 
+_STATISTIC_PROPERTIES = (
+    "extrema_min", "extrema_max", "running_min", "running_max",
+    "running_mean", "running_std", "running_mad", "running_histc",
+)
+_STATISTIC_KEY_AXIS_PROPERTIES = (
+    "extrema_min_key_axis", "extrema_max_key_axis", "running_min_key_axis", "running_max_key_axis",
+    "running_mean_key_axis", "running_std_key_axis", "running_mad_key_axis", "running_histc_key_axis",
+)
+
+
+# columnar statistic file: magic, little-endian uint64 size of the json index, the json index, then a blob of arrays.
+# the index maps node -> tensor -> field to a scalar (or null) or {"dtype", "shape", "offset"} of an array in the blob.
+_STATISTIC_FILE_MAGIC = b'OPTSTAT\x01'
+_STATISTIC_FILE_ALIGN = 64
+
+
+def _is_columnar_statistic_file(fname):
+    with open(fname, 'rb') as f:
+        return f.read(len(_STATISTIC_FILE_MAGIC)) == _STATISTIC_FILE_MAGIC
+
+
+def _save_columnar_statistic(fname, statistic_info):
+    import json
+    import struct
+    import numpy as np
+
+    def align(offset):
+        return (offset + _STATISTIC_FILE_ALIGN - 1) // _STATISTIC_FILE_ALIGN * _STATISTIC_FILE_ALIGN
+
+    index = {}
+    arrays = []
+    offset = 0
+    for node_name, tensors in statistic_info.items():
+        index[node_name] = {}
+        for tensor_name, fields in tensors.items():
+            entry = {}
+            for field, value in fields.items():
+                if isinstance(value, np.ndarray):
+                    value = np.ascontiguousarray(value)
+                    offset = align(offset)
+                    entry[field] = {'dtype': value.dtype.str, 'shape': list(value.shape), 'offset': offset}
+                    arrays.append((offset, value))
+                    offset += value.nbytes
+                else:
+                    entry[field] = value
+            index[node_name][tensor_name] = entry
+    header = json.dumps(index).encode('utf-8')
+    blob_start = align(len(_STATISTIC_FILE_MAGIC) + 8 + len(header))
+    with open(fname, 'wb') as fw:
+        fw.write(_STATISTIC_FILE_MAGIC)
+        fw.write(struct.pack('<Q', len(header)))
+        fw.write(header)
+        for offset, value in arrays:
+            fw.write(b'\0' * (blob_start + offset - fw.tell()))
+            fw.write(value.tobytes())
+
+
+class _ColumnarStatisticFields(dict):
+    # the fields of one tensor of a columnar statistic file, an array field becomes a zero-copy view on the mapped
+    # file when it is first read
+    def __init__(self, fields, view):
+        super().__init__(fields)
+        self._view = view
+
+    def __getitem__(self, field):
+        value = super().__getitem__(field)
+        if isinstance(value, dict):
+            value = self._view(value)
+            self[field] = value
+        return value
+
+
+def _load_columnar_statistic(fname):
+    # returns the index, the file is only mapped and the arrays only viewed when their fields are read
+    import json
+    import struct
+    import numpy as np
+    with open(fname, 'rb') as f:
+        f.seek(len(_STATISTIC_FILE_MAGIC))
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        index = json.loads(f.read(header_size).decode('utf-8'))
+    blob_start = len(_STATISTIC_FILE_MAGIC) + 8 + header_size
+    blob_start = (blob_start + _STATISTIC_FILE_ALIGN - 1) // _STATISTIC_FILE_ALIGN * _STATISTIC_FILE_ALIGN
+    mapped = []
+
+    def view(meta):
+        dtype = np.dtype(meta['dtype'])
+        count = int(np.prod(meta['shape'], dtype=np.int64))
+        if count == 0:
+            return np.zeros(meta['shape'], dtype=dtype)
+        if not mapped:
+            # copy-on-write mapping keeps the views writable for torch without touching the file
+            mapped.append(np.memmap(fname, dtype=np.uint8, mode='c'))
+        start = blob_start + meta['offset']
+        return np.asarray(mapped[0][start: start + count * dtype.itemsize]).view(dtype).reshape(meta['shape'])
+
+    return {node_name: {tensor_name: _ColumnarStatisticFields(fields, view) for tensor_name, fields in tensors.items()}
+            for node_name, tensors in index.items()}
+
+
+def _digest_update(h, value):
+    # feed a (nested) params/attrs value into a hashlib object, tensors and arrays are hashed by content
+    import torch
+    import numpy as np
+    if isinstance(value, np.ndarray):
+        value = torch.from_numpy(np.ascontiguousarray(value))
+    if isinstance(value, torch.Tensor):
+        t = value.detach().cpu().contiguous().flatten()
+        h.update(f'tensor{str(t.dtype)}{list(value.shape)}'.encode())
+        h.update(t.view(torch.uint8).numpy().tobytes())
+    elif isinstance(value, dict):
+        h.update(b'{')
+        for k in sorted(value.keys(), key=str):
+            _digest_update(h, k)
+            _digest_update(h, value[k])
+        h.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        h.update(b'[')
+        for v in value:
+            _digest_update(h, v)
+        h.update(b']')
+    else:
+        h.update(f'{type(value).__name__}:{value!r};'.encode())
+
+
 class QuantizeGraph(PyGraph):
     def __init__(self, name="unamed"):
         super().__init__(name)
         self.quantgraph = None
         self.constants_statisticed = False
+        # pipelined statistic mode: the latest pending reduction of each tensor and the in-flight batches
+        self.statistic_pending = {}
+        self.statistic_inflight = []
 
     def clone(self):
         clone_graph = super().clone()
@@ -93,14 +307,31 @@ class QuantizeGraph(PyGraph):
             inp.betensor = PyTensor('tmp', d).betensor
             inp.betensor = inp.betensor.float()
 
-    def statistic(self, inputs, config):
-        import sys
-        from AIPUBuilder.Optimizer.framework.pycore.pytensor import TensorShape, PyTensor
-        from AIPUBuilder.Optimizer.utils import QuantMode
-        from AIPUBuilder.Optimizer.config import CalibrationStrategyField, TrimInfinityField
-        from AIPUBuilder.Optimizer.logger import tqdm, OPT_DEBUG
+    def submit_statistic(self, reduction_pool, t, *args, **kwargs):
+        # the running values depend on the batch order, so each reduction waits for the former one of the same tensor.
+        # workers take tasks in submission order, so the waited one has already been started and can not deadlock.
+        prev = self.statistic_pending.get(id(t), (None, None))[1]
+        # hold the current data as t.betensor will be released once it has been consumed
+        data = t.betensor
 
-        time_saving_mode = not config.save_statistic_info
+        def _reduce():
+            if prev is not None:
+                prev.result()
+            t.statistic(*args, data=data, **kwargs)
+        future = reduction_pool.submit(_reduce)
+        self.statistic_pending[id(t)] = (t, future)
+        return future
+
+    def wait_statistic(self, inflight_batches=0):
+        # block until at most inflight_batches batches have pending reductions, reraise errors raised in workers
+        while len(self.statistic_inflight) > inflight_batches:
+            for future in self.statistic_inflight.pop(0):
+                future.result()
+        if not self.statistic_inflight:
+            self.statistic_pending.clear()
+
+    def statistic_trim_infinity(self, config):
+        from AIPUBuilder.Optimizer.config import TrimInfinityField
         trim_inf_c, trim_inf_v = TrimInfinityField.parse(config.trim_infinity_before_statistic)
         trim_inf = {}
         for n in self.nodes:
@@ -115,10 +346,37 @@ class QuantizeGraph(PyGraph):
                 trim_inf[n] = trim_inf_v[layer_id] if layer_id in trim_inf_v.keys() else dv
             else:
                 trim_inf[n] = dv
-            if trim_inf[n] != dv:
+        return trim_inf
+
+    def statistic(self, inputs, config, reduction_pool=None, statistic_nodes=None):
+        """
+        statistic the constants (only once) and the activations of one batch of inputs.
+        if reduction_pool (a concurrent.futures executor) is given, the reductions are dispatched to it and overlap
+        with the forward of the following nodes and batches, call wait_statistic() before using the statistic results.
+        if statistic_nodes is given, only these nodes are statisticed and only they and their ancestors are forwarded.
+        """
+        import sys
+        from AIPUBuilder.Optimizer.framework.pycore.pytensor import TensorShape, PyTensor
+        from AIPUBuilder.Optimizer.utils import QuantMode
+        from AIPUBuilder.Optimizer.config import CalibrationStrategyField
+        from AIPUBuilder.Optimizer.logger import tqdm, OPT_DEBUG
+
+        # the sweep evaluates other calibration strategies, so it needs all the statistic info as well
+        time_saving_mode = not (config.save_statistic_info or config.calibration_strategy_sweep)
+        trim_inf = self.statistic_trim_infinity(config)
+        for n in self.nodes:
+            if trim_inf[n] != ((float('-inf'), float('inf')), ''):
                 OPT_DEBUG(
                     f"{n.type}, layer_id={n.attrs['layer_id']}, layer_name={n.name}, infinite values will be trimed {trim_inf[n]} before statistic", log_once=True)
 
+        futures = []
+
+        def _statistic(t, *args, **kwargs):
+            if reduction_pool is None:
+                t.statistic(*args, **kwargs)
+            else:
+                futures.append(self.submit_statistic(reduction_pool, t, *args, **kwargs))
+
         if not self.constants_statisticed:
             with tqdm(total=len(self.nodes), desc='statistic weights and biases', file=sys.stdout, leave=False) as pbar:
                 for n in self.nodes:
@@ -127,7 +385,7 @@ class QuantizeGraph(PyGraph):
                     statistic_std_mean = True
                     cstrategy = n.get_attrs('q_strategy_weight')
                     qmethod_wht = n.get_attrs('q_mode_weight')
-                    if not n.quantized:
+                    if not n.quantized and (statistic_nodes is None or n in statistic_nodes):
                         for _, v in n.constants.items():
                             key_axis = v.key_axis if v.ir_shape != TensorShape([]) else None
                             if time_saving_mode:
@@ -138,17 +396,28 @@ class QuantizeGraph(PyGraph):
                                     histc_bins = None
                                 if not r['std_mean']:
                                     statistic_std_mean = False
-                            v.statistic(running_statistic_momentum, key_axis=key_axis,
-                                        histc_bins=histc_bins, statistic_std_mean=statistic_std_mean,
-                                        trim_infinity=trim_inf[n],
-                                        reset=True)
+                            _statistic(v, running_statistic_momentum, key_axis=key_axis,
+                                       histc_bins=histc_bins, statistic_std_mean=statistic_std_mean,
+                                       trim_infinity=trim_inf[n],
+                                       reset=True)
                     pbar.update(1)
                 pbar.refresh()
         self.constants_statisticed = True
         self.reset_edge_tensors_ref_count()
         tz = PyTensor('null').betensor
+        forward_nodes = None
+        if statistic_nodes is not None:
+            forward_nodes = set()
+            pending = list(statistic_nodes)
+            while pending:
+                n = pending.pop()
+                if n not in forward_nodes:
+                    forward_nodes.add(n)
+                    pending.extend(n.parents)
         self.feed_inputs_data(inputs)
         for n in self.nodes:
+            if forward_nodes is not None and n not in forward_nodes:
+                continue
             n.forward()
 
             running_statistic_momentum = n.attrs["running_statistic_momentum"]
@@ -156,7 +425,7 @@ class QuantizeGraph(PyGraph):
             statistic_std_mean = True
             astrategy = n.get_attrs('q_strategy_activation')
             qmethod_act = n.get_attrs('q_mode_activation')
-            if not n.quantized:
+            if not n.quantized and (statistic_nodes is None or n in statistic_nodes):
                 r = CalibrationStrategyField._need_statistic_info(astrategy)
                 if time_saving_mode:
                     if not r['histc']:
@@ -164,15 +433,15 @@ class QuantizeGraph(PyGraph):
                     if not r['std_mean']:
                         statistic_std_mean = False
                 for o in n.outputs:
-                    o.statistic(running_statistic_momentum, key_axis=None,
-                                histc_bins=histc_bins, statistic_std_mean=statistic_std_mean,
-                                trim_infinity=trim_inf[n],
-                                reset=not self.current_batch_idx)
+                    _statistic(o, running_statistic_momentum, key_axis=None,
+                               histc_bins=histc_bins, statistic_std_mean=statistic_std_mean,
+                               trim_infinity=trim_inf[n],
+                               reset=not self.current_batch_idx)
                 for p in n.placeholders:
-                    p.statistic(running_statistic_momentum, key_axis=None,
-                                histc_bins=histc_bins, statistic_std_mean=statistic_std_mean,
-                                trim_infinity=trim_inf[n],
-                                reset=not self.current_batch_idx)
+                    _statistic(p, running_statistic_momentum, key_axis=None,
+                               histc_bins=histc_bins, statistic_std_mean=statistic_std_mean,
+                               trim_infinity=trim_inf[n],
+                               reset=not self.current_batch_idx)
             for pld in n.placeholders:
                 del pld.betensor
                 pld.betensor = tz
@@ -181,76 +450,58 @@ class QuantizeGraph(PyGraph):
                 del t.betensor
                 t.betensor = tz
         self.reset_edge_tensors_ref_count()
+        if reduction_pool is not None:
+            # keep at most two batches in flight to bound the memory held by pending reductions
+            self.statistic_inflight.append(futures)
+            self.wait_statistic(inflight_batches=1)
 
     def save_statistic_info(self, statistic_info_fname):
-        import pickle
+        import torch
+        import numpy as np
         from AIPUBuilder.Optimizer.logger import OPT_WARN
         from AIPUBuilder.Optimizer.utils.files_utils import make_path
 
         def get_value(t_param):
-            return t_param.cpu().contiguous().numpy() if t_param is not None else t_param
+            if isinstance(t_param, torch.Tensor):
+                return t_param.cpu().contiguous().numpy()
+            return t_param.item() if isinstance(t_param, np.generic) else t_param
 
         statistic_info = {}
         for n in self.nodes:
             statistic_info[n.name] = {}
             for o in n.outputs:
-                statistic_info[n.name][o.name] = {
-                    "extrema_min": o.extrema_min,
-                    "extrema_max": o.extrema_max,
-                    "running_min": o.running_min,
-                    "running_max": o.running_max,
-                    "running_mean": o.running_mean,
-                    "running_std": o.running_std,
-                    "running_mad": o.running_mad,
-                    "running_histc": get_value(o.running_histc),
-                }
+                statistic_info[n.name][o.name] = {k: get_value(getattr(o, k)) for k in _STATISTIC_PROPERTIES}
             for _, v in n.constants.items():
-                statistic_info[n.name][v.name] = {
-                    "extrema_min": v.extrema_min,
-                    "extrema_max": v.extrema_max,
-                    "running_min": v.running_min,
-                    "running_max": v.running_max,
-                    "running_mean": v.running_mean,
-                    "running_std": v.running_std,
-                    "running_mad": v.running_mad,
-                    "running_histc": get_value(v.running_histc),
-                    "extrema_min_key_axis": get_value(v.extrema_min_key_axis),
-                    "extrema_max_key_axis": get_value(v.extrema_max_key_axis),
-                    "running_min_key_axis": get_value(v.running_min_key_axis),
-                    "running_max_key_axis": get_value(v.running_max_key_axis),
-                    "running_mean_key_axis": get_value(v.running_mean_key_axis),
-                    "running_std_key_axis": get_value(v.running_std_key_axis),
-                    "running_mad_key_axis": get_value(v.running_mad_key_axis),
-                    "running_histc_key_axis": get_value(v.running_histc_key_axis),
-                }
+                statistic_info[n.name][v.name] = {k: get_value(getattr(v, k))
+                                                  for k in _STATISTIC_PROPERTIES + _STATISTIC_KEY_AXIS_PROPERTIES}
             for p in n.placeholders:
-                statistic_info[n.name][p.name] = {
-                    "extrema_min": p.extrema_min,
-                    "extrema_max": p.extrema_max,
-                    "running_min": p.running_min,
-                    "running_max": p.running_max,
-                    "running_mean": p.running_mean,
-                    "running_std": p.running_std,
-                    "running_mad": p.running_mad,
-                    "running_histc": get_value(p.running_histc),
-                }
+                statistic_info[n.name][p.name] = {k: get_value(getattr(p, k)) for k in _STATISTIC_PROPERTIES}
         statistic_info_fname = make_path(statistic_info_fname)
         try:
-            # np.save(statistic_info_fname, statistic_info)
-            with open(statistic_info_fname, 'wb') as fw:
-                pickle.dump(statistic_info, fw)
+            _save_columnar_statistic(statistic_info_fname, statistic_info)
         except Exception as e:
             OPT_WARN(f"Optimizer saves the statistic file failed, because {e}")
 
-    def load_statistic_info(self, statistic_info_fname):
+    def load_statistic_info(self, statistic_info_fname, only_required=False):
+        """
+        load the statistic file saved by save_statistic_info (the former pickled format is still readable).
+        if only_required, the array fields which are not read by the calibration strategy of each node are skipped,
+        which keeps the same info as statistic() computes when 'save_statistic_info' is false.
+        """
         import numpy as np
         import torch
         from AIPUBuilder.Optimizer.logger import OPT_FATAL, OPT_INFO
+        from AIPUBuilder.Optimizer.utils import QuantMode
+        from AIPUBuilder.Optimizer.config import CalibrationStrategyField
         from AIPUBuilder.Optimizer.framework.pycore.pytensor import opt_use_cuda
-        # statistic_info = np.load(statistic_info_fname, allow_pickle=True).item()
-        statistic_info = np.load(statistic_info_fname, allow_pickle=True)
-        if isinstance(statistic_info, np.ndarray):
-            statistic_info = statistic_info.item()
+        if _is_columnar_statistic_file(statistic_info_fname):
+            # array fields are materialized as zero-copy views only when queried
+            statistic_info = _load_columnar_statistic(statistic_info_fname)
+        else:
+            # statistic_info = np.load(statistic_info_fname, allow_pickle=True).item()
+            statistic_info = np.load(statistic_info_fname, allow_pickle=True)
+            if isinstance(statistic_info, np.ndarray):
+                statistic_info = statistic_info.item()
 
         def query_property(node_name, tensor_name, property):
             if not node_name in statistic_info:
@@ -271,45 +522,155 @@ class QuantizeGraph(PyGraph):
             if isinstance(value, torch.Tensor):
                 value = value.cuda() if opt_use_cuda() else value.cpu()
             return value
+
+        def skipped_properties(n, is_constant):
+            if not only_required:
+                return ()
+            skipped = []
+            r = CalibrationStrategyField._need_statistic_info(
+                n.get_attrs('q_strategy_weight' if is_constant else 'q_strategy_activation'))
+            if not r['histc']:
+                skipped += ['running_histc', 'running_histc_key_axis']
+            if not r['std_mean']:
+                skipped += ['running_mean_key_axis', 'running_std_key_axis', 'running_mad_key_axis']
+            if is_constant and not (QuantMode.is_per_channel(n.get_attrs('q_mode_weight')) or
+                                    n.get_param('group', optional=True, default_value=1) > 1):
+                skipped += list(_STATISTIC_KEY_AXIS_PROPERTIES)
+            return skipped
+
         for n in self.nodes:
+            skipped = skipped_properties(n, False)
             for o in n.outputs:
-                o.extrema_min = query_property(n.name,   o.name, "extrema_min")
-                o.extrema_max = query_property(n.name,   o.name, "extrema_max")
-                o.running_min = query_property(n.name,   o.name, "running_min")
-                o.running_max = query_property(n.name,   o.name, "running_max")
-                o.running_mean = query_property(n.name,  o.name, "running_mean")
-                o.running_std = query_property(n.name,   o.name, "running_std")
-                o.running_mad = query_property(n.name,   o.name, "running_mad")
-                o.running_histc = query_property(n.name, o.name, "running_histc")
+                for k in _STATISTIC_PROPERTIES:
+                    if k not in skipped:
+                        setattr(o, k, query_property(n.name, o.name, k))
+            skipped = skipped_properties(n, True)
             for _, v in n.constants.items():
-                v.extrema_min = query_property(n.name,   v.name, "extrema_min")
-                v.extrema_max = query_property(n.name,   v.name, "extrema_max")
-                v.running_min = query_property(n.name,   v.name, "running_min")
-                v.running_max = query_property(n.name,   v.name, "running_max")
-                v.running_mean = query_property(n.name,  v.name, "running_mean")
-                v.running_std = query_property(n.name,   v.name, "running_std")
-                v.running_mad = query_property(n.name,   v.name, "running_mad")
-                v.running_histc = query_property(n.name, v.name, "running_histc")
-                v.extrema_min_key_axis = query_property(n.name,   v.name, "extrema_min_key_axis")
-                v.extrema_max_key_axis = query_property(n.name,   v.name, "extrema_max_key_axis")
-                v.running_min_key_axis = query_property(n.name,   v.name, "running_min_key_axis")
-                v.running_max_key_axis = query_property(n.name,   v.name, "running_max_key_axis")
-                v.running_mean_key_axis = query_property(n.name,  v.name, "running_mean_key_axis")
-                v.running_std_key_axis = query_property(n.name,   v.name, "running_std_key_axis")
-                v.running_mad_key_axis = query_property(n.name,   v.name, "running_mad_key_axis")
-                v.running_histc_key_axis = query_property(n.name, v.name, "running_histc_key_axis")
+                for k in _STATISTIC_PROPERTIES + _STATISTIC_KEY_AXIS_PROPERTIES:
+                    if k not in skipped:
+                        setattr(v, k, query_property(n.name, v.name, k))
+            skipped = skipped_properties(n, False)
             for p in n.placeholders:
-                p.extrema_min = query_property(n.name,   p.name, "extrema_min")
-                p.extrema_max = query_property(n.name,   p.name, "extrema_max")
-                p.running_min = query_property(n.name,   p.name, "running_min")
-                p.running_max = query_property(n.name,   p.name, "running_max")
-                p.running_mean = query_property(n.name,  p.name, "running_mean")
-                p.running_std = query_property(n.name,   p.name, "running_std")
-                p.running_mad = query_property(n.name,   p.name, "running_mad")
-                p.running_histc = query_property(n.name, p.name, "running_histc")
+                for k in _STATISTIC_PROPERTIES:
+                    if k not in skipped:
+                        setattr(p, k, query_property(n.name, p.name, k))
         OPT_INFO('Succesfully loaded statistic info from file: ' + statistic_info_fname)
         return True
 
+    def statistic_cache_keys(self, config, dataset_fingerprint):
+        """
+        content-addressed keys of the statistic info of each tensor (outputs, placeholders and constants),
+        a tensor's key only changes when its producer subgraph (op types, params, constants), the calibration
+        dataset or the statistic settings (histc_bins, momentum, trim_infinity) change. returns {tensor: key}.
+        """
+        import hashlib
+        from AIPUBuilder.Optimizer.utils import QuantMode
+        from AIPUBuilder.Optimizer.config import CalibrationStrategyField
+
+        # the sweep evaluates other calibration strategies, so it needs all the statistic info as well
+        time_saving_mode = not (config.save_statistic_info or config.calibration_strategy_sweep)
+        trim_inf = self.statistic_trim_infinity(config)
+        keys = {}
+        for n in self.nodes:
+            settings = [n.attrs["running_statistic_momentum"], n.attrs["histc_bins"], trim_inf[n], time_saving_mode]
+            if time_saving_mode:
+                # only the statistic info required by the calibration strategies is computed
+                cstrategy = CalibrationStrategyField._need_statistic_info(n.get_attrs('q_strategy_weight'))
+                astrategy = CalibrationStrategyField._need_statistic_info(n.get_attrs('q_strategy_activation'))
+                per_channel = (QuantMode.is_per_channel(n.get_attrs('q_mode_weight')) or
+                               n.get_param('group', optional=True, default_value=1) > 1)
+                settings += [cstrategy, astrategy, per_channel]
+            constants_digest = hashlib.sha1()
+            for k, v in n.constants.items():
+                h = hashlib.sha1()
+                _digest_update(h, [settings, k, v.key_axis, list(v.ir_shape) if v.ir_shape is not None else None])
+                _digest_update(h, v.betensor)
+                keys[v] = h.hexdigest()
+                constants_digest.update(keys[v].encode())
+            h = hashlib.sha1()
+            _digest_update(h, [str(n.type), n.params, settings, constants_digest.hexdigest()])
+            for t in n.inputs:
+                _digest_update(h, keys[t] if t in keys else [dataset_fingerprint, t.name])
+            if len(n.inputs) == 0:
+                # graph inputs are fed by the calibration dataset
+                _digest_update(h, [dataset_fingerprint, [t.name for t in n.outputs]])
+            node_key = h.hexdigest()
+            for i, t in enumerate(n.outputs):
+                keys[t] = hashlib.sha1(f'{node_key}:output:{i}'.encode()).hexdigest()
+            for i, t in enumerate(n.placeholders):
+                keys[t] = hashlib.sha1(f'{node_key}:placeholder:{i}'.encode()).hexdigest()
+        return keys
+
+    def float_result_key(self, dataset_fingerprint):
+        """
+        key of the float results of this graph on a dataset (see FloatResultCache), it changes when the op types,
+        params, constants or connections of the graph, or dataset_fingerprint change.
+        the constants still as they are in the IR bin file are identified by where they are read from, so that lazily
+        loaded ones are not loaded just to be hashed.
+        """
+        import hashlib
+        h = hashlib.sha1()
+        _digest_update(h, dataset_fingerprint)
+        for n in self.nodes:
+            _digest_update(h, [str(n.type), n.name, n.params, [t.name for t in n.inputs], [t.name for t in n.outputs]])
+            for k, v in n.constants.items():
+                _digest_update(h, k)
+                source = v.betensor_source()
+                _digest_update(h, v.betensor if source is None else ['source', source])
+        return h.hexdigest()
+
+    def load_statistic_cache(self, cache_dir, keys):
+        """restore the statistic info of tensors found in cache_dir, returns the set of restored tensors."""
+        import os
+        import pickle
+        import torch
+        import numpy as np
+        from AIPUBuilder.Optimizer.framework.pycore.pytensor import opt_use_cuda
+        from AIPUBuilder.Optimizer.logger import OPT_DEBUG
+        hits = set()
+        for t, key in keys.items():
+            fname = os.path.join(cache_dir, key[:2], key + '.pkl')
+            if not os.path.isfile(fname):
+                continue
+            try:
+                with open(fname, 'rb') as f:
+                    info = pickle.load(f)
+            except Exception as e:
+                OPT_DEBUG(f"ignore broken statistic cache file {fname}: {e}")
+                continue
+            for prop, value in info.items():
+                if isinstance(value, np.ndarray):
+                    value = torch.from_numpy(value)
+                    value = value.cuda() if opt_use_cuda() else value
+                setattr(t, prop, value)
+            hits.add(t)
+        return hits
+
+    def save_statistic_cache(self, cache_dir, keys, tensors=None):
+        """store the statistic info of tensors (None means all the keyed tensors) into cache_dir."""
+        import os
+        import pickle
+        from AIPUBuilder.Optimizer.utils.files_utils import make_dir_path
+
+        def get_value(t_param):
+            return t_param.cpu().contiguous().numpy() if t_param is not None else t_param
+
+        consts = set(v for n in self.nodes for v in n.constants.values())
+        for t in (keys.keys() if tensors is None else tensors):
+            key = keys[t]
+            props = _STATISTIC_PROPERTIES + (_STATISTIC_KEY_AXIS_PROPERTIES if t in consts else ())
+            info = {prop: getattr(t, prop) for prop in props}
+            for prop in ("running_histc", ) + _STATISTIC_KEY_AXIS_PROPERTIES:
+                if prop in info:
+                    info[prop] = get_value(info[prop])
+            fdir = make_dir_path(os.path.join(cache_dir, key[:2]))
+            fname = os.path.join(fdir, key + '.pkl')
+            # write to a temporary file first so that concurrent runs never read a partial entry
+            tmp_fname = f'{fname}.{os.getpid()}.tmp'
+            with open(tmp_fname, 'wb') as f:
+                pickle.dump(info, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_fname, fname)
+
     def set_tensor_quantization_attrs(self):
         import sys
         from AIPUBuilder.Optimizer.logger import tqdm
@@ -456,6 +817,9 @@ class QuantizeGraph(PyGraph):
         cast_count_num = 0
         end_idx = len(self.nodes)
         inserted_op_list = []
+        # names pools of get_valid_node_name/get_valid_tensor_name, kept up to date with the inserted ones
+        node_names = set([n.name for n in self.nodes])
+        tensor_names = set([t.name for t in self.tensors()])
         if condition_func:
             while node_idx < end_idx:
                 n = self.nodes[node_idx]
@@ -472,11 +836,13 @@ class QuantizeGraph(PyGraph):
                         parent_out_tensor = n.inputs[tensor_idx]
                         _nname = current_parent.name + \
                             ("_%s_" % (str(ntype)[7:],)) + str(cast_count_num) + timestamp_string()
-                        dummy_op = PyNode(self.get_valid_node_name(_nname), ntype)
+                        dummy_op = PyNode(self.get_valid_name(_nname, node_names), ntype)
+                        node_names.add(dummy_op.name)
                         dummy_op.additional = True
                         dummy_op.add_input(parent_out_tensor)
-                        atensor_name = self.get_valid_tensor_name(
-                            parent_out_tensor.name + ("_%s_tensor_" % (str(ntype)[7:],)) + str(cast_count_num) + timestamp_string())
+                        atensor_name = self.get_valid_name(
+                            parent_out_tensor.name + ("_%s_tensor_" % (str(ntype)[7:],)) + str(cast_count_num) + timestamp_string(), tensor_names)
+                        tensor_names.add(atensor_name)
                         atensor = parent_out_tensor.clone(atensor_name)
                         dummy_op.add_output(atensor)
                         idx = n.remove_input(parent_out_tensor)
@@ -486,12 +852,13 @@ class QuantizeGraph(PyGraph):
                             dummy_op.attrs['quantization_info'] = {}
                             dummy_op.attrs['quantization_info'][atensor_name] = current_parent.attrs['quantization_info'][parent_out_tensor.name]
                         dummy_op.attrs['layer_id'] = '0' + str(current_parent.attrs['layer_id'])
+                        # links the dummy op into the graph's topology index
                         self.nodes.insert(node_idx, dummy_op)
-                        # update graph network relations and related variables
-                        self.init_networkx()
                         inserted_op_list.append(dummy_op)
                         node_idx += 1
                         end_idx += 1
                         cast_count_num += 1
                 node_idx += 1
+        if inserted_op_list:
+            self.update_topological_generations()
         return inserted_op_list
@@ -0,0 +1,91 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import json
+
+__all__ = ['StageCheckpoint']
+
+
+class StageCheckpoint(object):
+    """
+    on-disk snapshots of a graph taken after each completed stage of a workflow, so that an interrupted run resumes
+    from the last completed stage instead of starting again from the IR.
+    a store lives in <checkpoint_dir>/<key>/: the pickled snapshot of the last completed stage (<stage>.ckpt) and the
+    json list of the completed stages (stages.json). a snapshot holds the graph (with its quantgraph) and the workflow
+    state given by the caller, the featuremaps of the graphs are not stored as every stage forwards them again.
+    the key must identify the IR, the config and the datasets (see OptMaster.stage_checkpoint).
+    """
+
+    def __init__(self, checkpoint_dir, key):
+        from AIPUBuilder.Optimizer.utils.files_utils import make_dir_path
+        self.key = key
+        self.path = make_dir_path(os.path.join(checkpoint_dir, key))
+        self.stages_fname = os.path.join(self.path, 'stages.json')
+        self.stages = []
+        self._load_stages()
+
+    def _load_stages(self):
+        from AIPUBuilder.Optimizer.logger import OPT_DEBUG
+        if not os.path.isfile(self.stages_fname):
+            return
+        try:
+            with open(self.stages_fname) as f:
+                stages = json.load(f)
+        except (OSError, ValueError) as e:
+            OPT_DEBUG(f"ignore broken stage checkpoint {self.path}: {e}")
+            return
+        if len(stages) > 0 and os.path.isfile(self._snapshot_fname(stages[-1])):
+            self.stages = stages
+
+    def _snapshot_fname(self, stage):
+        return os.path.join(self.path, f'{stage}.ckpt')
+
+    def last_stage(self):
+        """the name of the last completed stage, None when nothing has been stored."""
+        return self.stages[-1] if len(self.stages) > 0 else None
+
+    def load(self):
+        """(graph, state) of the last completed stage."""
+        import pickle
+        with open(self._snapshot_fname(self.last_stage()), 'rb') as f:
+            snapshot = pickle.load(f)
+        return snapshot['graph'], snapshot['state']
+
+    def save(self, stage, graph, state):
+        """store graph and state (a picklable dict) as the snapshot after stage, replacing the former snapshot."""
+        import pickle
+        from AIPUBuilder.Optimizer.framework.pycore.pytensor import PyTensor
+        # featuremaps are dropped while pickling and put back afterwards
+        graphs = [graph] if graph.quantgraph is None or graph.quantgraph is graph else [graph, graph.quantgraph]
+        featuremaps = {}
+        for g in graphs:
+            for n in g.nodes:
+                for t in list(n.inputs) + list(n.outputs):
+                    featuremaps.setdefault(id(t), (t, t.betensor))
+        tz = PyTensor('null').betensor
+        fname = self._snapshot_fname(stage)
+        tmp_fname = f'{fname}.{os.getpid()}.tmp'
+        try:
+            for t, _ in featuremaps.values():
+                t.betensor = tz
+            with open(tmp_fname, 'wb') as fw:
+                pickle.dump({'stage': stage, 'graph': graph, 'state': state}, fw, protocol=pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            if os.path.isfile(tmp_fname):
+                os.remove(tmp_fname)
+            raise
+        finally:
+            for t, betensor in featuremaps.values():
+                t.betensor = betensor
+        os.replace(tmp_fname, fname)
+        former = [s for s in self.stages if s != stage]
+        self.stages = former + [stage]
+        tmp_fname = f'{self.stages_fname}.{os.getpid()}.tmp'
+        with open(tmp_fname, 'w') as fw:
+            json.dump(self.stages, fw)
+        os.replace(tmp_fname, self.stages_fname)
+        # only the last snapshot is needed to resume
+        for s in former:
+            if os.path.isfile(self._snapshot_fname(s)):
+                os.remove(self._snapshot_fname(s))
@@ -3,9 +3,9 @@
 
 import sys
 import time
-import traceback
 
-from AIPUBuilder.Optimizer.logger.aipu_logger import INFO, DEBUG, WARN, ERROR, FATAL, LOGLEVEL, _DEBUG_LEVEL
+from AIPUBuilder.Optimizer.logger.aipu_logger import INFO, DEBUG, WARN, ERROR, FATAL, _DEBUG_LEVEL, _INFO_LEVEL, _WARN_LEVEL
+import AIPUBuilder.Optimizer.logger.aipu_logger as aipu_logger
 import AIPUBuilder
 
 __all__ = ['OPT_DEBUG', 'OPT_INFO', 'OPT_WARN', 'OPT_ERROR', 'OPT_FATAL', 'tqdm']
@@ -31,198 +31,65 @@ def get_time():
 __time__ = get_time
 BT_NAME = '[OPT]'
 g_msg_mem_dt = {}
-if hasattr(AIPUBuilder, '__release__') and AIPUBuilder.__dict__.get('__release__'):
-
-    def base_logger(msg, *args, workflow_name='', op_name='', **kwargs):
-        ltime = __time__()
-        log_head = BT_NAME + ' [' + ltime + ']'
-        args_str = ' '.join(args) + ' '.join(kwargs.values())
-        workflow_name = workflow_name + ' ' if len(workflow_name) else workflow_name
-        op_name = op_name + ' ' if len(op_name) else op_name
-        log_body = workflow_name + op_name + msg + ('' if len(args_str) == 0 else args_str)
-        return '%s: %s' % (log_head, log_body)
-
-    def OPT_INFO(msg, *args, workflow_name='', log_once=False, **kwargs):
-        if log_once:
-            global g_msg_mem_dt
-            if msg in g_msg_mem_dt.keys():
-                return
-            else:
-                g_msg_mem_dt[msg] = True
-        log = base_logger(msg, *args, workflow_name=workflow_name, **kwargs)
-        INFO(log)
-
-    def OPT_DEBUG(msg, *args, workflow_name='', op_name='', log_once=False, **kwargs):
-
-        if LOGLEVEL > _DEBUG_LEVEL:
+# release builds log without the caller's location
+_RELEASE = bool(hasattr(AIPUBuilder, '__release__') and AIPUBuilder.__dict__.get('__release__'))
+
+
+def _caller_location(depth):
+    """file name and line number of the frame depth levels above the caller of this function."""
+    try:
+        f = sys._getframe(depth + 1)
+        return f.f_code.co_filename.split('/')[-1], f.f_lineno
+    except (AttributeError, ValueError):
+        return '', ''
+
+
+def _log(sink, level, msg, args, kwargs, workflow_name='', op_name='', log_once=False, with_time=True,
+         with_location=True):
+    """
+    the common path of OPT_* logs: the level and log_once are checked before any formatting, so a disabled log only
+    costs a comparison. msg can be a callable returning the message, it is only called when the log is emitted
+    (or when log_once needs the message to tell repeated ones apart). level is None for the sinks which are always
+    called, e.g. ERROR counts the errors even when they are not printed.
+    """
+    if level is not None and level < aipu_logger.LOGLEVEL:
+        return
+    if callable(msg):
+        msg = msg()
+    if log_once:
+        if msg in g_msg_mem_dt:
             return
-        if log_once:
-            global g_msg_mem_dt
-            if msg in g_msg_mem_dt.keys():
-                return
-            else:
-                g_msg_mem_dt[msg] = True
-        log = base_logger(msg, *args, workflow_name=workflow_name, op_name=op_name, **kwargs)
-        DEBUG(log)
-
-    def OPT_ERROR(msg, *args, workflow_name='', op_name='', log_once=False, **kwargs):
-        if log_once:
-            global g_msg_mem_dt
-            if msg in g_msg_mem_dt.keys():
-                return
-            else:
-                g_msg_mem_dt[msg] = True
-        log = base_logger(msg, *args, workflow_name=workflow_name, op_name=op_name, **kwargs)
-        ERROR(log)
-
-    def OPT_WARN(msg, *args, workflow_name='', op_name='', log_once=False, **kwargs):
-        if log_once:
-            global g_msg_mem_dt
-            if msg in g_msg_mem_dt.keys():
-                return
-            else:
-                g_msg_mem_dt[msg] = True
-        log = base_logger(msg, *args, workflow_name=workflow_name, op_name=op_name, **kwargs)
-        WARN(log)
-
-    def OPT_FATAL(msg, *args, workflow_name='', op_name='', **kwargs):
-        log = base_logger(msg, *args, workflow_name=workflow_name, op_name=op_name, **kwargs)
-        FATAL(log)
-else:
-    bt_depth = -3
-
-    # def get_cur_info():
-    #     """Return the frame object for the caller's stack frame."""
-    #     f = None
-    #     try:
-    #         raise Exception
-    #     except:
-    #         f = sys.exc_info()[2].tb_frame.f_back
-    #     return (f.f_code.co_name, f.f_lineno)
-
-    def get_line_number():
-        try:
-            raise Exception
-        except:
-            try:
-                fs = traceback.extract_stack()[bt_depth]
-                return fs.lineno
-            except:
-                return ''
-
-    def get_function_name():
-        try:
-            raise Exception
-        except:
-            try:
-                fs = traceback.extract_stack()[bt_depth]
-                return fs.name
-            except:
-                return ''
-
-    def get_file_name():
-        try:
-            raise Exception
-        except:
-            try:
-                fs = traceback.extract_stack()[bt_depth]
-                return fs.filename.split('/')[-1]
-            except:
-                return ''
-
-    # def get_time():
-    #     """Return the asctime."""
-    #     local_time = time.localtime()
-    #     return "%02d:%02d:%02d" % (local_time.tm_hour, local_time.tm_min, local_time.tm_sec)
-
-    __line__ = get_line_number
-    __func__ = get_function_name
-    __filen__ = get_file_name
-
-    def OPT_INFO(msg, *args, workflow_name='', log_once=False, **kwargs):
-        ltime = __time__()
+        g_msg_mem_dt[msg] = True
+    ltime = __time__() if with_time or _RELEASE else ''
+    if _RELEASE or not with_location:
         log_head = BT_NAME + ' [' + ltime + ']'
-        args_str = ' '.join(args) + ' '.join(kwargs.values())
-        workflow_name = workflow_name + ' ' if len(workflow_name) else workflow_name
-        log_body = workflow_name + msg + ('' if len(args_str) == 0 else args_str)
-        if log_once:
-            global g_msg_mem_dt
-            if msg in g_msg_mem_dt.keys():
-                return
-            else:
-                g_msg_mem_dt[msg] = True
-        INFO('%s: %s' % (log_head, log_body))
-
-    def OPT_DEBUG(msg, *args, workflow_name='', op_name='', log_once=False, **kwargs):
-
-        if LOGLEVEL > _DEBUG_LEVEL:
-            return
+    else:
+        # _log <- OPT_* <- the caller
+        fname, lineno = _caller_location(2)
+        log_head = BT_NAME + ' [' + ltime + ' ' + fname + ':' + str(lineno) + ']'
+    args_str = ' '.join(args) + ' '.join(kwargs.values())
+    workflow_name = workflow_name + ' ' if len(workflow_name) else workflow_name
+    op_name = op_name + ' ' if len(op_name) else op_name
+    log_body = workflow_name + op_name + msg + ('' if len(args_str) == 0 else args_str)
+    sink('%s: %s' % (log_head, log_body))
 
-        # debug without time
-        # ltime = __time__()
 
-        ltime = ''
-        fname = __filen__()
-        lineno = __line__()
-        log_head = BT_NAME + ' [' + ltime + ' ' + fname + ':' + str(lineno) + ']'
+def OPT_INFO(msg, *args, workflow_name='', log_once=False, **kwargs):
+    _log(INFO, _INFO_LEVEL, msg, args, kwargs, workflow_name, '', log_once, with_location=False)
 
-        args_str = ' '.join(args) + ' '.join(kwargs.values())
-        workflow_name = workflow_name + ' ' if len(workflow_name) else workflow_name
-        op_name = op_name + ' ' if len(op_name) else op_name
-        log_body = workflow_name + op_name + msg + ('' if len(args_str) == 0 else args_str)
-        if log_once:
-            global g_msg_mem_dt
-            if msg in g_msg_mem_dt.keys():
-                return
-            else:
-                g_msg_mem_dt[msg] = True
-        DEBUG('%s: %s' % (log_head, log_body))
-
-    def OPT_ERROR(msg, *args, workflow_name='', op_name='', log_once=False, **kwargs):
-        ltime = __time__()
-        fname = __filen__()
-        lineno = __line__()
-        log_head = BT_NAME + ' [' + ltime + ' ' + fname + ':' + str(lineno) + ']'
 
-        args_str = ' '.join(args) + ' '.join(kwargs.values())
-        workflow_name = workflow_name + ' ' if len(workflow_name) else workflow_name
-        op_name = op_name + ' ' if len(op_name) else op_name
-        log_body = workflow_name + op_name + msg + ('' if len(args_str) == 0 else args_str)
-        if log_once:
-            global g_msg_mem_dt
-            if msg in g_msg_mem_dt.keys():
-                return
-            else:
-                g_msg_mem_dt[msg] = True
-        ERROR('%s: %s' % (log_head, log_body))
-
-    def OPT_WARN(msg, *args, workflow_name='', op_name='', log_once=False, **kwargs):
-        ltime = __time__()
-        fname = __filen__()
-        lineno = __line__()
-        log_head = BT_NAME + ' [' + ltime + ' ' + fname + ':' + str(lineno) + ']'
+def OPT_DEBUG(msg, *args, workflow_name='', op_name='', log_once=False, **kwargs):
+    # debug without time
+    _log(DEBUG, _DEBUG_LEVEL, msg, args, kwargs, workflow_name, op_name, log_once, with_time=False)
 
-        args_str = ' '.join(args) + ' '.join(kwargs.values())
-        workflow_name = workflow_name + ' ' if len(workflow_name) else workflow_name
-        op_name = op_name + ' ' if len(op_name) else op_name
-        log_body = workflow_name + op_name + msg + ('' if len(args_str) == 0 else args_str)
-        if log_once:
-            global g_msg_mem_dt
-            if msg in g_msg_mem_dt.keys():
-                return
-            else:
-                g_msg_mem_dt[msg] = True
-        WARN('%s: %s' % (log_head, log_body))
-
-    def OPT_FATAL(msg, *args, workflow_name='', op_name='', **kwargs):
-        ltime = __time__()
-        fname = __filen__()
-        lineno = __line__()
-        log_head = BT_NAME + ' [' + ltime + ' ' + fname + ':' + str(lineno) + ']'
 
-        args_str = ' '.join(args) + ' '.join(kwargs.values())
-        workflow_name = workflow_name + ' ' if len(workflow_name) else workflow_name
-        op_name = op_name + ' ' if len(op_name) else op_name
-        log_body = workflow_name + op_name + msg + ('' if len(args_str) == 0 else args_str)
+def OPT_ERROR(msg, *args, workflow_name='', op_name='', log_once=False, **kwargs):
+    _log(ERROR, None, msg, args, kwargs, workflow_name, op_name, log_once)
+
+
+def OPT_WARN(msg, *args, workflow_name='', op_name='', log_once=False, **kwargs):
+    _log(WARN, _WARN_LEVEL, msg, args, kwargs, workflow_name, op_name, log_once)
+
 
-        FATAL('%s: %s' % (log_head, log_body))
+def OPT_FATAL(msg, *args, workflow_name='', op_name='', **kwargs):
+    _log(FATAL, None, msg, args, kwargs, workflow_name, op_name)
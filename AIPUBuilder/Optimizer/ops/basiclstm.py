@@ -27,16 +27,10 @@ def lstm(self, *args):
         input_seq = torch.flip(input_seq, [1])
 
     start_data_idx = self.current_batch_idx * batch_size
-    start_h_initial_idx = start_data_idx % h_initial_batch
-    start_c_initial_idx = start_data_idx % c_initial_batch
 
-    h_initial = h_cell[start_h_initial_idx: start_h_initial_idx + 1]
-    c_initial = c_cell[start_c_initial_idx: start_c_initial_idx + 1]
-    for initial_idx in range(1, batch_size):
-        current_h_initial_idx = (start_data_idx + initial_idx) % h_initial_batch
-        current_c_initial_idx = (start_data_idx + initial_idx) % c_initial_batch
-        h_initial = torch.cat((h_initial, h_cell[current_h_initial_idx: current_h_initial_idx + 1]), dim=0)
-        c_initial = torch.cat((c_initial, c_cell[current_c_initial_idx: current_c_initial_idx + 1]), dim=0)
+    data_idx = torch.arange(start_data_idx, start_data_idx + batch_size, device=h_cell.device)
+    h_initial = h_cell[data_idx % h_initial_batch]
+    c_initial = c_cell[data_idx % c_initial_batch]
 
     w = self.constants["weights"].betensor.clone()
     weights = w.permute(1, 0).float()
@@ -69,53 +63,45 @@ def lstm(self, *args):
         h_lut_in = torch.zeros([batch_size, time_step, cell_size], device=inp0.betensor.device)
         h_lut_out = torch.zeros([batch_size, time_step, cell_size], device=inp0.betensor.device)
 
-        for b in range(batch_size):
-            h_all = torch.zeros([1, cell_size], device=inp0.betensor.device, dtype=torch.float)
-            c_all = torch.zeros([1, cell_size], device=inp0.betensor.device, dtype=torch.float)
-            h_prev = torch.unsqueeze(h_initial[b], dim=0)
-            c_prev = torch.unsqueeze(c_initial[b], dim=0)
-            for ts in range(time_step):
-                in_ts = torch.reshape(input_seq[b, ts, :], (-1, input_size))
-                inputs = torch.cat((in_ts, h_prev), dim=1)
-                sum0 = torch.add(torch.matmul(inputs, weights), torch.unsqueeze(bias, 0))
-                i_tmp, g_tmp, f_tmp, o_tmp = torch.chunk(sum0, 4, dim=1)
-                i_tmp = torch.clamp(i_tmp, -threshold, threshold)
-                g_tmp = torch.clamp(g_tmp, -threshold, threshold)
-                f_tmp = torch.clamp(f_tmp + forget_bias, -threshold, threshold)
-                o_tmp = torch.clamp(o_tmp, -threshold, threshold)
-
-                f_lut_in[b, ts, :] = torch.squeeze(torch.cat((i_tmp, f_tmp, o_tmp), dim=1), 0)
-                g_lut_in[b, ts, :] = torch.squeeze(g_tmp, 0)
-
-                i = g_rnn_activation_func[activations_list[0]][1](i_tmp)
-                g = g_rnn_activation_func[activations_list[1]][1](g_tmp)
-                f = g_rnn_activation_func[activations_list[0]][1](f_tmp)
-                o = g_rnn_activation_func[activations_list[0]][1](o_tmp)
-
-                f_lut_out[b, ts, :] = torch.squeeze(torch.cat((i, f, o), dim=1), 0)
-                g_lut_out[b, ts, :] = torch.squeeze(g, 0)
-
-                c_prev = torch.multiply(f, c_prev) + torch.multiply(i, g)
-                c_prev = torch.clamp(c_prev, -cell_clip, cell_clip)
-                h_lut_in[b, ts, :] = torch.squeeze(c_prev, 0)
-                c_lut = g_rnn_activation_func[activations_list[2]][1](c_prev)
-                h_lut_out[b, ts, :] = torch.squeeze(c_lut, 0)
-                h_prev = torch.multiply(o, c_lut)
-
-                h_all = h_prev if ts == 0 else torch.cat((h_all, h_prev), dim=0)
-                c_all = c_prev if ts == 0 else torch.cat((c_all, c_prev), dim=0)
-
-            # h_expd = torch.unsqueeze(h_prev, dim = 0)
-            h_last = h_prev if b == 0 else torch.cat((h_last, h_prev), dim=0)
-
-            h_all = torch.unsqueeze(h_all, dim=0)
-            h_batch = h_all if b == 0 else torch.cat((h_batch, h_all), dim=0)
-
-            # c_expd = torch.unsqueeze(c_prev, dim = 0)
-            c_last = c_prev if b == 0 else torch.cat((c_last, c_prev), dim=0)
-
-            c_all = torch.unsqueeze(c_all, dim=0)
-            c_batch = c_all if b == 0 else torch.cat((c_batch, c_all), dim=0)
+        # the whole batch goes through each time step together
+        h_prev = h_initial
+        c_prev = c_initial
+        h_all = []
+        c_all = []
+        for ts in range(time_step):
+            inputs = torch.cat((input_seq[:, ts, :], h_prev), dim=1)
+            sum0 = torch.add(rnn_rowwise_matmul(inputs, weights), torch.unsqueeze(bias, 0))
+            i_tmp, g_tmp, f_tmp, o_tmp = torch.chunk(sum0, 4, dim=1)
+            i_tmp = torch.clamp(i_tmp, -threshold, threshold)
+            g_tmp = torch.clamp(g_tmp, -threshold, threshold)
+            f_tmp = torch.clamp(f_tmp + forget_bias, -threshold, threshold)
+            o_tmp = torch.clamp(o_tmp, -threshold, threshold)
+
+            f_lut_in[:, ts, :] = torch.cat((i_tmp, f_tmp, o_tmp), dim=1)
+            g_lut_in[:, ts, :] = g_tmp
+
+            i = rnn_rowwise_activation(g_rnn_activation_func[activations_list[0]][1], i_tmp)
+            g = rnn_rowwise_activation(g_rnn_activation_func[activations_list[1]][1], g_tmp)
+            f = rnn_rowwise_activation(g_rnn_activation_func[activations_list[0]][1], f_tmp)
+            o = rnn_rowwise_activation(g_rnn_activation_func[activations_list[0]][1], o_tmp)
+
+            f_lut_out[:, ts, :] = torch.cat((i, f, o), dim=1)
+            g_lut_out[:, ts, :] = g
+
+            c_prev = torch.multiply(f, c_prev) + torch.multiply(i, g)
+            c_prev = torch.clamp(c_prev, -cell_clip, cell_clip)
+            h_lut_in[:, ts, :] = c_prev
+            c_lut = rnn_rowwise_activation(g_rnn_activation_func[activations_list[2]][1], c_prev)
+            h_lut_out[:, ts, :] = c_lut
+            h_prev = torch.multiply(o, c_lut)
+
+            h_all.append(h_prev)
+            c_all.append(c_prev)
+
+        h_last = h_prev
+        h_batch = torch.stack(h_all, dim=1)
+        c_last = c_prev
+        c_batch = torch.stack(c_all, dim=1)
 
         # currently AIFF only use two activation lut
         if activations_list[0] == activations_list[1]:
@@ -203,90 +189,84 @@ def lstm(self, *args):
 
         act_qmax = 2 ** 31 - 1
         act_qmin = -2 ** 31
-        for b in range(batch_size):
-            h_all = torch.zeros([1, cell_size], device=inp0.betensor.device, dtype=torch.float)
-            c_all = torch.zeros([1, cell_size], device=inp0.betensor.device, dtype=torch.float)
-            h_prev = torch.unsqueeze(h_initial[b], dim=0)
-            c_prev = torch.unsqueeze(c_initial[b], dim=0)
-            for ts in range(time_step):
-                in_ts = torch.reshape(input_seq[b, ts, :], (-1, input_size)).float()
-                x_by_wx = torch.matmul(in_ts, wx_q)
-                h_by_wh = torch.matmul(h_prev.to(wh_q.dtype), wh_q)
-                if dtype == 'int8':
-                    re_scaled_h_by_wh = linear_requantize(h_by_wh, scale_[0], shift_[0], 0, act_qmin, act_qmax)
-                    mat_sum = x_by_wx + re_scaled_h_by_wh + bias
-                    i_tmp, g_tmp, f_tmp, o_tmp = torch.chunk(mat_sum, 4, dim=1)
-
-                    f_in = linear_requantize(f_tmp, ft_scale, ft_shift, 0, qmin, qmax)
-                    i_in = linear_requantize(i_tmp, it_scale, it_shift, 0, qmin, qmax)
-                    g_in = linear_requantize(g_tmp, ct_scale, ct_shift, 0, qmin, qmax)
-                    o_in = linear_requantize(o_tmp, ot_scale, ot_shift, 0, qmin, qmax)
-
-                    # g_rnn_activation_func[activations_list[0]][2](f_in, ft_table).float()
-                    f = lookup_lut_powerof2(f_in, ft_table, lut_in_bits, True, lut_out_bits, True)
-                    # g_rnn_activation_func[activations_list[0]][2](i_in, it_table).float()
-                    i = lookup_lut_powerof2(i_in, it_table, lut_in_bits, True, lut_out_bits, True)
-                    # g_rnn_activation_func[activations_list[1]][2](g_in, ct_table).float()
-                    g = lookup_lut_powerof2(g_in, ct_table, lut_in_bits, True, lut_out_bits, True)
-                    # g_rnn_activation_func[activations_list[0]][2](o_in, ot_table).float()
-                    o = lookup_lut_powerof2(o_in, ot_table, lut_in_bits, True, lut_out_bits, True)
-
-                elif dtype == 'int16':
-                    m_shift = self.get_param('lut_shift_value')
-                    h_by_wh_s = linear_requantize(h_by_wh, 1, shift_[0] - m_shift, 0, act_qmin, act_qmax)
-                    re_scaled_h_by_wh_s = linear_requantize(h_by_wh_s, scale_[0], shift_[1], 0, act_qmin, act_qmax)
-                    x_by_wx_s = linear_requantize(x_by_wx, 1, shift_[1] - m_shift, 0, act_qmin, act_qmax)
-                    bias_s = linear_requantize(bias, 1, shift_[1] - m_shift, 0, act_qmin, act_qmax)
-                    mat_sum = x_by_wx_s + re_scaled_h_by_wh_s + bias_s
-                    mat_sum = torch.clamp(torch.round(mat_sum), act_qmin, act_qmax)
-
-                    i_tmp, g_tmp, f_tmp, o_tmp = torch.chunk(mat_sum, 4, dim=1)
-
-                    f_in = linear_requantize(f_tmp, ft_scale, m_shift, 0, qmin, qmax)
-                    i_in = linear_requantize(i_tmp, it_scale, m_shift, 0, qmin, qmax)
-                    g_in = linear_requantize(g_tmp, ct_scale, ct_shift - it_shift + m_shift, 0, qmin, qmax)
-                    o_in = linear_requantize(o_tmp, ot_scale, m_shift, 0, qmin, qmax)
-
-                    # g_rnn_activation_func[activations_list[0]][3](f_in, ft_table).float()
-                    f = lookup_lut_powerof2(f_in, ft_table, lut_in_bits, True, lut_out_bits, True)
-                    # g_rnn_activation_func[activations_list[0]][3](i_in, it_table).float()
-                    i = lookup_lut_powerof2(i_in, it_table, lut_in_bits, True, lut_out_bits, True)
-                    # g_rnn_activation_func[activations_list[1]][3](g_in, ct_table).float()
-                    g = lookup_lut_powerof2(g_in, ct_table, lut_in_bits, True, lut_out_bits, True)
-                    # g_rnn_activation_func[activations_list[0]][3](o_in, ot_table).float()
-                    o = lookup_lut_powerof2(o_in, ot_table, lut_in_bits, True, lut_out_bits, True)
-
-                diff_shift = diff_shifts_[ts]
-                i_times_g = torch.multiply(i, g)
-                i_times_g = linear_requantize(i_times_g, 1, diff_shift, 0, act_qmin, act_qmax)
-                f_times_c_prev = torch.multiply(f, c_prev + c_zerop[2 * ts])
-                rescaled_f_times_c_prev = linear_requantize(f_times_c_prev, scale_[5 + 2 * ts], shift_[5 + 2 * ts]+diff_shift, 0,
-                                                            act_qmin, act_qmax)
-                c_tmp = i_times_g + rescaled_f_times_c_prev
-
-                c_tmp = torch.clamp(c_tmp, act_qmin, act_qmax)
-
-                re_scaled_c_tmp = linear_requantize(c_tmp, scale_[3], shift_[3]-diff_shift, 0, qmin+1, qmax)
-                ctmp_lut_out = lookup_lut_powerof2(re_scaled_c_tmp, h_table, lut_in_bits, True, lut_out_bits, True)
-                h_prev = torch.multiply(o, ctmp_lut_out).float()
-                h_prev = linear_requantize(h_prev, scale_[4], shift_[4], 0, qmin+1, qmax)
-                c_prev = linear_requantize(c_tmp, scale_[5 + 2 * ts + 1], shift_[5 + 2 * ts + 1]-diff_shift,
-                                           c_zerop[2 * ts + 1], qmin+1, qmax)
-
-                h_all = h_prev if ts == 0 else torch.cat((h_all, h_prev), dim=0)
-                c_all = c_prev if ts == 0 else torch.cat((c_all, c_prev), dim=0)
-
-            # h_expd = torch.unsqueeze(h_prev, dim = 0) #[1,1,512]
-            h_last = h_prev if b == 0 else torch.cat((h_last, h_prev), dim=0)
-
-            h_all = torch.unsqueeze(h_all, dim=0)  # [1,40,512]
-            h_batch = h_all if b == 0 else torch.cat((h_batch, h_all), dim=0)
-
-            # c_expd = torch.unsqueeze(c_prev, dim = 0) #[1,1,512]
-            c_last = c_prev if b == 0 else torch.cat((c_last, c_prev), dim=0)
-
-            c_all = torch.unsqueeze(c_all, dim=0)  # [1,40,512]
-            c_batch = c_all if b == 0 else torch.cat((c_batch, c_all), dim=0)
+        # x * wx of all the time steps in one shot, then the whole batch goes through each time step together
+        x_by_wx_all = rnn_input_projection(input_seq, wx_q)
+        if dtype == 'int16':
+            m_shift = self.get_param('lut_shift_value')
+            x_by_wx_all = linear_requantize(x_by_wx_all, 1, shift_[1] - m_shift, 0, act_qmin, act_qmax)
+            bias_s = linear_requantize(bias, 1, shift_[1] - m_shift, 0, act_qmin, act_qmax)
+        h_prev = h_initial
+        c_prev = c_initial
+        h_all = []
+        c_all = []
+        for ts in range(time_step):
+            x_by_wx = x_by_wx_all[:, ts, :]
+            h_by_wh = rnn_rowwise_matmul(h_prev.to(wh_q.dtype), wh_q)
+            if dtype == 'int8':
+                re_scaled_h_by_wh = linear_requantize(h_by_wh, scale_[0], shift_[0], 0, act_qmin, act_qmax)
+                mat_sum = x_by_wx + re_scaled_h_by_wh + bias
+                i_tmp, g_tmp, f_tmp, o_tmp = torch.chunk(mat_sum, 4, dim=1)
+
+                f_in = linear_requantize(f_tmp, ft_scale, ft_shift, 0, qmin, qmax)
+                i_in = linear_requantize(i_tmp, it_scale, it_shift, 0, qmin, qmax)
+                g_in = linear_requantize(g_tmp, ct_scale, ct_shift, 0, qmin, qmax)
+                o_in = linear_requantize(o_tmp, ot_scale, ot_shift, 0, qmin, qmax)
+
+                # g_rnn_activation_func[activations_list[0]][2](f_in, ft_table).float()
+                f = lookup_lut_powerof2(f_in, ft_table, lut_in_bits, True, lut_out_bits, True)
+                # g_rnn_activation_func[activations_list[0]][2](i_in, it_table).float()
+                i = lookup_lut_powerof2(i_in, it_table, lut_in_bits, True, lut_out_bits, True)
+                # g_rnn_activation_func[activations_list[1]][2](g_in, ct_table).float()
+                g = lookup_lut_powerof2(g_in, ct_table, lut_in_bits, True, lut_out_bits, True)
+                # g_rnn_activation_func[activations_list[0]][2](o_in, ot_table).float()
+                o = lookup_lut_powerof2(o_in, ot_table, lut_in_bits, True, lut_out_bits, True)
+
+            elif dtype == 'int16':
+                h_by_wh_s = linear_requantize(h_by_wh, 1, shift_[0] - m_shift, 0, act_qmin, act_qmax)
+                re_scaled_h_by_wh_s = linear_requantize(h_by_wh_s, scale_[0], shift_[1], 0, act_qmin, act_qmax)
+                mat_sum = x_by_wx + re_scaled_h_by_wh_s + bias_s
+                mat_sum = torch.clamp(torch.round(mat_sum), act_qmin, act_qmax)
+
+                i_tmp, g_tmp, f_tmp, o_tmp = torch.chunk(mat_sum, 4, dim=1)
+
+                f_in = linear_requantize(f_tmp, ft_scale, m_shift, 0, qmin, qmax)
+                i_in = linear_requantize(i_tmp, it_scale, m_shift, 0, qmin, qmax)
+                g_in = linear_requantize(g_tmp, ct_scale, ct_shift - it_shift + m_shift, 0, qmin, qmax)
+                o_in = linear_requantize(o_tmp, ot_scale, m_shift, 0, qmin, qmax)
+
+                # g_rnn_activation_func[activations_list[0]][3](f_in, ft_table).float()
+                f = lookup_lut_powerof2(f_in, ft_table, lut_in_bits, True, lut_out_bits, True)
+                # g_rnn_activation_func[activations_list[0]][3](i_in, it_table).float()
+                i = lookup_lut_powerof2(i_in, it_table, lut_in_bits, True, lut_out_bits, True)
+                # g_rnn_activation_func[activations_list[1]][3](g_in, ct_table).float()
+                g = lookup_lut_powerof2(g_in, ct_table, lut_in_bits, True, lut_out_bits, True)
+                # g_rnn_activation_func[activations_list[0]][3](o_in, ot_table).float()
+                o = lookup_lut_powerof2(o_in, ot_table, lut_in_bits, True, lut_out_bits, True)
+
+            diff_shift = diff_shifts_[ts]
+            i_times_g = torch.multiply(i, g)
+            i_times_g = linear_requantize(i_times_g, 1, diff_shift, 0, act_qmin, act_qmax)
+            f_times_c_prev = torch.multiply(f, c_prev + c_zerop[2 * ts])
+            rescaled_f_times_c_prev = linear_requantize(f_times_c_prev, scale_[5 + 2 * ts], shift_[5 + 2 * ts]+diff_shift, 0,
+                                                        act_qmin, act_qmax)
+            c_tmp = i_times_g + rescaled_f_times_c_prev
+
+            c_tmp = torch.clamp(c_tmp, act_qmin, act_qmax)
+
+            re_scaled_c_tmp = linear_requantize(c_tmp, scale_[3], shift_[3]-diff_shift, 0, qmin+1, qmax)
+            ctmp_lut_out = lookup_lut_powerof2(re_scaled_c_tmp, h_table, lut_in_bits, True, lut_out_bits, True)
+            h_prev = torch.multiply(o, ctmp_lut_out).float()
+            h_prev = linear_requantize(h_prev, scale_[4], shift_[4], 0, qmin+1, qmax)
+            c_prev = linear_requantize(c_tmp, scale_[5 + 2 * ts + 1], shift_[5 + 2 * ts + 1]-diff_shift,
+                                       c_zerop[2 * ts + 1], qmin+1, qmax)
+
+            h_all.append(h_prev)
+            c_all.append(c_prev)
+
+        h_last = h_prev
+        h_batch = torch.stack(h_all, dim=1)  # [batch, time_step, cell_size]
+        c_last = c_prev
+        c_batch = torch.stack(c_all, dim=1)
 
     results = []
     for idx, sequence in enumerate(out_sequence):
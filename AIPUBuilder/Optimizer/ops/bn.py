@@ -21,7 +21,7 @@ def batch_norm_quantize(self, *args):
 # where Z is zero point, S is scale
 
 
-@op_register(OpType.BatchNorm)
+@op_register(OpType.BatchNorm, mutable_inputs=False)
 def batch_norm(self, *args):
     inp = self.inputs[0].betensor.clone()
     weights = self.constants["weights"].betensor.clone()
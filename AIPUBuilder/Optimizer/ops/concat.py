@@ -110,7 +110,7 @@ def concat_quantize(self, *args):
         self.params['shift_value'] = branch_shifts
 
 
-@op_register(OpType.Concat)
+@op_register(OpType.Concat, mutable_inputs=False)
 def concat(self, *args):
     axis = self.get_param('axis')
     out = self.outputs[0]
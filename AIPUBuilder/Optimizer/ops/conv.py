@@ -50,7 +50,7 @@ def _conv2d_torch_impl(self, *args):
     return x
 
 
-@op_register(OpType.Convolution)
+@op_register(OpType.Convolution, mutable_inputs=False)
 def conv2d(self, *args):
     in_shape = self.inputs[0].shape
     ih, iw = in_shape[1], in_shape[2]
@@ -5,6 +5,7 @@ from AIPUBuilder.Optimizer.framework import *
 
 from AIPUBuilder.Optimizer.utils import *
 from AIPUBuilder.Optimizer.logger import OPT_ERROR
+from AIPUBuilder.Optimizer.ops.roialign import roi_reference_kernels, gather_nhwc
 import torch
 
 '''
@@ -23,6 +24,116 @@ method=BILINEAR
 '''
 
 
+def _check_box_indices(box_indices, batch):
+    for b_idx in box_indices.long().tolist():
+        if b_idx < 0 or b_idx >= batch:
+            OPT_ERROR(f"Error: batch_index {b_idx} out of range [0, {batch}).")
+
+
+def crop_and_resize_gathered(fm, boxes, box_indices, method, crop_size, extrapolation_value):
+    # crop_and_resize with the sample grid of all the boxes computed at once and the corners read by gathers
+    batch, fm_height, fm_width, fm_depth = fm.shape
+    crop_height, crop_width = crop_size[0], crop_size[1]
+    dev = fm.device
+    _check_box_indices(box_indices, batch)
+    y1, x1, y2, x2 = [c.unsqueeze(1) for c in boxes.unbind(-1)]
+
+    if crop_height > 1:
+        height_scale = (y2 - y1) * (fm_height - 1) / (crop_height - 1)
+        in_y = y1 * (fm_height - 1) + torch.arange(crop_height, device=dev) * height_scale
+    else:
+        in_y = 0.5 * (y1 + y2) * (fm_height - 1)
+    if crop_width > 1:
+        width_scale = (x2 - x1) * (fm_width - 1) / (crop_width - 1)
+        in_x = x1 * (fm_width - 1) + torch.arange(crop_width, device=dev) * width_scale
+    else:
+        in_x = 0.5 * (x1 + x2) * (fm_width - 1)
+    y_inside = ~((in_y < 0) | (in_y > fm_height - 1))
+    x_inside = ~((in_x < 0) | (in_x > fm_width - 1))
+    inside = y_inside.unsqueeze(2) & x_inside.unsqueeze(1)
+    in_y = torch.where(y_inside, in_y, torch.zeros_like(in_y))
+    in_x = torch.where(x_inside, in_x, torch.zeros_like(in_x))
+
+    if method == 'bilinear':
+        top_y_index = torch.floor(in_y).long()
+        bottom_y_index = torch.ceil(in_y).long()
+        y_lerp = (in_y - top_y_index).unsqueeze(2).unsqueeze(-1)
+        left_x_index = torch.floor(in_x).long()
+        right_x_index = torch.ceil(in_x).long()
+        x_lerp = (in_x - left_x_index).unsqueeze(1).unsqueeze(-1)
+        top_y_index, bottom_y_index = top_y_index.unsqueeze(2), bottom_y_index.unsqueeze(2)
+        left_x_index, right_x_index = left_x_index.unsqueeze(1), right_x_index.unsqueeze(1)
+
+        top_left = gather_nhwc(fm, box_indices, top_y_index, left_x_index)
+        top_right = gather_nhwc(fm, box_indices, top_y_index, right_x_index)
+        bottom_left = gather_nhwc(fm, box_indices, bottom_y_index, left_x_index)
+        bottom_right = gather_nhwc(fm, box_indices, bottom_y_index, right_x_index)
+
+        top = top_left + (top_right - top_left) * x_lerp
+        bottom = bottom_left + (bottom_right - bottom_left) * x_lerp
+        out = top + (bottom - top) * y_lerp
+    else:  # method == 'nearest':
+        in_y = torch.floor(in_y + 0.5).long().unsqueeze(2)
+        in_x = torch.floor(in_x + 0.5).long().unsqueeze(1)
+        out = gather_nhwc(fm, box_indices, in_y, in_x)
+    padded_v = torch.tensor(extrapolation_value, dtype=torch.float32, device=dev)
+    return torch.where(inside.unsqueeze(-1), out.to(torch.float32), padded_v)
+
+
+def quant_crop_and_resize_gathered(fm, boxes, box_indices, method, crop_size, qextrapolation_value, index_scale,
+                                   index_shift):
+    # quant_crop_and_resize with the sample grid of all the boxes computed at once and the corners read by gathers
+    batch, fm_height, fm_width, fm_depth = fm.shape
+    crop_height, crop_width = crop_size[0], crop_size[1]
+    dev = fm.device
+    _check_box_indices(box_indices, batch)
+    y1, x1, y2, x2 = [c.unsqueeze(1) for c in boxes.unbind(-1)]
+
+    qheight_scale = torch.div((y2 - y1) * (fm_height - 1) * 256, crop_height - 1,
+                              rounding_mode='trunc').int() >> 8 if crop_height > 1 else torch.zeros_like(y1).int()
+    qwidth_scale = torch.div((x2 - x1) * (fm_width - 1) * 256, crop_width - 1,
+                             rounding_mode='trunc').int() >> 8 if crop_width > 1 else torch.zeros_like(x1).int()
+    in_y = (y1 * (fm_height - 1) + torch.arange(crop_height, device=dev, dtype=torch.int32) * qheight_scale)
+    in_x = (x1 * (fm_width - 1) + torch.arange(crop_width, device=dev, dtype=torch.int32) * qwidth_scale)
+    in_y = in_y.to(torch.int64)
+    in_x = in_x.to(torch.int64)
+    y_inside = (in_y >= 0) & ((in_y * index_scale >> index_shift) <= (fm_height - 1))
+    x_inside = (in_x >= 0) & ((in_x * index_scale >> index_shift) <= (fm_width - 1))
+    inside = y_inside.unsqueeze(2) & x_inside.unsqueeze(1)
+    in_y = torch.where(y_inside, in_y, 0)
+    in_x = torch.where(x_inside, in_x, 0)
+
+    if method == 'bilinear':
+        top_y_index = (in_y * index_scale >> index_shift).long()
+        bottom_y_index = top_y_index + 1
+        y_lerp = in_y - torch.div(top_y_index * 2 ** index_shift, index_scale, rounding_mode='trunc')
+        left_x_index = (in_x * index_scale >> index_shift).long()
+        right_x_index = left_x_index + 1
+        x_lerp = in_x - torch.div(left_x_index * 2 ** index_shift, index_scale, rounding_mode='trunc')
+        y_lerp = y_lerp.unsqueeze(2).unsqueeze(-1)
+        x_lerp = x_lerp.unsqueeze(1).unsqueeze(-1)
+
+        top_y_index = torch.clamp(top_y_index, 0, fm_height - 1).unsqueeze(2)
+        bottom_y_index = torch.clamp(bottom_y_index, 0, fm_height - 1).unsqueeze(2)
+        left_x_index = torch.clamp(left_x_index, 0, fm_width - 1).unsqueeze(1)
+        right_x_index = torch.clamp(right_x_index, 0, fm_width - 1).unsqueeze(1)
+
+        top_left = gather_nhwc(fm, box_indices, top_y_index, left_x_index)
+        top_right = gather_nhwc(fm, box_indices, top_y_index, right_x_index)
+        bottom_left = gather_nhwc(fm, box_indices, bottom_y_index, left_x_index)
+        bottom_right = gather_nhwc(fm, box_indices, bottom_y_index, right_x_index)
+
+        top = top_left + (((top_right - top_left) * x_lerp * index_scale).long() >> index_shift)
+        bottom = bottom_left + (((bottom_right - bottom_left) * x_lerp * index_scale).long() >> index_shift)
+        out = (top + (((bottom - top) * y_lerp * index_scale).long() >> index_shift))
+    else:  # method == 'nearest':
+        in_y = ((in_y * index_scale + 2 ** (index_shift - 1)).long() >> index_shift).unsqueeze(2)
+        in_x = ((in_x * index_scale + 2 ** (index_shift - 1)).long() >> index_shift).unsqueeze(1)
+        out = gather_nhwc(fm, box_indices, torch.where(inside, in_y, 0), torch.where(inside, in_x, 0))
+    padded_v = torch.tensor(qextrapolation_value, device=dev).to(torch.float32)
+    return torch.where(inside.unsqueeze(-1), out.to(torch.float32), padded_v)
+
+
 def crop_and_resize(fm, boxes, box_indices, method, crop_size, extrapolation_value):
     batch, fm_height, fm_width, fm_depth = fm.shape
     crop_height, crop_width = crop_size[0], crop_size[1]
@@ -192,17 +303,19 @@ def cropandresize(self, *args):
     if self.quantized:
         index_shift = self.get_param('shift_value')
         index_scale = self.get_param('scale_value')
-        self.outputs[0].betensor = quant_crop_and_resize(feature_map,
-                                                         boxes,
-                                                         box_indices,
-                                                         method,
-                                                         crop_size,
-                                                         extrapolation_value,
-                                                         index_scale,
-                                                         index_shift
-                                                         )
+        quant_crop_and_resize_fn = quant_crop_and_resize if roi_reference_kernels() else quant_crop_and_resize_gathered
+        self.outputs[0].betensor = quant_crop_and_resize_fn(feature_map,
+                                                            boxes,
+                                                            box_indices,
+                                                            method,
+                                                            crop_size,
+                                                            extrapolation_value,
+                                                            index_scale,
+                                                            index_shift
+                                                            )
     else:
-        self.outputs[0].betensor = crop_and_resize(
+        crop_and_resize_fn = crop_and_resize if roi_reference_kernels() else crop_and_resize_gathered
+        self.outputs[0].betensor = crop_and_resize_fn(
             feature_map, boxes, box_indices, method, crop_size, extrapolation_value)
 
     return self.outputs[0].betensor
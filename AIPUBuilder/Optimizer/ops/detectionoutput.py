@@ -104,31 +104,20 @@ def default_detect(node, class_conf, box_encodings, crop_proposals):
 
 def _get_box_score(class_score, box_encoding, score_thresh, max_detection_num, max_class_num):
     class_num = class_score.shape[-1]
-    crop_box_num = class_score.shape[0]
     box = torch.zeros((max_detection_num, 4), dtype=torch.float32, device=class_score.device)
     score = torch.zeros((max_detection_num), dtype=torch.float32, device=class_score.device)
     box_num_perClass = torch.zeros([max_class_num], dtype=torch.float32, device=class_score.device)
 
-    outbox_idx = 0
-    box_num_perClass_list = []
-    class_label = []
-    for class_idx in range(class_num):
-        # if class_idx == 0:
-        #     continue
-        box_num_curClass = 0
-        for box_idx in range(crop_box_num):
-            if class_score[box_idx][class_idx] > score_thresh:
-                if outbox_idx >= max_detection_num:
-                    break
-                if class_idx not in class_label:
-                    class_label.append(class_idx)
-                box[outbox_idx, :] = box_encoding[box_idx * class_num + class_idx, :]
-                score[outbox_idx] = class_score[box_idx, class_idx]
-                outbox_idx += 1
-                box_num_curClass += 1
-        if box_num_curClass != 0:
-            box_num_perClass_list.append(box_num_curClass)
-    box_num_perClass[:len(box_num_perClass_list)] = torch.tensor(box_num_perClass_list, device=class_score.device)
+    # candidates are taken class by class (boxes in order within a class) until max_detection_num ones
+    class_idx, box_idx = torch.nonzero(class_score.t() > score_thresh, as_tuple=True)
+    class_idx = class_idx[:max_detection_num]
+    box_idx = box_idx[:max_detection_num]
+    outbox_num = class_idx.numel()
+    box[:outbox_num, :] = box_encoding[box_idx * class_num + class_idx, :]
+    score[:outbox_num] = class_score[box_idx, class_idx]
+    labels, box_num_perClass_list = torch.unique_consecutive(class_idx, return_counts=True)
+    box_num_perClass[:box_num_perClass_list.numel()] = box_num_perClass_list
+    class_label = labels.tolist()
     total_class_num = len(class_label)
     class_label.extend((max_class_num - total_class_num) * [0])
     return box, score, box_num_perClass, \
@@ -184,7 +184,7 @@ def eltwise_quantizes(self, *args):
         self.params["scale_type"] = do_scale_type
 
 
-@op_register(OpType.Eltwise)
+@op_register(OpType.Eltwise, mutable_inputs=False)
 def eltwise(self, *args):
     '''
     eltwise op
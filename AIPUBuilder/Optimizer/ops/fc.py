@@ -9,7 +9,7 @@ from AIPUBuilder.Optimizer.framework import *
 import torch.nn as nn
 
 
-@op_register(OpType.FullyConnected)
+@op_register(OpType.FullyConnected, mutable_inputs=False)
 def fc(self, *args):
     inp = self.inputs[0].betensor.float()
     bias = self.constants["biases"].betensor.clone().float()
@@ -5,6 +5,7 @@ from AIPUBuilder.Optimizer.utils import *
 from AIPUBuilder.Optimizer.framework import *
 
 from AIPUBuilder.Optimizer.logger import *
+from AIPUBuilder.Optimizer.ops.nms import batched_nms
 import torch
 
 
@@ -89,29 +90,22 @@ def _filter_boxes(node, boxes, min_size):
 
 
 def NMS_F(boxes, scores, iou_thresh):
-    x1 = boxes[:, 0]
-    y1 = boxes[:, 1]
-    x2 = boxes[:, 2]
-    y2 = boxes[:, 3]
-
-    areas = (x2 - x1+1) * (y2 - y1+1)
-    order = torch.argsort(torch.flatten(scores), descending=True)
-    keep = []
-    while order.shape[0] > 0:
-        i = order[0]
-        keep.append(i)
-        xx1 = torch.maximum(x1[i], x1[order[1:]])
-        yy1 = torch.maximum(y1[i], y1[order[1:]])
-        xx2 = torch.minimum(x2[i], x2[order[1:]])
-        yy2 = torch.minimum(y2[i], y2[order[1:]])
+    def suppress_fn(rows, cols):
+        x1, y1, x2, y2 = [rows[..., k:k + 1] for k in range(4)]
+        cx1, cy1, cx2, cy2 = [cols[..., k].unsqueeze(-2) for k in range(4)]
+        areas = (x2 - x1+1) * (y2 - y1+1)
+        careas = (cx2 - cx1+1) * (cy2 - cy1+1)
+        xx1 = torch.maximum(x1, cx1)
+        yy1 = torch.maximum(y1, cy1)
+        xx2 = torch.minimum(x2, cx2)
+        yy2 = torch.minimum(y2, cy2)
         w = torch.maximum(torch.tensor([0], device=boxes.device), xx2 - xx1+1)
         h = torch.maximum(torch.tensor([0], device=boxes.device), yy2 - yy1+1)
 
         inter = w * h
-        ovr = inter / (areas[i] + areas[order[1:]] - inter)
-        inds = torch.where(ovr <= iou_thresh)[0]
-        order = order[inds + 1]
-    return keep
+        ovr = inter / (areas + careas - inter)
+        return ~(ovr <= iou_thresh)
+    return batched_nms([boxes], [scores], suppress_fn)[0]
 
 
 def NMS_Q(box, score, iou_threshold=None):
@@ -119,36 +113,25 @@ def NMS_Q(box, score, iou_threshold=None):
     # currently area_shift is consistent with lib, and  will write to quantIR and will be modified
     area_shift = 15
 
-    x0 = box[:, 0]
-    y0 = box[:, 1]
-    x1 = box[:, 2]
-    y1 = box[:, 3]
-    areas = (y1 - y0).type(torch.int32) * (x1 - x0).type(torch.int32)
-    areas = areas >> area_shift
-    # order = score.ravel().argsort()[::-1]
-
-    # order = torch.argsort(torch.flatten(score), descending=True)
-    order = torch.linspace(0, len(torch.flatten(score))-1, steps=len(torch.flatten(score)), device=score.device).long()
-    keep = []
-    while order.shape[0] > 0:
-        i = order[0]
-        keep.append(i)
-
-        xx0 = torch.maximum(x0[i], x0[order[1:]])
-        yy0 = torch.maximum(y0[i], y0[order[1:]])
-        xx1 = torch.minimum(x1[i], x1[order[1:]])
-        yy1 = torch.minimum(y1[i], y1[order[1:]])
+    def suppress_fn(rows, cols):
+        x0, y0, x1, y1 = [rows[..., k:k + 1] for k in range(4)]
+        cx0, cy0, cx1, cy1 = [cols[..., k].unsqueeze(-2) for k in range(4)]
+        areas = ((y1 - y0).type(torch.int32) * (x1 - x0).type(torch.int32)) >> area_shift
+        careas = ((cy1 - cy0).type(torch.int32) * (cx1 - cx0).type(torch.int32)) >> area_shift
+
+        xx0 = torch.maximum(x0, cx0)
+        yy0 = torch.maximum(y0, cy0)
+        xx1 = torch.minimum(x1, cx1)
+        yy1 = torch.minimum(y1, cy1)
         w = torch.maximum(torch.tensor([0], device=box.device), xx1 - xx0)
         h = torch.maximum(torch.tensor([0], device=box.device), yy1 - yy0)
 
         inter = (w * h).type(torch.int32) >> area_shift
-        union = areas[i] + areas[order[1:]] - inter
+        union = areas + careas - inter
         inter_area_thresh = union * iou_threshold >> int(iou_thresh_shift)
-
-        inds = torch.where(inter <= inter_area_thresh)[0]
-        order = order[inds + 1]
-
-    return keep
+        return ~(inter <= inter_area_thresh)
+    # boxes are already in descending order of scores
+    return batched_nms([box], [score], suppress_fn, sort=False)[0]
 
 
 class Generateproposals_Context:
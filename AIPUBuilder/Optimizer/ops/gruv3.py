@@ -39,11 +39,8 @@ def gruv3(self, *args):
     initial_H = inp1.betensor.float()
     start_data_idx = self.current_batch_idx * batch_size
 
-    start_initial_idx = start_data_idx % initial_batch
-    in_state = initial_H[start_initial_idx: start_initial_idx + 1]
-    for initial_idx in range(1, batch_size):
-        current_initial_idx = (start_data_idx + initial_idx) % initial_batch
-        in_state = torch.cat((in_state, initial_H[current_initial_idx: current_initial_idx + 1]), dim=0)
+    data_idx = torch.arange(start_data_idx, start_data_idx + batch_size, device=initial_H.device)
+    in_state = initial_H[data_idx % initial_batch]
 
     w = self.constants["weights"].betensor.float()
     bias = self.constants['biases'].betensor.float()
@@ -81,64 +78,66 @@ def gruv3(self, *args):
 
         gates_bias = bias[: 2 * cell_size]
         candidate_bias = bias[2 * cell_size: 3 * cell_size]
-        for b in range(batch_size):
-            state = torch.unsqueeze(in_state[b], dim=0)
-            state_all = torch.zeros([1, cell_size], device=inp0.betensor.device, dtype=torch.float)
-            for ts in range(time_step):
-                in_ts = torch.reshape(input_seq[b, ts, :], (-1, input_size))
-                if 'version' in self.params and self.params['version'] == "GRUV1":
-
-                    gate_kernel_x_f = gates_kernel[:input_size, :]
-                    gate_kernel_h_f = gates_kernel[input_size:, :]
-                    candidate_kernel_x_f = candidate_kernel[:input_size, :]
-                    candidate_kernel_h_f = candidate_kernel[input_size:, :]
-
-                    hidden_bias = bias[3 * cell_size:]
-                    h_by_wg_f = torch.matmul(state, gate_kernel_h_f)
-                    x_by_wg_f = torch.add(torch.matmul(in_ts, gate_kernel_x_f),
-                                          torch.unsqueeze(gates_bias, 0))
-
-                    mat_sum_f = x_by_wg_f + h_by_wg_f
-                    mat_sum_f = torch.clamp(mat_sum_f, -threshold, threshold)
-                    f_lut_in[b, ts, :] = torch.squeeze(mat_sum_f, 0)
-                    sig_lut_out_f = g_rnn_activation_func[activations_list[0]][1](mat_sum_f)
-                    f_lut_out[b, ts, :] = torch.squeeze(sig_lut_out_f, 0)
-                    r_f, u_f = torch.chunk(sig_lut_out_f, 2, dim=1)
-
-                    h_by_wc_f = torch.matmul(state, candidate_kernel_h_f)
-                    h_by_wc_f = torch.add(h_by_wc_f, torch.unsqueeze(hidden_bias, 0))
-                    hidden_gate_out[b, ts, :] = torch.squeeze(h_by_wc_f)
-                    r_hwc_f = torch.multiply(r_f, h_by_wc_f)
-                    x_by_wc_f = torch.add(torch.matmul(in_ts, candidate_kernel_x_f), torch.unsqueeze(candidate_bias, 0))
-                    mat_sum2_f = x_by_wc_f + r_hwc_f
-                    mat_sum2_f = torch.clamp(mat_sum2_f, -threshold, threshold)
-                    g_lut_in[b, ts, :] = torch.squeeze(mat_sum2_f, 0)
-                    c_f = g_rnn_activation_func[activations_list[1]][1](mat_sum2_f)
-                    g_lut_out[b, ts, :] = torch.squeeze(c_f, 0)
-                    state = torch.multiply((1.0 - u_f), c_f) + torch.multiply(u_f, state)
-                else:  # GRUV3
-                    gate_input = torch.cat((in_ts, state), dim=1)
-                    sum0 = torch.add(torch.matmul(gate_input, gates_kernel), torch.unsqueeze(gates_bias, 0))  # [1,1024]
-                    sum0 = torch.clamp(sum0, -threshold, threshold)
-                    f_lut_in[b, ts, :] = torch.squeeze(sum0, 0)
-                    f_out = g_rnn_activation_func[activations_list[0]][1](sum0)
-                    f_lut_out[b, ts, :] = torch.squeeze(f_out, 0)
-                    r, u = torch.chunk(f_out, 2, dim=1)
-                    state_r = torch.multiply(state, r)
-
-                    candidate_input = torch.cat((in_ts, state_r), dim=1)
-                    sum1 = torch.add(torch.matmul(candidate_input, candidate_kernel),
-                                     torch.unsqueeze(candidate_bias, 0))
-                    sum1 = torch.clamp(sum1, -threshold, threshold)
-                    g_lut_in[b, ts, :] = torch.squeeze(sum1, 0)
-                    c = g_rnn_activation_func[activations_list[1]][1](sum1)
-                    g_lut_out[b, ts, :] = torch.squeeze(c, 0)
-                    state = torch.multiply((1.0 - u), c) + torch.multiply(u, state)
-                state_all = state if ts == 0 else torch.cat((state_all, state), dim=0)
-
-            state_last = state if b == 0 else torch.cat((state_last, state), dim=0)
-            state_all = torch.unsqueeze(state_all, dim=0)
-            state_batch = state_all if b == 0 else torch.cat((state_batch, state_all), dim=0)
+        # the whole batch goes through each time step together
+        is_gruv1 = 'version' in self.params and self.params['version'] == "GRUV1"
+        if is_gruv1:
+            gate_kernel_x_f = gates_kernel[:input_size, :]
+            gate_kernel_h_f = gates_kernel[input_size:, :]
+            candidate_kernel_x_f = candidate_kernel[:input_size, :]
+            candidate_kernel_h_f = candidate_kernel[input_size:, :]
+            hidden_bias = bias[3 * cell_size:]
+            # x * wx of all the time steps in one shot
+            x_by_wg_all = rnn_input_projection(input_seq, gate_kernel_x_f)
+            x_by_wc_all = rnn_input_projection(input_seq, candidate_kernel_x_f)
+        state = in_state
+        state_all = []
+        for ts in range(time_step):
+            in_ts = input_seq[:, ts, :]
+            if is_gruv1:
+                h_by_wg_f = rnn_rowwise_matmul(state, gate_kernel_h_f)
+                x_by_wg_f = torch.add(x_by_wg_all[:, ts, :], torch.unsqueeze(gates_bias, 0))
+
+                mat_sum_f = x_by_wg_f + h_by_wg_f
+                mat_sum_f = torch.clamp(mat_sum_f, -threshold, threshold)
+                f_lut_in[:, ts, :] = mat_sum_f
+                sig_lut_out_f = rnn_rowwise_activation(g_rnn_activation_func[activations_list[0]][1], mat_sum_f)
+                f_lut_out[:, ts, :] = sig_lut_out_f
+                r_f, u_f = torch.chunk(sig_lut_out_f, 2, dim=1)
+
+                h_by_wc_f = rnn_rowwise_matmul(state, candidate_kernel_h_f)
+                h_by_wc_f = torch.add(h_by_wc_f, torch.unsqueeze(hidden_bias, 0))
+                hidden_gate_out[:, ts, :] = h_by_wc_f
+                r_hwc_f = torch.multiply(r_f, h_by_wc_f)
+                x_by_wc_f = torch.add(x_by_wc_all[:, ts, :], torch.unsqueeze(candidate_bias, 0))
+                mat_sum2_f = x_by_wc_f + r_hwc_f
+                mat_sum2_f = torch.clamp(mat_sum2_f, -threshold, threshold)
+                g_lut_in[:, ts, :] = mat_sum2_f
+                c_f = rnn_rowwise_activation(g_rnn_activation_func[activations_list[1]][1], mat_sum2_f)
+                g_lut_out[:, ts, :] = c_f
+                state = torch.multiply((1.0 - u_f), c_f) + torch.multiply(u_f, state)
+            else:  # GRUV3
+                gate_input = torch.cat((in_ts, state), dim=1)
+                sum0 = torch.add(rnn_rowwise_matmul(gate_input, gates_kernel),
+                                 torch.unsqueeze(gates_bias, 0))  # [batch,1024]
+                sum0 = torch.clamp(sum0, -threshold, threshold)
+                f_lut_in[:, ts, :] = sum0
+                f_out = rnn_rowwise_activation(g_rnn_activation_func[activations_list[0]][1], sum0)
+                f_lut_out[:, ts, :] = f_out
+                r, u = torch.chunk(f_out, 2, dim=1)
+                state_r = torch.multiply(state, r)
+
+                candidate_input = torch.cat((in_ts, state_r), dim=1)
+                sum1 = torch.add(rnn_rowwise_matmul(candidate_input, candidate_kernel),
+                                 torch.unsqueeze(candidate_bias, 0))
+                sum1 = torch.clamp(sum1, -threshold, threshold)
+                g_lut_in[:, ts, :] = sum1
+                c = rnn_rowwise_activation(g_rnn_activation_func[activations_list[1]][1], sum1)
+                g_lut_out[:, ts, :] = c
+                state = torch.multiply((1.0 - u), c) + torch.multiply(u, state)
+            state_all.append(state)
+
+        state_last = state
+        state_batch = torch.stack(state_all, dim=1)
         placeholders_list = ['state_batch', 'f_lut_in', 'f_lut_out', 'g_lut_in', 'g_lut_out', 'hidden_gate_out']
         if len(self.placeholders) < len(placeholders_list):
             for placeholder_name in placeholders_list:
@@ -198,47 +197,47 @@ def gruv3(self, *args):
             qmax = 2**15 - 1
             qmin = -qmax
 
-        for b in range(batch_size):
-            state = torch.unsqueeze(in_state[b], dim=0).float()
-            state_all = torch.zeros([1, cell_size], device=inp0.betensor.device, dtype=torch.float)
-            for ts in range(time_step):
-                in_ts = torch.reshape(input_seq[b, ts, :], (-1, input_size)).float()
-                x_by_wg = torch.matmul(in_ts, wx_gk_q)
-                h_by_wg = torch.matmul(state, wh_gk_q)
-                re_scaled_h_by_wg = linear_requantize(h_by_wg, scale[0], shift[0], 0, act_qmin, act_qmax)
-
-                mat_sum = x_by_wg + re_scaled_h_by_wg + torch.unsqueeze(gates_bias_q, 0)
-                rescaled_mat_sum = linear_requantize(mat_sum, scale[1], shift[1], 0, qmin, qmax)
-                rt_zt_lut_out = lookup_lut_powerof2(rescaled_mat_sum, rt_table, lut_in_bits, True, lut_out_bits, True)
-                r, u = torch.chunk(rt_zt_lut_out, 2, dim=1)
-
-                x_by_wc = torch.matmul(in_ts, wx_ck_q)
-                if 'version' in self.params and self.params['version'] == "GRUV1":
-                    hidden_scale = self.params["hidden_scale_value"]
-                    hidden_shift = self.params["hidden_shift_value"]
-                    h_by_wc = torch.add(torch.matmul(state, wh_ck_q), torch.unsqueeze(hidden_bias_q, 0))
-                    h_by_wc = linear_requantize(h_by_wc, hidden_scale, hidden_shift, 0, qmin, qmax)
-                    h_by_wc = torch.multiply(r, h_by_wc)
-                else:
-                    factor = 256.0 if dtype == 'int8' else 65536.0
-                    hprev_r = torch.round(torch.div(torch.multiply(r, state), factor))
-                    h_by_wc = torch.matmul(hprev_r, wh_ck_q)
-                re_scaled_h_by_wc = linear_requantize(h_by_wc, scale[2], shift[2], 0, act_qmin, act_qmax)
-                mat_sum2 = x_by_wc + re_scaled_h_by_wc + torch.unsqueeze(candidate_bias_q, 0)
-
-                rescaled_mat_sum2 = linear_requantize(mat_sum2, scale[3], shift[3], 0, qmin, qmax)
-                c = lookup_lut_powerof2(rescaled_mat_sum2, ht_table, lut_in_bits, True, lut_out_bits, True)
-                max_pre = qmax
-                c_times_1_minus_u = (max_pre - u) * c
-                rescaled_c_times_1_minus_u = linear_requantize(
-                    c_times_1_minus_u, scale[4], shift[4], 0, act_qmin, act_qmax)
-
-                state = rescaled_c_times_1_minus_u + u * state
-                state = linear_requantize(state, scale[5], shift[5], 0, qmin, qmax)
-                state_all = state if ts == 0 else torch.cat((state_all, state), dim=0)
-            state_last = state if b == 0 else torch.cat((state_last, state), dim=0)
-            state_all = torch.unsqueeze(state_all, dim=0)
-            state_batch = state_all if b == 0 else torch.cat((state_batch, state_all), dim=0)
+        # x * wx of all the time steps in one shot, then the whole batch goes through each time step together
+        x_by_wg_all = rnn_input_projection(input_seq, wx_gk_q)
+        x_by_wc_all = rnn_input_projection(input_seq, wx_ck_q)
+        state = in_state.float()
+        state_all = []
+        for ts in range(time_step):
+            x_by_wg = x_by_wg_all[:, ts, :]
+            h_by_wg = rnn_rowwise_matmul(state, wh_gk_q)
+            re_scaled_h_by_wg = linear_requantize(h_by_wg, scale[0], shift[0], 0, act_qmin, act_qmax)
+
+            mat_sum = x_by_wg + re_scaled_h_by_wg + torch.unsqueeze(gates_bias_q, 0)
+            rescaled_mat_sum = linear_requantize(mat_sum, scale[1], shift[1], 0, qmin, qmax)
+            rt_zt_lut_out = lookup_lut_powerof2(rescaled_mat_sum, rt_table, lut_in_bits, True, lut_out_bits, True)
+            r, u = torch.chunk(rt_zt_lut_out, 2, dim=1)
+
+            x_by_wc = x_by_wc_all[:, ts, :]
+            if 'version' in self.params and self.params['version'] == "GRUV1":
+                hidden_scale = self.params["hidden_scale_value"]
+                hidden_shift = self.params["hidden_shift_value"]
+                h_by_wc = torch.add(rnn_rowwise_matmul(state, wh_ck_q), torch.unsqueeze(hidden_bias_q, 0))
+                h_by_wc = linear_requantize(h_by_wc, hidden_scale, hidden_shift, 0, qmin, qmax)
+                h_by_wc = torch.multiply(r, h_by_wc)
+            else:
+                factor = 256.0 if dtype == 'int8' else 65536.0
+                hprev_r = torch.round(torch.div(torch.multiply(r, state), factor))
+                h_by_wc = rnn_rowwise_matmul(hprev_r, wh_ck_q)
+            re_scaled_h_by_wc = linear_requantize(h_by_wc, scale[2], shift[2], 0, act_qmin, act_qmax)
+            mat_sum2 = x_by_wc + re_scaled_h_by_wc + torch.unsqueeze(candidate_bias_q, 0)
+
+            rescaled_mat_sum2 = linear_requantize(mat_sum2, scale[3], shift[3], 0, qmin, qmax)
+            c = lookup_lut_powerof2(rescaled_mat_sum2, ht_table, lut_in_bits, True, lut_out_bits, True)
+            max_pre = qmax
+            c_times_1_minus_u = (max_pre - u) * c
+            rescaled_c_times_1_minus_u = linear_requantize(
+                c_times_1_minus_u, scale[4], shift[4], 0, act_qmin, act_qmax)
+
+            state = rescaled_c_times_1_minus_u + u * state
+            state = linear_requantize(state, scale[5], shift[5], 0, qmin, qmax)
+            state_all.append(state)
+        state_last = state
+        state_batch = torch.stack(state_all, dim=1)
 
     if direction == 'reverse':
         state_batch = torch.flip(state_batch, [1])
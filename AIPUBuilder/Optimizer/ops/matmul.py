@@ -7,7 +7,7 @@ from AIPUBuilder.Optimizer.utils import *
 import torch
 
 
-@op_register(OpType.MatMul)
+@op_register(OpType.MatMul, mutable_inputs=False)
 def matmul_forward(self, *args):
     inp0 = self.inputs[0]
     inp1 = self.inputs[1]
@@ -3,6 +3,7 @@
 
 from AIPUBuilder.Optimizer.utils import *
 from AIPUBuilder.Optimizer.framework import *
+from AIPUBuilder.Optimizer.ops.roialign import roi_reference_kernels, roi_range_max
 
 
 # Layer IR,such as
@@ -20,6 +21,65 @@ from AIPUBuilder.Optimizer.framework import *
 # currently, this OP is used in caffe fasterrcnn
 
 
+def maxroipooling_gathered(self, feature, rois_box, rois, spatial_scale_value, resize_height, resize_width, channel):
+    # the bins of all the rois at once, each bin's max is read from a range-max table of the feature map
+    height, width = feature.shape[1:3]
+    dev = feature.device
+    top_data = torch.zeros((rois.shape[0], rois.shape[1], resize_height, resize_width, channel), device=dev)
+    batch_index = rois_box[..., 0].int().reshape(-1)
+    rois = rois.reshape(-1, rois.shape[-1])
+    if not self.quantized:
+        roi_start_w = (torch.floor(rois[:, 1] * spatial_scale_value[1] + 0.5)).int()
+        roi_end_w = (torch.floor(rois[:, 3] * spatial_scale_value[1] + 0.5)).int()
+        roi_start_h = (torch.floor(rois[:, 0] * spatial_scale_value[0] + 0.5)).int()
+        roi_end_h = (torch.floor(rois[:, 2] * spatial_scale_value[0] + 0.5)).int()
+
+        roi_height = torch.clamp(roi_end_h - roi_start_h + 1, min=1).unsqueeze(1)
+        roi_width = torch.clamp(roi_end_w - roi_start_w + 1, min=1).unsqueeze(1)
+        bin_size_h = roi_height / resize_height
+        bin_size_w = roi_width / resize_width
+
+        hstart = torch.floor((torch.arange(0, resize_height, device=dev)) * bin_size_h)
+        wstart = torch.floor((torch.arange(0, resize_width, device=dev)) * bin_size_w)
+        hend = torch.ceil((torch.arange(1, resize_height + 1, device=dev)) * bin_size_h)
+        wend = torch.ceil((torch.arange(1, resize_width + 1, device=dev)) * bin_size_w)
+
+        hstart = (torch.clamp(hstart + roi_start_h.unsqueeze(1), 0, height)).int()
+        hend = (torch.clamp(hend + roi_start_h.unsqueeze(1), 0, height)).int()
+        wstart = (torch.clamp(wstart + roi_start_w.unsqueeze(1), 0, width)).int()
+        wend = (torch.clamp(wend + roi_start_w.unsqueeze(1), 0, width)).int()
+    else:
+        spatial_scale_int16 = [spatial_scale_value[0], spatial_scale_value[1]]
+        half_value = 1 << 15
+        rois = rois.long()
+
+        def round_q(expand):
+            return (expand // 65536).int().long() + ((expand % 65536) >= half_value).long()
+        roi_start_w_q = round_q(rois[:, 1] * spatial_scale_int16[1])
+        roi_end_w_q = round_q(rois[:, 3] * spatial_scale_int16[1])
+        roi_start_h_q = round_q(rois[:, 0] * spatial_scale_int16[0])
+        roi_end_h_q = round_q(rois[:, 2] * spatial_scale_int16[0])
+
+        def bins(roi_size_q, resize_size):
+            bin_size_q = (roi_size_q // resize_size).unsqueeze(1)
+            bin_size_q_mod = (roi_size_q % resize_size).unsqueeze(1)
+            start_q = torch.arange(0, resize_size, device=dev) * bin_size_q + \
+                (bin_size_q_mod * torch.arange(0, resize_size, device=dev)) // resize_size
+            end_q = torch.arange(1, resize_size + 1, device=dev) * bin_size_q + \
+                (bin_size_q_mod * torch.arange(1, resize_size + 1, device=dev)) // resize_size
+            end_q += (((bin_size_q_mod * torch.arange(1, resize_size + 1, device=dev)) % resize_size) > 0).long()
+            return start_q, end_q
+        hstart, hend = bins(torch.clamp(roi_end_h_q - roi_start_h_q + 1, min=1), resize_height)
+        wstart, wend = bins(torch.clamp(roi_end_w_q - roi_start_w_q + 1, min=1), resize_width)
+        hstart = torch.clamp(hstart + roi_start_h_q.unsqueeze(1), 0, height)
+        hend = torch.clamp(hend + roi_start_h_q.unsqueeze(1), 0, height)
+        wstart = torch.clamp(wstart + roi_start_w_q.unsqueeze(1), 0, width)
+        wend = torch.clamp(wend + roi_start_w_q.unsqueeze(1), 0, width)
+    roi_range_max(feature, batch_index, hstart, hend, wstart, wend,
+                  top_data.reshape(-1, resize_height, resize_width, channel))
+    return top_data
+
+
 @op_register(OpType.MaxRoiPool)
 def maxroipooling(self, *args):
     out = self.outputs[0].betensor
@@ -39,7 +99,10 @@ def maxroipooling(self, *args):
         OPT_WARN("MaxRoiPool batch dim is not correct")
     spatial_scale_value = [self.get_param('spatial')[0], self.get_param('spatial')[1]]  # [spatial_y, spatial_x] in IR
     dev = feature.device
-    if not self.quantized:
+    if not roi_reference_kernels():
+        top_data = maxroipooling_gathered(self, feature, rois_box, rois, spatial_scale_value,
+                                          resize_height, resize_width, channel)
+    elif not self.quantized:
         top_data = torch.zeros((rois.shape[0], rois.shape[1], resize_height, resize_width, channel), device=dev)
         for i in range(rois_box.shape[0]):
             batch_index = rois_box[i, :, 0]
@@ -5,6 +5,7 @@ from AIPUBuilder.Optimizer.framework import *
 
 from AIPUBuilder.Optimizer.utils import *
 from AIPUBuilder.Optimizer.logger import *
+import numpy as np
 
 
 def del_tensor_from_index(arr, index):
@@ -141,81 +142,145 @@ def single_softnms(self, box, score, max_nms_box_num_per_class):
     return nms_box, nms_score, boxNum_perclass, keep
 
 
-def single_nms(self, box, score, max_nms_box_num):
-    # keep = torchvision.ops.nms(box,score,iou_threshold)
-    # outputs
-    # iou_threshold =  self.params['iou_threshold']
-    nms_box = torch.zeros((max_nms_box_num, 4))
-    nms_score = torch.zeros((max_nms_box_num))
-    keep = torch.zeros((max_nms_box_num))
-
-    y0 = box[:, 0]
-    x0 = box[:, 1]
-    y1 = box[:, 2]
-    x1 = box[:, 3]
-
-    # it will set optional to False when parser add 'score_threshold' in future
-    score_threshold = float(self.get_param('score_threshold', optional=True, default_value='-inf'))
-    areas_shift = self.params['areas_shift'] if self.quantized else 0
-
+class _SuppressionRows(object):
+    # rows of the suppression matrices of S padded box sets ([S, L, 4]), computed lazily in blocks of rows
+    # and packed into bitmasks
+    def __init__(self, boxes, suppress_fn, max_elements):
+        self.boxes = boxes
+        self.suppress_fn = suppress_fn
+        # small blocks, the scan usually stops (max_keep) long before reaching the last rows
+        self.block = max(1, min(64, max_elements // max(1, boxes.shape[0] * boxes.shape[1])))
+        self.blocks = {}
+
+    def get(self, s, a):
+        b = a // self.block
+        if b not in self.blocks:
+            rows = self.boxes[:, b * self.block: (b + 1) * self.block]
+            self.blocks[b] = np.packbits(self.suppress_fn(rows, self.boxes).cpu().numpy(), axis=-1)
+        return self.blocks[b][s, a - b * self.block]
+
+
+def batched_nms(boxes_list, scores_list, suppress_fn, score_threshold=None, max_keep=None, sort=True,
+                max_elements=1 << 22):
+    """
+    greedy hard nms of several independent box sets (e.g. each class of each batch item) at once.
+    boxes of each set are put in selection order (descending scores if sort else the given order), the sets are
+    padded to [S, L, 4] and suppress_fn(rows, cols) gives the [S, R, C] bool matrix telling whether a kept box of
+    rows removes a box of cols, which is evaluated elementwise so that each pair gets the same value as comparing
+    one box against the others. a set stops at its first remaining box whose score <= score_threshold, or after
+    max_keep boxes are kept. returns the kept indices (into boxes_list[k], in selection order) of each set.
+    """
+    num = len(boxes_list)
+    keeps = [[] for _ in range(num)]
+    orders = []
+    for k in range(num):
+        n = boxes_list[k].shape[0]
+        if sort:
+            orders.append(torch.argsort(torch.flatten(scores_list[k]), descending=True))
+        else:
+            orders.append(torch.arange(n, device=boxes_list[k].device))
+    # pack the sets into chunks of about max_elements pairs
+    chunks = []
+    chunk = []
+    chunk_len = 0
+    for k in range(num):
+        n = boxes_list[k].shape[0]
+        if n == 0:
+            continue
+        if chunk and (len(chunk) + 1) * max(chunk_len, n) ** 2 > max_elements:
+            chunks.append(chunk)
+            chunk = []
+            chunk_len = 0
+        chunk.append(k)
+        chunk_len = max(chunk_len, n)
+    if chunk:
+        chunks.append(chunk)
+
+    for chunk in chunks:
+        lmax = max(boxes_list[k].shape[0] for k in chunk)
+        ref = boxes_list[chunk[0]]
+        boxes = torch.zeros((len(chunk), lmax, 4), dtype=ref.dtype, device=ref.device)
+        for s, k in enumerate(chunk):
+            boxes[s, :boxes_list[k].shape[0]] = boxes_list[k][orders[k]]
+        rows = _SuppressionRows(boxes, suppress_fn, max_elements)
+        for s, k in enumerate(chunk):
+            n = boxes_list[k].shape[0]
+            order = orders[k].tolist()
+            below = [False] * n
+            if score_threshold is not None:
+                below = (torch.flatten(scores_list[k])[orders[k]].float() <= score_threshold).tolist()
+            removed = np.zeros((lmax + 7) // 8, dtype=np.uint8)
+            keep = keeps[k]
+            for a in range(n):
+                if removed[a >> 3] & (0x80 >> (a & 7)):
+                    continue
+                if below[a]:
+                    break
+                keep.append(order[a])
+                if max_keep is not None and len(keep) >= max_keep:
+                    break
+                np.bitwise_or(removed, rows.get(s, a), out=removed)
+    return keeps
+
+
+def _nms_suppression(self):
+    # suppress_fn of batched_nms for NMS op, the same iou test as the single box one in single_nms
     if self.quantized:
         iou_threshold = self.params['iou_threshold']
         iou_thresh_shift = self.params['iou_thresh_shift']
-        box_scale = self.params['scale_value']
-        box_shift = self.params['shift_value']
-        areas = torch.abs((y1 - y0) * (x1 - x0)).int()
-        areas = areas >> areas_shift
+        areas_shift = self.params['areas_shift']
     else:
         iou_threshold = self.get_param('iou_threshold')
-        areas = torch.abs((y1 - y0) * (x1 - x0))
-
-    order = score[:].argsort(dim=-1, descending=True)  # descending order
-    keep_idx = 0
-    boxNum_perclass_single = 0
-    device = x0[0].device
-    while order.size()[0] > 0:
-        i = order[0]
-        if score[i].float() <= score_threshold:
-            break
-        boxNum_perclass_single += 1
 
-        keep[keep_idx] = i
-        nms_box[keep_idx, :] = box[i, :]
-        nms_score[keep_idx] = score[i]
-
-        keep_idx += 1
-        if keep_idx >= max_nms_box_num:
-            break
-
-        # xx0 = torch.max(x0[i], x0[order[1:]])
-        # yy0 = torch.max(y0[i], y0[order[1:]])
-        # xx1 = torch.min(x1[i], x1[order[1:]])
-        # yy1 = torch.min(y1[i], y1[order[1:]])
-        # w = torch.max(torch.tensor(0.0).to(device), xx1 - xx0)
-        # h = torch.max(torch.tensor(0.0).to(device), yy1 - yy0)
-        w, h = iou(x0, y0, x1, y1, i, order[1:])
-        inter = w * h
+    def _areas(box):
+        y0, x0, y1, x1 = box[..., 0], box[..., 1], box[..., 2], box[..., 3]
+        areas = torch.abs((y1 - y0) * (x1 - x0))
         if self.quantized:
-            inter = (inter).int()
-            inter = inter >> areas_shift
-
-        union = areas[i] + areas[order[1:]] - inter
-
+            areas = areas.int() >> areas_shift
+        return areas
+
+    def suppress_fn(rows, cols):
+        # rows as [S, R, 1] and cols as [S, 1, C]
+        ry0, rx0, ry1, rx1 = [rows[..., k:k + 1] for k in range(4)]
+        cy0, cx0, cy1, cx1 = [cols[..., k].unsqueeze(-2) for k in range(4)]
+        zero = torch.tensor(0.0).to(rows.device)
+        intersection_ymin = torch.max(torch.min(ry0, ry1), torch.min(cy0, cy1))
+        intersection_xmin = torch.max(torch.min(rx0, rx1), torch.min(cx0, cx1))
+        intersection_ymax = torch.min(torch.max(ry0, ry1), torch.max(cy0, cy1))
+        intersection_xmax = torch.min(torch.max(rx0, rx1), torch.max(cx0, cx1))
+        inter_h = torch.max(intersection_ymax - intersection_ymin, zero)
+        inter_w = torch.max(intersection_xmax - intersection_xmin, zero)
+        inter = inter_w * inter_h
+        if self.quantized:
+            inter = inter.int() >> areas_shift
+        union = _areas(rows).unsqueeze(-1) + _areas(cols).unsqueeze(-2) - inter
         inter_area_thresh = union * iou_threshold
         if self.quantized:
             inter_area_thresh = union * iou_threshold >> int(iou_thresh_shift)
+        return ~(inter <= inter_area_thresh)
+    return suppress_fn
 
-        inds = torch.where(inter <= inter_area_thresh)[0]
-        order = order[inds + 1]
 
-    boxNum_perclass = boxNum_perclass_single
+def _nms_results(self, box, score, keep, max_nms_box_num):
+    # the per class outputs of single_nms/single_softnms from the kept indices
+    keep = keep[:max_nms_box_num]
+    box_num = len(keep)
+    keep_idx = torch.tensor(keep, dtype=torch.long, device=box.device)
+    nms_box = box[keep_idx].to(torch.float32).cpu()
+    nms_score = score[keep_idx].to(torch.float32).cpu()
     if self.quantized:
+        box_scale = self.params['scale_value']
+        box_shift = self.params['shift_value']
         nms_box = nms_box.int() * box_scale >> box_shift
-        pass
-    nms_box = nms_box[0:boxNum_perclass, :]
-    nms_score = nms_score[0:boxNum_perclass]
-    keep = keep[0:boxNum_perclass]
-    return nms_box, nms_score, boxNum_perclass, keep
+    return nms_box, nms_score, box_num, keep_idx.to(torch.float32).cpu()
+
+
+def single_nms(self, box, score, max_nms_box_num):
+    # keep = torchvision.ops.nms(box,score,iou_threshold)
+    # it will set optional to False when parser add 'score_threshold' in future
+    score_threshold = float(self.get_param('score_threshold', optional=True, default_value='-inf'))
+    keep = batched_nms([box], [score], _nms_suppression(self), score_threshold, max_nms_box_num)[0]
+    return _nms_results(self, box, score, keep, max_nms_box_num)
 
 
 @op_register(OpType.NMS)
@@ -244,10 +309,6 @@ def Nms(self, *args):
                  f"and Opt will use 'hard-nms' method to continue.")
         method = 'HARD'
 
-    nms_func = {
-        "HARD":  single_nms,
-        "GAUSSIAN": single_softnms,
-    }
     dev = self.inputs[0].betensor.device
     batch_nms_boxes = torch.zeros((batch_num, max_nms_box_num, 4), device=dev)
     batch_nms_scores = torch.zeros((batch_num, max_nms_box_num), device=dev)
@@ -255,37 +316,44 @@ def Nms(self, *args):
     batch_keep = torch.zeros((batch_num, max_nms_box_num), device=dev)
     batch_proposal_scores = torch.reshape(
         batch_proposal_scores, [batch_num, -1])
+
+    # (batch, class, boxes, scores) of every class of every batch item, the hard nms solves them at once
+    segments = []
+    boxNum_perclass_list = batch_boxNum_perClass.tolist()
     for idx_batch in range(batch_num):
         proposal_boxes = batch_proposal_boxes[idx_batch]
-        boxNum_perclass = batch_boxNum_perClass[idx_batch]  # [5000]
-        total_class_num = batch_total_class_num[idx_batch]  # [1]
+        boxNum_perclass = boxNum_perclass_list[idx_batch]  # [5000]
+        tot_cls = int(batch_total_class_num[idx_batch][0])
         proposal_scores = batch_proposal_scores[idx_batch]
-
         idx_proposals = 0
-        idx_keep = 0
-        tot_cls = int(total_class_num[0])
         for idx_class in range(tot_cls):
-            if idx_keep > max_nms_box_num:
-                break
             box_num = int(boxNum_perclass[idx_class])
             if box_num == 0:
                 continue
             boxes = proposal_boxes[idx_proposals: idx_proposals + box_num, :].reshape(box_num, 4)
             scores = proposal_scores[idx_proposals: idx_proposals + box_num]
-
-            nms_box_, nms_score_, nms_boxNum_perClass_, keep_ = nms_func[method](self, boxes, scores, max_output_size)
-            if idx_keep + nms_boxNum_perClass_ > max_nms_box_num:
-                nms_boxNum_perClass_ = max_nms_box_num - idx_keep
-
-            batch_nms_boxes[idx_batch][idx_keep: idx_keep + nms_boxNum_perClass_] = nms_box_[0:nms_boxNum_perClass_]
-            batch_nms_scores[idx_batch][idx_keep: idx_keep +
-                                        nms_boxNum_perClass_] = nms_score_[0:nms_boxNum_perClass_]
-            batch_keep[idx_batch][idx_keep: idx_keep +
-                                  nms_boxNum_perClass_] = keep_[0:nms_boxNum_perClass_]
-            batch_nms_boxNum_perClass[idx_batch][idx_class] = nms_boxNum_perClass_
-
+            segments.append((idx_batch, idx_class, boxes, scores))
             idx_proposals = idx_proposals + box_num
-            idx_keep = idx_keep + nms_boxNum_perClass_
+    if method == 'HARD':
+        score_threshold = float(self.get_param('score_threshold', optional=True, default_value='-inf'))
+        keeps = batched_nms([seg[2] for seg in segments], [seg[3] for seg in segments],
+                            _nms_suppression(self), score_threshold, max_output_size)
+        results = [_nms_results(self, seg[2], seg[3], keep, max_output_size) for seg, keep in zip(segments, keeps)]
+    else:
+        results = [single_softnms(self, seg[2], seg[3], max_output_size) for seg in segments]
+
+    idx_keep = [0] * batch_num
+    for (idx_batch, idx_class, _, _), (nms_box_, nms_score_, nms_boxNum_perClass_, keep_) in zip(segments, results):
+        if idx_keep[idx_batch] > max_nms_box_num:
+            continue
+        start = idx_keep[idx_batch]
+        if start + nms_boxNum_perClass_ > max_nms_box_num:
+            nms_boxNum_perClass_ = max_nms_box_num - start
+        batch_nms_boxes[idx_batch][start: start + nms_boxNum_perClass_] = nms_box_[0:nms_boxNum_perClass_]
+        batch_nms_scores[idx_batch][start: start + nms_boxNum_perClass_] = nms_score_[0:nms_boxNum_perClass_]
+        batch_keep[idx_batch][start: start + nms_boxNum_perClass_] = keep_[0:nms_boxNum_perClass_]
+        batch_nms_boxNum_perClass[idx_batch][idx_class] = nms_boxNum_perClass_
+        idx_keep[idx_batch] = start + nms_boxNum_perClass_
 
     out[0].betensor = batch_nms_boxes
     out[1].betensor = batch_nms_boxNum_perClass
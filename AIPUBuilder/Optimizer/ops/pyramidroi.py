@@ -3,6 +3,7 @@
 
 from AIPUBuilder.Optimizer.utils import *
 from AIPUBuilder.Optimizer.framework import *
+from AIPUBuilder.Optimizer.ops.roialign import roi_reference_kernels, gather_nhwc
 
 
 register_optype('PyramidROIAlign')
@@ -33,6 +34,75 @@ def mylog2(Am):
     return y
 
 
+def pyramid_roi_align_gathered(self, feature, boxes, resize_height_, resize_width_):
+    # crop and resize all the boxes of one pyramid level at once, the four corners are read by gathers
+    image_width = feature.shape[1]
+    image_height = feature.shape[2]
+    dev = feature.device
+    bidx = torch.zeros([boxes.shape[0]], dtype=torch.long, device=dev)
+    if self.quantized:
+        qvalue = self.get_param('box_input_qvalue')
+        qmax = (1 << qvalue)-1
+        y0_q, x0_q, y1_q, x1_q = [c.int().unsqueeze(1) for c in boxes.unbind(-1)]
+        height_scale_q = (torch.div((y1_q - y0_q) * (image_height - 1) * 256,
+                          (resize_height_ - 1), rounding_mode='trunc')) >> 8  # Q15*Q0
+        width_scale_q = (torch.div((x1_q - x0_q) * (image_width - 1) * 256,
+                         (resize_width_ - 1), rounding_mode='trunc')) >> 8
+
+        x_q = (image_width-1) * x0_q + torch.arange(0, resize_width_, device=dev) * width_scale_q
+        y_q = (image_height-1) * y0_q + torch.arange(0, resize_height_, device=dev) * height_scale_q
+
+        yy_q = torch.clamp(y_q, 0,  (image_width - 1)*qmax)
+        xx_q = torch.clamp(x_q, 0, (image_height - 1)*qmax)
+
+        top_y_index_q = (yy_q >> qvalue).unsqueeze(2)
+        bottom_y_index_q = ((yy_q+qmax) >> qvalue).unsqueeze(2)
+        y_lerp_q = (yy_q & 0x7fff).unsqueeze(2).unsqueeze(-1)
+        left_x_index_q = (xx_q >> qvalue).unsqueeze(1)
+        right_x_index_q = ((xx_q+qmax) >> qvalue).unsqueeze(1)
+        x_lerp_q = (xx_q & 0x7fff).unsqueeze(1).unsqueeze(-1)
+
+        top_left = gather_nhwc(feature, bidx, top_y_index_q, left_x_index_q)
+        top_right = gather_nhwc(feature, bidx, top_y_index_q, right_x_index_q)
+        bottom_left = gather_nhwc(feature, bidx, bottom_y_index_q, left_x_index_q)
+        bottom_right = gather_nhwc(feature, bidx, bottom_y_index_q, right_x_index_q)
+
+        xy_q = y_lerp_q*x_lerp_q >> qvalue
+        fourpoint_sum = (top_left+bottom_right-top_right-bottom_left)*xy_q
+        top = (top_left.long() << qvalue) + ((top_right-top_left) * x_lerp_q)
+        bottom = (bottom_left - top_left) * y_lerp_q
+        return (fourpoint_sum+top+bottom).long() >> qvalue
+    else:
+        y0, x0, y1, x1 = [c.unsqueeze(1) for c in boxes.unbind(-1)]
+        height_scale = (y1 - y0) * (image_height - 1) / (resize_height_ - 1)
+        width_scale = (x1 - x0) * (image_width - 1) / (resize_width_ - 1)
+
+        x = (image_width-1) * x0 + torch.arange(0, resize_width_, device=dev) * width_scale
+        y = (image_height-1) * y0 + torch.arange(0, resize_height_, device=dev) * height_scale
+
+        yy = torch.clamp(y, 0,  image_width - 1)
+        xx = torch.clamp(x, 0, image_height - 1)
+        top_y_index = (torch.floor(yy)).int()
+        bottom_y_index = (torch.ceil(yy)).int()
+        y_lerp = (yy - top_y_index).unsqueeze(2).unsqueeze(-1)
+        left_x_index = (torch.floor(xx)).int()
+        right_x_index = (torch.ceil(xx)).int()
+        x_lerp = (xx - left_x_index).unsqueeze(1).unsqueeze(-1)
+        top_y_index, bottom_y_index = top_y_index.unsqueeze(2), bottom_y_index.unsqueeze(2)
+        left_x_index, right_x_index = left_x_index.unsqueeze(1), right_x_index.unsqueeze(1)
+
+        top_left = gather_nhwc(feature, bidx, top_y_index, left_x_index)
+        top_right = gather_nhwc(feature, bidx, top_y_index, right_x_index)
+        bottom_left = gather_nhwc(feature, bidx, bottom_y_index, left_x_index)
+        bottom_right = gather_nhwc(feature, bidx, bottom_y_index, right_x_index)
+
+        xy = y_lerp*x_lerp
+        fourpoint_sum = (top_left+bottom_right-top_right-bottom_left)*xy
+        top = top_left + (top_right-top_left) * x_lerp
+        bottom = (bottom_left - top_left) * y_lerp
+        return fourpoint_sum+top+bottom
+
+
 @op_register(OpType.PyramidROIAlign)
 def PyramidROIAlign(self, *args):
     # get each level's area range
@@ -111,7 +181,13 @@ def PyramidROIAlign(self, *args):
         roi_level = (f2+f3+f4+f5).int()
 
     # the roialign algorithm
-    if self.quantized:
+    if not roi_reference_kernels():
+        resize_feature = torch.zeros((nor_box.shape[1], resize_height_, resize_width_, channel_), device=dev)
+        for level in torch.unique(roi_level).tolist():
+            idx = torch.nonzero(roi_level == level, as_tuple=True)[0]
+            resize_feature[idx] = pyramid_roi_align_gathered(self, feature_maps[level - 1], nor_box[0, idx],
+                                                             resize_height_, resize_width_).to(resize_feature.dtype)
+    elif self.quantized:
         resize_feature = torch.zeros((nor_box.shape[1], resize_height_, resize_width_, channel_), device=dev)
         # for batchidx in range(feature.shape[0]):
         batch_idx = 0
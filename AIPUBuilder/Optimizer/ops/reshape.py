@@ -7,7 +7,7 @@ from AIPUBuilder.Optimizer.logger import *
 import torch
 
 
-@op_register(OpType.Reshape)
+@op_register(OpType.Reshape, mutable_inputs=False)
 def reshape(self, *args):
     inp = self.inputs[0].betensor
     out = self.outputs[0]
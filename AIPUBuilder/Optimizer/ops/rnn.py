@@ -252,6 +252,45 @@ def itp_lut_no_mirror(d, LUT_DATA):
     return torch.unsqueeze(output, dim=0).float()
 
 
+# below this many weights (K * N) torch.bmm computes each [1, K] @ [K, N] product with plain dot loops, which sum in
+# another order than mm does for a single row, so smaller products are multiplied row by row instead
+RNN_ROWWISE_BMM_MIN_WEIGHTS = 400
+
+
+def rnn_rowwise_matmul(x, w):
+    """
+    x[B, K] @ w[K, N] of a whole batch (or of all the time steps) in one call. each row is multiplied as its own
+    [1, K] matrix, so the results stay the same as multiplying the samples one by one: torch.bmm over the rows when
+    w has at least RNN_ROWWISE_BMM_MIN_WEIGHTS weights, else one matmul per row.
+    """
+    rows, k = x.shape
+    n = w.shape[1]
+    if rows == 1 or k * n < RNN_ROWWISE_BMM_MIN_WEIGHTS:
+        return torch.cat([torch.matmul(x[r:r + 1], w) for r in range(rows)], dim=0)
+    return torch.bmm(x.unsqueeze(1), w.expand(rows, k, n)).squeeze(1)
+
+
+def rnn_input_projection(input_seq, w):
+    # x_t @ w of all the time steps at once: [B, T, K] -> [B, T, N]
+    batch_size, time_step = input_seq.shape[:2]
+    return rnn_rowwise_matmul(input_seq.reshape(batch_size * time_step, -1), w).reshape(batch_size, time_step, -1)
+
+
+def rnn_rowwise_activation(func, x):
+    """
+    applies an elementwise activation on x[B, N] exactly as on each [1, N] row alone. torch runs sigmoid/tanh in
+    vector chunks and the last N % vector_width elements of a contiguous run in a scalar tail, and the two paths may
+    differ in the last bit. a contiguous x[B, N] is one run of B * N elements, so its rows would be split into chunks
+    at other offsets than a single row; x is copied into rows padded to a stride of N + 1 instead, which keeps every
+    row a separate run with the same chunks as a [1, N] tensor.
+    """
+    if x.dim() == 2 and x.shape[0] > 1 and x.stride() == (x.shape[1], 1):
+        padded = x.new_empty(x.shape[0], x.shape[1] + 1)[:, :x.shape[1]]
+        padded.copy_(x)
+        x = padded
+    return func(x)
+
+
 def absorb_input_h_zp_to_bias(node, *args):
     inp_zerop = node.inputs[0].zerop
     # currently h_zerop always is 0, because h0 is symmetric quantization
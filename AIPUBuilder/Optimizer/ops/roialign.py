@@ -5,11 +5,211 @@ from AIPUBuilder.Optimizer.logger import OPT_ERROR, OPT_WARN
 from AIPUBuilder.Optimizer.utils import *
 from AIPUBuilder.Optimizer.framework import *
 
+import os
 import torch
 import math
 from torchvision.ops import roi_align
 
 
+# the RoiAlign/MaxRoiPool/ROIPooling/CropAndResize/PyramidROIAlign forwards run gathered over all the rois at once,
+# set AIPUOPT_ROI_REFERENCE=1 (or ROI_REFERENCE_KERNELS = True) to run their original per-roi loops instead,
+# which is only meant for parity checks.
+ROI_REFERENCE_KERNELS = os.environ.get('AIPUOPT_ROI_REFERENCE', '0').lower() in ('1', 'true')
+
+
+def roi_reference_kernels():
+    return ROI_REFERENCE_KERNELS
+
+
+def roi_chunks(n, elements_per_roi, max_elements=1 << 24):
+    # split n rois into slices which hold about max_elements gathered elements each
+    chunk = max(1, max_elements // max(1, elements_per_roi))
+    return [slice(i, min(i + chunk, n)) for i in range(0, n, chunk)]
+
+
+def gather_nhwc(fm, bidx, ys, xs):
+    # fm[bidx[g], ys[g, i, j], xs[g, i, j], :] -> [G, oh, ow, C], ys/xs broadcast to [G, oh, ow]
+    return fm[bidx.long().reshape(-1, 1, 1), ys.long(), xs.long()]
+
+
+def gather_nhwc_offsets(fm, bidx, offsets):
+    # fm[bidx[g]].flatten()[offsets[g, i, j] + k] -> [G, oh, ow, C]
+    n, c = fm.shape[0], fm.shape[-1]
+    bidx = bidx.long().reshape(-1, 1, 1)
+    if bool((offsets % c == 0).all()):
+        return fm.reshape(n, -1, c)[bidx, offsets // c]
+    # offsets which are not on a pixel (e.g. rounded float offsets) index the flattened batch element by element
+    k = torch.arange(c, device=offsets.device)
+    return fm.reshape(n, -1)[bidx.unsqueeze(-1), offsets.unsqueeze(-1) + k]
+
+
+class _RangeMaxTable(object):
+    # maxima of all the 2**kh x 2**kw windows of fm, built level by level when first asked for
+    def __init__(self, fm):
+        self.tables = {(0, 0): fm}
+
+    def get(self, kh, kw):
+        if (kh, kw) not in self.tables:
+            if kw > 0:
+                t = self.get(kh, kw - 1)
+                half = 1 << (kw - 1)
+                self.tables[(kh, kw)] = torch.maximum(t[:, :, :-half], t[:, :, half:])
+            else:
+                t = self.get(kh - 1, 0)
+                half = 1 << (kh - 1)
+                self.tables[(kh, kw)] = torch.maximum(t[:, :-half], t[:, half:])
+        return self.tables[(kh, kw)]
+
+
+def _floor_log2(x):
+    k = torch.zeros_like(x)
+    while True:
+        more = (2 << k) <= x
+        if not bool(more.any()):
+            return k
+        k += more.long()
+
+
+def roi_range_max(fm, bidx, hstart, hend, wstart, wend, out):
+    """
+    out[g, i, j, :] = max(fm[bidx[g], hstart[g, i]:hend[g, i], wstart[g, j]:wend[g, j], :]) for all the non-empty bins,
+    each window is covered by (at most) four power-of-two windows of a range-max table.
+    """
+    G, oh = hstart.shape
+    ow = wstart.shape[1]
+    hs = hstart.long().unsqueeze(2).expand(G, oh, ow)
+    he = hend.long().unsqueeze(2).expand(G, oh, ow)
+    ws = wstart.long().unsqueeze(1).expand(G, oh, ow)
+    we = wend.long().unsqueeze(1).expand(G, oh, ow)
+    g, i, j = torch.nonzero((hs < he) & (ws < we), as_tuple=True)
+    if g.numel() == 0:
+        return out
+    b = bidx.long()[g]
+    hs, he, ws, we = hs[g, i, j], he[g, i, j], ws[g, i, j], we[g, i, j]
+    kh = _floor_log2(he - hs)
+    kw = _floor_log2(we - ws)
+    table = _RangeMaxTable(fm)
+    levels = torch.unique(torch.stack([kh, kw], dim=-1), dim=0).tolist()
+    for lh, lw in levels:
+        sel = torch.nonzero((kh == lh) & (kw == lw), as_tuple=True)[0]
+        t = table.get(lh, lw)
+        sb, sh, sw = b[sel], hs[sel], ws[sel]
+        eh, ew = he[sel] - (1 << lh), we[sel] - (1 << lw)
+        v = torch.maximum(torch.maximum(t[sb, sh, sw], t[sb, sh, ew]),
+                          torch.maximum(t[sb, eh, sw], t[sb, eh, ew]))
+        out[g[sel], i[sel], j[sel]] = v.to(out.dtype)
+    return out
+
+
+def _valid_roi_batch_index(batch_index, batch_size):
+    valid = (batch_index >= 0) & (batch_index <= batch_size - 1)
+    for r in torch.nonzero(~valid, as_tuple=True)[0].tolist():
+        if batch_index[r] < 0:
+            OPT_WARN(f"RoiAlign layer: the batch_index of box_id={r} is {batch_index[r]} < 0.")
+        else:
+            OPT_ERROR(
+                f"RoiAlign layer: batch_index={batch_index[r]} should be < the featuremap batch_size={batch_size}")
+    return valid
+
+
+def float_roi_align(fm, rois, params):
+    """
+    the same computation as local_float_roi_align, with the bilinear sample coordinates and weights of all the rois
+    precomputed as [rois, out_height, out_width] tensors and the feature map read by gathers.
+    """
+    out_height, out_width = params['output_size']
+    spatial_y, spatial_x = params['spatial_scale']
+    h_sample_ratio, w_sample_ratio = params['sample_ratio']
+    method = params['method'].lower()
+    is_half_pixel = params['is_half_pixel']
+
+    # nhwc
+    in_height, in_width, in_depth = fm.shape[1:]
+    roi_num = rois.shape[0]
+    dev = fm.device
+    out = torch.zeros(roi_num, out_height, out_width, in_depth)
+    half_pixel_offset = 0.5 if is_half_pixel else 0.
+    valid = _valid_roi_batch_index(rois[:, 0], fm.shape[0])
+
+    w_roi_start = rois[:, 2] * spatial_x - half_pixel_offset
+    w_roi_end = rois[:, 4] * spatial_x - half_pixel_offset
+    h_roi_start = rois[:, 1] * spatial_y - half_pixel_offset
+    h_roi_end = rois[:, 3] * spatial_y - half_pixel_offset
+    roi_width = w_roi_end - w_roi_start
+    roi_height = h_roi_end - h_roi_start
+    if not is_half_pixel:
+        roi_width = torch.maximum(roi_width, torch.tensor(1.0, device=dev))
+        roi_height = torch.maximum(roi_height, torch.tensor(1.0, device=dev))
+    w_step_size = roi_width / out_width
+    h_step_size = roi_height / out_height
+
+    # if sampling_ratio=0, use adaptive value of ceil(roi_width/out_width), same for height,
+    # so the rois are solved in groups of the same sampling ratios
+    w_ratios = torch.full([roi_num], w_sample_ratio, dtype=torch.long) if w_sample_ratio > 0 else \
+        torch.where(valid, torch.ceil(w_step_size), torch.zeros_like(w_step_size)).long().cpu()
+    h_ratios = torch.full([roi_num], h_sample_ratio, dtype=torch.long) if h_sample_ratio > 0 else \
+        torch.where(valid, torch.ceil(h_step_size), torch.zeros_like(h_step_size)).long().cpu()
+    groups = {}
+    for r in torch.nonzero(valid, as_tuple=True)[0].tolist():
+        groups.setdefault((h_ratios[r].item(), w_ratios[r].item()), []).append(r)
+
+    for (h_sampling_ratio, w_sampling_ratio), group in groups.items():
+        group = torch.tensor(group, device=dev)
+        for part in roi_chunks(group.numel(), out_height * out_width * in_depth):
+            idx = group[part]
+            out[idx.cpu()] = _float_roi_align_group(fm, rois[idx, 0], w_roi_start[idx], h_roi_start[idx],
+                                                    w_step_size[idx], h_step_size[idx], h_sampling_ratio,
+                                                    w_sampling_ratio, out_height, out_width, method).cpu()
+    return out.to(dev)
+
+
+def _float_roi_align_group(fm, batch_index, w_roi_start, h_roi_start, w_step_size, h_step_size,
+                           h_sampling_ratio, w_sampling_ratio, out_height, out_width, method):
+    in_height, in_width, in_depth = fm.shape[1:]
+    dev = fm.device
+    w_bin_size = (w_step_size / w_sampling_ratio).unsqueeze(1)
+    h_bin_size = (h_step_size / h_sampling_ratio).unsqueeze(1)
+    w_start = w_step_size.unsqueeze(1) * torch.arange(out_width, device=dev) + w_roi_start.unsqueeze(1)
+    h_start = h_step_size.unsqueeze(1) * torch.arange(out_height, device=dev) + h_roi_start.unsqueeze(1)
+
+    if method == 'avg':
+        out = torch.zeros(batch_index.shape[0], out_height, out_width, in_depth, device=dev)
+    else:  # method == max
+        out = torch.full([batch_index.shape[0], out_height, out_width, in_depth], torch.finfo(torch.float32).min,
+                         device=dev)
+    for y_ind in range(h_sampling_ratio):
+        y = h_start + h_bin_size / 2 + h_bin_size * y_ind
+        y_outside = ((y < -1.0) | (y > in_height)).unsqueeze(2)
+        y = torch.clamp(y, 0., in_height - 1)
+        y_low = torch.floor(y)
+        y_high = torch.clamp(y_low + 1, max=in_height - 1)
+        dy1 = (y - y_low).unsqueeze(2)
+        dy2 = 1. - dy1
+        for x_ind in range(w_sampling_ratio):
+            x = w_start + w_bin_size / 2 + w_bin_size * x_ind
+            outside = y_outside | ((x < -1.0) | (x > in_width)).unsqueeze(1)
+            x = torch.clamp(x, 0., in_width - 1)
+            x_low = torch.floor(x)
+            x_high = torch.clamp(x_low + 1, max=in_width - 1)
+            dx1 = (x - x_low).unsqueeze(1)
+            dx2 = 1. - dx1
+
+            ws = [dx2 * dy2, dx1 * dy2, dx2 * dy1, dx1 * dy1]
+            ws = [torch.where(outside, torch.zeros_like(w), w).unsqueeze(-1) for w in ws]
+            rows = [y_low.unsqueeze(2) * in_width * in_depth, y_high.unsqueeze(2) * in_width * in_depth]
+            cols = [x_low.unsqueeze(1) * in_depth, x_high.unsqueeze(1) * in_depth]
+            offsets = [rows[0] + cols[0], rows[0] + cols[1], rows[1] + cols[0], rows[1] + cols[1]]
+            values = [w * gather_nhwc_offsets(fm, batch_index, torch.where(outside, 0, o.long()))
+                      for w, o in zip(ws, offsets)]
+            if method == 'avg':
+                out += values[0] + values[1] + values[2] + values[3]
+            else:  # max
+                out = torch.maximum(out, torch.max(torch.stack(values), dim=0)[0])
+    if method == 'avg':
+        out = out / (w_sampling_ratio * h_sampling_ratio)
+    return out
+
+
 def local_float_roi_align(fm, rois, params):
     out_height, out_width = params['output_size']
     spatial_y, spatial_x = params['spatial_scale']
@@ -118,6 +318,109 @@ def local_float_roi_align(fm, rois, params):
     return out.to(dev)
 
 
+def quant_roi_align_gathered(fm, rois, method, is_half_pixel, pooled_shape, sample, spatial, spatial_shift,
+                             scale_shift_pairs, o_qmin, o_qmax):
+    """
+    the same integer computation as quant_roi_align, with the sample points, bilinear weights and corners of all the
+    rois precomputed as tensors and the feature map read by gathers.
+    """
+    do_scale, do_shift = scale_shift_pairs['total_scale_shift']
+    out_h_scale, out_h_shift = scale_shift_pairs['out_h_scale_shift']
+    out_w_scale, out_w_shift = scale_shift_pairs['out_w_scale_shift']
+    sample_h_scale, sample_h_shift = scale_shift_pairs['sample_h_scale_shift']
+    sample_w_scale, sample_w_shift = scale_shift_pairs['sample_w_scale_shift']
+    roi_scale, roi_shift = scale_shift_pairs['roi_scale_shift']
+
+    half_pixel_offset = 2 ** (spatial_shift - 1) if is_half_pixel else 0  # 0.5 * 2 ** spatial_shift
+    out_h, out_w = pooled_shape
+    sample_h_ratio, sample_w_ratio = sample
+    spatial_y, spatial_x = spatial
+    roi_num = rois.shape[0]
+    _, fm_height, fm_width, fm_channel = fm.shape[:]
+    dev = fm.device
+    out = torch.zeros(roi_num, out_h, out_w, fm_channel)
+    valid = _valid_roi_batch_index(rois[:, 0], fm.shape[0])
+    if sample_h_ratio <= 0:
+        OPT_ERROR(f"optimizer quant forward now does not support sample_h <=0")
+    if sample_w_ratio <= 0:
+        OPT_ERROR(f"optimizer quant forward now does not support sample_w <=0")
+
+    # lib impl
+    y_start = ((rois[:, 1] * roi_scale * 0.5 ** roi_shift).int() * spatial_y) - half_pixel_offset
+    x_start = ((rois[:, 2] * roi_scale * 0.5 ** roi_shift).int() * spatial_x) - half_pixel_offset
+    y_end = ((rois[:, 3] * roi_scale * 0.5 ** roi_shift).int() * spatial_y) - half_pixel_offset
+    x_end = ((rois[:, 4] * roi_scale * 0.5 ** roi_shift).int() * spatial_x) - half_pixel_offset
+    roi_width = x_end - x_start
+    roi_height = y_end - y_start
+    if not is_half_pixel:
+        roi_width = torch.maximum(roi_width.long(), torch.tensor(2 ** spatial_shift, device=dev))
+        roi_height = torch.maximum(roi_height.long(), torch.tensor(2 ** spatial_shift, device=dev))
+    step_size_qw = (roi_width * out_w_scale) >> out_w_shift
+    step_size_qh = (roi_height * out_h_scale) >> out_h_shift
+    w_bin_size = (step_size_qw * sample_w_scale / 2 ** sample_w_shift).long().to(step_size_qw.dtype)
+    h_bin_size = (step_size_qh * sample_h_scale / 2 ** sample_h_shift).long().to(step_size_qh.dtype)
+    w_start = step_size_qw.unsqueeze(1) * torch.arange(out_w, device=dev, dtype=step_size_qw.dtype) + \
+        x_start.unsqueeze(1)
+    h_start = step_size_qh.unsqueeze(1) * torch.arange(out_h, device=dev, dtype=step_size_qh.dtype) + \
+        y_start.unsqueeze(1)
+
+    one = 2 ** spatial_shift
+    total_shift = do_shift + spatial_shift
+    for part in roi_chunks(roi_num, out_h * out_w * fm_channel):
+        idx = torch.nonzero(valid[part], as_tuple=True)[0] + part.start
+        if idx.numel() == 0:
+            continue
+        batch_index = rois[idx, 0]
+        if method == 'avg':
+            outdata = torch.zeros(idx.numel(), out_h, out_w, fm_channel, device=dev)
+        else:
+            outdata = torch.full([idx.numel(), out_h, out_w, fm_channel], -2 ** 31, dtype=torch.float32, device=dev)
+        for yInd in range(sample_h_ratio):
+            y = h_start[idx] + h_bin_size[idx].unsqueeze(1) * (2 * yInd + 1)
+            y1 = (y >> spatial_shift).long()
+            y2 = y1 + 1
+            dy1 = y - (y1 << spatial_shift)
+            y_outside = ((y1 < -1) | (y1 > fm_height)).unsqueeze(2)
+            y1 = torch.clamp(y1, 0, fm_height - 1)
+            y_edge = y1 >= fm_height - 1
+            y2 = torch.where(y_edge, fm_height - 1, y2).unsqueeze(2)
+            dy1 = torch.where(y_edge, 0, dy1).unsqueeze(2)
+            dy2 = one - dy1
+            y1 = y1.unsqueeze(2)
+            for xInd in range(sample_w_ratio):
+                x = w_start[idx] + w_bin_size[idx].unsqueeze(1) * (2 * xInd + 1)
+                x1 = (x >> spatial_shift).long()
+                x2 = x1 + 1
+                dx1 = x - (x1 << spatial_shift)
+                outside = y_outside | ((x1 < -1) | (x1 > fm_width)).unsqueeze(1)
+                x1 = torch.clamp(x1, 0, fm_width - 1)
+                x_edge = x1 >= fm_width - 1
+                x2 = torch.where(x_edge, fm_width - 1, x2).unsqueeze(1)
+                dx1 = torch.where(x_edge, 0, dx1).unsqueeze(1)
+                dx2 = one - dx1
+                x1 = x1.unsqueeze(1)
+
+                ws = [(dx2 * dy2) >> spatial_shift, (dx1 * dy2) >> spatial_shift,
+                      (dx2 * dy1) >> spatial_shift, (dx1 * dy1) >> spatial_shift]
+                ws = [torch.where(outside, 0, w.long()).unsqueeze(-1) for w in ws]
+                corners = [(y1, x1), (y1, x2), (y2, x1), (y2, x2)]
+                values = [w * gather_nhwc(fm, batch_index, torch.where(outside, 0, cy), torch.where(outside, 0, cx))
+                          for w, (cy, cx) in zip(ws, corners)]
+                if method == 'avg':
+                    outdata += values[0] + values[1] + values[2] + values[3]
+                else:  # max, the first one of the equal maxima as python max()
+                    max_4points = values[0]
+                    for v in values[1:]:
+                        max_4points = torch.where(v > max_4points, v, max_4points)
+                    max_4points = (max_4points * do_scale / 2 ** total_shift)
+                    outdata = torch.where(max_4points > outdata, max_4points, outdata)
+        if method == 'avg':
+            # the same with quant_roi_align, 1/(sample_h*sample_w) has been included in do_scale/do_shift
+            outdata = torch.round((outdata * do_scale) * 0.5 ** total_shift)
+        out[idx.cpu()] = outdata.cpu()
+    return out.to(fm.device)
+
+
 def quant_roi_align(fm, rois, method, is_half_pixel, pooled_shape, sample, spatial, spatial_shift, scale_shift_pairs, o_qmin, o_qmax):
 
     do_scale, do_shift = scale_shift_pairs['total_scale_shift']
@@ -311,18 +614,19 @@ def roialign(self, *args):
 
         inp_d_zp = inp_d + self.inputs[0].zerop
         rois_zp = rois + self.inputs[1].zerop
-        out = quant_roi_align(inp_d_zp,
-                              rois_zp,
-                              method,
-                              is_half_pixel,
-                              [pool_height, pool_width],
-                              [sample_h, sample_w],
-                              [spatial_y, spatial_x],
-                              spatial_shift,
-                              scale_shift_pairs,
-                              o_qmin,
-                              o_qmax
-                              )
+        quant_roi_align_fn = quant_roi_align if roi_reference_kernels() else quant_roi_align_gathered
+        out = quant_roi_align_fn(inp_d_zp,
+                                 rois_zp,
+                                 method,
+                                 is_half_pixel,
+                                 [pool_height, pool_width],
+                                 [sample_h, sample_w],
+                                 [spatial_y, spatial_x],
+                                 spatial_shift,
+                                 scale_shift_pairs,
+                                 o_qmin,
+                                 o_qmax
+                                 )
         out = linear_quantize_clip(out, 1.0, self.outputs[0].zerop, o_qmin, o_qmax)
     else:
         if method == 'avg':
@@ -333,7 +637,7 @@ def roialign(self, *args):
                 params['spatial_scale'] = self.get_param('spatial_scale_value')
                 params['method'] = method
                 params['is_half_pixel'] = is_half_pixel
-                out = local_float_roi_align(inp_d, rois, params)
+                out = (local_float_roi_align if roi_reference_kernels() else float_roi_align)(inp_d, rois, params)
             else:
                 split_rois = torch.split(rois, split_size_or_sections=1, dim=-1)
                 rois = torch.cat([split_rois[0], split_rois[2], split_rois[1], split_rois[4], split_rois[3]], dim=-1)
@@ -347,7 +651,7 @@ def roialign(self, *args):
             params['spatial_scale'] = self.get_param('spatial_scale_value')
             params['method'] = method
             params['is_half_pixel'] = is_half_pixel
-            out = local_float_roi_align(inp_d, rois, params)
+            out = (local_float_roi_align if roi_reference_kernels() else float_roi_align)(inp_d, rois, params)
 
     self.outputs[0].betensor = out
     return self.outputs[0].betensor
@@ -3,6 +3,7 @@
 
 from AIPUBuilder.Optimizer.utils import *
 from AIPUBuilder.Optimizer.framework import *
+from AIPUBuilder.Optimizer.ops.roialign import roi_reference_kernels, gather_nhwc
 
 
 register_optype('ROIPooling')
@@ -25,6 +26,42 @@ register_optype('ROIPooling')
 # currently, this OP is for tensorflow fasterrcnn and has been splited into crop_and_resize + pooling
 
 
+def roipooling_gathered(self, feature, nor_box, resize_height_, resize_width_, channel_):
+    # the nearest sample grid of all the boxes at once, only the first batch's boxes are used as the loops do
+    feature_height_, feature_width_ = feature.shape[1:3]
+    dev = feature.device
+    batch_idx = 0
+    if not self.quantized:
+        resize_feature = torch.zeros((nor_box.shape[1], resize_height_, resize_width_, channel_), device=dev)
+        boxes = nor_box[batch_idx]
+        y0 = (boxes[:, 0]*feature_height_/resize_height_).unsqueeze(1)
+        y1 = (boxes[:, 2]*feature_height_/resize_height_).unsqueeze(1)
+        x0 = (boxes[:, 1]*feature_width_/resize_width_).unsqueeze(1)
+        x1 = (boxes[:, 3]*feature_width_/resize_width_).unsqueeze(1)
+
+        x = ((resize_width_ * x0 + torch.arange(0, resize_width_, device=dev) * (x1+1 - x0))).int()
+        y = ((resize_height_ * y0 + torch.arange(0, resize_height_, device=dev) * (y1+1 - y0))).int()
+    else:
+        resize_feature = torch.zeros((nor_box.shape[1], resize_height_, resize_width_, channel_))
+        x_index_scale_ = self.get_param('x_index_scale')
+        y_index_scale_ = self.get_param('y_index_scale')
+        x_index_shift_ = self.get_param('x_index_shift')
+        y_index_shift_ = self.get_param('y_index_shift')
+        boxes = torch.clamp(torch.round(nor_box * 255.0) >> 15, 0, 255)[batch_idx]
+        y0, y1 = boxes[:, 0].unsqueeze(1), boxes[:, 2].unsqueeze(1)
+        x0, x1 = boxes[:, 1].unsqueeze(1), boxes[:, 3].unsqueeze(1)
+
+        x = ((resize_width_ * x0 + torch.arange(0, resize_width_, device=dev)
+             * (x1 - x0 + 1)).int() * (x_index_scale_)) >> x_index_shift_
+        y = ((resize_height_ * y0 + torch.arange(0, resize_height_, device=dev)
+             * (y1 - y0 + 1)).int() * (y_index_scale_)) >> y_index_shift_
+    y = torch.clamp(y, 0, feature_height_ - 1)
+    x = torch.clamp(x, 0, feature_width_ - 1)
+    bidx = torch.full([boxes.shape[0]], batch_idx, device=dev)
+    resize_feature[...] = gather_nhwc(feature, bidx, y.unsqueeze(2), x.unsqueeze(1))
+    return resize_feature
+
+
 @op_register(OpType.ROIPooling)
 def roipooling(self, *args):
     out = self.outputs[0].betensor
@@ -36,7 +73,9 @@ def roipooling(self, *args):
     channel_ = out.shape[3]
     feature_height_, feature_width_ = feature.shape[1:3]
 
-    if not self.quantized:
+    if not roi_reference_kernels():
+        resize_feature = roipooling_gathered(self, feature, nor_box, resize_height_, resize_width_, channel_)
+    elif not self.quantized:
         resize_feature = torch.zeros((nor_box.shape[1], resize_height_, resize_width_, channel_), device=feature.device)
         # this nor_box has normalized to (0,1)
         # for batchidx in range(feature.shape[0]):
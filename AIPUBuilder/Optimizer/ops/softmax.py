@@ -47,7 +47,7 @@ def softmax_quantize(self, *args):
     self.params["scale_type"] = do_scale_type
 
 
-@op_register(OpType.Softmax)
+@op_register(OpType.Softmax, mutable_inputs=False)
 def softmax(self, *args):
     inp = self.inputs[0]
     out = self.outputs[0]
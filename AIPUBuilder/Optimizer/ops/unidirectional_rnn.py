@@ -27,11 +27,8 @@ def rnn(self, *args):
     initial_H = inp1.betensor
     start_data_idx = self.current_batch_idx * batch_size
 
-    start_initial_idx = start_data_idx % initial_batch
-    in_state = initial_H[start_initial_idx: start_initial_idx + 1]
-    for initial_idx in range(1, batch_size):
-        current_initial_idx = (start_data_idx + initial_idx) % initial_batch
-        in_state = torch.cat((in_state, initial_H[current_initial_idx: current_initial_idx + 1]), dim=0)
+    data_idx = torch.arange(start_data_idx, start_data_idx + batch_size, device=initial_H.device)
+    in_state = initial_H[data_idx % initial_batch]
 
     activations = self.get_param('activations')
     cell_size = self.get_param('cell_size')
@@ -63,42 +60,39 @@ def rnn(self, *args):
                 self.constants[weights_name].ir_dtype = self.constants["weights"].dtype
                 self.constants[weights_name].dtype = self.constants["weights"].dtype
                 self.constants[weights_name].ir_shape = TensorShape(list(split_weights.shape))
-        for b in range(batch_size):
-            state = torch.unsqueeze(in_state[b], dim=0).float()  # (1,2161)
-            state_all = torch.zeros([0, cell_size], device=inp0.betensor.device)
-            for ts in range(time_step):
-                in_ts = torch.reshape(input_seq[b, ts, :], (-1, input_size)).float()
-                #x*wx + h*wh + bias
-                x_wx_sum = torch.matmul(in_ts, wx)
-                h_wh_sum = torch.matmul(state, wh)
-                xw_hw_sum = x_wx_sum + h_wh_sum + torch.unsqueeze(bias, 0)
-                if threshold is not None:
-                    xw_hw_sum = torch.clamp(xw_hw_sum, -threshold, threshold)
-                lut_in_batch[b, ts, :] = torch.squeeze(xw_hw_sum).clone()
-
-                if activations == 'TANH':
-                    state = torch.tanh(xw_hw_sum)
-                elif activations == 'SIGMOID':
-                    state = torch.sigmoid(xw_hw_sum)
-                elif activations == 'RELU':
-                    state = torch.relu(xw_hw_sum)
-                elif activations == 'CLIP':
-                    clip_min = self.get_param('clip_min')
-                    clip_max = self.get_param('clip_max')
-                    state = torch.clamp(xw_hw_sum, clip_min, clip_max)
-                elif activations == 'SIGN_BIT':
-                    less_zero = xw_hw_sum < 0
-                    larger_zero = xw_hw_sum >= 0
-                    xw_hw_sum[less_zero] = 1
-                    xw_hw_sum[larger_zero] = 0
-                    state = xw_hw_sum
-                elif activations == 'NONE':
-                    state = xw_hw_sum
-
-                state_all = torch.cat((state_all, state), dim=0)
-
-            state_last[b, :] = state
-            state_batch[b, :, :] = state_all
+        # x * wx of all the time steps in one shot, then the whole batch goes through each time step together
+        x_wx_sum_all = rnn_input_projection(input_seq.float(), wx)
+        state = in_state.float()  # (batch,2161)
+        for ts in range(time_step):
+            #x*wx + h*wh + bias
+            x_wx_sum = x_wx_sum_all[:, ts, :]
+            h_wh_sum = rnn_rowwise_matmul(state, wh)
+            xw_hw_sum = x_wx_sum + h_wh_sum + torch.unsqueeze(bias, 0)
+            if threshold is not None:
+                xw_hw_sum = torch.clamp(xw_hw_sum, -threshold, threshold)
+            lut_in_batch[:, ts, :] = xw_hw_sum
+
+            if activations == 'TANH':
+                state = rnn_rowwise_activation(torch.tanh, xw_hw_sum)
+            elif activations == 'SIGMOID':
+                state = rnn_rowwise_activation(torch.sigmoid, xw_hw_sum)
+            elif activations == 'RELU':
+                state = torch.relu(xw_hw_sum)
+            elif activations == 'CLIP':
+                clip_min = self.get_param('clip_min')
+                clip_max = self.get_param('clip_max')
+                state = torch.clamp(xw_hw_sum, clip_min, clip_max)
+            elif activations == 'SIGN_BIT':
+                less_zero = xw_hw_sum < 0
+                larger_zero = xw_hw_sum >= 0
+                xw_hw_sum[less_zero] = 1
+                xw_hw_sum[larger_zero] = 0
+                state = xw_hw_sum
+            elif activations == 'NONE':
+                state = xw_hw_sum
+
+            state_batch[:, ts, :] = state
+        state_last[:, :] = state
 
         if len(self.placeholders) < 1:
             ph0 = PyTensor(self.name + "/h_state", state_batch.cpu().numpy().astype(dtype2nptype(Dtype.FP32)))
@@ -121,41 +115,38 @@ def rnn(self, *args):
             act_qmin = -2 ** 47
         qmin, qmax = dtype2range(self.outputs[0].dtype)
         qbits = self.outputs[0].qbits
-        for b in range(batch_size):
-            state = torch.unsqueeze(in_state[b], dim=0).float()
-            state_all = torch.zeros([0, cell_size], device=inp0.betensor.device)
-            for ts in range(time_step):
-                in_ts = torch.reshape(input_seq[b, ts, :], (-1, input_size)).float()
-                #x*wx + h*wh + bias
-                x_wx_sum = torch.matmul(in_ts, wx)
-                h_wh_sum = torch.matmul(state, wh)
-                re_scaled_x_wx_sum = linear_requantize(x_wx_sum, scale[0], shift[0], 0, act_qmin, act_qmax)
-                re_scaled_h_wh_sum = linear_requantize(h_wh_sum, scale[1], shift[1], 0, act_qmin, act_qmax)
-                xw_hw_sum = re_scaled_x_wx_sum + re_scaled_h_wh_sum + torch.unsqueeze(bias, 0)
-                if activations in ['TANH', 'SIGMOID']:
-                    xw_hw_sum = linear_requantize(xw_hw_sum, scale[2], shift[2], 0, qmin, qmax)
-                    state = lookup_lut_powerof2(xw_hw_sum, lut_table.betensor, qbits, True,
-                                                dtype2bits(lut_table.dtype), is_signed(lut_table.dtype))
-                elif activations == "RELU":
-                    xw_hw_sum = torch.nn.functional.relu(xw_hw_sum)
-                    state = linear_requantize(xw_hw_sum, scale[2], shift[2], outp.zerop, outp.qmin, outp.qmax)
-                elif activations in ["NONE"]:
-                    state = linear_requantize(xw_hw_sum, scale[2], shift[2], outp.zerop, outp.qmin, outp.qmax)
-                elif activations == "CLIP":
-                    clip_max, clip_min = self.get_param('clip_max'), self.get_param('clip_min')
-                    xw_hw_sum = torch.clamp(xw_hw_sum, clip_min, clip_max)
-                    state = linear_requantize(
-                        xw_hw_sum, scale[2], shift[2], 0, self.outputs[0].qmin, self.outputs[0].qmax)
-                elif activations == "SIGN_BIT":
-                    less_zero = xw_hw_sum < 0
-                    larger_zero = xw_hw_sum >= 0
-                    xw_hw_sum[less_zero] = 1
-                    xw_hw_sum[larger_zero] = 0
-                    state = xw_hw_sum
-                state_all = torch.cat((state_all, state), dim=0)
-
-            state_last[b, :] = state
-            state_batch[b, :, :] = state_all
+        # x * wx of all the time steps in one shot, then the whole batch goes through each time step together
+        x_wx_sum_all = rnn_input_projection(input_seq.float(), wx)
+        state = in_state.float()
+        for ts in range(time_step):
+            #x*wx + h*wh + bias
+            x_wx_sum = x_wx_sum_all[:, ts, :]
+            h_wh_sum = rnn_rowwise_matmul(state, wh)
+            re_scaled_x_wx_sum = linear_requantize(x_wx_sum, scale[0], shift[0], 0, act_qmin, act_qmax)
+            re_scaled_h_wh_sum = linear_requantize(h_wh_sum, scale[1], shift[1], 0, act_qmin, act_qmax)
+            xw_hw_sum = re_scaled_x_wx_sum + re_scaled_h_wh_sum + torch.unsqueeze(bias, 0)
+            if activations in ['TANH', 'SIGMOID']:
+                xw_hw_sum = linear_requantize(xw_hw_sum, scale[2], shift[2], 0, qmin, qmax)
+                state = lookup_lut_powerof2(xw_hw_sum, lut_table.betensor, qbits, True,
+                                            dtype2bits(lut_table.dtype), is_signed(lut_table.dtype))
+            elif activations == "RELU":
+                xw_hw_sum = torch.nn.functional.relu(xw_hw_sum)
+                state = linear_requantize(xw_hw_sum, scale[2], shift[2], outp.zerop, outp.qmin, outp.qmax)
+            elif activations in ["NONE"]:
+                state = linear_requantize(xw_hw_sum, scale[2], shift[2], outp.zerop, outp.qmin, outp.qmax)
+            elif activations == "CLIP":
+                clip_max, clip_min = self.get_param('clip_max'), self.get_param('clip_min')
+                xw_hw_sum = torch.clamp(xw_hw_sum, clip_min, clip_max)
+                state = linear_requantize(
+                    xw_hw_sum, scale[2], shift[2], 0, self.outputs[0].qmin, self.outputs[0].qmax)
+            elif activations == "SIGN_BIT":
+                less_zero = xw_hw_sum < 0
+                larger_zero = xw_hw_sum >= 0
+                xw_hw_sum[less_zero] = 1
+                xw_hw_sum[larger_zero] = 0
+                state = xw_hw_sum
+            state_batch[:, ts, :] = state
+        state_last[:, :] = state
 
     if direction == "reverse":
         state_batch = torch.flip(state_batch, [1])
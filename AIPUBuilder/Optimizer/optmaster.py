@@ -18,6 +18,54 @@ from AIPUBuilder.Optimizer.logger import *
 from AIPUBuilder.Optimizer.features import *
 from AIPUBuilder.Optimizer.passes import *
 
+# config fields which only change where or how fast things run, not the results of the stages: they are left out of
+# the stage checkpoint key and a resumed run keeps its own values
+_CHECKPOINT_IGNORED_FIELDS = frozenset(['checkpoint_dir', 'dataloader_workers', 'statistic_workers', 'metric_workers',
+                                        'profile_dir', 'statistic_cache_dir', 'float_result_cache_dir',
+                                        'global_calibration_memory_budget', 'global_calibration_spill_dir'])
+
+
+def _prefetch(iterable, depth):
+    """iterate over iterable in a background thread which keeps at most depth items ready ahead of the consumer"""
+    import queue
+    import threading
+    end = object()
+    items = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def _put(item):
+        # give up once the consumer has gone, otherwise a full queue would block forever
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce():
+        try:
+            for item in iterable:
+                if not _put((item, None)):
+                    return
+            _put((end, None))
+        except BaseException as e:
+            _put((end, e))
+
+    producer = threading.Thread(target=_produce, name='opt_prefetch', daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, err = items.get()
+            if err is not None:
+                raise err
+            if item is end:
+                break
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
 
 class OptMaster(object):
 
@@ -233,7 +281,6 @@ class OptMaster(object):
                            self.hparams.unify_scales_for_concat_threshold)
             node.attrs['optimization_info'] = {}
             node.attrs['batch_size_in_IR'] = self.batch_size_in_IR
-            node.attrs['calculate_running_time'] = False
 
             # update the scaling_bits to corresponding ops
             # from AIPUBuilder.Optimizer.cfg_parser import ScalingBits
@@ -293,15 +340,72 @@ class OptMaster(object):
                     node.attrs['layer_top_type_original'][0] = dtype2str(Dtype.INT32)
 
     def optimize(self):
-        self.graph_optimize_stage1()
-        self.statistic()
-        self.graph_optimize_stage2()
-        self.quantize()
-        self.collect_information_for_debug()
-        self.graph_optimize_stage3()
+        stages = [('graph_optimize_stage1', self.graph_optimize_stage1),
+                  ('statistic', self.statistic),
+                  ('graph_optimize_stage2', self.graph_optimize_stage2),
+                  ('quantize', self.quantize),
+                  ('collect_information_for_debug', self.collect_information_for_debug),
+                  ('graph_optimize_stage3', self.graph_optimize_stage3)]
+        names = [name for name, _ in stages]
+        checkpoint = self.stage_checkpoint()
+        start = 0
+        if checkpoint is not None and checkpoint.last_stage() in names:
+            start = names.index(checkpoint.last_stage()) + 1
+            self.restore_stage_checkpoint(checkpoint)
+            OPT_INFO(f"resume from the checkpoint after [{checkpoint.last_stage()}] in '{checkpoint.path}'")
+        for name, stage in stages[start:]:
+            stage()
+            if checkpoint is not None:
+                self.save_stage_checkpoint(checkpoint, name)
 
         self.graph_param_show()
 
+    def stage_checkpoint(self):
+        """
+        the StageCheckpoint of this run, None when 'checkpoint_dir' is not set. it is keyed by the IR files, the
+        config and the calibration and validation datasets.
+        """
+        if not self.hparams.checkpoint_dir:
+            return None
+        import hashlib
+        from AIPUBuilder.Optimizer.config.cfg_fields import ALL_FIELDS
+        config = {k: getattr(self.hparams, k) for k in sorted(ALL_FIELDS.keys())
+                  if k not in _CHECKPOINT_IGNORED_FIELDS and hasattr(self.hparams, k)}
+        # the IR is identified by its files, hashing the constants would load the lazily loaded ones
+        ir = []
+        for fpath in [self.hparams.graph, self.hparams.bin]:
+            st = os.stat(fpath)
+            ir.append([os.path.abspath(fpath), st.st_size, st.st_mtime_ns])
+        datasets = [self.calibration_fingerprint()]
+        if self.validation_dataloader is not None:
+            datasets.append(self.dataset_fingerprint(self.validation_dataloader,
+                                                     [self.hparams.data, self.hparams.label]))
+        h = hashlib.sha1()
+        h.update(json.dumps([ir, config, datasets], sort_keys=True, default=str).encode())
+        return StageCheckpoint(self.hparams.checkpoint_dir, h.hexdigest())
+
+    def save_stage_checkpoint(self, checkpoint, stage):
+        state = {'graph_optimize_stage1_flag': self.graph_optimize_stage1_flag,
+                 'graph_optimize_stage2_flag': self.graph_optimize_stage2_flag,
+                 'graph_optimize_stage3_flag': self.graph_optimize_stage3_flag,
+                 'hparams': dict(vars(self.hparams))}
+        try:
+            checkpoint.save(stage, self.g, state)
+            OPT_DEBUG(f"saved the checkpoint after [{stage}] into '{checkpoint.path}'")
+        except Exception as e:
+            # a failed snapshot only loses the ability to resume from this stage
+            OPT_WARN(f"failed to save the checkpoint after [{stage}] into '{checkpoint.path}': {e}")
+
+    def restore_stage_checkpoint(self, checkpoint):
+        self.g, state = checkpoint.load()
+        self.graph_optimize_stage1_flag = state['graph_optimize_stage1_flag']
+        self.graph_optimize_stage2_flag = state['graph_optimize_stage2_flag']
+        self.graph_optimize_stage3_flag = state['graph_optimize_stage3_flag']
+        # the stages may have updated the config, e.g. the strategies picked by calibration_strategy_sweep
+        for k, v in state['hparams'].items():
+            if k not in _CHECKPOINT_IGNORED_FIELDS:
+                setattr(self.hparams, k, v)
+
     def graph_param_show(self, *args):
         self.g.graph_param_show(*args)
 
@@ -317,50 +421,62 @@ class OptMaster(object):
         self.graph_optimize_stage1_flag = True
 
     @opt_workflow_register
+    @profile_phase('calibration')
     def graph_optimize_stage2(self):
         # quantization aware optimization (also partly hardware aware)
         if self.graph_optimize_stage2_flag:
             return
         if self.hparams.save_statistic_info:
-            # save statistic info first
-            self.g.save_statistic_info(self.hparams.output_dir + "/" + self.hparams.model_name + "_statistic_info.npy")
+            # save statistic info first, in the columnar '.stat' format which replaced the pickled
+            # '_statistic_info.npy' file, load_statistic_info still reads both
+            self.g.save_statistic_info(self.hparams.output_dir + "/" + self.hparams.model_name + "_statistic_info.stat")
+        if self.hparams.calibration_strategy_sweep:
+            # pick the best calibration strategies before applying them
+            CalibrationStrategySweep(self).sweep()
+        self.calibrate()
+
+        self.graph_optimize_stage2_flag = True
+
+    def calibrate(self):
         # apply calibration strategy per-layer
         if self.hparams.calibration_strategy_for_weight and self.hparams.calibration_strategy_for_activation:
             OPT_INFO('applying calibration strategy based on statistic info')
-            with tqdm(total=len(self.g.nodes), desc='calibration', file=sys.stdout) as pbar:
-                for n in self.g.nodes:
-                    astrategy = n.attrs[
-                        'q_strategy_activation'] if 'q_strategy_activation' in n.attrs else self.hparams.calibration_strategy_for_activation
-                    cstrategy = n.attrs[
-                        'q_strategy_weight'] if 'q_strategy_weight' in n.attrs else self.hparams.calibration_strategy_for_weight
-                    qmethod_wht = n.attrs[
-                        'q_mode_weight'] if 'q_mode_weight' in n.attrs else self.hparams.quantize_method_for_weight
-                    qmethod_act = n.attrs[
-                        'q_mode_activation'] if 'q_mode_activation' in n.attrs else self.hparams.quantize_method_for_activaion
-                    for o in n.outputs:
-                        o.qbits = n.attrs['q_bits_activation']
-                        apply_calibration_strategy(o, astrategy, qmethod_act)
-                    for k, v in n.constants.items():
-                        v.qbits = n.attrs['q_bits_bias'] if k.lower() == 'biases' else n.attrs['q_bits_weight']
-                        apply_calibration_strategy(v, cstrategy, qmethod_wht)
-                    for p in n.placeholders:
-                        p.qbits = n.attrs['q_bits_activation']
-                        apply_calibration_strategy(p, astrategy, qmethod_act)
-                    pbar.update(1)
-                pbar.refresh()
+            items = []
+            for n in self.g.nodes:
+                astrategy = n.attrs[
+                    'q_strategy_activation'] if 'q_strategy_activation' in n.attrs else self.hparams.calibration_strategy_for_activation
+                cstrategy = n.attrs[
+                    'q_strategy_weight'] if 'q_strategy_weight' in n.attrs else self.hparams.calibration_strategy_for_weight
+                qmethod_wht = n.attrs[
+                    'q_mode_weight'] if 'q_mode_weight' in n.attrs else self.hparams.quantize_method_for_weight
+                qmethod_act = n.attrs[
+                    'q_mode_activation'] if 'q_mode_activation' in n.attrs else self.hparams.quantize_method_for_activaion
+                for o in n.outputs:
+                    o.qbits = n.attrs['q_bits_activation']
+                    items.append((o, astrategy, qmethod_act))
+                for k, v in n.constants.items():
+                    v.qbits = n.attrs['q_bits_bias'] if k.lower() == 'biases' else n.attrs['q_bits_weight']
+                    items.append((v, cstrategy, qmethod_wht))
+                for p in n.placeholders:
+                    p.qbits = n.attrs['q_bits_activation']
+                    items.append((p, astrategy, qmethod_act))
+            # tensors sharing strategies (like kld) are calibrated together
+            apply_calibration_strategies(items)
 
         if self.hparams.global_calibration.lower().strip() != 'none':
             # get the intial calibration's results (each tensor's scale, zp, dtype, qbits)
             self.g.set_tensor_quantization_attrs()
             # apply global quantization optimization (scales, rounding, etc) here
-            apply_global_calibration(self.g, self.calibration_dataloader, self.hparams.global_calibration)
+            apply_global_calibration(self.g, self.calibration_dataloader, self.hparams.global_calibration,
+                                     self.hparams.global_calibration_memory_budget,
+                                     self.hparams.global_calibration_spill_dir,
+                                     self.hparams.global_calibration_schedule,
+                                     self.hparams.global_calibration_workers)
             # clear float graph's calibration results (each tensor's scale, zp, dtype, qbits) to avoid misusing in float forward
             self.g.clear_tensor_quantization_attrs()
 
         optimization_stage2(self.g, self.hparams)
 
-        self.graph_optimize_stage2_flag = True
-
     @opt_workflow_register
     def graph_optimize_stage3(self):
         # hardware aware optimization (quantization independent)
@@ -448,8 +564,45 @@ class OptMaster(object):
 
         self.graph_optimize_stage3_flag = True
 
+    def dataset_fingerprint(self, dataloader, data_paths, shuffle=False):
+        # identify the inputs of dataloader by the dataset plugin, the data files and the batching
+        fingerprint = [self.hparams.dataset.lower(), len(dataloader.dataset), dataloader.batch_size, shuffle]
+        for data_path in data_paths:
+            if not data_path:
+                continue
+            if os.path.isdir(data_path):
+                fpaths = sorted(os.path.join(root, f) for root, _, files in os.walk(data_path) for f in files)
+            else:
+                fpaths = [data_path]
+            for fpath in fpaths:
+                st = os.stat(fpath)
+                fingerprint.append([os.path.abspath(fpath), st.st_size, st.st_mtime_ns])
+        return fingerprint
+
+    def calibration_fingerprint(self):
+        dataloader = self.calibration_dataloader
+        if dataloader is None:
+            return ['zeros', self.batch_size_in_IR]
+        return self.dataset_fingerprint(dataloader, [self.hparams.calibration_data], self.hparams.calibration_shuffe)
+
+    def float_result_cache(self, graph, dataloader, namespace='outputs'):
+        """
+        the FloatResultCache of the float graph on dataloader (unshuffled), None when 'float_result_cache_dir' is
+        not set. namespace tells apart what is stored: 'outputs' for the graph outputs fed to float metrics and
+        'tensors' for the node outputs of the similarity check.
+        """
+        if not self.hparams.float_result_cache_dir or dataloader is None:
+            return None
+        if self.validation_dataloader is not None and dataloader.dataset is self.validation_dataloader.dataset:
+            data_paths = [self.hparams.data, self.hparams.label]
+        else:
+            data_paths = [self.hparams.calibration_data]
+        fingerprint = self.dataset_fingerprint(dataloader, data_paths)
+        return FloatResultCache(self.hparams.float_result_cache_dir, graph.float_result_key([namespace, fingerprint]))
+
     # optimizer quantize has two step: collect statistic data and quantize each op
     @opt_workflow_register
+    @profile_phase('statistic')
     def statistic(self, refresh=False):
         """get statistic info from 2 paths:
             1 statistic file
@@ -458,24 +611,58 @@ class OptMaster(object):
 
         if os.path.exists(self.hparams.statistic_file):
             # load statistic info from file
-            self.g.load_statistic_info(self.hparams.statistic_file)
+            self.g.load_statistic_info(self.hparams.statistic_file,
+                                       only_required=not (self.hparams.save_statistic_info or
+                                                          self.hparams.calibration_strategy_sweep))
         # elif self.ts_min_file=='' or self.ts_max_file=='':
         else:
-            if self.calibration_dataloader is not None:
+            cache_dir = self.hparams.statistic_cache_dir
+            cache_keys = None
+            statistic_nodes = None
+            if cache_dir:
+                cache_keys = self.g.statistic_cache_keys(self.hparams, self.calibration_fingerprint())
+                hits = self.g.load_statistic_cache(cache_dir, cache_keys)
+                statistic_nodes = set()
+                for n in self.g.nodes:
+                    node_tensors = list(n.outputs) + n.placeholders + list(n.constants.values())
+                    if not n.quantized and any(t not in hits for t in node_tensors):
+                        statistic_nodes.add(n)
+                OPT_INFO(f"found statistic info of {len(hits)}/{len(cache_keys)} tensors in statistic cache "
+                         f"'{cache_dir}', {len(statistic_nodes)} nodes need to be statisticed")
+            if statistic_nodes is not None and len(statistic_nodes) == 0:
+                pass
+            elif self.calibration_dataloader is not None:
                 dataloader = self.calibration_dataloader
                 self.g.current_batch_size = dataloader.batch_size
                 current_batch_idx = 0
-                with tqdm(dataloader, desc='statistic batch', file=sys.stdout) as pbar:
-                    for i, sample in enumerate(pbar):
-                        inp, _ = sample
-                        self.g.current_batch_idx = current_batch_idx
-                        current_batch_idx += 1
-                        if current_batch_idx * dataloader.batch_size > len(dataloader.dataset):
-                            self.g.current_batch_size = len(dataloader.dataset) - \
-                                (current_batch_idx - 1) * dataloader.batch_size
-                        self.g.statistic(inp, self.hparams)
-
-                    pbar.refresh()
+                workers = self.hparams.statistic_workers
+                reduction_pool = None
+                samples = dataloader
+                if workers > 0:
+                    from concurrent.futures import ThreadPoolExecutor
+                    OPT_INFO(f"statistic in pipelined mode with {workers} reduction workers")
+                    reduction_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='opt_statistic')
+                    samples = _prefetch(dataloader, workers)
+                try:
+                    with tqdm(samples, total=len(dataloader), desc='statistic batch', file=sys.stdout) as pbar:
+                        for i, sample in enumerate(pbar):
+                            inp, _ = sample
+                            self.g.current_batch_idx = current_batch_idx
+                            current_batch_idx += 1
+                            if current_batch_idx * dataloader.batch_size > len(dataloader.dataset):
+                                self.g.current_batch_size = len(dataloader.dataset) - \
+                                    (current_batch_idx - 1) * dataloader.batch_size
+                            self.g.statistic(inp, self.hparams, reduction_pool=reduction_pool,
+                                             statistic_nodes=statistic_nodes)
+                        if reduction_pool is not None:
+                            self.g.wait_statistic()
+
+                        pbar.refresh()
+                finally:
+                    if reduction_pool is not None:
+                        reduction_pool.shutdown(wait=True)
+                        self.g.statistic_inflight.clear()
+                        self.g.statistic_pending.clear()
             else:  # use all zeros data for statistic
                 OPT_INFO(f"Optimizer will use all zeros inputs to statistic tensor information because the config is"
                          f" not setted 'calibration_data'.")
@@ -486,7 +673,11 @@ class OptMaster(object):
                     inputs.append(np.zeros(shape).astype(dtype2nptype(dtype)))
                 self.g.current_batch_size = self.batch_size_in_IR
                 self.g.current_batch_idx = 0
-                self.g.statistic(inputs, self.hparams)
+                self.g.statistic(inputs, self.hparams, statistic_nodes=statistic_nodes)
+            if statistic_nodes:
+                tensors = [t for n in statistic_nodes
+                           for t in list(n.outputs) + n.placeholders + list(n.constants.values())]
+                self.g.save_statistic_cache(cache_dir, cache_keys, tensors)
 
         for n in self.g.nodes:
             if n.attrs['q_strategy_weight'].lower().strip() == 'in_ir':
@@ -525,6 +716,7 @@ class OptMaster(object):
         #     self.hparams.calibration_strategy_for_weight = None
 
     @opt_workflow_register
+    @profile_phase('quantize')
     def quantize(self):
         """OptMaster::quantize() will use the QuantizeGraph::quantize() to quantize each op"""
 
@@ -534,7 +726,9 @@ class OptMaster(object):
                                                                self.validation_dataloader,
                                                                self.f_metrics,
                                                                self.q_metrics,
-                                                               self.hparams)
+                                                               self.hparams,
+                                                               self.float_result_cache(self.g,
+                                                                                       self.validation_dataloader))
             autosearch_enginer.auto_search()
 
         # this pass will insert cast/quantize/dequantize op which meets the requirement
@@ -820,30 +1014,43 @@ class OptMaster(object):
             #################################################################################
             # log per layer similarity info after quantization
 
-            # enable to calculate op running time
-            for n in self.g.nodes:
-                n.attrs['calculate_running_time'] = True
-            for n in self.g.quantgraph.nodes:
-                n.attrs['calculate_running_time'] = True
-
+            # time each op with the active profiler, or with a temporary one when profiling is off
+            profiler = opt_profiler()
+            temporary_profiler = profiler is None
+            if temporary_profiler:
+                profiler = OpProfiler().start()
             self.g.current_batch_size = self.dataloader4debug.batch_size
             self.g.quantgraph.current_batch_size = self.dataloader4debug.batch_size
             check_sim_len = self.hparams.similarity_data_num if self.hparams.similarity_data_num <= len(
                 self.dataloader4debug) else 1
             OPT_INFO(
                 f'collecting per-layer similarity infomation between float graph and quanted graph by forwarding {check_sim_len} sample on both of them')
-            for i, sample in zip(range(check_sim_len), self.dataloader4debug):
-                inp, _ = sample
-                self.g.current_batch_idx = i
-                self.g.quantgraph.current_batch_idx = i
-                if (i + 1) * self.dataloader4debug.batch_size > len(self.dataloader4debug.dataset):
-                    bsize = len(self.dataloader4debug.dataset) - i * self.dataloader4debug.batch_size
-                    self.g.current_batch_size = bsize
-                    self.g.quantgraph.current_batch_size = bsize
-                check_nodes_similarity(self.g, self.g.quantgraph, inp, keep_tensors=self.hparams.dump)
+            float_cache = self.float_result_cache(self.g, self.dataloader4debug, 'tensors')
+            similarity = LayerSimilarity()
+            try:
+                with profile_phase('similarity'):
+                    for i, sample in zip(range(check_sim_len), self.dataloader4debug):
+                        inp, _ = sample
+                        self.g.current_batch_idx = i
+                        self.g.quantgraph.current_batch_idx = i
+                        if (i + 1) * self.dataloader4debug.batch_size > len(self.dataloader4debug.dataset):
+                            bsize = len(self.dataloader4debug.dataset) - i * self.dataloader4debug.batch_size
+                            self.g.current_batch_size = bsize
+                            self.g.quantgraph.current_batch_size = bsize
+                        check_nodes_similarity(self.g, self.g.quantgraph, inp, keep_tensors=self.hparams.dump,
+                                               float_cache=float_cache, similarity=similarity)
+                if float_cache is not None:
+                    float_cache.flush()
+            finally:
+                if temporary_profiler:
+                    profiler.stop()
+            similarity_rows = similarity.report()
+            similarity.set_tensor_similarity(similarity_rows)
             show_similarity(self.g.quantgraph)
+            if self.hparams.layer_similarity_report:
+                self.export_layer_similarity(similarity, similarity_rows)
 
-            calculate_op_running_time(self.g, self.g.quantgraph)
+            calculate_op_running_time(self.g, self.g.quantgraph, profiler, 'similarity')
 
             # dump tensor
             if self.hparams.dump:
@@ -852,21 +1059,36 @@ class OptMaster(object):
             if opt_use_cuda():
                 torch.cuda.empty_cache()
 
+    def export_layer_similarity(self, similarity, rows):
+        json_path, csv_path = similarity.export(self.hparams.output_dir, self.hparams.model_name, rows)
+        OPT_INFO("layers adding the most degradation (cosine drop against their worst input):")
+        for row in similarity.ranked(rows)[:5]:
+            sqnr = 'inf' if row['sqnr_db'] is None else f"{row['sqnr_db']:.3f}"
+            OPT_INFO(f"layer_id={row['layer_id']} layer_type={row['layer_type']} tensor_name={row['tensor_name']}: "
+                     f"cosine={row['cosine']:.6f} (inputs {row['input_cosine']:.6f}), mse={row['mse']:.6g}, "
+                     f"max_abs_error={row['max_abs_error']:.6g}, sqnr={sqnr}dB")
+        OPT_INFO(f"per-layer similarity report has been saved into {json_path} and {csv_path}")
+
     @opt_workflow_register
+    @profile_phase('metric')
     def float_metric(self, graph, dataloader, fmetrics):
         if opt_use_cuda():
             torch.cuda.empty_cache()
-        graph_inference(graph, graph.forward, dataloader, fmetrics, with_float=True)
+        graph_inference(graph, graph.forward, dataloader, fmetrics, with_float=True, workers=self.hparams.metric_workers,
+                        float_cache=self.float_result_cache(graph, dataloader))
         for fmetric in fmetrics:
             OPT_INFO('float metric: %s' % (fmetric.report()))
+        OPT_INFO('float graph peak activation memory: %.3f MB' % (graph.peak_activation_memory / 1024 ** 2))
 
     @opt_workflow_register
+    @profile_phase('metric')
     def quant_metric(self, graph, dataloader, qmetrics):
         if opt_use_cuda():
             torch.cuda.empty_cache()
-        graph_inference(graph.quantgraph, graph.qforward, dataloader, qmetrics)
+        graph_inference(graph.quantgraph, graph.qforward, dataloader, qmetrics, workers=self.hparams.metric_workers)
         for qmetric in qmetrics:
             OPT_INFO('quant metric: %s' % (qmetric.report()))
+        OPT_INFO('quant graph peak activation memory: %.3f MB' % (graph.quantgraph.peak_activation_memory / 1024 ** 2))
 
     def open_quantized_flag(self):
         if self.g.quantgraph is None:
@@ -945,75 +1167,90 @@ class OptMaster(object):
         if self.validation_dataloader is not None:
             self.metric(self.hparams.eval_original_model)
 
+    def export_profile(self, profiler):
+        json_path, trace_path = profiler.export(self.hparams.profile_dir, self.hparams.model_name)
+        hot_ops = profiler.op_type_report()[:10]
+        for item in hot_ops:
+            OPT_INFO(f"[profile] phase={item['phase']}, {item['kind']} {item['graph']} {item['type']}: "
+                     f"calls={item['calls']}, total={item['total']:.3f}s, p50={item['p50'] * 1000:.3f}ms, "
+                     f"p99={item['p99'] * 1000:.3f}ms, peak={item['peak_bytes'] / 1024 ** 2:.3f}MB")
+        OPT_INFO(f"op profile has been saved into {json_path}, trace events into {trace_path}")
+
     def __call__(self, *args, **kwargs):
-        self.prepare(self.hparams)
-        if hasattr(self.g, 'compat_quantized_model') and self.g.compat_quantized_model:
-            OPT_INFO(f"Now we do quantization transform in Optimizer.")
-            try:
-                from AIPUBuilder.core import quantize_transform as qtlib_quantize_transform
-            except Exception as e:
-                OPT_ERROR(
-                    f"The AIPUBuilder.core module is required when compat_quantized_model is True. now error message: {e}")
-
-            new_quantization_method_ops_type = []
-            if self.hparams.compat_quantized_model_ops != '':
-                lower_optype = {}
-                for k, v in OpType.__dict__.items():
-                    lower_optype.update({k.lower(): v})
-                for op in self.hparams.compat_quantized_model_ops.strip().replace(' ', '').split(','):
-                    new_quantization_method_ops_type.append(lower_optype[op])
-            # pre-pass
-            convert_resize_to_convolution(self.g)
-            for n in self.g.nodes:
-                n.attrs['unify_shifts_mode'] = self.hparams.compat_quantized_model_unify_shifts_mode
-                # now qat model fixed to 13bits, TODO: set by cfg fields and distinguish with opt flow.
-                n.attrs['multiplier_bits'] = 13
-                if 'conv_from_resize_opt' not in n.attrs:
-                    n.attrs['trigger_float_op'] = 'float16_preferred' if self.hparams.trigger_float_op.lower(
-                    ) == 'disable' else self.hparams.trigger_float_op.lower()
-                if self.hparams.compat_quantized_model_int8_to_uint8:
-                    n.attrs["int8_to_uint8"] = True
-                if n.type == OpType.Constant:
-                    n.attrs['scale_zp_need_quantize'] = True
-                if n.type in new_quantization_method_ops_type:
-                    n.attrs['tflite_quantization'] = True
-                if n.type == OpType.Eltwise:
-                    # n.attrs['eltwise_quantization'] = True
-                    # n.attrs['eltwise_quantization'] = False
-                    n.attrs['left_shift_bits'] = self.hparams.compat_quantized_model_left_shift_bits
-                if n.type == OpType.BasicLSTM:
-                    n.attrs['weight_dim'] = 1
-                    n.attrs['set_default_placeholder_info'] = True
-                    # n.attrs['start_basic_lstm_id'] = 64
-                    # n.attrs['start_basic_lstm_id'] = 32
-                if n.type == OpType.Cast:
-                    n.attrs["eliminate_cast"] = self.hparams.compat_quantized_model_eliminate_cast
-
-            cg = convert_opt_graph_to_aipu_graph(self.g)
-            qtlib_quantize_transform(cg, run_mode=self.hparams.compat_quantized_model_strategy)
-            name = os.path.join(self.hparams.output_dir, self.hparams.quant_ir_name)
-            if not os.path.exists(self.hparams.output_dir):
-                os.makedirs(self.hparams.output_dir)
-            if self.hparams.run_mode not in ['quant_ir_forward', ]:
-                cg.attrs['serialize_scale_zp'] = True
-                cg.serialize(f"{name}.txt", f"{name}.bin")
-                return
+        profiler = OpProfiler().start() if self.hparams.profile_dir else None
+        try:
+            self.prepare(self.hparams)
+            if hasattr(self.g, 'compat_quantized_model') and self.g.compat_quantized_model:
+                OPT_INFO(f"Now we do quantization transform in Optimizer.")
+                try:
+                    from AIPUBuilder.core import quantize_transform as qtlib_quantize_transform
+                except Exception as e:
+                    OPT_ERROR(
+                        f"The AIPUBuilder.core module is required when compat_quantized_model is True. now error message: {e}")
+
+                new_quantization_method_ops_type = []
+                if self.hparams.compat_quantized_model_ops != '':
+                    lower_optype = {}
+                    for k, v in OpType.__dict__.items():
+                        lower_optype.update({k.lower(): v})
+                    for op in self.hparams.compat_quantized_model_ops.strip().replace(' ', '').split(','):
+                        new_quantization_method_ops_type.append(lower_optype[op])
+                # pre-pass
+                convert_resize_to_convolution(self.g)
+                for n in self.g.nodes:
+                    n.attrs['unify_shifts_mode'] = self.hparams.compat_quantized_model_unify_shifts_mode
+                    # now qat model fixed to 13bits, TODO: set by cfg fields and distinguish with opt flow.
+                    n.attrs['multiplier_bits'] = 13
+                    if 'conv_from_resize_opt' not in n.attrs:
+                        n.attrs['trigger_float_op'] = 'float16_preferred' if self.hparams.trigger_float_op.lower(
+                        ) == 'disable' else self.hparams.trigger_float_op.lower()
+                    if self.hparams.compat_quantized_model_int8_to_uint8:
+                        n.attrs["int8_to_uint8"] = True
+                    if n.type == OpType.Constant:
+                        n.attrs['scale_zp_need_quantize'] = True
+                    if n.type in new_quantization_method_ops_type:
+                        n.attrs['tflite_quantization'] = True
+                    if n.type == OpType.Eltwise:
+                        # n.attrs['eltwise_quantization'] = True
+                        # n.attrs['eltwise_quantization'] = False
+                        n.attrs['left_shift_bits'] = self.hparams.compat_quantized_model_left_shift_bits
+                    if n.type == OpType.BasicLSTM:
+                        n.attrs['weight_dim'] = 1
+                        n.attrs['set_default_placeholder_info'] = True
+                        # n.attrs['start_basic_lstm_id'] = 64
+                        # n.attrs['start_basic_lstm_id'] = 32
+                    if n.type == OpType.Cast:
+                        n.attrs["eliminate_cast"] = self.hparams.compat_quantized_model_eliminate_cast
+
+                cg = convert_opt_graph_to_aipu_graph(self.g)
+                qtlib_quantize_transform(cg, run_mode=self.hparams.compat_quantized_model_strategy)
+                name = os.path.join(self.hparams.output_dir, self.hparams.quant_ir_name)
+                if not os.path.exists(self.hparams.output_dir):
+                    os.makedirs(self.hparams.output_dir)
+                if self.hparams.run_mode not in ['quant_ir_forward', ]:
+                    cg.attrs['serialize_scale_zp'] = True
+                    cg.serialize(f"{name}.txt", f"{name}.bin")
+                    return
+                else:
+                    self.g.quantgraph = convert_aipu_graph_to_opt_graph(cg)
+                    self.g.quantgraph.serialize(f"{name}.txt", f"{name}.bin")
+
+            if self.hparams.run_mode == 'float_ir_forward':
+                OPT_INFO(f"Now configure the Float Compass IR, and Optimizer uses this IR only to float inference.")
+                self.run_float_ir_forward()
+            elif self.hparams.run_mode == 'quant_ir_forward':
+                OPT_INFO(
+                    f"Now configure the Quantization Compass IR, and Optimizer uses this IR only to quantization inference.")
+                self.run_quant_ir_forward()
+            elif self.hparams.run_mode == 'mixed_ir_forward':
+                OPT_INFO(
+                    f"Now configure the Mixed-Float-Quantization Compass IR, and Optimizer uses this IR only to inference.")
+                self.run_mixed_ir_forward()
             else:
-                self.g.quantgraph = convert_aipu_graph_to_opt_graph(cg)
-                self.g.quantgraph.serialize(f"{name}.txt", f"{name}.bin")
-
-        if self.hparams.run_mode == 'float_ir_forward':
-            OPT_INFO(f"Now configure the Float Compass IR, and Optimizer uses this IR only to float inference.")
-            self.run_float_ir_forward()
-        elif self.hparams.run_mode == 'quant_ir_forward':
-            OPT_INFO(
-                f"Now configure the Quantization Compass IR, and Optimizer uses this IR only to quantization inference.")
-            self.run_quant_ir_forward()
-        elif self.hparams.run_mode == 'mixed_ir_forward':
-            OPT_INFO(
-                f"Now configure the Mixed-Float-Quantization Compass IR, and Optimizer uses this IR only to inference.")
-            self.run_mixed_ir_forward()
-        else:
-            self.run_default()
-        report = self.report()
-        return report
+                self.run_default()
+            report = self.report()
+            return report
+        finally:
+            if profiler is not None:
+                profiler.stop()
+                self.export_profile(profiler)
@@ -4,6 +4,7 @@
 
 from AIPUBuilder.Optimizer.framework import *
 
+from AIPUBuilder.Optimizer.utils.similarity_utils import SimilarityState, row_moments, cosine_from_moments
 import torch
 
 
@@ -14,28 +15,27 @@ class CosDistancewseqlenMetric(OptBaseMetric):
     The label of metric has two elements: [label_value(tensor), actual_len(int)]. This metric will
     select the actual_len in predict_value and label_value to calculate the cosine distance.
     """
+    state_fields = {'state': 'state'}
 
     def __init__(self):
-        self.cos = torch.nn.CosineSimilarity(dim=-1)
-        self.sim = []
+        self.state = SimilarityState()
 
     def __call__(self, pred, target):
-        preds = pred[0].cpu()
-        padded_targets = target[0].cpu()
-        act_len = target[1].cpu()
-        targets = padded_targets
-        for i in range(targets.shape[0]):
-            flatten_pred = preds[i][:act_len[i]].reshape([-1])
-            flatten_target = targets[i][:act_len[i]].reshape([-1])
-            self.sim.append(self.cos(flatten_pred, flatten_target))
+        preds = pred[0]
+        targets = target[0].to(preds.device)
+        batch, seq = preds.shape[0], preds.shape[1]
+        act_len = target[1].to(preds.device).reshape(-1, 1)
+        # zero the padded steps of each sample instead of slicing sample by sample
+        mask = (torch.arange(seq, device=preds.device).reshape(1, -1) < act_len).double().reshape(batch, seq, 1)
+        x = (preds.reshape(batch, seq, -1).double() * mask).reshape(batch, -1)
+        y = (targets.reshape(batch, seq, -1).double() * mask).reshape(batch, -1)
+        self.state.update(cosine_from_moments(*row_moments(x, y)))
 
     def reset(self):
-        self.sim = []
+        self.state.reset()
 
     def compute(self):
-        # shape of tensor self.sim is rank 1 as x, y above have iterate all dims and reshape
-        t = torch.Tensor(self.sim)
-        return float(torch.mean(t, 0))
+        return float(self.state.mean())
 
     def report(self):
         return "cosine similarity is %f" % (self.compute())
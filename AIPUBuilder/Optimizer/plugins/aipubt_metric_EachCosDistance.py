@@ -5,6 +5,7 @@
 from AIPUBuilder.Optimizer.framework import *
 
 from AIPUBuilder.Optimizer.logger import *
+from AIPUBuilder.Optimizer.utils.similarity_utils import SimilarityState, batch_rows, outputs_list, row_moments, cosine_from_moments
 import torch
 import numpy as np
 
@@ -16,48 +17,32 @@ class EachCosDistanceMetric(OptBaseMetric):
     This plugin supports the model has multi-outputs and metric cosine distance of each output
     between label and prediction.
     """
+    state_fields = {'state': 'state'}
 
     def __init__(self):
-        self.cos = torch.nn.CosineSimilarity(dim=-1)
-        self.sim = None
-        self.total_quan = 0
+        self.state = SimilarityState()
         self.total_sim = None
 
     def __call__(self, pred, target):
-        if self.sim is None:
-            self.sim = torch.zeros([len(pred)])
-        pred_list = []
-        target_list = []
         device = pred[0].device
         output_num = len(pred)
-
-        for i in range(output_num):
-            pred_list.append(pred[i].reshape(-1).double().to(device))
-
-        if isinstance(target, dict):
-            for k in target.keys():
-                target_list.append(target[k].reshape(-1,).double().to(device))
-        elif isinstance(target, list):
-            for i in range(output_num):
-                target_list.append(target[i].reshape(-1,).double().to(device))
-        else:
-            target_list.append(target.reshape(-1,).double().to(device))
-
+        targets = outputs_list(target, output_num)
         for i in range(output_num):
-            x = pred_list[i]
-            y = target_list[i]
-            if torch.count_nonzero(x) == 0 and torch.count_nonzero(y) == 0:
-                self.sim[i] += 1.0
+            x = batch_rows(pred[i], 1, device)
+            y = batch_rows(targets[i], 1, device)
+            dot, xx, yy = row_moments(x, y)
+            if xx.item() == 0 and yy.item() == 0:
+                # both outputs are all zeros
+                self.state.update(1.0, i)
             else:
-                self.sim[i] += self.cos(x, y).cpu().numpy()
-
-        self.total_quan += 1
+                self.state.update(cosine_from_moments(dot, xx, yy), i)
 
     def reset(self):
-        self.sim = None
+        self.state.reset()
+        self.total_sim = None
 
     def compute(self):
-        self.total_sim = self.sim.cpu().numpy()/self.total_quan
+        self.total_sim = np.array(self.state.slot_means())
         return float(np.mean(self.total_sim, 0))
 
     def report(self):
@@ -14,6 +14,7 @@ import re
 class IWSLTBLEUMetric(OptBaseMetric):
     """
     """
+    state_fields = {'pt_lines': 'extend', 'lines_num': 'max', 'vocab_fpath': 'first', 'gt_fpath': 'first'}
 
     def __init__(self, perl_fname='./multi_bleu.perl'):
         self.reset()
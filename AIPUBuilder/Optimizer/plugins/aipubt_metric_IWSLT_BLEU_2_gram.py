@@ -15,6 +15,7 @@ class IWSLTBLEU2gramMetric(OptBaseMetric):
     """
     This IWSLTBLEU2gramMetric is used for the metric of transformer_mini_tensorflow model in Optimizer.
     """
+    state_fields = {'pt_lines': 'extend', 'lines_num': 'max', 'vocab_fpath': 'first', 'gt_fpath': 'first'}
 
     def __init__(self, perf_fname='./multi_bleu.perl'):
         self.reset()
@@ -14,6 +14,7 @@ class KeywordSpottingMetric(OptBaseMetric):
     This KeywordSpottingMetric is used for the metric of kws_gru/kws_lstm models in Optimizer.
     accuracy = correct / total.
     """
+    state_fields = {'correct': 'sum', 'total': 'sum'}
 
     def __init__(self, K=1):
         self.correct = 0
@@ -11,6 +11,7 @@ class MaskRcnnCOCOmAPMetric(OptBaseMetric):
     """
     This MaskRcnnCOCOmAPMetric is used for the metric of MaskRcnn model in Optimizer.
     """
+    state_fields = {'AP': 'extend'}
 
     def __init__(self):
         self.AP = []
@@ -227,8 +228,7 @@ class MaskRcnnCOCOmAPMetric(OptBaseMetric):
         precisions = np.concatenate([[0], precisions, [0]])
         recalls = np.concatenate([[0], recalls, [1]])
 
-        for i in range(len(precisions) - 2, -1, -1):
-            precisions[i] = np.maximum(precisions[i], precisions[i + 1])
+        precisions = np.maximum.accumulate(precisions[::-1])[::-1]
 
         indices = np.where(recalls[:-1] != recalls[1:])[0] + 1
         mAP = np.sum((recalls[indices] - recalls[indices - 1]) *
@@ -4,8 +4,8 @@
 
 from AIPUBuilder.Optimizer.framework import *
 
+from AIPUBuilder.Optimizer.utils.similarity_utils import SimilarityState
 import torch
-import numpy
 
 
 @register_plugin(PluginType.Metric, '1.0')
@@ -15,30 +15,27 @@ class MaxAbsErrorwseqlenMetric(OptBaseMetric):
     The label of metric has two elements: [label_value(tensor), actual_len(int)]. This metric will
     select the actual_len in predict_value and label_value to calculate the maximum absolute error.
     """
+    state_fields = {'state': 'state'}
 
     def __init__(self):
-        self.errors = []
+        self.state = SimilarityState()
 
     def __call__(self, pred, target):
-        sim_per_output = []
-        for o_p, o_t, o_len in zip(pred, target[0], target[1]):
-            o_len = o_len.cpu()
-            x = o_p.float()[:, :o_len].reshape(-1)
-            y = o_t.float()[:o_len].reshape(-1)
-            sim_per_output.append(torch.max(torch.abs(x - y)).cpu().numpy())
-        self.errors.append(sim_per_output)
+        for i, (o_p, o_t, o_len) in enumerate(zip(pred, target[0], target[1])):
+            o_len = int(o_len)
+            x = o_p.double()[:, :o_len].reshape(-1)
+            y = o_t.to(o_p.device).double()[:o_len].reshape(-1)
+            self.state.update(torch.max(torch.abs(x - y)).item(), i)
 
     def reset(self):
-        self.errors = []
+        self.state.reset()
 
     def compute(self):
-        errors = numpy.array(self.errors)
-        return numpy.mean(errors)
+        return self.state.mean()
 
     def report(self):
         txt = ''
-        errors = numpy.array(self.errors).T  # [output, per call result]
-        txt += "maximum absolute error is %f" % numpy.mean(errors)
-        for i, e in enumerate(errors):
-            txt += "\noutput %d: maximum absolute error is %f" % (i, numpy.mean(e))
+        txt += "maximum absolute error is %f" % self.state.mean()
+        for i, e in enumerate(self.state.slot_means()):
+            txt += "\noutput %d: maximum absolute error is %f" % (i, e)
         return txt
@@ -86,6 +86,7 @@ class OcrMetric(OptBaseMetric):
     """
     This OcrMetric is used for the metric of Optical Character Recognition models.
     """
+    state_fields = {'correct': 'sum', 'total': 'sum'}
 
     def __init__(self, character_type='ch',
                  character_dict_path=None,
@@ -2,43 +2,37 @@
 # Copyright © 2023 Arm Technology (China) Co. Ltd.
 
 from AIPUBuilder.Optimizer.framework import *
-import torch
-import numpy
+from AIPUBuilder.Optimizer.utils.similarity_utils import SimilarityState, batch_rows, row_moments, cosine_from_moments
 
 
 @register_plugin(PluginType.Metric, '0.01')
 class OpTestCosDistanceMetric(OptBaseMetric):
+    state_fields = {'state': 'state'}
+
     def __init__(self):
-        self.cos = torch.nn.CosineSimilarity()
-        self.sim = []
+        self.state = SimilarityState()
 
     def __call__(self, pred, target):
-        sim_per_output = []
-        for o_p, o_t in zip(pred, target):
+        for i, (o_p, o_t) in enumerate(zip(pred, target)):
             if len(o_p.shape):
                 b = o_p.shape[0]
-                x = o_p.reshape(b, -1).float()
-                y = o_t.reshape(b, -1).float()
-                sim = numpy.mean(self.cos(x, y).cpu().flatten().numpy())
+                x = batch_rows(o_p, b)
+                y = batch_rows(o_t, b, o_p.device)
+                sim = cosine_from_moments(*row_moments(x, y)).mean()
             else:  # if output is a scalar
-                x = o_p
-                y = o_t[0]
-                sim = (x == y).item()
-
-            sim_per_output.append(sim)
-        self.sim.append(sim_per_output)
+                sim = (o_p == o_t[0]).item()
+            # each call contributes the mean over its batch, as a single value of this output
+            self.state.update(float(sim), i)
 
     def reset(self):
-        self.sim = []
+        self.state.reset()
 
     def compute(self):
-        sim = numpy.array(self.sim)
-        return numpy.mean(sim)
+        return self.state.mean()
 
     def report(self):
         txt = ''
-        sims = numpy.array(self.sim).T  # [output, per call result]
-        txt += "cosine similarity is %f" % numpy.mean(sims)
-        for i, sim in enumerate(sims):
-            txt += "\noutput %d: cosine similarity is %f" % (i, numpy.mean(sim))
+        txt += "cosine similarity is %f" % self.state.mean()
+        for i, sim in enumerate(self.state.slot_means()):
+            txt += "\noutput %d: cosine similarity is %f" % (i, sim)
         return txt
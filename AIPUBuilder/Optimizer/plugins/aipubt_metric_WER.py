@@ -23,6 +23,7 @@ class WERMetric(OptBaseMetric):
     Word error rate (WER) is a common metric of the performance of a speech recognition or machine translation system.
     Work Error Rate =  100 * (insertions + substitutions + deletions) / (total words in correct transcript)
     """
+    state_fields = {'predictions': 'extend'}
 
     def __init__(self):
         self.predictions = []
@@ -49,7 +49,8 @@ class CenterFaceMetric(WiderFaceMetric):
                                 target['hard'][batch].cpu().numpy()])
 
     def reset(self):
-        pass
+        self.box_pred = []
+        self.box_gt = []
 
     def compute(self):
         return self.eval_map(self.box_pred, self.box_gt)
@@ -5,12 +5,11 @@
 from AIPUBuilder.Optimizer.framework import *
 
 from AIPUBuilder.Optimizer.logger import *
-from AIPUBuilder.Optimizer.plugins.aipubt_metric_mAP import BasemAPMetric
+from AIPUBuilder.Optimizer.plugins.aipubt_metric_mAP import BasemAPMetric, DetectionTable
 import torch
 import numpy as np
 from torch import nn
 from torchvision.ops import nms
-from collections import defaultdict
 
 
 @register_plugin(PluginType.Metric, '1.0')
@@ -29,13 +28,13 @@ class CenterNetMetric(BasemAPMetric):
         self.nms = True
         self.cuda = torch.cuda.is_available()
 
-        self.predicts = defaultdict()
-        self.targets = defaultdict()
+        self.predicts = DetectionTable()
+        self.targets = DetectionTable()
         self.mAP = 0
 
     def reset(self):
-        self.predicts = defaultdict()
-        self.targets = defaultdict()
+        self.predicts = DetectionTable()
+        self.targets = DetectionTable()
         self.mAP = 0
 
     def compute(self):
@@ -14,6 +14,7 @@ class delta1Metric(OptBaseMetric):
     """
     This delta1Metric is used for the metric of fast_depth_onnx model in Optimizer.
     """
+    state_fields = {'num': 'sum', 'delta1_sum': 'sum'}
 
     def __init__(self):
         self.num = 0
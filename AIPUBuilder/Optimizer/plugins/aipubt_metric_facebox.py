@@ -17,6 +17,7 @@ class faceboxMetric(OptBaseMetric):
     This faceboxMetric is used for the metric of FaceBoxes_onnx model in Optimizer.
     The input image size of facebox model is 1024x1024.
     """
+    state_fields = {'box_pred': 'extend', 'box_gt': 'extend'}
 
     def __init__(self):
         self.cfg = {
@@ -150,7 +151,8 @@ class faceboxMetric(OptBaseMetric):
         return keep
 
     def reset(self):
-        pass
+        self.box_pred = []
+        self.box_gt = []
 
     def compute(self):
         return self.eval_map(self.box_pred, self.box_gt)
@@ -17,6 +17,7 @@ class IMDBMetric(OptBaseMetric):
     test set each have 25000 samples (each sample is a movie review),
     The number of samples of the positive/the negative class (ie positive/negative) is the same, 12500/12500.
     """
+    state_fields = {'correct': 'sum', 'total': 'sum'}
 
     def __init__(self):
         self.correct = [0, 0]
@@ -81,7 +81,8 @@ class lightfaceMetric(WiderFaceMetric):
         return picked_box_probs[:, :4].astype(np.int32), np.array(picked_labels), picked_box_probs[:, 4]
 
     def reset(self):
-        pass
+        self.box_pred = []
+        self.box_gt = []
 
     def compute(self):
         return self.eval_map(self.box_pred, self.box_gt)
@@ -9,8 +9,103 @@ import numpy as np
 from collections import defaultdict
 
 
+class DetectionTable(object):
+    """
+    columnar store of the objects (detections or ground truth) collected by the mAP metrics: the image id, class,
+    score and [ymin, xmin, ymax, xmax] box of each object are kept in preallocated numpy arrays, which grow by doubling.
+    """
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.image_ids = np.empty([capacity], dtype=np.int64)
+        self.labels = np.empty([capacity], dtype=np.int64)
+        self.scores = np.empty([capacity], dtype=np.float64)
+        self.boxes = np.empty([capacity, 4], dtype=np.float64)
+        self._columns = None
+
+    def __len__(self):
+        return self.size
+
+    def _reserve(self, num):
+        capacity = self.labels.shape[0]
+        if self.size + num <= capacity:
+            return
+        while capacity < self.size + num:
+            capacity *= 2
+        for name in ['image_ids', 'labels', 'scores', 'boxes']:
+            old = getattr(self, name)
+            new = np.empty([capacity] + list(old.shape[1:]), dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def append(self, image_id, labels, boxes, scores=None):
+        labels = np.asarray(labels).reshape([-1])
+        num = labels.shape[0]
+        if num < 1:
+            return
+        self._reserve(num)
+        end = self.size + num
+        self.image_ids[self.size:end] = image_id
+        self.labels[self.size:end] = labels
+        self.boxes[self.size:end] = np.asarray(boxes, dtype=np.float64).reshape([-1, 4])[:num]
+        self.scores[self.size:end] = np.nan if scores is None else np.asarray(
+            scores, dtype=np.float64).reshape([-1])[:num]
+        self.size = end
+        self._columns = None
+
+    def state_dict(self):
+        return {name: getattr(self, name)[:self.size].copy() for name in ['image_ids', 'labels', 'scores', 'boxes']}
+
+    def merge(self, state):
+        """
+        append the objects of another table's state_dict() after the ones already collected.
+        """
+        num = state['labels'].shape[0]
+        if num < 1:
+            return
+        self._reserve(num)
+        for name in ['image_ids', 'labels', 'scores', 'boxes']:
+            getattr(self, name)[self.size:self.size + num] = state[name]
+        self.size += num
+        self._columns = None
+
+    def columns(self):
+        """
+        :return: (image_ids, labels, boxes, scores) of the collected objects. a box repeated in the same image and
+                 class only keeps its first occurrence. objects are ordered by class, then by the first appearance of
+                 their image in that class, then by insertion.
+        """
+        if self._columns is not None:
+            return self._columns
+        image_ids = self.image_ids[:self.size]
+        labels = self.labels[:self.size]
+        boxes = self.boxes[:self.size]
+
+        # drop the repeated boxes, np.lexsort is stable so the first one of each run is the earliest inserted
+        order = np.lexsort((boxes[:, 3], boxes[:, 2], boxes[:, 1], boxes[:, 0], image_ids, labels))
+        repeated = (labels[order[1:]] == labels[order[:-1]]) & (image_ids[order[1:]] == image_ids[order[:-1]]) & \
+            (boxes[order[1:]] == boxes[order[:-1]]).all(axis=-1)
+        keep = np.ones([self.size], dtype=bool)
+        keep[order[1:][repeated]] = False
+        kept = np.nonzero(keep)[0]
+
+        # first insertion of each (class, image) group
+        k_images = image_ids[kept]
+        k_labels = labels[kept]
+        order = np.lexsort((kept, k_images, k_labels))
+        group_start = np.ones([kept.shape[0]], dtype=bool)
+        group_start[1:] = (k_labels[order[1:]] != k_labels[order[:-1]]) | (k_images[order[1:]] != k_images[order[:-1]])
+        group_first = np.empty_like(kept)
+        group_first[order] = kept[order][group_start][np.cumsum(group_start) - 1]
+
+        kept = kept[np.lexsort((kept, group_first, k_labels))]
+        self._columns = (image_ids[kept], labels[kept], boxes[kept], self.scores[:self.size][kept])
+        return self._columns
+
+
 class BasemAPMetric(OptBaseMetric):
     iou_thresh = 0.5
+    state_fields = {'predicts': 'state', 'targets': 'state'}
 
     def __init__(self):
         super().__init__()
@@ -21,14 +116,14 @@ class BasemAPMetric(OptBaseMetric):
         self.gt_labels = []
         self.AP = 0
         self.mAP = 0
-        self.predicts = defaultdict()
-        self.targets = defaultdict()
+        self.predicts = DetectionTable()
+        self.targets = DetectionTable()
 
     def reset(self):
         self.AP = 0
         self.mAP = 0
-        self.predicts = defaultdict()
-        self.targets = defaultdict()
+        self.predicts = DetectionTable()
+        self.targets = DetectionTable()
 
     @staticmethod
     def extract_obj_all_class(obj, collector):
@@ -37,39 +132,18 @@ class BasemAPMetric(OptBaseMetric):
 
         image_name = int(obj['image_name'])
         label_index = obj['label_index']
-        bbox = obj['bbox']
         if isinstance(label_index, np.ndarray):
-            label_index = label_index.reshape([-1]).tolist()
-        if isinstance(bbox, np.ndarray):
-            bbox = bbox.reshape([-1, 4]).tolist()
-
-        for idx in range(len(label_index)):
-            label_idx = int(label_index[idx])
-            bbox_exist = False
-
-            if label_idx not in list(collector.keys()):
-                collector.update({label_idx: {image_name: {'bbox': [bbox[idx]]}}})
-            else:
-                if image_name not in list(collector[label_idx].keys()):
-                    collector[label_idx].update({image_name: {'bbox': [bbox[idx]]}})
-                else:
-                    for bbox_i in collector[label_idx][image_name]['bbox']:
-                        if isinstance(bbox_i, np.ndarray):
-                            if (bbox_i == bbox[idx]).all():
-                                bbox_exist = True
-                                break
-                        elif bbox_i == bbox[idx]:
-                            bbox_exist = True
-                            break
-                    if not bbox_exist:
-                        collector[label_idx][image_name]['bbox'].append(bbox[idx])
-
-            if 'confidence' in obj and not bbox_exist:
-                confidence = obj['confidence']
-                if 'confidence' not in list(collector[label_idx][image_name].keys()):
-                    collector[label_idx][image_name].update({'confidence': [confidence[idx]]})
-                else:
-                    collector[label_idx][image_name]['confidence'].append(confidence[idx])
+            label_index = label_index.reshape([-1])
+        num = len(label_index)
+        if num < 1:
+            return
+        label_index = [int(label_index[idx]) for idx in range(num)]
+        bbox = obj['bbox']
+        bbox = bbox.reshape([-1, 4])[:num] if isinstance(bbox, np.ndarray) else [bbox[idx] for idx in range(num)]
+        confidence = obj['confidence'] if 'confidence' in obj else None
+        if confidence is not None:
+            confidence = [confidence[idx] for idx in range(num)]
+        collector.append(image_name, label_index, bbox, confidence)
 
     @staticmethod
     def cal_rec_prec(tp, fp, num_bbgt):
@@ -120,8 +194,8 @@ class BasemAPMetric(OptBaseMetric):
         rec = np.concatenate(([0.], recall, [1.0]))
         prec = np.concatenate(([0.], precision, [0.]))
 
-        for prec_idx in range(prec.shape[0]-1, 0, -1):
-            prec[prec_idx-1] = np.maximum(prec[prec_idx], prec[prec_idx-1])
+        # make the precision monotonically decreasing
+        prec = np.maximum.accumulate(prec[::-1])[::-1]
 
         rec_idx = np.where(rec[1:] != rec[:-1])[0]
         ap = np.sum((rec[rec_idx + 1] - rec[rec_idx]) * prec[rec_idx + 1])
@@ -133,85 +207,77 @@ class BasemAPMetric(OptBaseMetric):
         mAP = np.nanmean(ap)
         return mAP
 
+    @staticmethod
+    def eval_class_AP(det_images, det_boxes, det_scores, gt_images, gt_boxes):
+        '''
+        greedy matching of the detections of one class (in descending confidence) to its ground truth boxes
+        :param det_images: [num_det] image id of each detection
+        :param det_boxes: [num_det, 4] [ymin, xmin, ymax, xmax]
+        :param det_scores: [num_det]
+        :param gt_images: [num_gt] image id of each ground truth box
+        :param gt_boxes: [num_gt, 4]
+        :return: AP of this class
+        '''
+        # sort all the detection boxes confidences for current class
+        sorted_inds = np.argsort(-det_scores)
+        det_images = det_images[sorted_inds]
+        det_boxes = det_boxes[sorted_inds]
+        # the ground truth boxes of each image become contiguous, in their collected order
+        gt_inds = np.argsort(gt_images, kind='stable')
+        gt_images = gt_images[gt_inds]
+        gt_boxes = gt_boxes[gt_inds]
+
+        num_pbb = det_images.shape[0]
+        TP = np.zeros(num_pbb)
+        FP = np.ones(num_pbb)
+        gt_start = np.searchsorted(gt_images, det_images, side='left')
+        gt_num = np.searchsorted(gt_images, det_images, side='right') - gt_start
+        dets = np.nonzero(gt_num)[0]
+        if dets.shape[0] > 0:
+            # iou of every (detection, ground truth box of the same image) pair, pairs of a detection are contiguous
+            seg_num = gt_num[dets]
+            seg_start = np.cumsum(seg_num) - seg_num
+            pair_det = np.repeat(dets, seg_num)
+            pair_gt = np.arange(seg_start[-1] + seg_num[-1]) - np.repeat(seg_start - gt_start[dets], seg_num)
+            iou = BasemAPMetric.cal_iou_yxyx(det_boxes[pair_det], gt_boxes[pair_gt])
+            max_iou = np.maximum.reduceat(iou, seg_start)
+            # the first ground truth box reaching the max iou, as np.argmax
+            hit = np.nonzero(iou == np.repeat(max_iou, seg_num))[0]
+            hit_seg, first_hit = np.unique(np.repeat(np.arange(dets.shape[0]), seg_num)[hit], return_index=True)
+            midx = np.full([dets.shape[0]], -1, dtype=np.int64)
+            midx[hit_seg] = pair_gt[hit[first_hit]]
+            matched = max_iou > BasemAPMetric.iou_thresh
+            # a ground truth box only counts the first (the most confident) detection matched to it
+            _, first_det = np.unique(midx[matched], return_index=True)
+            tp_inds = dets[matched][first_det]
+            TP[tp_inds] = 1
+            FP[tp_inds] = 0
+        recall, precision = BasemAPMetric.cal_rec_prec(TP, FP, gt_images.shape[0])
+        return BasemAPMetric.cal_AP(recall, precision)
+
     def eval_mAP(self, prediction, gt, class_num, start_label_id=0):
         '''
-        :param pred: {labeld_index: {label_name:
-                                     image_name: {bbox: , confidence: }}}
-        :param gt:
+        :param prediction: DetectionTable of the detections
+        :param gt: DetectionTable of the ground truth
         :param class_num:
         :param start_label_id:
         :return:
         '''
-
-        def extract_obj_per_class(target, label_index):
-            return target[label_index] if label_index in target else None
-
+        det_images, det_labels, det_boxes, det_scores = prediction.columns()
+        gt_images, gt_labels, gt_boxes, _ = gt.columns()
         ap = []
         for class_idx in range(class_num):
             if class_idx < start_label_id:
                 continue
-            prediction_per_class = extract_obj_per_class(prediction, class_idx)
-            gt_per_class = extract_obj_per_class(gt, class_idx)
-
-            if not (prediction_per_class is None or gt_per_class is None):
-                image_names = list(prediction_per_class.keys())
-
-                num_bbgt = 0
-                for n in gt_per_class.keys():
-                    nbbgt = len(gt_per_class[n]['bbox'])
-                    gt_per_class[n].update({'match': [False] * nbbgt})
-                    num_bbgt += nbbgt
-
-                # get the detection result
-                # confidence: [img_num, MAX_NMS_BOX_NUM]
-                # bboxes: [img_num, MAX_NMS_BOX_NUM, 4]
-                # gtbboxes: [img_num, MAX_NMS_BOX_NUM, 4]
-                imagename_list = []
-                confidences = []
-                bboxes = []
-                for image_name in image_names:
-                    c = prediction_per_class[image_name]['confidence']
-                    bb = prediction_per_class[image_name]['bbox']
-                    for i in range(len(c)):
-                        imagename_list.append(image_name)
-                        confidences.append(c[i])
-                        bboxes.append(bb[i])
-                confidences = np.array(confidences)
-                bboxes = np.array(bboxes)
-
-                # sort all the detection boxes confidences for current class
-                sorted_inds = np.argsort(-confidences)
-                bboxes = bboxes[sorted_inds]
-                imagename_list = [imagename_list[idx] for idx in sorted_inds]
-
-                # the count of all the detection boxes for current class
-                num_pbb = len(confidences)
-                TP = np.zeros(num_pbb)
-                FP = np.zeros(num_pbb)
-                for idx in range(num_pbb):
-                    bb = bboxes[idx]
-                    name = imagename_list[idx]
-                    if name not in gt_per_class:
-                        FP[idx] = 1
-                    else:
-                        gt_class_image = gt_per_class[name]
-                        bbox_gt = np.array(gt_class_image['bbox'])
-                        iou = BasemAPMetric.cal_iou_yxyx(bb, bbox_gt)
-                        midx = np.argmax(iou)
-                        if iou[midx] > BasemAPMetric.iou_thresh:
-                            if not gt_class_image['match'][midx]:
-                                gt_class_image['match'][midx] = True
-                                TP[idx] = 1
-                            else:
-                                FP[idx] = 1
-                        else:
-                            FP[idx] = 1
-                recall, precision = BasemAPMetric.cal_rec_prec(
-                    TP, FP, num_bbgt)
-                ap.append(BasemAPMetric.cal_AP(recall, precision))
-            elif prediction_per_class is None and gt_per_class is None:
+            ds, de = np.searchsorted(det_labels, [class_idx, class_idx + 1])
+            gs, ge = np.searchsorted(gt_labels, [class_idx, class_idx + 1])
+
+            if de > ds and ge > gs:
+                ap.append(BasemAPMetric.eval_class_AP(det_images[ds:de], det_boxes[ds:de], det_scores[ds:de],
+                                                      gt_images[gs:ge], gt_boxes[gs:ge]))
+            elif de == ds and ge == gs:
                 ap.append(np.nan)
-            elif gt_per_class is not None:
+            elif ge > gs:
                 ap.append(0)
 
         self.mAP = BasemAPMetric.cal_mAP(ap)
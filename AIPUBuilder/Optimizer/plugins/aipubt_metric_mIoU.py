@@ -11,6 +11,8 @@ import numpy as np
 
 @register_plugin(PluginType.Metric, '1.0')
 class mIoUMetricBase(OptBaseMetric):
+    state_fields = {'confusion_matrix': 'sum', 'class_num': 'max', 'label': 'first', 'perm': 'first'}
+
     def __init__(self):
         self.confusion_matrix = None
         self.label = None
@@ -227,6 +229,8 @@ class mIoUpointnetMetric(mIoUMetricBase):
     This mIoUpointnetMetric is used for the metric of pointnet model in Optimizer.
     This plugin computes the mean Intersection-Over-Union metric.
     """
+    # the votes of each call are indexed by its position in the dataset, so states of shards can not be merged
+    state_fields = None
 
     def __init__(self,
                  scene_point_index='scene_point_index.npy',
@@ -301,6 +305,7 @@ class mIoUwithresizeMetric(mIoUMetricBase):
     This mIoUMetric is used for the metric of deeplab_onnx models in Optimizer.
     This plugin computes the mean Intersection-Over-Union metric
     """
+    state_fields = {'hist': 'sum'}
 
     def __init__(self, class_num=21, size=513, channel_axis=1):
         self.label = None
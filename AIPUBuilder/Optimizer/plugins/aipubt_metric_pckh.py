@@ -15,6 +15,7 @@ class PCKhMetric(OptBaseMetric):
     """
     This PCKhMetric is used for the metric of stacked_hourglass_tensorflow model in Optimizer.
     """
+    state_fields = {'ret': 'extend', 'label': 'extend'}
 
     def __init__(self, threshold=0.5, hmap_thres=1e-6, bias=0.6):
         self.ret = []
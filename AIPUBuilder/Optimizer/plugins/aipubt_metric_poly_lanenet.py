@@ -15,6 +15,7 @@ class LanenetMetric(OptBaseMetric):
     This LanenetMetric is used for the metric of poly lanenet model in Optimizer.
     The input image size of lanenet model is 360x640(original image is 720x1280)
     """
+    state_fields = {'lanes_pred': 'extend', 'lanes_gt': 'extend'}
 
     def __init__(self):
         # lstsq replace sklearn linear_regression fit
@@ -119,7 +120,8 @@ class LanenetMetric(OptBaseMetric):
         return accuracy/num, fp/num, fn/num
 
     def reset(self):
-        pass
+        self.lanes_pred = []
+        self.lanes_gt = []
 
     def compute(self):
         return self.lanes_acc(self.lanes_pred, self.lanes_gt)
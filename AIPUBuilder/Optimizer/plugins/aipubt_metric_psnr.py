@@ -25,6 +25,7 @@ class PsnrMetric(OptBaseMetric):
     so only cosine similarity can't reflect net' performance.
     for reason given above, we design a simple rule: cos similarity need multipled by factor; less psnr, less factor
     """
+    state_fields = {'sim': 'extend', 'sim_psnr': 'extend'}
 
     def __init__(self):
         self.loss = torch.nn.MSELoss(reduction='sum')
@@ -119,7 +119,8 @@ class RetinafaceboxMetric(WiderFaceMetric):
         return output
 
     def reset(self):
-        pass
+        self.box_pred = []
+        self.box_gt = []
 
     def compute(self):
         return self.eval_map(self.box_pred, self.box_gt)
@@ -14,6 +14,7 @@ class ROCMetric(OptBaseMetric):
     """
     This ROCMetric is used for the metric of arcface_onnx model in Optimizer.
     """
+    state_fields = {'ret': 'extend', 'label': 'extend'}
 
     def __init__(self, folds_num=10):
         self.ret = []
@@ -26,8 +27,8 @@ class ROCMetric(OptBaseMetric):
             self.label.append(label)
 
     def reset(self):
-        self.correct = 0
-        self.total = 0
+        self.ret = []
+        self.label = []
 
     def compute(self):
         num = len(self.ret)
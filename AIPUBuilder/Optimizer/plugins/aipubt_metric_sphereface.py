@@ -16,6 +16,7 @@ class SphereFaceMetric(OptBaseMetric):
     The input image size of centerface model is 112x96.
     https://github.com/wy1iu/sphereface/blob/master/README.md
     """
+    state_fields = {'predicts': 'extend'}
 
     def __init__(self):
 
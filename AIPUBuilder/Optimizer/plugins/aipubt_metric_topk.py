@@ -14,6 +14,7 @@ class TopKMetric(OptBaseMetric):
     This TopKMetric is used for the metric of image classfication models in Optimizer.
     This plugin defaultly computes Top1.
     """
+    state_fields = {'correct': 'sum', 'total': 'sum'}
 
     def __init__(self, K='1'):
         self.correct = 0
@@ -13,6 +13,7 @@ class WiderFaceMetric(OptBaseMetric):
     using for lightface and centerface,retinaface
 
     """
+    state_fields = {'box_pred': 'extend', 'box_gt': 'extend'}
 
     def __init__(self):
 
@@ -126,7 +127,8 @@ class WiderFaceMetric(OptBaseMetric):
         return keep
 
     def reset(self):
-        pass
+        self.box_pred = []
+        self.box_gt = []
 
     def compute(self):
         return self.eval_map(self.box_pred, self.box_gt)
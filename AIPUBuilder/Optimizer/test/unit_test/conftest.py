@@ -0,0 +1,154 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import pytest
+
+_ELTWISE_IR = '''model_name=eltwise
+layer_number=3
+input_tensors=[Placeholder1,Placeholder2]
+output_tensors=[eltwise]
+
+layer_id=0
+layer_name=Placeholder1
+layer_type=Input
+layer_bottom=[]
+layer_bottom_shape=[]
+layer_bottom_type=[]
+layer_top=[Placeholder1]
+layer_top_shape=[[1,4,4,16]]
+layer_top_type=[float32]
+
+layer_id=1
+layer_name=Placeholder2
+layer_type=Input
+layer_bottom=[]
+layer_bottom_shape=[]
+layer_bottom_type=[]
+layer_top=[Placeholder2]
+layer_top_shape=[[1,4,4,16]]
+layer_top_type=[float32]
+
+layer_id=2
+layer_name=eltwise
+layer_type=Eltwise
+layer_bottom=[Placeholder1,Placeholder2]
+layer_bottom_shape=[[1,4,4,16],[1,4,4,16]]
+layer_bottom_type=[float32,float32]
+layer_top=[eltwise]
+layer_top_shape=[[1,4,4,16]]
+layer_top_type=[float32]
+method=ADD
+with_activation=NONE
+'''
+
+_FC_IR = '''model_name=fc
+layer_number=2
+input_tensors=[input]
+output_tensors=[fc]
+
+layer_id=0
+layer_name=input
+layer_type=Input
+layer_bottom=[]
+layer_bottom_shape=[]
+layer_bottom_type=[]
+layer_top=[input]
+layer_top_shape=[[2,8]]
+layer_top_type=[float32]
+
+layer_id=1
+layer_name=fc
+layer_type=FullyConnected
+layer_bottom=[input]
+layer_bottom_shape=[[2,8]]
+layer_bottom_type=[float32]
+layer_top=[fc]
+layer_top_shape=[[2,4]]
+layer_top_type=[float32]
+num_output=4
+with_activation=NONE
+weights_type=float32
+weights_offset=0
+weights_size=128
+weights_shape=[4,8]
+biases_type=float32
+biases_offset=128
+biases_size=16
+biases_shape=[4]
+nested=[[1,2],[3.5,-inf],['a', b]]
+'''
+
+
+@pytest.fixture
+def eltwise_ir(tmp_path):
+    """(ir_txt, ir_bin) of a graph adding its two inputs."""
+    ir_txt = os.path.join(str(tmp_path), 'eltwise.txt')
+    ir_bin = os.path.join(str(tmp_path), 'eltwise.bin')
+    with open(ir_txt, 'w') as f:
+        f.write(_ELTWISE_IR)
+    open(ir_bin, 'wb').close()
+    return ir_txt, ir_bin
+
+
+@pytest.fixture
+def fc_ir(tmp_path):
+    """(ir_txt, ir_bin, weights, biases) of a graph with one fully connected layer."""
+    import numpy as np
+    rng = np.random.default_rng(0)
+    weights = rng.standard_normal([4, 8]).astype(np.float32)
+    biases = rng.standard_normal([4]).astype(np.float32)
+    ir_txt = os.path.join(str(tmp_path), 'fc.txt')
+    ir_bin = os.path.join(str(tmp_path), 'fc.bin')
+    with open(ir_txt, 'w') as f:
+        f.write(_FC_IR)
+    with open(ir_bin, 'wb') as f:
+        f.write(weights.tobytes())
+        f.write(biases.tobytes())
+    return ir_txt, ir_bin, weights, biases
+
+
+@pytest.fixture
+def eltwise_graph(eltwise_ir):
+    from AIPUBuilder.Optimizer.framework import QuantizeGraph
+    return QuantizeGraph.parse(*eltwise_ir)
+
+
+@pytest.fixture
+def eltwise_argv(tmp_path, eltwise_ir):
+    """make_argv(**fields): the parsed config quantizing the eltwise graph on 6 samples, fields extend the config."""
+    import argparse
+    import numpy as np
+    import AIPUBuilder.Optimizer.plugins  # registers the dataset and metric plugins
+    from AIPUBuilder.Optimizer.framework import QUANTIZE_METRIC_DICT, QUANTIZE_DATASET_DICT, traverse_opt_plugins
+    from AIPUBuilder.Optimizer.config.parser import cfg_parser
+    traverse_opt_plugins()
+    rng = np.random.default_rng(0)
+    data = {k: rng.standard_normal([6, 4, 4, 16]).astype(np.float32) for k in range(2)}
+    data_file = os.path.join(str(tmp_path), 'data.npy')
+    label_file = os.path.join(str(tmp_path), 'label.npy')
+    np.save(data_file, data)
+    np.save(label_file, {0: data[0] + data[1]})
+
+    def make_argv(**fields):
+        config = {'graph': eltwise_ir[0],
+                  'bin': eltwise_ir[1],
+                  'model_name': 'eltwise',
+                  'dataset': 'NumpyMultiInputDataset',
+                  'calibration_data': data_file,
+                  'calibration_batch_size': 2,
+                  'metric': 'CosDistanceMetric',
+                  'data': data_file,
+                  'label': label_file,
+                  'metric_batch_size': 1,
+                  'output_dir': os.path.join(str(tmp_path), 'out')}
+        config.update(fields)
+        cfg = os.path.join(str(tmp_path), 'opt.cfg')
+        with open(cfg, 'w') as f:
+            f.write('[Common]\n')
+            for k, v in config.items():
+                f.write(f'{k} = {v}\n')
+        argv = argparse.Namespace()
+        assert cfg_parser(argv, cfg, QUANTIZE_METRIC_DICT, QUANTIZE_DATASET_DICT)
+        return argv
+    return make_argv
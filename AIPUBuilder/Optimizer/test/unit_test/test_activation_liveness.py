@@ -0,0 +1,102 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import torch
+import pytest
+from AIPUBuilder.Optimizer.framework import QuantizeGraph, OP_DICT, OpType
+
+# input -> a = abs(input) -> b = abs(a) -> c = a + b, a is consumed by b and c
+_ABS_ADD_IR = '''model_name=abs_add
+layer_number=4
+input_tensors=[input]
+output_tensors=[c]
+
+layer_id=0
+layer_name=input
+layer_type=Input
+layer_bottom=[]
+layer_bottom_shape=[]
+layer_bottom_type=[]
+layer_top=[input]
+layer_top_shape=[[1,1024]]
+layer_top_type=[float32]
+
+layer_id=1
+layer_name=a
+layer_type=Abs
+layer_bottom=[input]
+layer_bottom_shape=[[1,1024]]
+layer_bottom_type=[float32]
+layer_top=[a]
+layer_top_shape=[[1,1024]]
+layer_top_type=[float32]
+
+layer_id=2
+layer_name=b
+layer_type=Abs
+layer_bottom=[a]
+layer_bottom_shape=[[1,1024]]
+layer_bottom_type=[float32]
+layer_top=[b]
+layer_top_shape=[[1,1024]]
+layer_top_type=[float32]
+
+layer_id=3
+layer_name=c
+layer_type=Eltwise
+layer_bottom=[a,b]
+layer_bottom_shape=[[1,1024],[1,1024]]
+layer_bottom_type=[float32,float32]
+layer_top=[c]
+layer_top_shape=[[1,1024]]
+layer_top_type=[float32]
+method=ADD
+with_activation=NONE
+'''
+_NBYTES = 1024 * 4
+
+
+@pytest.fixture
+def graph(tmp_path):
+    ir_txt = os.path.join(str(tmp_path), 'abs_add.txt')
+    ir_bin = os.path.join(str(tmp_path), 'abs_add.bin')
+    with open(ir_txt, 'w') as f:
+        f.write(_ABS_ADD_IR)
+    open(ir_bin, 'wb').close()
+    return QuantizeGraph.parse(ir_txt, ir_bin)
+
+
+def _record_alive(g, monkeypatch):
+    # the names of the featuremaps holding data when each node runs
+    alive = {}
+    for optype in (OpType.Abs, OpType.Eltwise):
+        def record(self, *args, forward=OP_DICT[optype]):
+            alive[self.name] = sorted(t.name for n in g.nodes for t in n.outputs if t.betensor.numel() > 1)
+            return forward(self, *args)
+        monkeypatch.setitem(OP_DICT, optype, record)
+    return alive
+
+
+def test_free_at_last_use(graph, monkeypatch):
+    g = graph
+    alive = _record_alive(g, monkeypatch)
+    x = -torch.rand([1, 1024]) - 1
+    out = g.forward(x)
+    assert torch.equal(out[0].betensor, -2 * x)
+    # input is freed after its only consumer, a is kept until c
+    assert alive == {'a': ['input'], 'b': ['a'], 'c': ['a', 'b']}
+    # only the graph output survives the forward
+    assert [t.name for n in g.nodes for t in n.outputs if t.betensor.numel() > 1] == ['c']
+    assert g.peak_activation_memory == 3 * _NBYTES
+
+
+def test_keep_tensors(graph, monkeypatch):
+    g = graph
+    alive = _record_alive(g, monkeypatch)
+    x = torch.rand([1, 1024])
+    g.forward(x, keep_tensors=True)
+    assert alive == {'a': ['input'], 'b': ['a', 'input'], 'c': ['a', 'b', 'input']}
+    for n in g.nodes:
+        assert n.outputs[0].betensor.numel() == 1024
+    assert g.peak_activation_memory == 4 * _NBYTES
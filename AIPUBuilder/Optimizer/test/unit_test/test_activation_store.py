@@ -0,0 +1,82 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import torch
+from AIPUBuilder.Optimizer.features.calibration.global_calibration.activation_store import ActivationStore
+
+_NBYTES = 64 * 4
+
+
+def _tensors():
+    gen = torch.Generator().manual_seed(0)
+    return {'a': torch.randn([4, 16], generator=gen),
+            'b': torch.randint(-128, 127, [64], generator=gen, dtype=torch.int32),
+            'c': torch.randn([2, 2, 16], generator=gen).double()[:, :, :8],
+            'empty': torch.zeros([0, 3])}
+
+
+def _spill_files(store):
+    return sorted(os.listdir(store.spill_dir)) if store.spill_dir is not None else []
+
+
+def test_without_budget_nothing_spills():
+    tensors = _tensors()
+    with ActivationStore({k: 1 for k in tensors}) as store:
+        for k, t in tensors.items():
+            store.put(k, t)
+        assert store.spill_dir is None and len(store.spilled) == 0
+        for k, t in tensors.items():
+            assert torch.equal(store.get(k), t)
+
+
+def test_spill_and_get(tmp_path):
+    tensors = _tensors()
+    spill_root = os.path.join(str(tmp_path), 'spill')
+    store = ActivationStore({k: 2 for k in tensors}, budget=_NBYTES, spill_dir=spill_root)
+    for k, t in tensors.items():
+        store.put(k, t)
+    # the least recently used ones are spilled to keep the resident bytes within the budget
+    assert store.resident_bytes <= _NBYTES
+    assert set(store.spilled.keys()) == {'a', 'b'}
+    assert store.spill_dir.startswith(spill_root) and len(_spill_files(store)) == 2
+    for k, t in tensors.items():
+        assert k in store
+        got = store.get(k)
+        assert got.dtype == t.dtype and torch.equal(got, t)
+        assert store.resident_bytes <= max(_NBYTES, got.numel() * got.element_size())
+
+    # the last release drops the tensor and its spill file
+    store.release(['a', 'b'])
+    assert 'a' in store and 'b' in store
+    store.release(['a', 'b', 'unknown'])
+    assert 'a' not in store and 'b' not in store
+    assert all(f not in _spill_files(store) for f in ['0.bin', '1.bin'])
+    spill_dir = store.spill_dir
+    store.close()
+    assert not os.path.exists(spill_dir)
+
+
+def test_unused_tensors_are_not_stored():
+    with ActivationStore({'a': 1, 'b': 0}) as store:
+        store.put('b', torch.ones([2]))
+        store.put('c', torch.ones([2]))
+        assert 'b' not in store and 'c' not in store and store.resident_bytes == 0
+
+
+def test_prefetch(tmp_path):
+    tensors = _tensors()
+    store = ActivationStore({k: 1 for k in tensors}, budget=2 * _NBYTES, spill_dir=str(tmp_path))
+    for k in ('a', 'b', 'c'):
+        store.put(k, tensors[k])
+    assert 'a' in store.spilled and 'a' not in store.resident
+    # a background load never spills other tensors, so it is skipped while the budget is used up
+    store.prefetch(['a'])
+    store.settle()
+    assert 'a' not in store.resident
+    store.release(['c'])
+    store.prefetch(['a', 'b'])
+    store.settle()
+    assert 'a' in store.resident and store.resident_bytes <= 2 * _NBYTES
+    assert torch.equal(store.get('a'), tensors['a'])
+    store.close()
@@ -0,0 +1,38 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import json
+import pytest
+from AIPUBuilder.Optimizer.framework import QuantizeGraph
+from AIPUBuilder.Optimizer.features import CalibrationStrategySweep
+
+
+def _sweep(argv):
+    from AIPUBuilder.Optimizer.optmaster import OptMaster
+    g = QuantizeGraph.parse(argv.graph, argv.bin)
+    opt = OptMaster(g, argv)
+    opt.prepare(argv)
+    opt.graph_optimize_stage1()
+    opt.statistic()
+    sweep = CalibrationStrategySweep(opt)
+    return opt, sweep, sweep.sweep()
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_sweep_keeps_per_layer_strategies(tmp_path, eltwise_argv, workers):
+    opt_config = os.path.join(str(tmp_path), 'opt_config.json')
+    with open(opt_config, 'w') as f:
+        json.dump({'Placeholder2': {'q_strategy_activation': '3std'}}, f)
+    argv = eltwise_argv(calibration_strategy_sweep='mean;2std/extrema;extrema',
+                        calibration_strategy_sweep_workers=workers,
+                        opt_config=opt_config)
+    opt, sweep, ranked = _sweep(argv)
+
+    # every candidate is ranked by how far its metric is from the float one
+    assert sorted(c for c, _ in ranked) == sorted([('mean', 'extrema'), ('2std', 'extrema'), ('extrema', 'extrema')])
+    drops = [abs(sweep.fscore - qscore) for _, (qscore, _) in ranked]
+    assert drops == sorted(drops)
+    best = ranked[0][0]
+    attrs = {n.name: n.attrs['q_strategy_activation'] for n in opt.g.nodes}
+    assert attrs == {'Placeholder1': best[0], 'Placeholder2': '3std', 'eltwise': best[0]}
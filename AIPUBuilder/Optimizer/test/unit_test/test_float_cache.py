@@ -0,0 +1,160 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import json
+import torch
+import pytest
+from AIPUBuilder.Optimizer.framework import QuantizeGraph, FloatResultCache
+
+
+def _batch_tensors(seed):
+    torch.manual_seed(seed)
+    return {'float': torch.randn([2, 3, 5]),
+            'half': torch.randn([7]).half(),
+            'int': torch.randint(-100, 100, [3, 3], dtype=torch.int32),
+            'bool': torch.rand([4, 3]) > 0.5,
+            'scalar': torch.tensor(1.5, dtype=torch.float64),
+            'empty': torch.zeros([0, 4]),
+            'strided': torch.randn([6, 4])[:, 1::2]}
+
+
+def _assert_same_tensors(got, expected):
+    assert list(got.keys()) == list(expected.keys())
+    for k, t in expected.items():
+        assert got[k].dtype == t.dtype and got[k].shape == t.shape, k
+        assert torch.equal(got[k], t), k
+
+
+def test_put_flush_get(tmp_path):
+    cache = FloatResultCache(str(tmp_path), 'key')
+    batches = {k: _batch_tensors(k) for k in range(3)}
+    for k, tensors in batches.items():
+        cache.put(k, tensors)
+    assert all(k in cache for k in batches)
+    _assert_same_tensors(cache.get(1), batches[1])
+    # a batch put after a get is read from the grown blob
+    cache.put(3, _batch_tensors(3))
+    _assert_same_tensors(cache.get(3), _batch_tensors(3))
+    # other runs only see the flushed batches
+    assert len(FloatResultCache(str(tmp_path), 'key')) == 0
+    cache.flush()
+    other = FloatResultCache(str(tmp_path), 'key')
+    assert len(other) == 4 and 4 not in other
+    for k in range(4):
+        _assert_same_tensors(other.get(k), _batch_tensors(k))
+    # the views are writable without touching the stored results
+    other.get(0)['float'].fill_(0)
+    _assert_same_tensors(FloatResultCache(str(tmp_path), 'key').get(0), batches[0])
+    assert len(FloatResultCache(str(tmp_path), 'another_key')) == 0
+
+
+def test_broken_cache_ignored(tmp_path):
+    cache = FloatResultCache(str(tmp_path), 'key')
+    for k in range(3):
+        cache.put(k, _batch_tensors(k))
+    cache.flush()
+    with open(cache.index_fname) as f:
+        index = json.load(f)
+    last_offset = min(meta['offset'] for meta in index['2'].values() if meta['nbytes'] > 0)
+
+    # a truncated blob only drops the batches it no longer holds
+    with open(cache.data_fname, 'r+b') as f:
+        f.truncate(last_offset)
+    truncated = FloatResultCache(str(tmp_path), 'key')
+    assert sorted(truncated.index.keys()) == [0, 1]
+    _assert_same_tensors(truncated.get(1), _batch_tensors(1))
+    # the dropped batch can be stored again
+    truncated.put(2, _batch_tensors(2))
+    truncated.flush()
+    _assert_same_tensors(FloatResultCache(str(tmp_path), 'key').get(2), _batch_tensors(2))
+
+    # a broken index drops the whole store
+    with open(cache.index_fname, 'w') as f:
+        f.write('{"0": {"float": ')
+    assert len(FloatResultCache(str(tmp_path), 'key')) == 0
+    # so does a missing blob
+    os.remove(cache.data_fname)
+    with open(cache.index_fname, 'w') as f:
+        json.dump(index, f)
+    assert len(FloatResultCache(str(tmp_path), 'key')) == 0
+
+
+def _no_forward(*args, **kwargs):
+    raise AssertionError('the float graph is forwarded again')
+
+
+def _float_metric(argv, forbid_forward=False):
+    from AIPUBuilder.Optimizer.optmaster import OptMaster
+    g = QuantizeGraph.parse(argv.graph, argv.bin)
+    # a list of its own, the default one is shared by every OptMaster
+    opt = OptMaster(g, argv, validation_metrics=[])
+    opt.prepare(argv)
+    if forbid_forward:
+        g.forward = _no_forward
+    opt.float_metric(opt.g, opt.validation_dataloader, opt.f_metrics)
+    return opt, [m.compute() for m in opt.f_metrics]
+
+
+def test_float_metric_from_cache(tmp_path, eltwise_argv):
+    cache_dir = os.path.join(str(tmp_path), 'float_cache')
+    _, reference = _float_metric(eltwise_argv())
+    opt, first = _float_metric(eltwise_argv(float_result_cache_dir=cache_dir))
+    assert first == reference
+    cache = opt.float_result_cache(opt.g, opt.validation_dataloader)
+    assert len(cache) == len(opt.validation_dataloader)
+
+    # the second run never forwards the float graph
+    _, second = _float_metric(eltwise_argv(float_result_cache_dir=cache_dir), forbid_forward=True)
+    assert second == reference
+
+    # another batching is another store
+    with pytest.raises(AssertionError, match='forwarded again'):
+        _float_metric(eltwise_argv(float_result_cache_dir=cache_dir, metric_batch_size=2), forbid_forward=True)
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_partial_float_cache(tmp_path, eltwise_argv, workers):
+    cache_dir = os.path.join(str(tmp_path), 'float_cache')
+    _, reference = _float_metric(eltwise_argv())
+    opt, _ = _float_metric(eltwise_argv(float_result_cache_dir=cache_dir))
+    cache = opt.float_result_cache(opt.g, opt.validation_dataloader)
+    total = len(cache)
+    for k in (0, 3, 4):
+        del cache.index[k]
+    cache.dirty = True
+    cache.flush()
+
+    opt, partial = _float_metric(eltwise_argv(float_result_cache_dir=cache_dir, metric_workers=workers))
+    assert partial == reference
+    # the missing batches have been stored again
+    assert len(opt.float_result_cache(opt.g, opt.validation_dataloader)) == total
+
+
+def test_float_result_key(fc_ir):
+    ir_txt, ir_bin, _, _ = fc_ir
+    eager = QuantizeGraph.parse(ir_txt, ir_bin)
+    lazy = QuantizeGraph.parse(ir_txt, ir_bin, lazy_constants=True)
+    key = eager.float_result_key('data')
+    assert lazy.float_result_key('data') == key
+    assert eager.float_result_key('other data') != key
+    # the lazily loaded constants are not loaded to be hashed
+    fc = lazy.nodes[1]
+    assert all(t._betensor_loader is not None for t in fc.constants.values())
+    # reading them keeps the key
+    assert torch.equal(fc.constants['weights'].betensor, eager.nodes[1].constants['weights'].betensor)
+    assert lazy.float_result_key('data') == key
+
+    # a constant modified in place, or replaced, is hashed by its content
+    eager.nodes[1].constants['weights'].betensor[0, 0] += 1
+    modified = eager.float_result_key('data')
+    assert modified != key
+    fc.constants['weights'].betensor = fc.constants['weights'].betensor.clone()
+    assert lazy.float_result_key('data') != key
+    fc.constants['weights'].betensor[0, 0] += 1
+    assert lazy.float_result_key('data') == modified
+
+    # so is a changed IR bin file
+    with open(ir_bin, 'r+b') as f:
+        f.write(b'\0' * 4)
+    assert QuantizeGraph.parse(ir_txt, ir_bin).float_result_key('data') != key
@@ -0,0 +1,46 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+from torch.utils.data import DataLoader
+from AIPUBuilder.Optimizer.framework import graph_inference, QUANTIZE_METRIC_DICT
+
+
+class _RecordMetric(object):
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, pred, target):
+        self.batches.append(([p.clone() for p in pred], [t.clone() for t in target]))
+
+
+def _dataloader():
+    torch.manual_seed(0)
+    samples = []
+    for _ in range(7):
+        x = [torch.randn([4, 4, 16]), torch.randn([4, 4, 16])]
+        samples.append((x, [x[0] + x[1]]))
+    return DataLoader(samples, batch_size=2)
+
+
+@pytest.mark.parametrize('max_batches', [0, 3])
+def test_parallel_metrics_match_serial(eltwise_graph, max_batches):
+    import AIPUBuilder.Optimizer.plugins  # registers the metric plugins
+    g = eltwise_graph
+    dataloader = _dataloader()
+    results = []
+    for workers in (0, 2, 3):
+        record = _RecordMetric()
+        cosine = QUANTIZE_METRIC_DICT['cosdistancemetric']()
+        graph_inference(g, g.forward, dataloader, [record, cosine], with_float=True, max_batches=max_batches,
+                        disable_tqdm=True, workers=workers)
+        results.append((record.batches, cosine.compute()))
+    serial_batches, serial_cosine = results[0]
+    assert len(serial_batches) == (max_batches if max_batches > 0 else len(dataloader))
+    for batches, cos in results[1:]:
+        assert cos == serial_cosine
+        assert len(batches) == len(serial_batches)
+        for (pred, target), (spred, starget) in zip(batches, serial_batches):
+            assert all(torch.equal(a, b) for a, b in zip(pred, spred))
+            assert all(torch.equal(a, b) for a, b in zip(target, starget))
@@ -0,0 +1,153 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import torch
+import numpy as np
+import pytest
+from AIPUBuilder.Optimizer.framework import QuantizeGraph
+from AIPUBuilder.Optimizer.framework.pycore import pyir
+from AIPUBuilder.Optimizer.framework.pycore.pyir import cast_from_NodeParamValue_string
+from AIPUBuilder.Optimizer.framework.pycore.pytype import Dtype
+
+
+def test_cast_from_NodeParamValue_string():
+    assert cast_from_NodeParamValue_string('[1, 2,3]') == [1, 2, 3]
+    assert cast_from_NodeParamValue_string("[[1,[2]],['x', 1e-3]]") == [[1, [2]], ['x', 1e-3]]
+    assert cast_from_NodeParamValue_string('[]') == []
+    assert cast_from_NodeParamValue_string(' -7 ') == -7
+    assert cast_from_NodeParamValue_string('+inf') == float('inf')
+    assert cast_from_NodeParamValue_string('TRUE') is True
+    assert cast_from_NodeParamValue_string('false') is False
+    assert cast_from_NodeParamValue_string('int8') == Dtype.INT8
+    assert cast_from_NodeParamValue_string('Dtype.float32') == Dtype.FP32
+    assert cast_from_NodeParamValue_string('NONE') == 'NONE'
+
+
+def _assert_same_graph(g, r):
+    assert g.name == r.name
+    assert [t.name for t in g.input_tensors] == [t.name for t in r.input_tensors]
+    assert [t.name for t in g.output_tensors] == [t.name for t in r.output_tensors]
+    assert [n.name for n in g.nodes] == [n.name for n in r.nodes]
+    for n, rn in zip(g.nodes, r.nodes):
+        assert n.type == rn.type
+        assert n.attrs['layer_id'] == rn.attrs['layer_id']
+        assert n.params == rn.params
+        assert [t.name for t in n.inputs] == [t.name for t in rn.inputs]
+        for t, rt in zip(n.outputs, rn.outputs):
+            assert (t.name, t.ir_shape, t.ir_dtype) == (rt.name, rt.ir_shape, rt.ir_dtype)
+        assert n.constants.keys() == rn.constants.keys()
+        for k in n.constants.keys():
+            assert n.constants[k].ir_shape == rn.constants[k].ir_shape
+            assert torch.equal(n.constants[k].betensor, rn.constants[k].betensor)
+
+
+def test_parse(fc_ir):
+    ir_txt, ir_bin, weights, biases = fc_ir
+    g = QuantizeGraph.parse(ir_txt, ir_bin)
+    assert g.name == 'fc'
+    assert [n.name for n in g.nodes] == ['input', 'fc']
+    fc = g.nodes[1]
+    assert fc.inputs[0] is g.nodes[0].outputs[0]
+    assert list(fc.outputs[0].ir_shape) == [2, 4] and fc.outputs[0].ir_dtype == Dtype.FP32
+    assert fc.params == {'num_output': 4, 'with_activation': 'NONE',
+                         'nested': [[1, 2], [3.5, float('-inf')], ['a', 'b']]}
+    assert list(fc.constants['weights'].ir_shape) == [4, 8]
+    assert np.array_equal(fc.constants['weights'].betensor.cpu().numpy(), weights)
+    assert np.array_equal(fc.constants['biases'].betensor.cpu().numpy(), biases)
+
+
+def test_topology_cache(tmp_path, fc_ir, monkeypatch):
+    ir_txt, ir_bin, _, _ = fc_ir
+    cache_dir = os.path.join(str(tmp_path), 'cache')
+    reference = QuantizeGraph.parse(ir_txt, ir_bin)
+    first = QuantizeGraph.parse(ir_txt, ir_bin, cache_dir)
+    entries = [f for _, _, files in os.walk(cache_dir) for f in files]
+    assert len(entries) == 1 and entries[0].endswith('.irtopo.pkl')
+    _assert_same_graph(first, reference)
+
+    # a hit never reads the IR text
+    def no_text(*args):
+        raise AssertionError('the IR text is parsed again')
+    with monkeypatch.context() as m:
+        m.setattr(pyir, '_iter_ir_sections', no_text)
+        second = QuantizeGraph.parse(ir_txt, ir_bin, cache_dir)
+    _assert_same_graph(second, reference)
+
+    # another IR text is another entry
+    with open(ir_txt, 'a') as f:
+        f.write('extra=1\n')
+    third = QuantizeGraph.parse(ir_txt, ir_bin, cache_dir)
+    assert third.nodes[1].params['extra'] == 1
+    assert len([f for _, _, files in os.walk(cache_dir) for f in files]) == 2
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float16, np.int8, np.uint8, np.int16, np.int32])
+def test_bin_constant_loader(tmp_path, dtype):
+    ir_bin = os.path.join(str(tmp_path), 'constants.bin')
+    values = (np.arange(24) - 12).astype(dtype)
+    with open(ir_bin, 'wb') as f:
+        # an odd offset, the constants of an IR bin file are not aligned
+        f.write(b'\1' * 3)
+        f.write(values.tobytes())
+    for copy in (False, True):
+        loader = pyir._BinConstantLoader(ir_bin, 3, values.nbytes, dtype, [2, 3, 4], copy=copy)
+        t = loader()
+        assert list(t.shape) == [2, 3, 4]
+        assert np.array_equal(t.cpu().numpy().astype(dtype).reshape(-1), values)
+
+
+def test_lazy_constants(fc_ir):
+    ir_txt, ir_bin, weights, biases = fc_ir
+    eager = QuantizeGraph.parse(ir_txt, ir_bin)
+    lazy = QuantizeGraph.parse(ir_txt, ir_bin, lazy_constants=True)
+    fc = lazy.nodes[1]
+    assert all(t._betensor_loader is not None for t in fc.constants.values())
+    _assert_same_graph(lazy, eager)
+    assert all(t._betensor_loader is None for t in fc.constants.values())
+
+    # an in-place write goes to the private mapping, never to the IR bin file
+    with open(ir_bin, 'rb') as f:
+        content = f.read()
+    fc.constants['weights'].betensor += 1
+    fc.constants['biases'].betensor.zero_()
+    assert torch.equal(fc.constants['weights'].betensor, eager.nodes[1].constants['weights'].betensor + 1)
+    with open(ir_bin, 'rb') as f:
+        assert f.read() == content
+    again = QuantizeGraph.parse(ir_txt, ir_bin, lazy_constants=True)
+    assert np.array_equal(again.nodes[1].constants['weights'].betensor.cpu().numpy(), weights)
+    assert np.array_equal(again.nodes[1].constants['biases'].betensor.cpu().numpy(), biases)
+
+
+@pytest.mark.parametrize('loaded', [False, True])
+def test_lazy_constants_deepcopy(fc_ir, loaded):
+    import copy
+    ir_txt, ir_bin, weights, _ = fc_ir
+    g = QuantizeGraph.parse(ir_txt, ir_bin, lazy_constants=True)
+    if loaded:
+        _ = g.nodes[1].constants['weights'].betensor
+    cg = copy.deepcopy(g)
+    w, cw = g.nodes[1].constants['weights'], cg.nodes[1].constants['weights']
+    cw.betensor.mul_(2)
+    assert np.array_equal(w.betensor.cpu().numpy(), weights)
+    assert np.array_equal(cw.betensor.cpu().numpy(), weights * 2)
+    w.betensor.zero_()
+    assert np.array_equal(cw.betensor.cpu().numpy(), weights * 2)
+
+
+def test_lazy_constants_pickle(tmp_path, fc_ir):
+    import pickle
+    from AIPUBuilder.Optimizer.framework import StageCheckpoint
+    ir_txt, ir_bin, weights, biases = fc_ir
+    eager = QuantizeGraph.parse(ir_txt, ir_bin)
+    g = QuantizeGraph.parse(ir_txt, ir_bin, lazy_constants=True)
+    _ = g.nodes[1].constants['biases'].betensor
+    rg = pickle.loads(pickle.dumps(g))
+    # the still unloaded constants are pickled as where to read them from
+    assert rg.nodes[1].constants['weights']._betensor_loader is not None
+    _assert_same_graph(rg, eager)
+
+    ckpt = StageCheckpoint(str(tmp_path), 'key')
+    ckpt.save('stage', QuantizeGraph.parse(ir_txt, ir_bin, lazy_constants=True), {})
+    rg, _ = StageCheckpoint(str(tmp_path), 'key').load()
+    _assert_same_graph(rg, eager)
@@ -0,0 +1,29 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import torch
+from AIPUBuilder.Optimizer.features.calibration.global_calibration.layer_schedule import layer_waves, run_layer_jobs
+
+
+def test_parallel_layer_jobs_match_serial():
+    torch.manual_seed(0)
+    weights = [torch.randn([16, 64]) for _ in range(5)]
+
+    def optimize(k):
+        return weights[k] * 2, {'loss': weights[k].abs().sum()}
+
+    jobs = list(range(len(weights)))
+    serial = run_layer_jobs(optimize, jobs, workers=0)
+    for workers in (2, 3):
+        parallel = run_layer_jobs(optimize, jobs, workers=workers)
+        assert len(parallel) == len(serial)
+        for (w, info), (sw, sinfo) in zip(parallel, serial):
+            assert torch.equal(w, sw)
+            assert torch.equal(info['loss'], sinfo['loss'])
+
+
+def test_layer_waves(eltwise_graph):
+    g = eltwise_graph
+    assert layer_waves(g, 'sequential') == [[0], [1], [2]]
+    assert layer_waves(g, 'wavefront') == [[0, 1], [2]]
+    assert layer_waves(g, 'float_input', workers=2, optimizable=lambda n: n.type.name == 'Eltwise') == [[0, 1, 2]]
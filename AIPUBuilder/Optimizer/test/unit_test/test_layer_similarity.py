@@ -0,0 +1,113 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import csv
+import json
+import math
+import torch
+import pytest
+from AIPUBuilder.Optimizer.framework import QuantizeGraph
+from AIPUBuilder.Optimizer.framework.pycore.pynode import PyNode
+from AIPUBuilder.Optimizer.framework.pycore.pytensor import PyTensor
+from AIPUBuilder.Optimizer.framework.pycore.pytype import OpType, Dtype
+from AIPUBuilder.Optimizer.analyzer.cosine import check_nodes_similarity
+from AIPUBuilder.Optimizer.analyzer.layer_similarity import LayerSimilarity, _REPORT_COLUMNS
+from AIPUBuilder.Optimizer.utils.quant_tool_utils import cosine_distance
+
+
+@pytest.fixture
+def quantized_eltwise(eltwise_argv):
+    from AIPUBuilder.Optimizer.optmaster import OptMaster
+    argv = eltwise_argv()
+    g = QuantizeGraph.parse(argv.graph, argv.bin)
+    opt = OptMaster(g, argv, validation_metrics=[])
+    opt.prepare(argv)
+    opt.optimize()
+    for n in opt.g.quantgraph.nodes:
+        for t in n.outputs:
+            t.similarity = None
+    return opt.g, opt.g.quantgraph
+
+
+def test_layer_similarity(tmp_path, quantized_eltwise):
+    g, qg = quantized_eltwise
+    similarity = LayerSimilarity()
+    torch.manual_seed(0)
+    expected = {}
+    for i in range(3):
+        inputs = [torch.randn([1, 4, 4, 16]) * (i + 1), torch.randn([1, 4, 4, 16]) + i]
+        g.current_batch_idx = i
+        qg.current_batch_idx = i
+        check_nodes_similarity(g, qg, inputs, keep_tensors=True, similarity=similarity)
+        for n in qg.nodes:
+            t = n.outputs[0]
+            f = [ft for fn in g.nodes for ft in fn.outputs if ft.name == t.name][0].betensor.double().reshape(-1)
+            q = (t.betensor.double().reshape(-1) + t.zerop) / float(t.scale)
+            e = expected.setdefault(t.name, {'cos': [], 'dot': 0., 'ff': 0., 'qq': 0., 'err2': 0., 'numel': 0,
+                                             'max_abs': 0.})
+            # the former similarity check compared t.betensor + t.zerop, the same cosine for per-tensor scales
+            e['cos'].append(cosine_distance(f, t.betensor + t.zerop))
+            e['dot'] += (f * q).sum().item()
+            e['ff'] += (f * f).sum().item()
+            e['qq'] += (q * q).sum().item()
+            e['err2'] += ((q - f) ** 2).sum().item()
+            e['numel'] += f.numel()
+            e['max_abs'] = max(e['max_abs'], (q - f).abs().max().item())
+
+    rows = similarity.report()
+    assert [r['tensor_name'] for r in rows] == [n.outputs[0].name for n in qg.nodes]
+    for row in rows:
+        e = expected[row['tensor_name']]
+        assert row['batches'] == 3
+        assert row['cosine'] == pytest.approx(sum(e['cos']) / 3, abs=1e-12)
+        assert row['global_cosine'] == pytest.approx(e['dot'] / math.sqrt(e['ff'] * e['qq']), abs=1e-12)
+        assert row['mse'] == pytest.approx(e['err2'] / e['numel'], rel=1e-9)
+        assert row['max_abs_error'] == pytest.approx(e['max_abs'], rel=1e-9)
+        assert row['sqnr_db'] == pytest.approx(10 * math.log10(e['ff'] / e['err2']), rel=1e-9)
+    inputs_cosine = min(r['cosine'] for r in rows[:2])
+    assert rows[2]['input_cosine'] == inputs_cosine
+    assert rows[2]['cosine_drop'] == inputs_cosine - rows[2]['cosine']
+    assert all(r['input_cosine'] == 1. for r in rows[:2])
+    ranked = similarity.ranked(rows)
+    assert [r['degradation_rank'] for r in ranked] == [1, 2, 3]
+    assert [r['cosine_drop'] for r in ranked] == sorted([r['cosine_drop'] for r in rows], reverse=True)
+
+    similarity.set_tensor_similarity(rows)
+    assert [n.outputs[0].similarity for n in qg.nodes] == [[r['cosine']] for r in rows]
+
+    json_path, csv_path = similarity.export(str(tmp_path), 'eltwise', rows)
+    assert json_path == os.path.join(str(tmp_path), 'eltwise_layer_similarity.json')
+    with open(json_path) as f:
+        report = json.load(f)
+    assert report['layers'] == rows
+    assert report['ranked'] == [r['tensor_name'] for r in ranked]
+    with open(csv_path, newline='') as f:
+        reader = csv.DictReader(f)
+        assert tuple(reader.fieldnames) == _REPORT_COLUMNS
+        csv_rows = list(reader)
+    assert len(csv_rows) == len(rows)
+    for csv_row, row in zip(csv_rows, rows):
+        for k, v in row.items():
+            assert csv_row[k] == str(v), k
+
+
+def test_per_channel_similarity():
+    torch.manual_seed(0)
+    f = torch.randn([2, 3, 5])
+    scale = torch.tensor([4., 40., 400.])
+    zerop = torch.tensor([1., -2., 0.])
+    n = PyNode('conv', OpType.Convolution)
+    n.add_output(PyTensor('out', f, Dtype.FP32))
+    qn = PyNode('conv', OpType.Convolution)
+    q = PyTensor('out', (f * scale.reshape([1, 3, 1]) - zerop.reshape([1, 3, 1])).round(), Dtype.INT16)
+    q.scale, q.zerop, q.key_axis = scale, zerop, 1
+    qn.add_output(q)
+    similarity = LayerSimilarity()
+    similarity.update(n, qn)
+    row = similarity.report()[0]
+    dequantized = (q.betensor.double() + zerop.reshape([1, 3, 1])) / scale.reshape([1, 3, 1])
+    assert row['cosine'] == pytest.approx(cosine_distance(f, dequantized), abs=1e-12)
+    assert row['max_abs_error'] <= 0.5 / 4 + 1e-6
+    # the channel scales are not ignored anymore
+    assert cosine_distance(f, q.betensor + zerop.reshape([1, 3, 1])) < 0.9 < row['cosine']
@@ -0,0 +1,123 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import numpy as np
+import pytest
+from AIPUBuilder.Optimizer.plugins.aipubt_metric_mAP import BasemAPMetric, DetectionTable
+
+
+def _reference_collect(obj, collector):
+    # the former dict collector: {label: {image: {'bbox': [...], 'confidence': [...]}}}, a box repeated in the same
+    # image and class is dropped
+    image = int(obj['image_name'])
+    for idx, label in enumerate(obj['label_index']):
+        entry = collector.setdefault(int(label), {}).setdefault(image, {'bbox': []})
+        if any(list(b) == list(obj['bbox'][idx]) for b in entry['bbox']):
+            continue
+        entry['bbox'].append(list(obj['bbox'][idx]))
+        if 'confidence' in obj:
+            entry.setdefault('confidence', []).append(obj['confidence'][idx])
+
+
+def _reference_mAP(prediction, gt, class_num):
+    # the former greedy matching, one detection after another in descending confidence
+    ap = []
+    for c in range(class_num):
+        pc, gc = prediction.get(c), gt.get(c)
+        if pc is not None and gc is not None:
+            matched = {n: [False] * len(v['bbox']) for n, v in gc.items()}
+            num_gt = sum(len(v['bbox']) for v in gc.values())
+            names, scores, boxes = [], [], []
+            for n, v in pc.items():
+                names.extend([n] * len(v['confidence']))
+                scores.extend(v['confidence'])
+                boxes.extend(v['bbox'])
+            order = np.argsort(-np.array(scores))
+            boxes = np.array(boxes)[order]
+            names = [names[i] for i in order]
+            tp = np.zeros(len(order))
+            fp = np.zeros(len(order))
+            for i, (n, bb) in enumerate(zip(names, boxes)):
+                if n not in gc:
+                    fp[i] = 1
+                    continue
+                iou = BasemAPMetric.cal_iou_yxyx(bb, np.array(gc[n]['bbox']))
+                m = np.argmax(iou)
+                if iou[m] > BasemAPMetric.iou_thresh and not matched[n][m]:
+                    matched[n][m] = True
+                    tp[i] = 1
+                else:
+                    fp[i] = 1
+            recall, precision = BasemAPMetric.cal_rec_prec(tp, fp, num_gt)
+            ap.append(BasemAPMetric.cal_AP(recall, precision))
+        elif pc is None and gc is None:
+            ap.append(np.nan)
+        elif gc is not None:
+            ap.append(0)
+    return np.nanmean(ap)
+
+
+def _random_boxes(rng, num):
+    # boxes on a coarse grid, so that repeated boxes and iou ties are frequent
+    ymin = rng.integers(0, 6, num)
+    xmin = rng.integers(0, 6, num)
+    return np.stack([ymin, xmin, ymin + rng.integers(1, 4, num), xmin + rng.integers(1, 4, num)], axis=-1) * 8.
+
+
+def _random_objects(rng, images, class_num, with_scores):
+    objects = []
+    for image in images:
+        num = int(rng.integers(0, 9))
+        obj = {'image_name': image,
+               'label_index': rng.integers(0, class_num, num),
+               'bbox': _random_boxes(rng, num)}
+        if num > 2:
+            # exact duplicates of other boxes of the image
+            obj['label_index'][-1] = obj['label_index'][0]
+            obj['bbox'][-1] = obj['bbox'][0]
+        if with_scores:
+            # few distinct scores, so that ties are frequent
+            obj['confidence'] = rng.integers(1, 6, num) / 5.
+        objects.append(obj)
+    return objects
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_mAP_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    class_num = int(rng.integers(1, 6))
+    images = list(range(int(rng.integers(1, 12))))
+    # some images have no ground truth or no detection at all
+    gts = _random_objects(rng, [i for i in images if rng.random() > 0.2], class_num, False)
+    dets = _random_objects(rng, [i for i in images if rng.random() > 0.2], class_num, True)
+    # images collected again in another batch
+    dets += _random_objects(rng, images[:2], class_num, True)
+
+    ref_det, ref_gt = {}, {}
+    metric = BasemAPMetric()
+    for obj in dets:
+        _reference_collect(obj, ref_det)
+        BasemAPMetric.extract_obj_all_class(obj, metric.predicts)
+    for obj in gts:
+        _reference_collect(obj, ref_gt)
+        BasemAPMetric.extract_obj_all_class(obj, metric.targets)
+    metric.eval_mAP(metric.predicts, metric.targets, class_num)
+    ref = _reference_mAP(ref_det, ref_gt, class_num)
+    np.testing.assert_equal(metric.mAP, ref)
+    if not np.isnan(ref):
+        assert metric.mAP == pytest.approx(ref, abs=0)
+
+
+def test_detection_table_merge():
+    rng = np.random.default_rng(0)
+    objects = _random_objects(rng, list(range(20)), 4, True)
+    whole = DetectionTable(capacity=2)
+    parts = [DetectionTable(capacity=2), DetectionTable(capacity=2)]
+    for i, obj in enumerate(objects):
+        BasemAPMetric.extract_obj_all_class(obj, whole)
+        BasemAPMetric.extract_obj_all_class(obj, parts[i * 2 // len(objects)])
+    merged = DetectionTable(capacity=2)
+    for p in parts:
+        merged.merge(p.state_dict())
+    for a, b in zip(merged.columns(), whole.columns()):
+        np.testing.assert_array_equal(a, b)
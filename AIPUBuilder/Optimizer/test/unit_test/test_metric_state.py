@@ -0,0 +1,86 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import pickle
+import torch
+import numpy as np
+import pytest
+from AIPUBuilder.Optimizer.framework import OptBaseMetric
+from AIPUBuilder.Optimizer.framework.opt_register import _merge_state_value
+from AIPUBuilder.Optimizer.plugins.aipubt_metric_CosDistance import CosDistanceMetric
+from AIPUBuilder.Optimizer.plugins.aipubt_metric_MaxAbsError import MaxAbsErrorMetric
+from AIPUBuilder.Optimizer.plugins.aipubt_metric_topk import TopKMetric
+from AIPUBuilder.Optimizer.plugins.aipubt_metric_mIoU import mIoUMetricBase
+
+
+def _cos_batch(gen):
+    return [torch.randn([2, 3, 5], generator=gen)], torch.randn([2, 3, 5], generator=gen)
+
+
+def _outputs_batch(gen):
+    return [torch.randn([2, 3, 5], generator=gen), torch.randn([2, 4], generator=gen)], \
+        [torch.randn([2, 3, 5], generator=gen), torch.randn([2, 4], generator=gen)]
+
+
+def _topk_batch(gen):
+    return [torch.randn([4, 10], generator=gen)], torch.randint(0, 10, [4], generator=gen)
+
+
+def _miou_batch(gen):
+    return [torch.randn([2, 4, 4, 3], generator=gen)], torch.randint(0, 3, [2, 4, 4, 1], generator=gen)
+
+
+@pytest.mark.parametrize('make, batch', [(CosDistanceMetric, _cos_batch),
+                                         (MaxAbsErrorMetric, _outputs_batch),
+                                         (lambda: TopKMetric('3'), _topk_batch),
+                                         (mIoUMetricBase, _miou_batch)])
+def test_merge_equals_single_pass(make, batch):
+    gen = torch.Generator().manual_seed(0)
+    batches = [batch(gen) for _ in range(6)]
+    whole = make()
+    shards = [make(), make()]
+    for i, (pred, target) in enumerate(batches):
+        whole(pred, target)
+        shards[i % 2](pred, target)
+    assert all(m.is_mergeable() for m in shards)
+    merged = make()
+    merged.reset()
+    for m in shards:
+        merged.merge(pickle.loads(pickle.dumps(m.state_dict())))
+    assert merged.compute() == pytest.approx(whole.compute())
+
+    # a state is a snapshot, the calls after it leave it unchanged
+    first = shards[0]
+    state = first.state_dict()
+    expected = first.compute()
+    first(*batches[0])
+    restored = make()
+    restored.reset()
+    restored.merge(state)
+    assert restored.compute() == pytest.approx(expected)
+
+
+def test_unmergeable_metric():
+    class Metric(OptBaseMetric):
+        pass
+    m = Metric()
+    assert not m.is_mergeable()
+    with pytest.raises(NotImplementedError):
+        m.state_dict()
+    with pytest.raises(NotImplementedError):
+        m.merge({})
+
+
+def test_merge_rules():
+    assert _merge_state_value('sum', None, 3) == 3
+    assert _merge_state_value('sum', [1, np.ones(2)], [2, np.ones(2)])[0] == 3
+    assert _merge_state_value('extend', [1], [2, 3]) == [1, 2, 3]
+    assert _merge_state_value('extend', {'a': [1]}, {'a': [2], 'b': [3]}) == {'a': [1, 2], 'b': [3]}
+    assert torch.equal(_merge_state_value('extend', torch.zeros([1, 2]), torch.ones([2, 2])),
+                       torch.tensor([[0., 0.], [1., 1.], [1., 1.]]))
+    assert _merge_state_value('update', {'a': 1}, {'b': 2}) == {'a': 1, 'b': 2}
+    assert _merge_state_value('max', None, 2) == 2 and _merge_state_value('max', 5, 2) == 5
+    assert _merge_state_value('min', 5, None) == 5 and _merge_state_value('min', 5, 2) == 2
+    assert _merge_state_value('first', '', 'x') == 'x' and _merge_state_value('first', 'y', 'x') == 'y'
+    with pytest.raises(ValueError):
+        _merge_state_value('mean', 1, 2)
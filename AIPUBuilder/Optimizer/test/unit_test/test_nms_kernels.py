@@ -0,0 +1,377 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import pytest
+from AIPUBuilder.Optimizer.utils import *
+from AIPUBuilder.Optimizer.framework import *
+from AIPUBuilder.Optimizer.ops.nms import iou, single_softnms, generate_gussi_lut
+from AIPUBuilder.Optimizer.ops.generateproposal import NMS_F, NMS_Q
+from AIPUBuilder.Optimizer.ops.detectionoutput import _get_box_score
+
+# the nms loops as they were before batched_nms: one box is kept at a time and compared against the remaining
+# boxes, so they are the reference the batched suppression must match exactly
+
+
+def _single_nms_loop(self, box, score, max_nms_box_num):
+    # keep = torchvision.ops.nms(box,score,iou_threshold)
+    # outputs
+    # iou_threshold =  self.params['iou_threshold']
+    nms_box = torch.zeros((max_nms_box_num, 4))
+    nms_score = torch.zeros((max_nms_box_num))
+    keep = torch.zeros((max_nms_box_num))
+
+    y0 = box[:, 0]
+    x0 = box[:, 1]
+    y1 = box[:, 2]
+    x1 = box[:, 3]
+
+    # it will set optional to False when parser add 'score_threshold' in future
+    score_threshold = float(self.get_param('score_threshold', optional=True, default_value='-inf'))
+    areas_shift = self.params['areas_shift'] if self.quantized else 0
+
+    if self.quantized:
+        iou_threshold = self.params['iou_threshold']
+        iou_thresh_shift = self.params['iou_thresh_shift']
+        box_scale = self.params['scale_value']
+        box_shift = self.params['shift_value']
+        areas = torch.abs((y1 - y0) * (x1 - x0)).int()
+        areas = areas >> areas_shift
+    else:
+        iou_threshold = self.get_param('iou_threshold')
+        areas = torch.abs((y1 - y0) * (x1 - x0))
+
+    order = score[:].argsort(dim=-1, descending=True)  # descending order
+    keep_idx = 0
+    boxNum_perclass_single = 0
+    device = x0[0].device
+    while order.size()[0] > 0:
+        i = order[0]
+        if score[i].float() <= score_threshold:
+            break
+        boxNum_perclass_single += 1
+
+        keep[keep_idx] = i
+        nms_box[keep_idx, :] = box[i, :]
+        nms_score[keep_idx] = score[i]
+
+        keep_idx += 1
+        if keep_idx >= max_nms_box_num:
+            break
+
+        # xx0 = torch.max(x0[i], x0[order[1:]])
+        # yy0 = torch.max(y0[i], y0[order[1:]])
+        # xx1 = torch.min(x1[i], x1[order[1:]])
+        # yy1 = torch.min(y1[i], y1[order[1:]])
+        # w = torch.max(torch.tensor(0.0).to(device), xx1 - xx0)
+        # h = torch.max(torch.tensor(0.0).to(device), yy1 - yy0)
+        w, h = iou(x0, y0, x1, y1, i, order[1:])
+        inter = w * h
+        if self.quantized:
+            inter = (inter).int()
+            inter = inter >> areas_shift
+
+        union = areas[i] + areas[order[1:]] - inter
+
+        inter_area_thresh = union * iou_threshold
+        if self.quantized:
+            inter_area_thresh = union * iou_threshold >> int(iou_thresh_shift)
+
+        inds = torch.where(inter <= inter_area_thresh)[0]
+        order = order[inds + 1]
+
+    boxNum_perclass = boxNum_perclass_single
+    if self.quantized:
+        nms_box = nms_box.int() * box_scale >> box_shift
+        pass
+    nms_box = nms_box[0:boxNum_perclass, :]
+    nms_score = nms_score[0:boxNum_perclass]
+    keep = keep[0:boxNum_perclass]
+    return nms_box, nms_score, boxNum_perclass, keep
+
+
+def _nms_loop(self, *args):
+    out = self.outputs[:]
+    # get bottom node
+    batch_proposal_boxes = self.inputs[0].betensor + (torch.tensor(
+        0) if not self.quantized else torch.tensor(self.inputs[0].zerop))
+    # batch_boxNum_perClass and batch_total_class_num are not quantized, so their zerop is 0
+    batch_boxNum_perClass = self.inputs[1].betensor
+    batch_total_class_num = self.inputs[2].betensor
+    # input batch_proposal_scores zerop pass to output score, it can omit zerop
+    batch_proposal_scores = self.inputs[3].betensor
+
+    batch_num = batch_proposal_boxes.shape[0]
+    max_class_num = self.outputs[1].ir_shape[1]
+    max_nms_box_num = self.outputs[0].ir_shape[1]
+
+    # it will set optional to False when parser add 'method' and 'max_output_size' in future
+    method = self.get_param('method', optional=True, default_value='HARD')
+    max_output_size = self.get_param(
+        'max_output_size', optional=True, default_value=max_nms_box_num)
+    support_method_ = ['HARD', 'GAUSSIAN']
+    if method not in support_method_:
+        OPT_WARN(f"NMS op now only supports {str(support_method_)} method, but now method={method}, "
+                 f"and Opt will use 'hard-nms' method to continue.")
+        method = 'HARD'
+
+    nms_func = {
+        "HARD": _single_nms_loop,
+        "GAUSSIAN": single_softnms,
+    }
+    dev = self.inputs[0].betensor.device
+    batch_nms_boxes = torch.zeros((batch_num, max_nms_box_num, 4), device=dev)
+    batch_nms_scores = torch.zeros((batch_num, max_nms_box_num), device=dev)
+    batch_nms_boxNum_perClass = torch.zeros((batch_num, max_class_num), device=dev)
+    batch_keep = torch.zeros((batch_num, max_nms_box_num), device=dev)
+    batch_proposal_scores = torch.reshape(
+        batch_proposal_scores, [batch_num, -1])
+    for idx_batch in range(batch_num):
+        proposal_boxes = batch_proposal_boxes[idx_batch]
+        boxNum_perclass = batch_boxNum_perClass[idx_batch]  # [5000]
+        total_class_num = batch_total_class_num[idx_batch]  # [1]
+        proposal_scores = batch_proposal_scores[idx_batch]
+
+        idx_proposals = 0
+        idx_keep = 0
+        tot_cls = int(total_class_num[0])
+        for idx_class in range(tot_cls):
+            if idx_keep > max_nms_box_num:
+                break
+            box_num = int(boxNum_perclass[idx_class])
+            if box_num == 0:
+                continue
+            boxes = proposal_boxes[idx_proposals: idx_proposals + box_num, :].reshape(box_num, 4)
+            scores = proposal_scores[idx_proposals: idx_proposals + box_num]
+
+            nms_box_, nms_score_, nms_boxNum_perClass_, keep_ = nms_func[method](self, boxes, scores, max_output_size)
+            if idx_keep + nms_boxNum_perClass_ > max_nms_box_num:
+                nms_boxNum_perClass_ = max_nms_box_num - idx_keep
+
+            batch_nms_boxes[idx_batch][idx_keep: idx_keep + nms_boxNum_perClass_] = nms_box_[0:nms_boxNum_perClass_]
+            batch_nms_scores[idx_batch][idx_keep: idx_keep +
+                                        nms_boxNum_perClass_] = nms_score_[0:nms_boxNum_perClass_]
+            batch_keep[idx_batch][idx_keep: idx_keep +
+                                  nms_boxNum_perClass_] = keep_[0:nms_boxNum_perClass_]
+            batch_nms_boxNum_perClass[idx_batch][idx_class] = nms_boxNum_perClass_
+
+            idx_proposals = idx_proposals + box_num
+            idx_keep = idx_keep + nms_boxNum_perClass_
+
+    out[0].betensor = batch_nms_boxes
+    out[1].betensor = batch_nms_boxNum_perClass
+    out[2].betensor = batch_nms_scores
+    out[3].betensor = batch_keep
+
+    return [o.betensor for o in self.outputs]
+
+
+def _nms_f_loop(boxes, scores, iou_thresh):
+    x1 = boxes[:, 0]
+    y1 = boxes[:, 1]
+    x2 = boxes[:, 2]
+    y2 = boxes[:, 3]
+
+    areas = (x2 - x1+1) * (y2 - y1+1)
+    order = torch.argsort(torch.flatten(scores), descending=True)
+    keep = []
+    while order.shape[0] > 0:
+        i = order[0]
+        keep.append(i)
+        xx1 = torch.maximum(x1[i], x1[order[1:]])
+        yy1 = torch.maximum(y1[i], y1[order[1:]])
+        xx2 = torch.minimum(x2[i], x2[order[1:]])
+        yy2 = torch.minimum(y2[i], y2[order[1:]])
+        w = torch.maximum(torch.tensor([0], device=boxes.device), xx2 - xx1+1)
+        h = torch.maximum(torch.tensor([0], device=boxes.device), yy2 - yy1+1)
+
+        inter = w * h
+        ovr = inter / (areas[i] + areas[order[1:]] - inter)
+        inds = torch.where(ovr <= iou_thresh)[0]
+        order = order[inds + 1]
+    return keep
+
+
+def _nms_q_loop(box, score, iou_threshold=None):
+    iou_thresh_shift = 11
+    # currently area_shift is consistent with lib, and  will write to quantIR and will be modified
+    area_shift = 15
+
+    x0 = box[:, 0]
+    y0 = box[:, 1]
+    x1 = box[:, 2]
+    y1 = box[:, 3]
+    areas = (y1 - y0).type(torch.int32) * (x1 - x0).type(torch.int32)
+    areas = areas >> area_shift
+    # order = score.ravel().argsort()[::-1]
+
+    # order = torch.argsort(torch.flatten(score), descending=True)
+    order = torch.linspace(0, len(torch.flatten(score))-1, steps=len(torch.flatten(score)), device=score.device).long()
+    keep = []
+    while order.shape[0] > 0:
+        i = order[0]
+        keep.append(i)
+
+        xx0 = torch.maximum(x0[i], x0[order[1:]])
+        yy0 = torch.maximum(y0[i], y0[order[1:]])
+        xx1 = torch.minimum(x1[i], x1[order[1:]])
+        yy1 = torch.minimum(y1[i], y1[order[1:]])
+        w = torch.maximum(torch.tensor([0], device=box.device), xx1 - xx0)
+        h = torch.maximum(torch.tensor([0], device=box.device), yy1 - yy0)
+
+        inter = (w * h).type(torch.int32) >> area_shift
+        union = areas[i] + areas[order[1:]] - inter
+        inter_area_thresh = union * iou_threshold >> int(iou_thresh_shift)
+
+        inds = torch.where(inter <= inter_area_thresh)[0]
+        order = order[inds + 1]
+
+    return keep
+
+
+def _get_box_score_loop(class_score, box_encoding, score_thresh, max_detection_num, max_class_num):
+    class_num = class_score.shape[-1]
+    crop_box_num = class_score.shape[0]
+    box = torch.zeros((max_detection_num, 4), dtype=torch.float32, device=class_score.device)
+    score = torch.zeros((max_detection_num), dtype=torch.float32, device=class_score.device)
+    box_num_perClass = torch.zeros([max_class_num], dtype=torch.float32, device=class_score.device)
+
+    outbox_idx = 0
+    box_num_perClass_list = []
+    class_label = []
+    for class_idx in range(class_num):
+        # if class_idx == 0:
+        #     continue
+        box_num_curClass = 0
+        for box_idx in range(crop_box_num):
+            if class_score[box_idx][class_idx] > score_thresh:
+                if outbox_idx >= max_detection_num:
+                    break
+                if class_idx not in class_label:
+                    class_label.append(class_idx)
+                box[outbox_idx, :] = box_encoding[box_idx * class_num + class_idx, :]
+                score[outbox_idx] = class_score[box_idx, class_idx]
+                outbox_idx += 1
+                box_num_curClass += 1
+        if box_num_curClass != 0:
+            box_num_perClass_list.append(box_num_curClass)
+    box_num_perClass[:len(box_num_perClass_list)] = torch.tensor(box_num_perClass_list, device=class_score.device)
+    total_class_num = len(class_label)
+    class_label.extend((max_class_num - total_class_num) * [0])
+    return box, score, box_num_perClass, \
+        torch.tensor(class_label, device=class_score.device), \
+        torch.tensor(total_class_num, device=class_score.device)
+
+
+def _boxes(num, quantized, corners=False):
+    # boxes around a few centers so that many of them overlap, some given with their corners swapped
+    centers = torch.rand([4, 2])[torch.randint(0, 4, [num])]
+    half = torch.rand([num, 2]) * 0.2 + 0.05
+    boxes = torch.cat([centers - half, centers + half], dim=1) + torch.randn([num, 4]) * 0.02
+    if not corners:
+        swap = torch.rand([num]) < 0.2
+        boxes[swap] = boxes[swap][:, [2, 3, 0, 1]]
+    if quantized:
+        boxes = torch.round(boxes.clamp(0, 1) * (2 ** 15 - 1))
+    return boxes
+
+
+def _scores(num, quantized):
+    # few distinct values, so many boxes tie
+    scores = torch.randint(0, 8, [num]).float()
+    return scores * 32 if quantized else scores / 8
+
+
+def _nms_node(quantized, method, max_output_size):
+    box_num_per_class = torch.tensor([[7, 0, 12, 5], [3, 9, 0, 10]])
+    total_class_num = torch.tensor([[4], [3]])
+    num = int(box_num_per_class.sum(dim=1).max())
+    n = PyNode('nms', OpType.NMS)
+    n.add_input(PyTensor('boxes', torch.stack([_boxes(num, quantized) for _ in range(2)])))
+    n.add_input(PyTensor('box_num_per_class', box_num_per_class.float()))
+    n.add_input(PyTensor('total_class_num', total_class_num.float()))
+    n.add_input(PyTensor('scores', torch.stack([_scores(num, quantized) for _ in range(2)])))
+    max_nms_box_num = 10
+    for name, shape in [('nms_boxes', [2, max_nms_box_num, 4]), ('nms_box_num_per_class', [2, 4]),
+                        ('nms_scores', [2, max_nms_box_num]), ('keep', [2, max_nms_box_num])]:
+        n.add_output(PyTensor(name, torch.zeros(shape)))
+    n.params['method'] = method
+    if max_output_size is not None:
+        n.params['max_output_size'] = max_output_size
+    soft_nms_sigma = 0.5
+    n.params['soft_nms_sigma'] = soft_nms_sigma
+    if quantized:
+        n.attrs['quantized'] = True
+        n.params['iou_threshold'] = int(0.5 * 256)
+        n.params['iou_thresh_shift'] = 8
+        n.params['areas_shift'] = 13
+        n.params['score_threshold'] = 40
+        n.params['scale_value'] = 19661
+        n.params['shift_value'] = 15
+        do_scale, do_shift = generate_gussi_lut(0, 2 ** 8 - 1, -0.5 / soft_nms_sigma)
+        n.constants['gaussian_scale_lut'] = PyTensor('gaussian_scale_lut', do_scale)
+        n.constants['gaussian_shift_lut'] = PyTensor('gaussian_shift_lut', do_shift)
+        n.params['soft_nms_sigma_in_shift'] = 8
+    else:
+        n.params['iou_threshold'] = 0.5
+        n.params['score_threshold'] = 0.2
+    return n
+
+
+@pytest.mark.parametrize('quantized', [False, True])
+@pytest.mark.parametrize('method', ['HARD', 'GAUSSIAN'])
+@pytest.mark.parametrize('max_output_size', [None, 3])
+@pytest.mark.parametrize('seed', range(4))
+def test_nms_matches_single_box_loop(quantized, method, max_output_size, seed):
+    torch.manual_seed(seed)
+    batched = _nms_node(quantized, method, max_output_size)
+    torch.manual_seed(seed)
+    looped = _nms_node(quantized, method, max_output_size)
+    OP_DICT[OpType.NMS](batched)
+    _nms_loop(looped)
+    for t, ref in zip(batched.outputs, looped.outputs):
+        assert torch.equal(t.betensor, ref.betensor), t.name
+
+
+@pytest.mark.parametrize('quantized', [False, True])
+@pytest.mark.parametrize('max_elements', [64, 1 << 22])
+def test_batched_nms_matches_single_nms(quantized, max_elements):
+    from AIPUBuilder.Optimizer.ops.nms import batched_nms, _nms_suppression
+    torch.manual_seed(0)
+    n = _nms_node(quantized, 'HARD', None)
+    boxes = [_boxes(k, quantized) for k in [1, 40, 0, 17, 33]]
+    scores = [_scores(k, quantized) for k in [1, 40, 0, 17, 33]]
+    threshold = n.params['score_threshold']
+    # small max_elements split the sets over several chunks and blocks of suppression rows
+    keeps = batched_nms(boxes, scores, _nms_suppression(n), threshold, 6, max_elements=max_elements)
+    assert keeps[2] == []
+    for box, score, keep in zip(boxes, scores, keeps):
+        if box.shape[0]:
+            assert keep == _single_nms_loop(n, box, score, 6)[3].long().tolist()
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_generateproposal_nms_f_matches_loop(seed):
+    torch.manual_seed(seed)
+    boxes = _boxes(60, False, corners=True) * 100
+    scores = _scores(60, False)
+    assert NMS_F(boxes, scores, 0.6) == [int(i) for i in _nms_f_loop(boxes, scores, 0.6)]
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_generateproposal_nms_q_matches_loop(seed):
+    torch.manual_seed(seed)
+    boxes = _boxes(60, True, corners=True)
+    # NMS_Q takes the boxes in descending order of their scores
+    scores = torch.sort(_scores(60, True), descending=True).values
+    iou_threshold = int(0.6 * 2 ** 11)
+    assert NMS_Q(boxes, scores, iou_threshold) == [int(i) for i in _nms_q_loop(boxes, scores, iou_threshold)]
+
+
+@pytest.mark.parametrize('max_detection_num', [5, 200])
+def test_detectionoutput_box_score_matches_loop(max_detection_num):
+    torch.manual_seed(0)
+    class_score = _scores(30 * 6, False).reshape(30, 6)
+    box_encoding = torch.randn([30 * 6, 4])
+    results = _get_box_score(class_score, box_encoding, 0.5, max_detection_num, 8)
+    for t, ref in zip(results, _get_box_score_loop(class_score, box_encoding, 0.5, max_detection_num, 8)):
+        assert torch.equal(t, ref)
@@ -0,0 +1,45 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import json
+import torch
+from AIPUBuilder.Optimizer.analyzer import OpProfiler, opt_profiler, profile_phase
+
+
+def _inputs():
+    return [torch.rand([1, 4, 4, 16]), torch.rand([1, 4, 4, 16])]
+
+
+def test_records_per_phase(tmp_path, eltwise_graph):
+    g = eltwise_graph
+    eltwise = g.nodes[-1]
+    g.forward(_inputs())
+    with OpProfiler(max_trace_events=4) as profiler:
+        assert opt_profiler() is profiler
+        with profile_phase('statistic'):
+            for _ in range(3):
+                g.forward(_inputs())
+        with profile_phase('metric'):
+            g.forward(_inputs())
+    assert opt_profiler() is None
+    # nothing is recorded once stopped
+    g.forward(_inputs())
+
+    assert profiler.node_summary(eltwise, 'statistic')['calls'] == 3
+    assert profiler.node_summary(eltwise, 'metric')['calls'] == 1
+    assert profiler.node_summary(eltwise, 'quantize')['calls'] == 0
+    nodes = [r for r in profiler.node_report() if r['name'] == 'eltwise']
+    assert sorted(r['phase'] for r in nodes) == ['metric', 'statistic']
+    assert all(r['type'] == 'Eltwise' and r['graph'] == 'float' for r in nodes)
+    assert nodes[0]['shapes'] == [{'inputs': ((1, 4, 4, 16), (1, 4, 4, 16)), 'outputs': ((1, 4, 4, 16), )}]
+    inputs = [r for r in profiler.op_type_report() if r['type'] == 'Input' and r['phase'] == 'statistic']
+    assert len(inputs) == 1 and inputs[0]['nodes'] == 2 and inputs[0]['calls'] == 6
+    # 3 nodes * 4 forwards, only the first max_trace_events are kept
+    assert profiler.dropped_events == 12 - 4
+
+    json_path, trace_path = profiler.export(str(tmp_path), 'eltwise')
+    with open(json_path) as f:
+        assert set(json.load(f).keys()) == {'nodes', 'op_types', 'dropped_trace_events'}
+    with open(trace_path) as f:
+        events = json.load(f)['traceEvents']
+    assert len(events) == 4 and all(e['ph'] == 'X' and e['dur'] >= 0 for e in events)
@@ -0,0 +1,67 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import re
+import sys
+import pytest
+import AIPUBuilder.Optimizer.logger.aipu_logger as aipu_logger
+from AIPUBuilder.Optimizer.logger import opt_logger
+from AIPUBuilder.Optimizer.logger import OPT_DEBUG, OPT_INFO, OPT_WARN, OPT_ERROR
+
+
+@pytest.fixture
+def sinks(monkeypatch):
+    """{sink name: [logged lines]}, with a fresh log_once memory and located logs."""
+    logged = {}
+    for name in ('DEBUG', 'INFO', 'WARN', 'ERROR'):
+        logged[name] = []
+        monkeypatch.setattr(opt_logger, name, logged[name].append)
+    monkeypatch.setattr(opt_logger, 'g_msg_mem_dt', {})
+    monkeypatch.setattr(opt_logger, '_RELEASE', False)
+    return logged
+
+
+def _lazy(calls, text):
+    def msg():
+        calls.append(text)
+        return text
+    return msg
+
+
+def test_disabled_level_skips_formatting(sinks, monkeypatch):
+    monkeypatch.setattr(aipu_logger, 'LOGLEVEL', aipu_logger._INFO_LEVEL)
+    calls = []
+    OPT_DEBUG(_lazy(calls, 'debug'))
+    OPT_WARN(_lazy(calls, 'warn'), log_once=True)
+    assert calls == [] and sinks['DEBUG'] == [] and sinks['WARN'] == []
+    # errors reach their sink whatever the level
+    OPT_ERROR(_lazy(calls, 'error'))
+    assert calls == ['error'] and len(sinks['ERROR']) == 1
+    OPT_INFO(_lazy(calls, 'info'))
+    assert calls == ['error', 'info'] and len(sinks['INFO']) == 1
+
+
+def test_log_format(sinks, monkeypatch):
+    monkeypatch.setattr(aipu_logger, 'LOGLEVEL', aipu_logger._DEBUG_LEVEL)
+    line = sys._getframe().f_lineno + 1
+    OPT_WARN('warn', op_name='OpType.Abs', workflow_name='quantize')
+    assert re.fullmatch(r'\[OPT\] \[\d\d:\d\d:\d\d test_opt_logger\.py:%d\]: quantize OpType\.Abs warn' % line,
+                        sinks['WARN'][0])
+    OPT_DEBUG(lambda: 'debug %d' % 1)
+    # debug logs have no time
+    assert re.fullmatch(r'\[OPT\] \[ test_opt_logger\.py:\d+\]: debug 1', sinks['DEBUG'][0])
+    OPT_INFO('info', 'a', 'b')
+    # info logs have no location
+    assert re.fullmatch(r'\[OPT\] \[\d\d:\d\d:\d\d\]: infoa b', sinks['INFO'][0])
+
+
+def test_log_once(sinks, monkeypatch):
+    monkeypatch.setattr(aipu_logger, 'LOGLEVEL', aipu_logger._DEBUG_LEVEL)
+    calls = []
+    for _ in range(3):
+        OPT_WARN(_lazy(calls, 'once'), log_once=True)
+        OPT_WARN('twice')
+    OPT_WARN(_lazy(calls, 'other'), log_once=True)
+    # the callable is still called to tell the repeated messages apart
+    assert calls == ['once'] * 3 + ['other']
+    assert [s.split(': ', 1)[1] for s in sinks['WARN']] == ['once', 'twice', 'twice', 'twice', 'other']
@@ -0,0 +1,46 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import pytest
+import torch
+from AIPUBuilder.Optimizer.utils import run_in_forked_processes
+
+
+def test_results_of_every_shard():
+    state = torch.arange(10.)
+
+    def square(shard):
+        for i in shard:
+            yield i, os.getpid(), state[i] ** 2
+    results = list(run_in_forked_processes(square, [[0, 3, 6, 9], [1, 4, 7], [2, 5, 8]], 'square'))
+    assert sorted(i for i, _, _ in results) == list(range(10))
+    assert all(torch.equal(v, state[i] ** 2) for i, _, v in results)
+    assert os.getpid() not in {pid for _, pid, _ in results}
+    assert len({pid for _, pid, _ in results}) == 3
+
+
+def test_failed_worker_raises():
+    def fail(shard):
+        yield shard
+        if shard == 1:
+            raise ValueError('bad shard')
+    with pytest.raises(RuntimeError, match='bad shard'):
+        list(run_in_forked_processes(fail, [0, 1], 'fail'))
+
+
+def test_lost_worker_raises():
+    def lost(shard):
+        os._exit(1)
+        yield shard
+    with pytest.raises(RuntimeError, match='exited unexpectedly'):
+        list(run_in_forked_processes(lost, [0], 'lost'))
+
+
+def test_stopping_early_terminates_the_workers():
+    def endless(shard):
+        while True:
+            yield shard
+    results = run_in_forked_processes(endless, [0, 1], 'endless')
+    next(results)
+    results.close()
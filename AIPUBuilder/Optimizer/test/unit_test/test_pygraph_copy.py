@@ -0,0 +1,32 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import copy
+import pickle
+import torch
+
+
+def _check_copy(g, c):
+    assert c is not g
+    assert c.nodes.graph is c
+    assert [n.name for n in c.nodes] == [n.name for n in g.nodes]
+    assert all(n.graph is c for n in c.nodes)
+    assert [t.name for t in c.input_tensors] == [t.name for t in g.input_tensors]
+    # the node list still keeps the topology of the copy up to date
+    n = c.nodes.pop()
+    assert n not in c.nodes
+    c.nodes.append(n)
+    assert c.nodes[-1] is n
+    inputs = [torch.rand([1, 4, 4, 16]), torch.rand([1, 4, 4, 16])]
+    out = c.forward(inputs)
+    assert torch.allclose(out[0].betensor, inputs[0] + inputs[1])
+
+
+def test_pickle_graph(eltwise_graph):
+    g = eltwise_graph
+    _check_copy(g, pickle.loads(pickle.dumps(g)))
+
+
+def test_deepcopy_graph(eltwise_graph):
+    g = eltwise_graph
+    _check_copy(g, copy.deepcopy(g))
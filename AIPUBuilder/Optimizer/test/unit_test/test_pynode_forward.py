@@ -0,0 +1,49 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import torch
+from AIPUBuilder.Optimizer.framework import OP_DICT, PyNode, PyTensor, OpType
+
+
+def _make_node():
+    n = PyNode('abs', OpType.Abs)
+    n.add_input(PyTensor('x', torch.zeros([2, 3])))
+    n.add_output(PyTensor('y', torch.zeros([2, 3])))
+    return n
+
+
+def _inplace_forward(self, *args):
+    for inp, t in zip(self.inputs, args):
+        inp.betensor = t
+    self.outputs[0].betensor = self.inputs[0].betensor.add_(1)
+    return self.outputs[0].betensor
+
+
+def test_mutable_op_never_changes_inputs(monkeypatch):
+    monkeypatch.setitem(OP_DICT, OpType.Abs, _inplace_forward)
+    n = _make_node()
+    x = n.inputs[0].betensor
+    out = n.forward()
+    assert torch.equal(out, torch.ones([2, 3]))
+    assert n.inputs[0].betensor is x
+    assert torch.equal(x, torch.zeros([2, 3]))
+
+
+def test_mutable_op_never_changes_explicit_args(monkeypatch):
+    monkeypatch.setitem(OP_DICT, OpType.Abs, _inplace_forward)
+    n = _make_node()
+    arg = torch.full([2, 3], 2.0)
+    out = n.forward(arg)
+    assert torch.equal(out, torch.full([2, 3], 3.0))
+    assert torch.equal(arg, torch.full([2, 3], 2.0))
+    assert torch.equal(n.inputs[0].betensor, torch.zeros([2, 3]))
+
+
+def test_immutable_op_shares_inputs(monkeypatch):
+    def forward(self, *args):
+        self.outputs[0].betensor = self.inputs[0].betensor
+        return self.outputs[0].betensor
+    forward.mutable_inputs = False
+    monkeypatch.setitem(OP_DICT, OpType.Abs, forward)
+    n = _make_node()
+    assert n.forward() is n.inputs[0].betensor
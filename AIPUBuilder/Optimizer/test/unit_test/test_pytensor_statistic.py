@@ -0,0 +1,29 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import torch
+from AIPUBuilder.Optimizer.framework.pycore.pytensor import _histc_key_axis
+
+
+def test_histc_key_axis_matches_torch_histc():
+    torch.manual_seed(0)
+    bins = 256
+    for t in range(50):
+        x = torch.randn(8, 1000) * torch.rand(8, 1) * 10
+        if t % 3 == 0:
+            # many values on the bin edges
+            x = torch.round(x * 4) / 4
+        kmin, kmax = torch.aminmax(x, dim=1)
+        if t % 5 == 0:
+            # values out of range are ignored
+            kmin, kmax = kmin * 0.5, kmax * 0.7
+        if t % 7 == 0:
+            # an empty range
+            x[2] = 1.5
+            kmin[2] = kmax[2] = 1.5
+        histc = _histc_key_axis(x, kmin, kmax, bins)
+        ref = torch.stack([x[i].histc(bins=bins, min=float(kmin[i]), max=float(kmax[i])) for i in range(x.shape[0])])
+        assert histc.shape == ref.shape
+        assert torch.equal(histc.sum(dim=1), ref.sum(dim=1))
+        # at most a few values per row may fall into the neighbouring bin
+        assert (histc - ref).abs().sum(dim=1).max() <= 2 * 4
@@ -0,0 +1,82 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+from AIPUBuilder.Optimizer.ops.roialign import (float_roi_align, local_float_roi_align, quant_roi_align,
+                                                quant_roi_align_gathered)
+from AIPUBuilder.Optimizer.ops.crop_and_resize import (crop_and_resize, crop_and_resize_gathered,
+                                                       quant_crop_and_resize, quant_crop_and_resize_gathered)
+from AIPUBuilder.Optimizer.utils.quant_tool_utils import get_scale_approximation_params
+
+
+def _rois(num, batch, height, width, scale=1.0):
+    torch.manual_seed(0)
+    y = torch.sort(torch.rand([num, 2]) * height * scale, dim=1).values
+    x = torch.sort(torch.rand([num, 2]) * width * scale, dim=1).values
+    bidx = torch.randint(0, batch, [num, 1]).float()
+    return torch.cat([bidx, y[:, :1], x[:, :1], y[:, 1:], x[:, 1:]], dim=1)
+
+
+def _approx(value, bits):
+    scale, _, shift, _ = get_scale_approximation_params(value, mult_bits=bits)
+    return int(scale), int(shift)
+
+
+@pytest.mark.parametrize('method', ['avg', 'max'])
+@pytest.mark.parametrize('is_half_pixel', [True, False])
+@pytest.mark.parametrize('sample', [[2, 2], [0, 0], [2, 3]])
+def test_float_roi_align_gathered(method, is_half_pixel, sample):
+    torch.manual_seed(1)
+    fm = torch.randn([2, 24, 20, 8])
+    rois = _rois(13, 2, 96, 80)
+    params = {'output_size': [4, 5], 'spatial_scale': [0.25, 0.25], 'sample_ratio': sample, 'method': method,
+              'is_half_pixel': is_half_pixel}
+    assert torch.allclose(float_roi_align(fm, rois, params), local_float_roi_align(fm, rois, params), atol=1e-5)
+
+
+@pytest.mark.parametrize('method', ['avg', 'max'])
+@pytest.mark.parametrize('is_half_pixel', [True, False])
+@pytest.mark.parametrize('sample', [[2, 2], [1, 3]])
+def test_quant_roi_align_gathered(method, is_half_pixel, sample):
+    torch.manual_seed(1)
+    out_h, out_w = 4, 5
+    fm = torch.randint(-128, 128, [2, 24, 20, 8]).float()
+    roi_scale = 2.0
+    rois = torch.round(_rois(13, 2, 96, 80) * roi_scale)
+    rois[:, 0] = torch.round(rois[:, 0] / roi_scale)
+    spatial_shift = 10
+    spatial = [round(0.25 * 2 ** spatial_shift)] * 2
+    samples = [s if s > 0 else 1 for s in sample]
+    pairs = {'total_scale_shift': _approx(1. / (samples[0] * samples[1]), 8),
+             'roi_scale_shift': _approx(1. / roi_scale, 8),
+             'out_h_scale_shift': _approx(1. / out_h, 12),
+             'out_w_scale_shift': _approx(1. / out_w, 12),
+             'sample_h_scale_shift': _approx(1. / (2 * sample[0]), 12) if sample[0] > 0 else (1., 0),
+             'sample_w_scale_shift': _approx(1. / (2 * sample[1]), 12) if sample[1] > 0 else (1., 0)}
+    args = (fm, rois, method, is_half_pixel, [out_h, out_w], sample, spatial, spatial_shift, pairs, -128, 127)
+    assert torch.equal(quant_roi_align_gathered(*args), quant_roi_align(*args))
+
+
+@pytest.mark.parametrize('method', ['bilinear', 'nearest'])
+def test_crop_and_resize_gathered(method):
+    torch.manual_seed(1)
+    fm = torch.randn([2, 24, 20, 8])
+    # boxes partly outside of the feature map get the extrapolation value
+    boxes = _rois(11, 1, 1.2, 1.2)[:, 1:] - 0.1
+    box_indices = torch.randint(0, 2, [11])
+    args = (fm, boxes, box_indices, method, [6, 7], 0.5)
+    assert torch.allclose(crop_and_resize_gathered(*args), crop_and_resize(*args), atol=1e-5)
+
+
+@pytest.mark.parametrize('method', ['bilinear', 'nearest'])
+def test_quant_crop_and_resize_gathered(method):
+    torch.manual_seed(1)
+    fm = torch.randint(-128, 128, [2, 24, 20, 8]).float()
+    box_scale = 2 ** 14
+    # the reference kernel needs the boxes to end inside of the feature map with nearest
+    boxes = torch.round((_rois(11, 1, 1.2, 1.2)[:, 1:] - 0.1).clamp(max=1.0) * box_scale)
+    box_indices = torch.randint(0, 2, [11])
+    index_scale, index_shift = _approx(1. / box_scale, 2)
+    args = (fm, boxes, box_indices, method, [6, 7], -3, index_scale, index_shift)
+    assert torch.equal(quant_crop_and_resize_gathered(*args), quant_crop_and_resize(*args))
@@ -0,0 +1,117 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+from AIPUBuilder.Optimizer.framework.pycore.pynode import PyNode
+from AIPUBuilder.Optimizer.framework.pycore.pytensor import PyTensor
+from AIPUBuilder.Optimizer.framework.pycore.pytype import OpType, Dtype
+from AIPUBuilder.Optimizer.utils.quant_tool_utils import linear_quantize_clip, linear_dequantize, layer_similarity
+from AIPUBuilder.Optimizer.features.calibration.global_calibration.svd_based_quant import _closest_singular_values
+from AIPUBuilder.Optimizer.features.calibration.global_calibration.easy_quant import _best_candidate
+
+
+def _best_svd_scale_loop(filt_out, scale, zerop, q_min, q_max, alpha, beta, nsteps):
+    # the former search of svd_quant get_best_scale, one full svd per candidate
+    U, S, Vh = torch.linalg.svd(filt_out, full_matrices=False)
+    best_s = scale
+    init_s = scale*scale
+    qbetensor = linear_quantize_clip(filt_out, init_s, zerop, q_min, q_max)
+    deqbetenor = linear_dequantize(qbetensor, init_s, zerop)
+    qU, qS, qVh = torch.linalg.svd(deqbetenor, full_matrices=False)
+    min_dist = torch.dist(S, qS)
+    for s in torch.linspace(alpha * scale, beta * scale, nsteps):
+        qbetensor = linear_quantize_clip(filt_out, s, zerop, q_min, q_max)
+        deqbetenor = linear_dequantize(qbetensor, s, zerop)
+        qU, qS, qVh = torch.linalg.svd(deqbetenor, full_matrices=False)
+        dist = torch.dist(S, qS)
+        if dist < min_dist:
+            min_dist = dist
+            best_s = s
+    return best_s
+
+
+def _best_svd_scale(filt_out, scale, zerop, q_min, q_max, alpha, beta, nsteps, chunk_numel=1 << 26):
+    # the search of svd_quant get_best_scale
+    S = torch.linalg.svdvals(filt_out)
+    candidates = torch.linspace(alpha * scale, beta * scale, nsteps)
+    scales = torch.cat([torch.as_tensor(scale*scale).reshape(1).to(candidates), candidates])
+    best = _closest_singular_values(filt_out, S, scales, zerop, q_min, q_max, chunk_numel)
+    return scale if best == 0 else candidates[best - 1]
+
+
+@pytest.mark.parametrize('shape', [[12, 9], [2, 6, 10], [1, 4, 5, 7]])
+@pytest.mark.parametrize('chunk_numel', [1, 500, 1 << 26])
+def test_svd_quant_best_scale(shape, chunk_numel):
+    torch.manual_seed(0)
+    chosen = set()
+    for k in range(12):
+        x = torch.randn(shape) * (k + 1)
+        if k % 3 == 0:
+            x = x.abs()
+        q_min, q_max = (0, 255) if k % 3 == 0 else (-127, 127)
+        frange = float(x.max() - x.min()) if k % 3 == 0 else 2 * float(x.abs().max())
+        # the initial scale is squared by get_best_scale, so it only wins against poor candidates
+        scale = torch.tensor((q_max - q_min) / frange * (0.05 if k % 4 == 0 else 1.))
+        zerop = torch.tensor(0.)
+        alpha, beta = (0.5, 2.0) if k % 2 else (0.05, 0.2)
+        expected = _best_svd_scale_loop(x, scale, zerop, q_min, q_max, alpha, beta, 10)
+        best = _best_svd_scale(x, scale, zerop, q_min, q_max, alpha, beta, 10, chunk_numel)
+        assert float(best) == float(expected)
+        chosen.add(float(best) == float(scale))
+    # both the initial scale and the candidates get picked
+    assert chosen == {False, True}
+
+
+def _node(outputs):
+    n = PyNode('conv', OpType.Convolution)
+    for i, t in enumerate(outputs):
+        n.add_output(PyTensor(f'out{i}', t, Dtype.FP32))
+    return n
+
+
+def _best_candidate_loop(n, candidates, baseline):
+    # the former scoring of easy_quant, one layer_similarity per candidate node
+    best = None
+    max_score = baseline
+    for i, outputs in enumerate(candidates):
+        score = layer_similarity(n, _node(outputs))
+        if score > max_score:
+            max_score = score
+            best = i
+    return best
+
+
+def test_easy_quant_best_candidate():
+    torch.manual_seed(0)
+    for k in range(20):
+        n = _node([torch.randn([2, 4, 4, 3]), torch.randn([2, 5])])
+        candidates = []
+        for j in range(10):
+            noise = 0.01 * (j % 4 + 1) * (k % 3 + 1)
+            candidates.append([t.betensor + torch.randn_like(t.betensor) * noise for t in n.outputs])
+        if k % 4 == 1:
+            # ties, the first one wins
+            candidates[7] = [t.clone() for t in candidates[2]]
+            candidates[3] = [t.clone() for t in candidates[2]]
+        baseline = layer_similarity(n, _node(candidates[k % 10]))
+        if k % 5 == 0:
+            baseline -= 0.01
+        expected = _best_candidate_loop(n, candidates, baseline)
+        assert _best_candidate(n, candidates, baseline) == expected
+        if k % 5 != 0:
+            # no candidate beats an identical one
+            assert _best_candidate(n, candidates, 1.) is None
+    assert _best_candidate(n, [], 0.) is None
+
+
+def test_easy_quant_candidate_inputs():
+    # easy_quant quantizes the searched input with every candidate scale in one broadcast op
+    torch.manual_seed(0)
+    x = torch.randn([2, 6, 7]) * 3
+    scale = torch.tensor(127 / float(x.abs().max()))
+    candidates = torch.linspace(0.5 * scale, 2. * scale, 10)
+    cscales = torch.tensor(candidates.tolist()).reshape([-1] + [1] * x.dim())
+    cinps = linear_quantize_clip(x.unsqueeze(0), cscales, 0, -127, 127)
+    for j, s in enumerate(candidates):
+        assert torch.equal(cinps[j], linear_quantize_clip(x, s.item(), 0, -127, 127))
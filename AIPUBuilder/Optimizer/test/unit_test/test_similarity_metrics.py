@@ -0,0 +1,315 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import numpy
+import torch
+import pytest
+from AIPUBuilder.Optimizer.plugins.aipubt_metric_CosDistance import CosDistanceMetric
+from AIPUBuilder.Optimizer.plugins.aipubt_metric_CosDistance_with_seqlen import CosDistancewseqlenMetric
+from AIPUBuilder.Optimizer.plugins.aipubt_metric_EachCosDistance import EachCosDistanceMetric
+from AIPUBuilder.Optimizer.plugins.aipubt_metric_FlattenCosDistance import FlattenCosDistanceMetric
+from AIPUBuilder.Optimizer.plugins.aipubt_metric_OpTestCosDistance import OpTestCosDistanceMetric
+from AIPUBuilder.Optimizer.plugins.aipubt_metric_MaxAbsError import MaxAbsErrorMetric
+from AIPUBuilder.Optimizer.plugins.aipubt_metric_MaxAbsError_with_seqlen import MaxAbsErrorwseqlenMetric
+
+
+# the former metrics, which kept every per-sample result in a list
+
+
+class _CosDistanceList(object):
+    def __init__(self):
+        self.cos = torch.nn.CosineSimilarity(dim=-1)
+        self.sim = []
+
+    def __call__(self, pred, target):
+        batch = pred[0].shape[0]
+        device = pred[0].device
+        x, y = [], []
+        for b in range(batch):
+            batch_data = []
+            for i in range(len(pred)):
+                data = pred[i][b].squeeze_().reshape(-1,)
+                batch_data.extend(data)
+            batch_data = torch.Tensor(batch_data).to(device).double()
+            x.append(batch_data)
+        if isinstance(target, dict):
+            for b in range(batch):
+                batch_label = []
+                for k in target.keys():
+                    label = target[k][b].squeeze_().reshape(-1,)
+                    batch_label.extend(label)
+                batch_label = torch.Tensor(batch_label).to(device).double()
+                y.append(batch_label)
+        elif isinstance(target, list):
+            for b in range(batch):
+                batch_label = []
+                for i in range(len(target)):
+                    label = target[i][b].squeeze_().reshape(-1,)
+                    batch_label.extend(label)
+                batch_label = torch.Tensor(batch_label).to(device).double()
+                y.append(batch_label)
+        else:
+            for b in range(batch):
+                batch_label = target[b].to(device).squeeze_().reshape(-1).double()
+                y.append(batch_label)
+
+        for b in range(batch):
+            self.sim.append(self.cos(x[b], y[b]))
+
+    def compute(self):
+        t = torch.Tensor(self.sim)
+        return float(torch.mean(t, 0))
+
+
+class _CosDistancewseqlenList(object):
+    def __init__(self):
+        self.cos = torch.nn.CosineSimilarity(dim=-1)
+        self.sim = []
+
+    def __call__(self, pred, target):
+        preds = pred[0].cpu()
+        padded_targets = target[0].cpu()
+        act_len = target[1].cpu()
+        targets = padded_targets
+        for i in range(targets.shape[0]):
+            flatten_pred = preds[i][:act_len[i]].reshape([-1])
+            flatten_target = targets[i][:act_len[i]].reshape([-1])
+            self.sim.append(self.cos(flatten_pred, flatten_target))
+
+    def compute(self):
+        t = torch.Tensor(self.sim)
+        return float(torch.mean(t, 0))
+
+
+class _EachCosDistanceList(object):
+    def __init__(self):
+        self.cos = torch.nn.CosineSimilarity(dim=-1)
+        self.sim = None
+        self.total_quan = 0
+        self.total_sim = None
+
+    def __call__(self, pred, target):
+        if self.sim is None:
+            self.sim = torch.zeros([len(pred)])
+        pred_list = []
+        target_list = []
+        device = pred[0].device
+        output_num = len(pred)
+
+        for i in range(output_num):
+            pred_list.append(pred[i].reshape(-1).double().to(device))
+
+        if isinstance(target, dict):
+            for k in target.keys():
+                target_list.append(target[k].reshape(-1,).double().to(device))
+        elif isinstance(target, list):
+            for i in range(output_num):
+                target_list.append(target[i].reshape(-1,).double().to(device))
+        else:
+            target_list.append(target.reshape(-1,).double().to(device))
+
+        for i in range(output_num):
+            x = pred_list[i]
+            y = target_list[i]
+            if torch.count_nonzero(x) == 0 and torch.count_nonzero(y) == 0:
+                self.sim[i] += 1.0
+            else:
+                self.sim[i] += self.cos(x, y).cpu().numpy()
+
+        self.total_quan += 1
+
+    def compute(self):
+        self.total_sim = self.sim.cpu().numpy() / self.total_quan
+        return float(numpy.mean(self.total_sim, 0))
+
+
+class _FlattenCosDistanceList(object):
+    # also the former OpTestCosDistanceMetric
+    def __init__(self):
+        self.cos = torch.nn.CosineSimilarity()
+        self.sim = []
+
+    def __call__(self, pred, target):
+        sim_per_output = []
+        for o_p, o_t in zip(pred, target):
+            if len(o_p.shape):
+                b = o_p.shape[0]
+                x = o_p.reshape(b, -1).float()
+                y = o_t.reshape(b, -1).float()
+                sim = numpy.mean(self.cos(x, y).cpu().flatten().numpy())
+            else:  # if output is a scalar
+                x = o_p
+                y = o_t[0]
+                sim = (x == y).item()
+
+            sim_per_output.append(sim)
+        self.sim.append(sim_per_output)
+
+    def compute(self):
+        sim = numpy.array(self.sim)
+        return numpy.mean(sim)
+
+    def output_means(self):
+        return [numpy.mean(sim) for sim in numpy.array(self.sim).T]
+
+
+class _MaxAbsErrorList(object):
+    def __init__(self):
+        self.errors = []
+
+    def __call__(self, pred, target):
+        sim_per_output = []
+        for o_p, o_t in zip(pred, target):
+            x = o_p.float().reshape(-1)
+            y = o_t.float().reshape(-1)
+            sim_per_output.append(torch.max(torch.abs(x - y)).cpu().numpy())
+        self.errors.append(sim_per_output)
+
+    def compute(self):
+        errors = numpy.array(self.errors)
+        return numpy.mean(errors)
+
+    def output_means(self):
+        return [numpy.mean(e) for e in numpy.array(self.errors).T]
+
+
+class _MaxAbsErrorwseqlenList(_MaxAbsErrorList):
+    def __call__(self, pred, target):
+        sim_per_output = []
+        for o_p, o_t, o_len in zip(pred, target[0], target[1]):
+            o_len = o_len.cpu()
+            x = o_p.float()[:, :o_len].reshape(-1)
+            y = o_t.float()[:o_len].reshape(-1)
+            sim_per_output.append(torch.max(torch.abs(x - y)).cpu().numpy())
+        self.errors.append(sim_per_output)
+
+
+def _noisy(t, i):
+    # the prediction of target t, a little noisier for each sample
+    noise = torch.randn_like(t) * torch.arange(1, t.shape[0] + 1).reshape([-1] + [1] * (t.dim() - 1)) * 0.1 * (i + 1)
+    return t + noise
+
+
+def _clone(x):
+    return [_clone(t) for t in x] if isinstance(x, list) else x.clone()
+
+
+def _feed(metrics, batches):
+    for pred, target in batches:
+        for m in metrics:
+            # the former metrics squeeze the tensors in place
+            m(_clone(pred), _clone(target))
+
+
+@pytest.mark.parametrize('target_type', ['list', 'dict', 'tensor'])
+def test_cos_distance(target_type):
+    torch.manual_seed(0)
+    batches = []
+    for i in range(4):
+        target = [torch.randn([3, 4, 5]), torch.randn([3, 7])]
+        pred = [_noisy(t, i) for t in target]
+        if target_type == 'tensor':
+            target, pred = target[0], pred[:1]
+        batches.append((pred, target))
+    metric, former = CosDistanceMetric(), _CosDistanceList()
+    _feed([former], batches)
+    for pred, target in batches:
+        if target_type == 'dict':
+            target = {f'out{k}': t for k, t in enumerate(target)}
+        metric(pred, target)
+    assert metric.state.counts == [12]
+    # the former mean was taken in float32
+    assert metric.compute() == pytest.approx(former.compute(), rel=1e-6)
+
+
+def test_cos_distance_with_seqlen():
+    torch.manual_seed(0)
+    batches = []
+    for i in range(3):
+        target = torch.randn([4, 6, 5])
+        pred = _noisy(target, i)
+        act_len = torch.tensor([6, 1, 3, 0])
+        # padded steps differ a lot, only the masking keeps them out
+        steps = torch.arange(6).reshape(1, 6, 1) >= act_len.reshape(4, 1, 1)
+        pred = torch.where(steps, torch.full_like(pred, 100.), pred)
+        target = torch.where(steps, torch.full_like(target, -100.), target)
+        batches.append(([pred], [target, act_len]))
+    metric, former = CosDistancewseqlenMetric(), _CosDistancewseqlenList()
+    _feed([metric, former], batches)
+    assert metric.state.counts == [12]
+    assert metric.compute() == pytest.approx(former.compute(), rel=1e-6)
+    # no masking at all would be far from it
+    unmasked = CosDistancewseqlenMetric()
+    _feed([unmasked], [(pred, [target, torch.full_like(act_len, 6)]) for pred, (target, act_len) in batches])
+    assert unmasked.compute() < metric.compute() - 0.1
+
+
+def test_each_cos_distance():
+    torch.manual_seed(0)
+    batches = []
+    for i in range(4):
+        target = [torch.randn([1, 4, 5]), torch.randn([1, 7]), torch.zeros([1, 3])]
+        pred = [_noisy(t, i) for t in target[:2]] + [torch.zeros([1, 3]) if i % 2 else torch.ones([1, 3])]
+        batches.append((pred, target))
+    metric, former = EachCosDistanceMetric(), _EachCosDistanceList()
+    _feed([metric, former], batches)
+    assert metric.compute() == pytest.approx(former.compute(), rel=1e-6)
+    assert metric.total_sim == pytest.approx(former.total_sim, rel=1e-6)
+    assert metric.total_sim[2] == 0.5
+
+
+@pytest.mark.parametrize('metric_class', [FlattenCosDistanceMetric, OpTestCosDistanceMetric])
+def test_flatten_cos_distance(metric_class):
+    torch.manual_seed(0)
+    batches = []
+    for i in range(4):
+        target = [torch.randn([3, 4, 5]), torch.randn([2, 7]), torch.tensor([float(i % 2)])]
+        pred = [_noisy(t, i) for t in target[:2]] + [torch.tensor(0.)]
+        batches.append((pred, target))
+    metric, former = metric_class(), _FlattenCosDistanceList()
+    _feed([metric, former], batches)
+    assert metric.compute() == pytest.approx(former.compute(), rel=1e-6)
+    assert metric.state.slot_means() == pytest.approx(former.output_means(), rel=1e-6)
+    assert metric.state.slot_means()[2] == 0.5
+
+    # the cosines are computed in float64 now, where float32 rounded nearly parallel large outputs to 1
+    x = torch.full([1, 4096], 1000.)
+    y = x.clone()
+    y[0, ::2] += 0.01
+    metric, former = metric_class(), _FlattenCosDistanceList()
+    _feed([metric, former], [([x], [y])])
+    expected = torch.nn.functional.cosine_similarity(x.double(), y.double()).item()
+    assert expected < 1.
+    assert metric.compute() == pytest.approx(expected, abs=1e-13)
+    assert former.compute() == pytest.approx(expected, abs=1e-6)
+
+
+def test_max_abs_error():
+    torch.manual_seed(0)
+    batches = []
+    for i in range(4):
+        target = [torch.randn([3, 4, 5]), torch.randint(-5, 5, [2, 7], dtype=torch.int32)]
+        pred = [_noisy(target[0], i), target[1] + i]
+        batches.append((pred, target))
+    metric, former = MaxAbsErrorMetric(), _MaxAbsErrorList()
+    _feed([metric, former], batches)
+    assert metric.compute() == pytest.approx(former.compute(), rel=1e-6)
+    assert metric.state.slot_means() == pytest.approx(former.output_means(), rel=1e-6)
+    assert metric.state.slot_means()[1] == 1.5
+
+
+def test_max_abs_error_with_seqlen():
+    torch.manual_seed(0)
+    batches = []
+    for i in range(3):
+        target = [torch.randn([6, 5]), torch.randn([4, 2])]
+        pred = [_noisy(t, i).unsqueeze(0) for t in target]
+        lens = torch.tensor([2 + i, 4])
+        # padded steps differ a lot, only the masking keeps them out
+        pred[0][:, 2 + i:] += 100.
+        batches.append((pred, [target, lens]))
+    metric, former = MaxAbsErrorwseqlenMetric(), _MaxAbsErrorwseqlenList()
+    _feed([metric, former], batches)
+    assert metric.compute() == pytest.approx(former.compute(), rel=1e-6)
+    assert metric.state.slot_means() == pytest.approx(former.output_means(), rel=1e-6)
+    assert metric.state.slot_means()[0] < 100.
@@ -0,0 +1,72 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import torch
+import pytest
+from AIPUBuilder.Optimizer.framework import QuantizeGraph, StageCheckpoint
+
+
+def test_save_and_load(tmp_path, eltwise_graph):
+    g = eltwise_graph
+    inputs = [torch.rand([1, 4, 4, 16]), torch.rand([1, 4, 4, 16])]
+    g.forward(inputs, keep_tensors=True)
+    expected = g.nodes[-1].outputs[0].betensor.clone()
+    ckpt = StageCheckpoint(str(tmp_path), 'key')
+    assert ckpt.last_stage() is None
+    ckpt.save('stage1', g, {'flag': 1})
+    ckpt.save('stage2', g, {'flag': 2})
+    # the featuremaps of the saved graph are kept
+    assert torch.equal(g.nodes[-1].outputs[0].betensor, expected)
+    assert not os.path.isfile(os.path.join(ckpt.path, 'stage1.ckpt'))
+
+    resumed = StageCheckpoint(str(tmp_path), 'key')
+    assert resumed.last_stage() == 'stage2'
+    rg, state = resumed.load()
+    assert state == {'flag': 2}
+    assert [n.name for n in rg.nodes] == [n.name for n in g.nodes]
+    # featuremaps are not stored
+    assert rg.nodes[-1].outputs[0].betensor.numel() < expected.numel()
+    out = rg.forward(inputs)
+    assert torch.allclose(out[0].betensor, expected)
+
+
+def _quantize(argv, break_at=None, monkeypatch=None):
+    from AIPUBuilder.Optimizer.optmaster import OptMaster
+    g = QuantizeGraph.parse(argv.graph, argv.bin)
+    opt = OptMaster(g, argv)
+    opt.prepare(argv)
+    if break_at is not None:
+        def interrupt(*args, **kwargs):
+            raise KeyboardInterrupt()
+        monkeypatch.setattr(opt, break_at, interrupt)
+    opt.optimize()
+    return opt
+
+
+def test_resume_from_last_stage(tmp_path, eltwise_argv, monkeypatch):
+    ckpt_dir = os.path.join(str(tmp_path), 'ckpt')
+    reference = _quantize(eltwise_argv()).g.quantgraph
+
+    argv = eltwise_argv(checkpoint_dir=ckpt_dir)
+    with pytest.raises(KeyboardInterrupt):
+        _quantize(argv, 'collect_information_for_debug', monkeypatch)
+    monkeypatch.undo()
+
+    # the fields which only change how the stages run can change between the interrupted and the resumed run
+    profile_dir = os.path.join(str(tmp_path), 'profile')
+    argv = eltwise_argv(checkpoint_dir=ckpt_dir, metric_workers=2, profile_dir=profile_dir)
+    from AIPUBuilder.Optimizer.optmaster import OptMaster
+    called = []
+    for stage in ('graph_optimize_stage1', 'statistic', 'graph_optimize_stage2', 'quantize'):
+        monkeypatch.setattr(OptMaster, stage, lambda self, stage=stage: called.append(stage))
+    opt = _quantize(argv)
+    assert called == []
+    assert opt.hparams.metric_workers == 2 and opt.hparams.profile_dir == profile_dir
+    resumed = opt.g.quantgraph
+    assert [n.name for n in resumed.nodes] == [n.name for n in reference.nodes]
+    for n, r in zip(resumed.nodes, reference.nodes):
+        for t, rt in zip(n.outputs, r.outputs):
+            assert t.dtype == rt.dtype
+            assert torch.allclose(torch.as_tensor(t.scale), torch.as_tensor(rt.scale))
+            assert torch.equal(torch.as_tensor(t.zerop), torch.as_tensor(rt.zerop))
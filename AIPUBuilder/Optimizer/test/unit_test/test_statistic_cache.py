@@ -0,0 +1,83 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import torch
+from AIPUBuilder.Optimizer.framework import QuantizeGraph
+
+
+def _quantize(argv):
+    from AIPUBuilder.Optimizer.optmaster import OptMaster
+    g = QuantizeGraph.parse(argv.graph, argv.bin)
+    opt = OptMaster(g, argv)
+    opt.prepare(argv)
+    opt.optimize()
+    return opt
+
+
+def _statisticed_nodes(monkeypatch):
+    # names of the nodes each QuantizeGraph.statistic call is asked to statistic
+    calls = []
+    statistic = QuantizeGraph.statistic
+
+    def record(self, inputs, config, **kwargs):
+        nodes = kwargs.get('statistic_nodes')
+        calls.append(None if nodes is None else sorted(n.name for n in nodes))
+        return statistic(self, inputs, config, **kwargs)
+    monkeypatch.setattr(QuantizeGraph, 'statistic', record)
+    return calls
+
+
+def _tensors(g):
+    return [t for n in g.nodes for t in list(n.outputs) + n.placeholders + list(n.constants.values())]
+
+
+def _assert_same_quantization(g, r):
+    for n, rn in zip(g.nodes, r.nodes):
+        for t, rt in zip(n.outputs, rn.outputs):
+            assert t.dtype == rt.dtype
+            assert torch.allclose(torch.as_tensor(t.scale), torch.as_tensor(rt.scale))
+            assert torch.equal(torch.as_tensor(t.zerop), torch.as_tensor(rt.zerop))
+
+
+def test_statistic_cache_hit(tmp_path, eltwise_argv, monkeypatch):
+    cache_dir = os.path.join(str(tmp_path), 'cache')
+    calls = _statisticed_nodes(monkeypatch)
+    reference = _quantize(eltwise_argv()).g.quantgraph
+    assert len(calls) > 0 and all(c is None for c in calls)
+
+    calls.clear()
+    first = _quantize(eltwise_argv(statistic_cache_dir=cache_dir)).g.quantgraph
+    # a cold cache statistics every node, then stores one entry per tensor
+    assert len(calls) > 0 and all(c == ['Placeholder1', 'Placeholder2', 'eltwise'] for c in calls)
+    entries = [f for _, _, files in os.walk(cache_dir) for f in files]
+    assert len(entries) == len(_tensors(first)) and all(f.endswith('.pkl') for f in entries)
+    _assert_same_quantization(first, reference)
+
+    calls.clear()
+    second = _quantize(eltwise_argv(statistic_cache_dir=cache_dir)).g.quantgraph
+    # every tensor is found in the cache, so no batch is forwarded
+    assert calls == []
+    _assert_same_quantization(second, reference)
+
+
+def test_statistic_cache_keys(eltwise_argv):
+    from AIPUBuilder.Optimizer.optmaster import OptMaster
+    argv = eltwise_argv()
+    g = QuantizeGraph.parse(argv.graph, argv.bin)
+    opt = OptMaster(g, argv)
+    opt.prepare(argv)
+    keys = g.statistic_cache_keys(argv, 'data')
+    assert set(keys.keys()) == set(_tensors(g))
+    assert len(set(keys.values())) == len(keys)
+    # the keys are stable and follow the dataset
+    assert g.statistic_cache_keys(argv, 'data') == keys
+    other = g.statistic_cache_keys(argv, 'other data')
+    assert all(other[t] != keys[t] for t in keys)
+    # changing the eltwise params only changes the keys of its outputs
+    eltwise = g.nodes[-1]
+    eltwise.params['method'] = 'SUB'
+    changed = g.statistic_cache_keys(argv, 'data')
+    for n in g.nodes:
+        for t in n.outputs:
+            assert (changed[t] != keys[t]) == (n is eltwise)
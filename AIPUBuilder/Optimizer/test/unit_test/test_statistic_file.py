@@ -0,0 +1,99 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import torch
+import numpy as np
+import pytest
+from AIPUBuilder.Optimizer.framework import QuantizeGraph
+from AIPUBuilder.Optimizer.framework.qgraph import _STATISTIC_PROPERTIES, _STATISTIC_FILE_MAGIC, _load_columnar_statistic
+
+
+def _fill_statistic(g):
+    gen = torch.Generator().manual_seed(0)
+    for n in g.nodes:
+        for t in list(n.outputs) + n.placeholders:
+            t.extrema_min = -float(torch.rand(1, generator=gen))
+            t.extrema_max = float(torch.rand(1, generator=gen))
+            t.running_min = t.extrema_min / 2
+            t.running_max = t.extrema_max / 2
+            t.running_mean = 0.0
+            t.running_std = None
+            t.running_mad = np.float32(0.5)
+            t.running_histc = torch.rand([7, 2048], generator=gen)
+
+
+def _assert_same_statistic(g, r):
+    for n, rn in zip(g.nodes, r.nodes):
+        for t, rt in zip(list(n.outputs) + n.placeholders, list(rn.outputs) + rn.placeholders):
+            for k in _STATISTIC_PROPERTIES:
+                v, rv = getattr(t, k), getattr(rt, k)
+                if isinstance(v, torch.Tensor):
+                    assert isinstance(rv, torch.Tensor) and torch.equal(v, rv)
+                else:
+                    assert v == rv
+
+
+@pytest.fixture
+def statistic_graphs(eltwise_ir):
+    g = QuantizeGraph.parse(*eltwise_ir)
+    _fill_statistic(g)
+    return g, QuantizeGraph.parse(*eltwise_ir)
+
+
+def test_columnar_round_trip(tmp_path, eltwise_ir, statistic_graphs):
+    g, loaded = statistic_graphs
+    fname = os.path.join(str(tmp_path), 'eltwise.stat')
+    g.save_statistic_info(fname)
+    with open(fname, 'rb') as f:
+        assert f.read(len(_STATISTIC_FILE_MAGIC)) == _STATISTIC_FILE_MAGIC
+    assert loaded.load_statistic_info(fname)
+    _assert_same_statistic(g, loaded)
+    # the loaded arrays are writable without changing the file
+    loaded.nodes[-1].outputs[0].running_histc.zero_()
+    again = QuantizeGraph.parse(*eltwise_ir)
+    assert again.load_statistic_info(fname)
+    _assert_same_statistic(g, again)
+
+
+def test_pickled_statistic_file(tmp_path, statistic_graphs):
+    g, loaded = statistic_graphs
+    # the former format, a dict of node -> tensor -> field saved by np.save
+    info = {n.name: {t.name: {k: getattr(t, k).numpy() if isinstance(getattr(t, k), torch.Tensor) else getattr(t, k)
+                              for k in _STATISTIC_PROPERTIES}
+                     for t in list(n.outputs) + n.placeholders}
+            for n in g.nodes}
+    fname = os.path.join(str(tmp_path), 'eltwise.npy')
+    np.save(fname, info)
+    assert loaded.load_statistic_info(fname)
+    _assert_same_statistic(g, loaded)
+
+
+def test_columnar_fields_viewed_on_first_read(tmp_path, statistic_graphs, monkeypatch):
+    g, _ = statistic_graphs
+    fname = os.path.join(str(tmp_path), 'eltwise.stat')
+    g.nodes[0].outputs[0].running_histc = torch.zeros([0, 3])
+    g.save_statistic_info(fname)
+    mappings = []
+    memmap = np.memmap
+
+    def record(*args, **kwargs):
+        mappings.append(args)
+        return memmap(*args, **kwargs)
+    monkeypatch.setattr(np, 'memmap', record)
+    info = _load_columnar_statistic(fname)
+    # loading only reads the index
+    assert mappings == []
+    t = g.nodes[-1].outputs[0]
+    fields = info[g.nodes[-1].name][t.name]
+    assert fields['running_min'] == t.running_min and fields['running_std'] is None
+    # an empty array needs no mapping either
+    assert info[g.nodes[0].name][g.nodes[0].outputs[0].name]['running_histc'].shape == (0, 3)
+    assert mappings == []
+    histc = fields['running_histc']
+    assert len(mappings) == 1 and np.array_equal(histc, t.running_histc.numpy())
+    # a view is created once, and the file is mapped once for all the views
+    assert fields['running_histc'] is histc
+    other = g.nodes[1].outputs[0]
+    assert np.array_equal(info[g.nodes[1].name][other.name]['running_histc'], other.running_histc.numpy())
+    assert len(mappings) == 1
@@ -0,0 +1,68 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import os
+import torch
+import numpy as np
+import pytest
+from AIPUBuilder.Optimizer.framework import QuantizeGraph
+from AIPUBuilder.Optimizer.framework.qgraph import _STATISTIC_PROPERTIES, _STATISTIC_KEY_AXIS_PROPERTIES
+
+
+@pytest.fixture
+def fc_argv(tmp_path, fc_ir, eltwise_argv):
+    """make_argv(**fields): the parsed config quantizing the fully connected graph on 13 samples."""
+    ir_txt, ir_bin, _, _ = fc_ir
+    rng = np.random.default_rng(1)
+    data = rng.standard_normal([13, 8]).astype(np.float32) * np.linspace(0.5, 4., 13, dtype=np.float32)[:, None]
+    data_file = os.path.join(str(tmp_path), 'fc_data.npy')
+    label_file = os.path.join(str(tmp_path), 'fc_label.npy')
+    np.save(data_file, {0: data})
+    np.save(label_file, {0: np.zeros([13, 4], dtype=np.float32)})
+
+    def make_argv(**fields):
+        config = {'graph': ir_txt, 'bin': ir_bin, 'model_name': 'fc', 'calibration_data': data_file,
+                  'data': data_file, 'label': label_file}
+        config.update(fields)
+        return eltwise_argv(**config)
+    return make_argv
+
+
+def _statistic(argv):
+    from AIPUBuilder.Optimizer.optmaster import OptMaster
+    g = QuantizeGraph.parse(argv.graph, argv.bin)
+    opt = OptMaster(g, argv, validation_metrics=[])
+    opt.prepare(argv)
+    opt.statistic()
+    return g
+
+
+def _assert_same_value(a, b, name):
+    if isinstance(a, torch.Tensor) or isinstance(b, torch.Tensor):
+        assert isinstance(a, torch.Tensor) and isinstance(b, torch.Tensor), name
+        assert a.dtype == b.dtype and torch.equal(a, b), name
+    else:
+        assert a == b, name
+
+
+@pytest.mark.parametrize('workers', [1, 2, 3])
+def test_statistic_workers_match_serial(fc_argv, workers):
+    # the whole statistic info is kept with save_statistic_info, including the per-channel histograms of the weights
+    fields = {'save_statistic_info': True, 'calibration_batch_size': 3, 'running_statistic_momentum': 0.7,
+              'histc_bins': 64}
+    serial = _statistic(fc_argv(**fields))
+    pipelined = _statistic(fc_argv(statistic_workers=workers, **fields))
+    assert not pipelined.statistic_pending and not pipelined.statistic_inflight
+    constants = 0
+    for n, pn in zip(serial.nodes, pipelined.nodes):
+        for t, pt in zip(list(n.outputs) + n.placeholders, list(pn.outputs) + pn.placeholders):
+            for k in _STATISTIC_PROPERTIES:
+                _assert_same_value(getattr(pt, k), getattr(t, k), f'{t.name}.{k}')
+            assert isinstance(t.running_histc, torch.Tensor)
+        for key, t in n.constants.items():
+            pt = pn.constants[key]
+            for k in _STATISTIC_PROPERTIES + _STATISTIC_KEY_AXIS_PROPERTIES:
+                _assert_same_value(getattr(pt, k), getattr(t, k), f'{t.name}.{k}')
+            assert list(t.running_histc_key_axis.shape) == [t.betensor.shape[t.key_axis], 64]
+            constants += 1
+    assert constants == 2
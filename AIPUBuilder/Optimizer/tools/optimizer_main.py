@@ -14,7 +14,7 @@ from AIPUBuilder.Optimizer.logger import OPT_START, OPT_END
 
 
 def OPT_WORK(argv):
-    graph = QuantizeGraph.parse(argv.graph, argv.bin)
+    graph = QuantizeGraph.parse(argv.graph, argv.bin, argv.ir_cache_dir, argv.lazy_load_constants)
     optimizer = OptMaster(graph, argv)
     report = optimizer()
     return report
@@ -7,3 +7,5 @@ from AIPUBuilder.Optimizer.utils.files_utils import *
 from AIPUBuilder.Optimizer.utils.math_utils import *
 from AIPUBuilder.Optimizer.utils.string_utils import *
 from AIPUBuilder.Optimizer.utils.random_utils import *
+from AIPUBuilder.Optimizer.utils.process_utils import *
+from AIPUBuilder.Optimizer.utils.similarity_utils import *
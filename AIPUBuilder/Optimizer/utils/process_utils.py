@@ -0,0 +1,74 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+__all__ = ['forked_processes_available', 'run_in_forked_processes']
+
+
+def forked_processes_available(what):
+    """
+    whether work can be shared out to forked processes: it needs cpu and the fork start method, else a warning
+    says that what runs serially.
+    """
+    import multiprocessing
+    from AIPUBuilder.Optimizer.framework.pycore.pytensor import opt_use_cuda
+    from AIPUBuilder.Optimizer.logger import OPT_WARN
+    if opt_use_cuda() or 'fork' not in multiprocessing.get_all_start_methods():
+        OPT_WARN(f"{what} needs forked processes on cpu, it runs serially.", log_once=True)
+        return False
+    return True
+
+
+def _forked_worker(func, shard, threads, results):
+    # workers are not daemonic, so the dataloaders inside can still spawn their own workers
+    import torch
+    import pickle
+    import traceback
+    torch.set_num_threads(threads)
+    try:
+        for result in func(shard):
+            # tensors put on the queue as they are would share their storage through file descriptors, which are
+            # gone once this worker exits, so the results are sent as pickled copies
+            results.put((False, pickle.dumps(result), None))
+        results.put((True, None, None))
+    except BaseException:
+        results.put((True, None, traceback.format_exc()))
+
+
+def run_in_forked_processes(func, shards, what):
+    """
+    iterate over the results of func(shard), a generator, for each shard run in its own forked process, in the
+    order the results arrive. the forked workers inherit func and whatever state it closes over copy-on-write, only
+    the results are pickled. the cpu threads are split among the workers. a failed or lost worker raises
+    RuntimeError, and the remaining workers are terminated when the caller stops early.
+    """
+    import queue
+    import pickle
+    import torch
+    import multiprocessing
+    ctx = multiprocessing.get_context('fork')
+    threads = max(1, torch.get_num_threads() // max(1, len(shards)))
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_forked_worker, args=(func, shard, threads, results)) for shard in shards]
+    finished = 0
+    try:
+        for p in processes:
+            p.start()
+        while finished < len(processes):
+            try:
+                done, result, error = results.get(timeout=1.0)
+            except queue.Empty:
+                if not any(p.is_alive() for p in processes) and results.empty():
+                    raise RuntimeError(f"{what} workers exited unexpectedly.")
+                continue
+            if error is not None:
+                raise RuntimeError(f"{what} worker failed:\n{error}")
+            if done:
+                finished += 1
+                continue
+            yield pickle.loads(result)
+    finally:
+        for p in processes:
+            if finished < len(processes) and p.is_alive():
+                p.terminate()
+            if p.pid is not None:
+                p.join()
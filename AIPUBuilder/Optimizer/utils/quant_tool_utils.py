@@ -166,6 +166,26 @@ def layer_similarity(n, qn):
     t1 = torch.cat(t1_list)
     t2 = torch.cat(t2_list)
     return cosine_distance(t1, t2)
+
+
+def cosine_distances(a, b):
+    # cosine_distance of a against each row of b at once, as a float64 tensor with b.shape[0] values
+    x = a.double().flatten()
+    y = b.double().reshape(b.shape[0], -1)
+    x_m = torch.norm(x, p=2)
+    y_m = torch.norm(y, p=2, dim=1)
+    xy = y @ x
+    xy_m = x_m * y_m
+    cos = torch.where(xy == xy_m, torch.ones_like(xy), xy / torch.where(xy_m == 0, torch.ones_like(xy_m), xy_m))
+    return torch.where(xy_m == 0, (x_m == y_m).double(), cos)
+
+
+def layer_similarities(n, candidates):
+    # layer_similarity of n against several candidates, each one is the list of output tensors (torch.Tensor)
+    # a candidate node produced, the candidates are scored in one batched op
+    t1 = torch.cat([t.betensor.reshape(-1).float() for t in n.outputs])
+    t2 = torch.stack([torch.cat([t.reshape(-1).float() for t in outs]) for outs in candidates])
+    return cosine_distances(t1, t2)
 ############################################
 # x_q = round(scale * x_f - zerop)
 # x_f = (x_q + zerop) / scale
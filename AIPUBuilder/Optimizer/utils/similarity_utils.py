@@ -0,0 +1,92 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2023 Arm Technology (China) Co. Ltd.
+
+import torch
+
+__all__ = ['batch_rows', 'outputs_list', 'row_moments', 'cosine_from_moments', 'SimilarityState']
+
+
+def batch_rows(t, batch, device=None):
+    """
+    view tensor t as [batch, -1] float64 rows, one row per sample.
+    """
+    if device is not None:
+        t = t.to(device)
+    return t.reshape(batch, -1).double()
+
+
+def outputs_list(target, num=None):
+    """
+    normalize the target of a metric call (a dict, a list/tuple or a single tensor) into a list of tensors.
+    """
+    if isinstance(target, dict):
+        outs = list(target.values())
+    elif isinstance(target, (list, tuple)):
+        outs = list(target)
+    else:
+        outs = [target]
+    return outs if num is None else outs[:num]
+
+
+def row_moments(x, y):
+    """
+    :param x: [N, L] float64 rows
+    :param y: [N, L] float64 rows
+    :return: (x.y, x.x, y.y) of each row, each one is a [N] float64 tensor
+    """
+    return (x * y).sum(dim=-1), (x * x).sum(dim=-1), (y * y).sum(dim=-1)
+
+
+def cosine_from_moments(dot, xx, yy, eps=1e-8):
+    """
+    cosine similarity from accumulated dot products and squared norms, the same as torch.nn.CosineSimilarity.
+    """
+    return dot / torch.clamp_min(xx * yy, eps * eps).sqrt()
+
+
+class SimilarityState(object):
+    """
+    running float64 sums of a similarity measure, one slot per model output. the memory it holds only depends on
+    the number of outputs, not on the number of samples that have been fed.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.sums = []
+        self.counts = []
+
+    def _slot(self, slot):
+        while len(self.sums) <= slot:
+            self.sums.append(0.0)
+            self.counts.append(0)
+
+    def update(self, values, slot=0):
+        """
+        add values (a scalar or a tensor of per-sample results) into the running sum of slot.
+        """
+        self._slot(slot)
+        if isinstance(values, torch.Tensor):
+            values = values.detach().double().reshape(-1)
+            self.sums[slot] += float(values.sum().item())
+            self.counts[slot] += values.numel()
+        else:
+            self.sums[slot] += float(values)
+            self.counts[slot] += 1
+
+    def state_dict(self):
+        return {'sums': list(self.sums), 'counts': list(self.counts)}
+
+    def merge(self, state):
+        for slot, (s, c) in enumerate(zip(state['sums'], state['counts'])):
+            self._slot(slot)
+            self.sums[slot] += s
+            self.counts[slot] += c
+
+    def slot_means(self):
+        return [s / c if c else 0.0 for s, c in zip(self.sums, self.counts)]
+
+    def mean(self):
+        total = sum(self.counts)
+        return sum(self.sums) / total if total else 0.0